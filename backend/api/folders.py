@@ -8,7 +8,8 @@ from pathlib import Path
 import mimetypes
 
 from schemas.folder import FolderCreate, FolderResponse, FileUploadResponse
-from utils.file_utils import validate_video_file, get_file_info
+from utils.file_utils import validate_video_file, get_file_info, video_signature_validator
+from utils.upload_stream import InvalidVideoFile, stream_upload_to_file
 
 router = APIRouter()
 
@@ -107,22 +108,22 @@ async def upload_videos(
             safe_filename = f"{uuid.uuid4().hex[:8]}_{file.filename}"
             file_path = os.path.join(folder_path, safe_filename)
             
-            # 保存文件
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            # 先檢查文件頭簽名再流式寫盤，非視頻文件不會產生磁盤寫入
+            validator = video_signature_validator(file.filename)
+            if validator is None:
+                continue
+            try:
+                await stream_upload_to_file(file, file_path, validate_head=validator)
+            except InvalidVideoFile:
+                continue
             
-            # 驗證文件
-            if validate_video_file(file_path):
-                file_info = get_file_info(file_path)
-                uploaded_files.append(FileUploadResponse(
-                    filename=safe_filename,
-                    original_name=file.filename,
-                    size=file_info["size"],
-                    path=file_path
-                ))
-            else:
-                # 如果不是有效視頻文件，刪除它
-                os.remove(file_path)
+            file_info = get_file_info(file_path)
+            uploaded_files.append(FileUploadResponse(
+                filename=safe_filename,
+                original_name=file.filename,
+                size=file_info["size"],
+                path=file_path
+            ))
         
         if not uploaded_files:
             raise HTTPException(status_code=400, detail="沒有成功上傳任何視頻文件")
@@ -3,7 +3,7 @@
 定義所有數據表的 SQLAlchemy 模型
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database.database import Base
@@ -32,6 +32,10 @@ class Task(Base):
 class VideoPair(Base):
     """視頻對模型"""
     __tablename__ = "video_pairs"
+    __table_args__ = (
+        # 按任務列出視頻對、統計未評估的對
+        Index("ix_video_pairs_task_evaluated", "task_id", "is_evaluated"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     task_id = Column(String, ForeignKey("tasks.id"), nullable=False, comment="所屬任務ID")
@@ -50,6 +54,12 @@ class VideoPair(Base):
 class Evaluation(Base):
     """評估結果模型"""
     __tablename__ = "evaluations"
+    __table_args__ = (
+        # 按任務/視頻對查詢評估
+        Index("ix_evaluations_task_pair", "task_id", "video_pair_id"),
+        # 按用戶查詢評估歷史（按時間排序）
+        Index("ix_evaluations_user_created", "user_id", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     task_id = Column(String, ForeignKey("tasks.id"), nullable=False, comment="所屬任務ID")
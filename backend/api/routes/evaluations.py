@@ -6,11 +6,12 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
-import os
-import json
 import uuid
 import time
 
+from database.repository import API_ROUTES_DB_FILE, EvaluationExists, get_repository, use_sqlite_storage
+from database.document_cache import get_document
+
 router = APIRouter()
 
 # 評估數據文件
@@ -33,11 +34,12 @@ class EvaluationResponse(BaseModel):
     created_at: float
 
 def load_evaluations():
-    """載入評估數據"""
+    """載入評估數據（JSON 文件未變化時直接使用進程內緩存）"""
     try:
-        if os.path.exists(EVALUATIONS_DATA_FILE):
-            with open(EVALUATIONS_DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        if use_sqlite_storage():
+            evaluations = get_repository(API_ROUTES_DB_FILE).list_evaluations()
+            return {e["id"]: e for e in evaluations}
+        return get_document(EVALUATIONS_DATA_FILE).get()
     except Exception as e:
         print(f"載入評估數據失敗: {e}")
     return {}
@@ -45,8 +47,11 @@ def load_evaluations():
 def save_evaluations(evaluations_db):
     """保存評估數據"""
     try:
-        with open(EVALUATIONS_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(evaluations_db, f, ensure_ascii=False, indent=2)
+        if use_sqlite_storage():
+            # 只寫入有變化的評估
+            get_repository(API_ROUTES_DB_FILE).replace_evaluations(list(evaluations_db.values()))
+            return
+        get_document(EVALUATIONS_DATA_FILE).save(evaluations_db)
     except Exception as e:
         print(f"保存評估數據失敗: {e}")
 
@@ -56,9 +61,6 @@ async def create_evaluation(evaluation_data: EvaluationCreate):
     提交視頻對的評估結果
     """
     try:
-        # 載入評估數據
-        evaluations_db = load_evaluations()
-        
         # 創建評估記錄
         evaluation_id = str(uuid.uuid4())
         current_time = time.time()
@@ -73,8 +75,13 @@ async def create_evaluation(evaluation_data: EvaluationCreate):
         }
         
         # 保存評估
-        evaluations_db[evaluation_id] = evaluation
-        save_evaluations(evaluations_db)
+        if use_sqlite_storage():
+            # SQLite 後端只插入這一行
+            get_repository(API_ROUTES_DB_FILE).add_evaluation(evaluation)
+        else:
+            evaluations_db = load_evaluations()
+            evaluations_db[evaluation_id] = evaluation
+            save_evaluations(evaluations_db)
         
         return {
             "success": True,
@@ -82,6 +89,8 @@ async def create_evaluation(evaluation_data: EvaluationCreate):
             "message": "評估結果已提交"
         }
         
+    except EvaluationExists as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -6,8 +6,9 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, Dict
-import os
-import json
+
+from database.repository import API_ROUTES_DB_FILE, get_repository, use_sqlite_storage
+from database.document_cache import get_document
 
 router = APIRouter()
 
@@ -16,23 +17,23 @@ EVALUATIONS_DATA_FILE = "evaluations_data.json"
 TASKS_DATA_FILE = "tasks_data.json"
 
 def load_evaluations():
-    """載入評估數據"""
+    """載入評估數據（與評估路由共用同一份進程內緩存）"""
     try:
-        if os.path.exists(EVALUATIONS_DATA_FILE):
-            with open(EVALUATIONS_DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        if use_sqlite_storage():
+            evaluations = get_repository(API_ROUTES_DB_FILE).list_evaluations()
+            return {e["id"]: e for e in evaluations}
+        return get_document(EVALUATIONS_DATA_FILE).get()
     except Exception as e:
         print(f"載入評估數據失敗: {e}")
         return {}
 
 def load_tasks():
-    """載入任務數據"""
+    """載入任務數據（與任務路由共用同一份進程內緩存）"""
     try:
-        if os.path.exists(TASKS_DATA_FILE):
-            with open(TASKS_DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        if use_sqlite_storage():
+            tasks = get_repository(API_ROUTES_DB_FILE).list_tasks()
+            return {t["id"]: t for t in tasks}
+        return get_document(TASKS_DATA_FILE).get()
     except Exception as e:
         print(f"載入任務數據失敗: {e}")
         return {}
@@ -4,11 +4,14 @@
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import Dict, List, Optional
 import os
+import asyncio
 
-from database.database import get_db
+from database.database import get_async_db
 from api.models import Task, VideoPair
 from api.schemas import (
     TaskCreate, TaskUpdate, TaskResponse, TaskListResponse, 
@@ -20,11 +23,40 @@ from utils.file_utils import validate_folder_path
 router = APIRouter()
 
 
+def video_pair_rows(task_id: str, matched_pairs: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """把匹配結果轉換為 video_pairs 表的行，用於批量插入（id 等由列默認值生成）"""
+    return [
+        {
+            "task_id": task_id,
+            "video_a_path": pair['video_a'],
+            "video_b_path": pair['video_b'],
+            "video_a_name": os.path.basename(pair['video_a']),
+            "video_b_name": os.path.basename(pair['video_b'])
+        }
+        for pair in matched_pairs
+    ]
+
+
+async def _load_task(db: AsyncSession, task_id: str) -> Optional[Task]:
+    """
+    載入任務並預先載入其視頻對
+
+    異步會話不能在序列化響應時隱式懶加載關聯，所以 video_pairs 必須一併查出
+    """
+    result = await db.execute(
+        select(Task)
+        .options(selectinload(Task.video_pairs))
+        .where(Task.id == task_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one_or_none()
+
+
 @router.get("/", response_model=TaskListResponse, summary="獲取任務列表")
 async def get_tasks(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     獲取任務列表
@@ -33,7 +65,13 @@ async def get_tasks(
     - **limit**: 返回的記錄數限制
     """
     try:
-        tasks = db.query(Task).offset(skip).limit(limit).all()
+        result = await db.execute(
+            select(Task)
+            .options(selectinload(Task.video_pairs))
+            .offset(skip)
+            .limit(limit)
+        )
+        tasks = result.scalars().all()
         return TaskListResponse(
             success=True,
             data=[TaskResponse.from_orm(task) for task in tasks],
@@ -47,14 +85,14 @@ async def get_tasks(
 
 
 @router.get("/{task_id}", response_model=TaskDetailResponse, summary="獲取任務詳情")
-async def get_task(task_id: str, db: Session = Depends(get_db)):
+async def get_task(task_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     獲取指定任務的詳細信息
     
     - **task_id**: 任務ID
     """
     try:
-        task = db.query(Task).filter(Task.id == task_id).first()
+        task = await _load_task(db, task_id)
         if not task:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -76,7 +114,7 @@ async def get_task(task_id: str, db: Session = Depends(get_db)):
 
 
 @router.post("/", response_model=TaskDetailResponse, summary="創建新任務")
-async def create_task(task_data: TaskCreate, db: Session = Depends(get_db)):
+async def create_task(task_data: TaskCreate, db: AsyncSession = Depends(get_async_db)):
     """
     創建新的視頻盲測任務
     
@@ -107,47 +145,39 @@ async def create_task(task_data: TaskCreate, db: Session = Depends(get_db)):
         )
         
         db.add(db_task)
-        db.commit()
-        db.refresh(db_task)
+        await db.commit()
         
-        # 匹配視頻文件
+        # 匹配視頻文件（遍歷目錄是阻塞 IO，放到線程池中執行）
         matcher = VideoMatcher()
-        matched_pairs = matcher.match_videos(
+        matched_pairs = await asyncio.get_running_loop().run_in_executor(
+            None,
+            matcher.match_videos,
             task_data.folder_a_path,
             task_data.folder_b_path
         )
         
-        # 創建視頻對
-        video_pairs = []
-        for pair in matched_pairs:
-            video_pair = VideoPair(
-                task_id=db_task.id,
-                video_a_path=pair['video_a'],
-                video_b_path=pair['video_b'],
-                video_a_name=os.path.basename(pair['video_a']),
-                video_b_name=os.path.basename(pair['video_b'])
-            )
-            video_pairs.append(video_pair)
-        
-        db.add_all(video_pairs)
+        # 批量創建視頻對：一條 INSERT 語句 executemany，不逐個構造 ORM 對象
+        pair_rows = video_pair_rows(db_task.id, matched_pairs)
+        if pair_rows:
+            await db.execute(insert(VideoPair), pair_rows)
         
         # 更新任務統計
-        db_task.total_pairs = len(video_pairs)
-        db_task.status = "in_progress" if video_pairs else "completed"
+        db_task.total_pairs = len(pair_rows)
+        db_task.status = "in_progress" if pair_rows else "completed"
         
-        db.commit()
-        db.refresh(db_task)
+        await db.commit()
+        db_task = await _load_task(db, db_task.id)
         
         return TaskDetailResponse(
             success=True,
             data=TaskResponse.from_orm(db_task),
-            message=f"成功創建任務，匹配到 {len(video_pairs)} 個視頻對"
+            message=f"成功創建任務，匹配到 {len(pair_rows)} 個視頻對"
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"創建任務失敗: {str(e)}"
@@ -158,7 +188,7 @@ async def create_task(task_data: TaskCreate, db: Session = Depends(get_db)):
 async def update_task(
     task_id: str,
     task_update: TaskUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     更新指定任務的信息
@@ -167,7 +197,7 @@ async def update_task(
     - **task_update**: 更新的任務數據
     """
     try:
-        task = db.query(Task).filter(Task.id == task_id).first()
+        task = await _load_task(db, task_id)
         if not task:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -179,8 +209,9 @@ async def update_task(
         for field, value in update_data.items():
             setattr(task, field, value)
         
-        db.commit()
-        db.refresh(task)
+        await db.commit()
+        # updated_at 由數據庫生成，重新查詢取得最新值
+        task = await _load_task(db, task_id)
         
         return TaskDetailResponse(
             success=True,
@@ -191,7 +222,7 @@ async def update_task(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"更新任務失敗: {str(e)}"
@@ -199,22 +230,22 @@ async def update_task(
 
 
 @router.delete("/{task_id}", response_model=BaseResponse, summary="刪除任務")
-async def delete_task(task_id: str, db: Session = Depends(get_db)):
+async def delete_task(task_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     刪除指定的任務及其相關數據
     
     - **task_id**: 任務ID
     """
     try:
-        task = db.query(Task).filter(Task.id == task_id).first()
+        task = await db.get(Task, task_id)
         if not task:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="任務不存在"
             )
         
-        db.delete(task)
-        db.commit()
+        await db.delete(task)
+        await db.commit()
         
         return BaseResponse(
             success=True,
@@ -224,7 +255,7 @@ async def delete_task(task_id: str, db: Session = Depends(get_db)):
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"刪除任務失敗: {str(e)}"
@@ -232,21 +263,22 @@ async def delete_task(task_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/{task_id}/video-pairs", summary="獲取任務的視頻對")
-async def get_task_video_pairs(task_id: str, db: Session = Depends(get_db)):
+async def get_task_video_pairs(task_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     獲取指定任務的所有視頻對
     
     - **task_id**: 任務ID
     """
     try:
-        task = db.query(Task).filter(Task.id == task_id).first()
+        task = await db.get(Task, task_id)
         if not task:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="任務不存在"
             )
         
-        video_pairs = db.query(VideoPair).filter(VideoPair.task_id == task_id).all()
+        result = await db.execute(select(VideoPair).where(VideoPair.task_id == task_id))
+        video_pairs = result.scalars().all()
         
         return {
             "success": True,
@@ -2,12 +2,16 @@ from fastapi import APIRouter, HTTPException, Query
 from typing import List, Optional
 import os
 import uuid
+import asyncio
 import time
 from pathlib import Path
 
 from schemas.task import TaskCreate, TaskResponse, TaskBasicResponse, TaskStatus, TaskListResponse, VideoPairResponse
 from utils.file_utils import validate_video_file
-from utils.video_matcher import match_videos
+from utils.name_rules import get_ruleset
+from utils.video_matcher import optimal_match_videos, preview_matches
+from database.repository import API_ROUTES_DB_FILE, get_repository, use_sqlite_storage
+from database.document_cache import get_document
 
 router = APIRouter()
 
@@ -19,22 +23,25 @@ TASKS_DATA_FILE = "tasks_data.json"
 tasks_db = {}
 
 def load_tasks():
-    """載入任務數據"""
-    import json
+    """載入任務數據（JSON 文件未變化時直接使用進程內緩存）"""
+    global tasks_db
     try:
-        if os.path.exists(TASKS_DATA_FILE):
-            with open(TASKS_DATA_FILE, 'r', encoding='utf-8') as f:
-                global tasks_db
-                tasks_db = json.load(f)
+        if use_sqlite_storage():
+            repository = get_repository(API_ROUTES_DB_FILE)
+            tasks_db = {t["id"]: t for t in repository.list_tasks(include_pairs=True)}
+        else:
+            tasks_db = get_document(TASKS_DATA_FILE).get()
     except Exception as e:
         print(f"載入任務數據失敗: {e}")
 
 def save_tasks():
     """保存任務數據"""
-    import json
     try:
-        with open(TASKS_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(tasks_db, f, ensure_ascii=False, indent=2)
+        if use_sqlite_storage():
+            # 只寫入有變化的任務和視頻對
+            get_repository(API_ROUTES_DB_FILE).replace_tasks(list(tasks_db.values()))
+        else:
+            get_document(TASKS_DATA_FILE).save(tasks_db)
     except Exception as e:
         print(f"保存任務數據失敗: {e}")
 
@@ -116,7 +123,15 @@ async def create_task(task_data: TaskCreate):
             raise HTTPException(status_code=400, detail=f"資料夾 {task_data.folder_b} 中沒有視頻文件")
         
         # 匹配視頻對
-        matched_pairs = match_videos(videos_a, videos_b)
+        try:
+            rules = get_ruleset(task_data.name_rules)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"文件名規則無效: {e}")
+        # 構建相似度矩陣和最優配對是 CPU 密集的計算，放到線程池中執行
+        matched_pairs = await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: optimal_match_videos(videos_a, videos_b, rules=rules)
+        )
         
         if not matched_pairs:
             raise HTTPException(status_code=400, detail="無法匹配到任何視頻對，請檢查文件名稱")
@@ -155,6 +170,35 @@ async def create_task(task_data: TaskCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"創建任務失敗: {str(e)}")
 
+@router.get("/preview")
+async def preview_task(
+    folder_a: str,
+    folder_b: str,
+    name_rules: Optional[str] = None
+):
+    """預覽兩個資料夾的匹配結果（相似度矩陣會被緩存，隨後用同樣的資料夾創建任務時直接使用）"""
+    try:
+        for folder in (folder_a, folder_b):
+            if not os.path.exists(os.path.join(UPLOAD_BASE_DIR, folder)):
+                raise HTTPException(status_code=404, detail=f"資料夾 {folder} 不存在")
+
+        try:
+            rules = get_ruleset(name_rules)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"文件名規則無效: {e}")
+
+        videos_a = get_folder_videos(folder_a)
+        videos_b = get_folder_videos(folder_b)
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: preview_matches(videos_a, videos_b, rules=rules)
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"預覽匹配失敗: {str(e)}")
+
 @router.get("/{task_id}", response_model=TaskResponse)
 async def get_task(task_id: str):
     """獲取任務詳情"""
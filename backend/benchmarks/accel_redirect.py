@@ -0,0 +1,228 @@
+"""
+X-Accel-Redirect 負載測試
+對比兩種視頻服務方式下後端 worker 的 CPU 佔用：
+- python: nginx 反向代理到後端，文件內容由 Python 發送（utils.video_serving.serve_file）
+- accel:  後端只檢查並解析路徑，返回 X-Accel-Redirect，由 nginx 的 internal location 發送
+並發發送隨機位置的 Range 請求，統計吞吐量、p50/p99 延遲，以及後端進程每個請求消耗的 CPU 時間
+（/proc/<pid>/stat 的 utime + stime）。
+
+需要 nginx（PATH 中或用 --nginx 指定）。找不到 nginx 時直接請求後端：
+accel 模式下後端只返回響應頭，此時只能比較後端的 CPU 佔用，文件內容不會被發送。
+
+用法（在 backend 目錄下，僅支持 Linux）:
+    python benchmarks/accel_redirect.py --size-mb 64 --requests 2000 --concurrency 32
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACCEL_LOCATION = "/_protected_uploads"
+
+NGINX_CONF = """
+worker_processes 1;
+pid {tmp}/nginx.pid;
+error_log {tmp}/error.log warn;
+events {{
+    worker_connections 1024;
+}}
+http {{
+    access_log off;
+    upstream backend {{
+        server 127.0.0.1:{backend_port};
+        keepalive 64;
+    }}
+    server {{
+        listen 127.0.0.1:{port};
+        location /uploads/ {{
+            proxy_pass http://backend;
+            proxy_http_version 1.1;
+            proxy_set_header Connection "";
+        }}
+        location {location}/ {{
+            internal;
+            alias {directory}/;
+            sendfile on;
+            sendfile_max_chunk 1m;
+            tcp_nopush on;
+            default_type video/mp4;
+        }}
+    }}
+}}
+"""
+
+
+def build_app(mode: str, directory: str):
+    from fastapi import FastAPI, HTTPException, Request
+    from utils.video_serving import StatCache, accel_redirect, resolve_served_path, serve_file
+
+    app = FastAPI()
+    stat_cache = StatCache()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+    async def serve_upload(file_path: str, request: Request):
+        path = resolve_served_path(directory, file_path)
+        if path is None:
+            raise HTTPException(status_code=404)
+        if mode == "accel":
+            return await accel_redirect(request, directory, path, stat_cache, location=ACCEL_LOCATION)
+        return await serve_file(request, path, stat_cache)
+
+    return app
+
+
+def serve(mode: str, port: int, directory: str):
+    import uvicorn
+    uvicorn.run(build_app(mode, directory), host="127.0.0.1", port=port, log_level="warning")
+
+
+def cpu_seconds(pid: int) -> float:
+    """進程累計的用戶態 + 內核態 CPU 時間"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def wait_ready(port: int, path: str, process: subprocess.Popen, name: str):
+    deadline = time.time() + 30
+    while True:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", path)
+            conn.getresponse().read()
+            return
+        except Exception:
+            if process.poll() is not None or time.time() > deadline:
+                raise RuntimeError(f"{name} 啟動失敗")
+            time.sleep(0.2)
+
+
+def run_mode(mode: str, args, directory: str, size: int, nginx: str) -> dict:
+    backend = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(args.backend_port),
+         "--directory", directory],
+        cwd=BACKEND_DIR
+    )
+    proxy = None
+    try:
+        wait_ready(args.backend_port, "/ping", backend, "後端")
+        port = args.backend_port
+        if nginx:
+            tmp = tempfile.mkdtemp(prefix="sbs-nginx-")
+            conf = os.path.join(tmp, "nginx.conf")
+            with open(conf, "w") as f:
+                f.write(NGINX_CONF.format(tmp=tmp, backend_port=args.backend_port, port=args.port,
+                                          location=ACCEL_LOCATION, directory=directory))
+            proxy = subprocess.Popen([nginx, "-p", tmp, "-c", conf, "-g", "daemon off;"])
+            port = args.port
+            wait_ready(port, "/uploads/bench.mp4", proxy, "nginx")
+
+        rng = random.Random(42)
+        range_bytes = args.range_kb * 1024
+        plans = []
+        for _ in range(args.requests):
+            start = rng.randrange(0, max(size - range_bytes, 1))
+            plans.append(f"bytes={start}-{start + range_bytes - 1}")
+
+        local = threading.local()
+
+        def timed(range_header):
+            conn = getattr(local, "conn", None)
+            if conn is None:
+                conn = local.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            started = time.perf_counter()
+            conn.request("GET", "/uploads/bench.mp4", headers={"Range": range_header})
+            response = conn.getresponse()
+            received = len(response.read())
+            return (time.perf_counter() - started) * 1000, response.status, received
+
+        cpu_before = cpu_seconds(backend.pid)
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(timed, plans))
+        elapsed = time.time() - started
+        cpu_used = cpu_seconds(backend.pid) - cpu_before
+
+        latencies = [r[0] for r in results]
+        statuses = {}
+        for _, status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        return {
+            "throughput": args.requests / elapsed,
+            "transferred_mb": sum(r[2] for r in results) / 1024 / 1024,
+            "p50": statistics.median(latencies),
+            "p99": percentile(latencies, 0.99),
+            "cpu_per_request_ms": cpu_used / args.requests * 1000,
+            "cpu_utilization": cpu_used / elapsed * 100,
+            "statuses": statuses,
+        }
+    finally:
+        for process in (proxy, backend):
+            if process is None:
+                continue
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="X-Accel-Redirect 與 Python 發送文件的後端 CPU 對比")
+    parser.add_argument("--size-mb", type=int, default=64, help="測試視頻大小（MB）")
+    parser.add_argument("--range-kb", type=int, default=512, help="每次 seek 請求的範圍大小（KB）")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--nginx", default=shutil.which("nginx"), help="nginx 可執行文件路徑")
+    parser.add_argument("--port", type=int, default=8770, help="nginx 監聽端口")
+    parser.add_argument("--backend-port", type=int, default=8771)
+    parser.add_argument("--serve", choices=("python", "accel"), help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        sys.path.insert(0, BACKEND_DIR)
+        serve(args.serve, args.port, args.directory)
+        return
+
+    directory = tempfile.mkdtemp(prefix="sbs-accel-redirect-")
+    size = args.size_mb * 1024 * 1024
+    with open(os.path.join(directory, "bench.mp4"), "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(block)
+
+    if args.nginx:
+        print(f"✅ 通過 nginx（{args.nginx}）測試，{args.requests} 個 {args.range_kb}KB Range 請求，並發 {args.concurrency}")
+    else:
+        print("⚠️ 找不到 nginx，直接請求後端：accel 模式只返回 X-Accel-Redirect 響應頭，僅比較後端 CPU")
+
+    for mode in ("python", "accel"):
+        result = run_mode(mode, args, directory, size, args.nginx)
+        print(f"{mode:7s} 吞吐 {result['throughput']:7.1f} req/s  傳輸 {result['transferred_mb']:8.1f}MB  "
+              f"p50 {result['p50']:6.1f}ms  p99 {result['p99']:6.1f}ms  "
+              f"後端 CPU {result['cpu_per_request_ms']:.2f}ms/請求（{result['cpu_utilization']:.0f}%）  "
+              f"狀態碼 {result['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
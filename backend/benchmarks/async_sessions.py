@@ -0,0 +1,212 @@
+"""
+同步會話與異步會話的並發對比
+分別以原來的同步 SessionLocal 寫法（async def 處理函數中直接 db.query）和
+api/routes/tasks.py 的異步會話寫法啟動服務，並發請求任務列表和視頻對列表，
+同時持續探測一個不訪問數據庫的 /ping 端點：同步寫法的查詢會阻塞事件循環，表現為 /ping 延遲升高
+
+用法（在 backend 目錄下，需要安裝 aiosqlite）:
+    python benchmarks/async_sessions.py --pairs 2000 --requests 400 --concurrency 32
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_app(mode: str):
+    """構建只包含任務路由和 /ping 的應用"""
+    from fastapi import FastAPI, Depends
+    from sqlalchemy.orm import Session
+
+    from database.database import get_db
+    from api.models import Task, VideoPair
+    from api.schemas import TaskResponse
+
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if mode == "async":
+        from api.routes.tasks import router
+        app.include_router(router, prefix="/api/tasks")
+        return app
+
+    # 改造前的寫法：async def 中使用同步會話，響應內容與異步路由相同
+    @app.get("/api/tasks/")
+    async def get_tasks(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+        tasks = db.query(Task).offset(skip).limit(limit).all()
+        return {"success": True, "data": [TaskResponse.from_orm(task) for task in tasks]}
+
+    @app.get("/api/tasks/{task_id}/video-pairs")
+    async def get_task_video_pairs(task_id: str, db: Session = Depends(get_db)):
+        db.query(Task).filter(Task.id == task_id).first()
+        video_pairs = db.query(VideoPair).filter(VideoPair.task_id == task_id).all()
+        return {
+            "success": True,
+            "data": [
+                {
+                    "id": pair.id,
+                    "video_a_path": pair.video_a_path,
+                    "video_b_path": pair.video_b_path,
+                    "video_a_name": pair.video_a_name,
+                    "video_b_name": pair.video_b_name,
+                    "is_evaluated": pair.is_evaluated,
+                    "created_at": pair.created_at
+                }
+                for pair in video_pairs
+            ]
+        }
+
+    return app
+
+
+def seed(pairs: int, tasks: int):
+    """寫入測試任務和視頻對，返回任務ID列表"""
+    from database.database import SessionLocal, init_db
+    from api.models import Task, VideoPair
+
+    init_db()
+    db = SessionLocal()
+    try:
+        task_ids = []
+        for t in range(tasks):
+            task = Task(name=f"bench_{t}", folder_a_path="/a", folder_b_path="/b", total_pairs=pairs)
+            db.add(task)
+            db.flush()
+            db.add_all([
+                VideoPair(
+                    task_id=task.id,
+                    video_a_path=f"/a/video_{i}.mp4",
+                    video_b_path=f"/b/video_{i}.mp4",
+                    video_a_name=f"video_{i}.mp4",
+                    video_b_name=f"video_{i}.mp4"
+                )
+                for i in range(pairs)
+            ])
+            task_ids.append(task.id)
+        db.commit()
+        return task_ids
+    finally:
+        db.close()
+
+
+def serve(mode: str, port: int):
+    import uvicorn
+    uvicorn.run(build_app(mode), host="127.0.0.1", port=port, log_level="warning")
+
+
+def get(base_url: str, path: str, timeout: float = 60):
+    with urllib.request.urlopen(base_url + path, timeout=timeout) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def run_mode(mode: str, args, env) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(args.port)],
+        cwd=BACKEND_DIR, env=env
+    )
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                get(base_url, "/ping", timeout=1)
+                break
+            except Exception:
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError(f"{mode} 服務啟動失敗")
+                time.sleep(0.2)
+
+        task_ids = env["BENCH_TASK_IDS"].split(",")
+        paths = [f"/api/tasks/{task_ids[i % len(task_ids)]}/video-pairs" if i % 4 else "/api/tasks/"
+                 for i in range(args.requests)]
+
+        ping_latencies = []
+        stop = threading.Event()
+
+        def probe():
+            while not stop.is_set():
+                started = time.perf_counter()
+                get(base_url, "/ping")
+                ping_latencies.append((time.perf_counter() - started) * 1000)
+                time.sleep(0.005)
+
+        def timed(path):
+            started = time.perf_counter()
+            get(base_url, path)
+            return (time.perf_counter() - started) * 1000
+
+        prober = threading.Thread(target=probe, daemon=True)
+        prober.start()
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = list(executor.map(timed, paths))
+        elapsed = time.time() - started
+        stop.set()
+        prober.join()
+
+        return {
+            "throughput": args.requests / elapsed,
+            "p50": statistics.median(latencies),
+            "p99": percentile(latencies, 0.99),
+            "ping_p50": statistics.median(ping_latencies) if ping_latencies else 0.0,
+            "ping_p99": percentile(ping_latencies, 0.99),
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步/異步數據庫會話並發對比")
+    parser.add_argument("--pairs", type=int, default=2000, help="每個任務的視頻對數")
+    parser.add_argument("--tasks", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--serve", choices=("sync", "async"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        sys.path.insert(0, BACKEND_DIR)
+        serve(args.serve, args.port)
+        return
+
+    data_dir = tempfile.mkdtemp(prefix="sbs-async-sessions-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(data_dir, 'bench.db')}"
+    sys.path.insert(0, BACKEND_DIR)
+    task_ids = seed(args.pairs, args.tasks)
+    print(f"✅ 已寫入 {args.tasks} 個任務，每個 {args.pairs} 個視頻對")
+
+    env = dict(os.environ, BENCH_TASK_IDS=",".join(task_ids))
+    for mode in ("sync", "async"):
+        result = run_mode(mode, args, env)
+        print(
+            f"{mode:>5}: {result['throughput']:7.1f} 請求/秒  "
+            f"延遲 p50 {result['p50']:7.1f}ms p99 {result['p99']:7.1f}ms  "
+            f"/ping p50 {result['ping_p50']:6.1f}ms p99 {result['ping_p99']:6.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
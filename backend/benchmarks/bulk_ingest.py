@@ -0,0 +1,119 @@
+"""
+批量導入測試
+啟動 main_railway.py，在服務器本地生成一批視頻文件，分別用三種方式放入資料夾並計時：
+- upload: 通過 /api/folders/{name}/upload 分批 multipart 上傳（現有的唯一方式）
+- auto:   /api/folders/{name}/ingest，reflink → 硬鏈接 → 複製
+- copy:   /api/folders/{name}/ingest，mode=copy
+導入任務通過輪詢進度接口等待完成
+
+用法（在 backend 目錄下）:
+    python benchmarks/bulk_ingest.py --files 2000 --size-kb 1024
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 文件以 MP4 的 ftyp box 開頭，能通過文件頭簽名檢查
+FTYP = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2"
+
+
+def request_json(base_url: str, method: str, path: str, payload=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return json.loads(response.read())
+
+
+def upload_batch(base_url: str, folder: str, paths):
+    """把一批文件作為一個 multipart 請求上傳"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        parts.append(
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; "
+            f"filename=\"{os.path.basename(path)}\"\r\nContent-Type: video/mp4\r\n\r\n".encode() + content + b"\r\n"
+        )
+    body = b"".join(parts) + f"--{boundary}--\r\n".encode()
+    request = urllib.request.Request(f"{base_url}/api/folders/{folder}/upload", data=body, method="POST",
+                                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(request, timeout=600) as response:
+        response.read()
+
+
+def run_ingest(base_url: str, folder: str, source: str, mode: str) -> dict:
+    job = request_json(base_url, "POST", f"/api/folders/{folder}/ingest", {"source": source, "mode": mode})["data"]
+    while job["status"] in ("queued", "running"):
+        time.sleep(0.05)
+        job = request_json(base_url, "GET", f"/api/folders/{folder}/ingest/{job['id']}")["data"]
+    return job
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP 上傳與服務器本地批量導入的耗時對比")
+    parser.add_argument("--files", type=int, default=2000, help="文件數")
+    parser.add_argument("--size-kb", type=int, default=1024, help="每個文件的大小（KB）")
+    parser.add_argument("--batch", type=int, default=50, help="upload 方式每個請求包含的文件數")
+    parser.add_argument("--port", type=int, default=8772)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="sbs-bulk-ingest-")
+    source = os.path.join(data_dir, "renders")
+    os.makedirs(source)
+    paths = []
+    for i in range(args.files):
+        path = os.path.join(source, f"render_{i:05d}.mp4")
+        with open(path, "wb") as f:
+            f.write(FTYP + os.urandom(args.size_kb * 1024 - len(FTYP)))
+        paths.append(path)
+    total_mb = args.files * args.size_kb / 1024
+    print(f"✅ 生成 {args.files} 個文件，共 {total_mb:.0f}MB")
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, DATA_DIR=data_dir, PORT=str(args.port), WEB_CONCURRENCY="1")
+    server = subprocess.Popen([sys.executable, "-u", "main_railway.py"], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                request_json(base_url, "GET", "/api/health")
+                break
+            except Exception:
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError("服務啟動失敗")
+                time.sleep(0.2)
+
+        request_json(base_url, "POST", "/api/folders", {"name": "upload"})
+        started = time.time()
+        for i in range(0, len(paths), args.batch):
+            upload_batch(base_url, "upload", paths[i:i + args.batch])
+        elapsed = time.time() - started
+        print(f"upload  {elapsed:7.2f}s  {args.files / elapsed:8.1f} 文件/s  {total_mb / elapsed:7.1f}MB/s")
+
+        for mode in ("auto", "copy"):
+            started = time.time()
+            job = run_ingest(base_url, f"ingest_{mode}", source, mode)
+            elapsed = time.time() - started
+            print(f"{mode:7s} {elapsed:7.2f}s  {args.files / elapsed:8.1f} 文件/s  {total_mb / elapsed:7.1f}MB/s  "
+                  f"狀態 {job['status']}  方式 {job['methods']}  跳過 {job['skipped_files']}")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+多 worker 投票壓力測試
+用 STORAGE_BACKEND=sqlite 和多個 uvicorn worker 啟動 main_railway.py，
+並發提交大量評估，最後檢查數據庫和每個 worker 看到的評估數都與提交數一致（沒有丟票）
+
+用法（在 backend 目錄下）:
+    python benchmarks/multiworker_votes.py --workers 4 --votes 2000 --concurrency 32
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def request_json(base_url: str, method: str, path: str, payload=None, timeout: float = 30):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(
+        base_url + path,
+        data=data,
+        method=method,
+        headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def wait_until_ready(base_url: str, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("服務進程提前退出")
+        try:
+            request_json(base_url, "GET", "/api/health", timeout=2)
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError("等待服務啟動超時")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多 worker 投票壓力測試")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--votes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="sbs-multiworker-")
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(
+        os.environ,
+        DATA_DIR=data_dir,
+        STORAGE_BACKEND="sqlite",
+        WEB_CONCURRENCY=str(args.workers),
+        PORT=str(args.port)
+    )
+    log_path = os.path.join(data_dir, "server.log")
+    log_file = open(log_path, "w")
+    server = subprocess.Popen(
+        [sys.executable, "-u", "main_railway.py"],
+        cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+
+    failures = []
+    try:
+        wait_until_ready(base_url, server)
+        print(f"✅ 服務已啟動: {args.workers} 個 worker, 數據目錄 {data_dir}")
+
+        for name in ("壓測A", "壓測B"):
+            request_json(base_url, "POST", "/api/folders", {"name": name})
+        task = request_json(base_url, "POST", "/api/tasks", {
+            "name": "多 worker 壓測", "folder_a": "壓測A", "folder_b": "壓測B"
+        })["data"]
+        task_id = task["id"]
+
+        def vote(i: int):
+            return request_json(base_url, "POST", "/api/evaluations", {
+                "video_pair_id": f"pair_{task_id}_{i}",
+                "choice": "A" if i % 2 else "B"
+            })
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(vote, range(args.votes)))
+        elapsed = time.time() - started
+        print(f"✅ 提交 {args.votes} 票用時 {elapsed:.2f}s ({args.votes / elapsed:.0f} 票/秒)")
+
+        errors = [r for r in results if not r.get("success")]
+        if errors:
+            failures.append(f"{len(errors)} 個投票請求失敗，例如: {errors[0]}")
+        ids = {r["data"]["id"] for r in results if r.get("success")}
+        if len(ids) != args.votes - len(errors):
+            failures.append(f"評估ID重複: {args.votes - len(errors)} 票只有 {len(ids)} 個不同的ID")
+
+        conn = sqlite3.connect(os.path.join(data_dir, "storage.db"))
+        stored = conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+        conn.close()
+        if stored != args.votes:
+            failures.append(f"數據庫中有 {stored} 票，提交了 {args.votes} 票")
+
+        # 新連接會被分配到不同的 worker，每個 worker 都必須看到全部投票
+        for _ in range(args.workers * 4):
+            count = request_json(base_url, "GET", "/api/evaluations")["count"]
+            stats = request_json(base_url, "GET", f"/api/statistics/{task_id}")["data"]
+            if count != args.votes or stats["total_evaluations"] != args.votes:
+                failures.append(
+                    f"worker 看到 {count} 票（統計 {stats['total_evaluations']} 票），應為 {args.votes} 票"
+                )
+                break
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log_file.close()
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        print(f"服務日誌: {log_path}")
+        sys.exit(1)
+    print("✅ 沒有丟失任何投票")
+
+
+if __name__ == "__main__":
+    main()
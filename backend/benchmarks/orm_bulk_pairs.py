@@ -0,0 +1,154 @@
+"""
+ORM 視頻對批量寫入和按任務查詢的基準測試
+比較逐個構造 ORM 對象（db.add_all）與 executemany 批量插入創建大任務的耗時，
+以及有/沒有複合索引時的常用按任務、按用戶查詢耗時
+
+用法（在 backend 目錄下）:
+    python benchmarks/orm_bulk_pairs.py --pairs 50000 --tasks 10
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def matched_pairs(n: int, tag: str):
+    return [
+        {"video_a": f"/data/{tag}/a/video_{i}.mp4", "video_b": f"/data/{tag}/b/video_{i}.mp4"}
+        for i in range(n)
+    ]
+
+
+def timed(label: str, func, repeat: int = 1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"  {label:<36} {elapsed * 1000:9.2f}ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ORM 視頻對批量寫入/查詢基準")
+    parser.add_argument("--pairs", type=int, default=50000, help="每個任務的視頻對數")
+    parser.add_argument("--tasks", type=int, default=10, help="數據庫中的任務數")
+    parser.add_argument("--evaluations", type=int, default=5, help="每個視頻對的評估數")
+    parser.add_argument("--repeat", type=int, default=20, help="每個查詢重複次數")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="sbs-orm-bulk-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(data_dir, 'bench.db')}"
+    sys.path.insert(0, BACKEND_DIR)
+
+    from sqlalchemy import func, insert, select, text
+    from database.database import SessionLocal, engine, init_db
+    from api.models import Task, VideoPair, Evaluation
+    from api.routes.tasks import video_pair_rows
+
+    init_db()
+    db = SessionLocal()
+
+    def new_task(name: str) -> Task:
+        task = Task(name=name, folder_a_path="/a", folder_b_path="/b")
+        db.add(task)
+        db.commit()
+        return task
+
+    print(f"創建 {args.pairs} 個視頻對的任務:")
+
+    def create_with_orm_objects():
+        task = new_task("orm_objects")
+        db.add_all([
+            VideoPair(
+                task_id=task.id,
+                video_a_path=pair["video_a"],
+                video_b_path=pair["video_b"],
+                video_a_name=os.path.basename(pair["video_a"]),
+                video_b_name=os.path.basename(pair["video_b"])
+            )
+            for pair in matched_pairs(args.pairs, "orm")
+        ])
+        db.commit()
+
+    def create_with_bulk_insert():
+        task = new_task("bulk_insert")
+        db.execute(insert(VideoPair), video_pair_rows(task.id, matched_pairs(args.pairs, "bulk")))
+        db.commit()
+
+    timed("逐個 ORM 對象 (add_all)", create_with_orm_objects)
+    timed("批量插入 (executemany)", create_with_bulk_insert)
+
+    # 構造查詢數據：多個任務、隨機已評估標記和評估記錄
+    rng = random.Random(0)
+    task_ids = []
+    users = [f"user_{i}" for i in range(50)]
+    base_time = datetime(2024, 1, 1)
+    for t in range(args.tasks):
+        task = new_task(f"task_{t}")
+        task_ids.append(task.id)
+        rows = video_pair_rows(task.id, matched_pairs(args.pairs, f"t{t}"))
+        for row in rows:
+            row["is_evaluated"] = rng.random() < 0.5
+        db.execute(insert(VideoPair), rows)
+        pair_ids = db.execute(select(VideoPair.id).where(VideoPair.task_id == task.id)).scalars().all()
+        sample = rng.sample(pair_ids, min(len(pair_ids), max(1, args.pairs // 10)))
+        db.execute(insert(Evaluation), [
+            {
+                "task_id": task.id,
+                "video_pair_id": pair_id,
+                "user_id": rng.choice(users),
+                "choice": rng.choice(("A", "B", "tie")),
+                "created_at": base_time + timedelta(seconds=rng.randrange(10 ** 7))
+            }
+            for pair_id in sample
+            for _ in range(args.evaluations)
+        ])
+        db.commit()
+    print(f"✅ 已寫入 {args.tasks} 個任務，共 {db.query(VideoPair).count()} 個視頻對、"
+          f"{db.query(Evaluation).count()} 條評估")
+
+    task_id = task_ids[len(task_ids) // 2]
+    pair_id = db.execute(
+        select(Evaluation.video_pair_id).where(Evaluation.task_id == task_id).limit(1)
+    ).scalar_one()
+
+    queries = {
+        "任務的全部視頻對": lambda: db.execute(
+            select(VideoPair.id).where(VideoPair.task_id == task_id)).all(),
+        "任務的未評估視頻對數": lambda: db.execute(
+            select(func.count()).select_from(VideoPair)
+            .where(VideoPair.task_id == task_id, VideoPair.is_evaluated.is_(False))).scalar(),
+        "視頻對的評估": lambda: db.execute(
+            select(Evaluation.id)
+            .where(Evaluation.task_id == task_id, Evaluation.video_pair_id == pair_id)).all(),
+        "用戶最近 20 條評估": lambda: db.execute(
+            select(Evaluation.id).where(Evaluation.user_id == "user_7")
+            .order_by(Evaluation.created_at.desc()).limit(20)).all(),
+    }
+
+    index_names = [index.name for model in (VideoPair, Evaluation) for index in model.__table__.indexes]
+
+    for title, drop in (("沒有複合索引", True), ("有複合索引", False)):
+        with engine.begin() as connection:
+            for index in (i for model in (VideoPair, Evaluation) for i in model.__table__.indexes):
+                if drop:
+                    index.drop(bind=connection, checkfirst=True)
+                else:
+                    index.create(bind=connection, checkfirst=True)
+            connection.execute(text("ANALYZE"))
+        print(f"{title}:")
+        for label, query in queries.items():
+            timed(label, query, repeat=args.repeat)
+
+    print(f"索引: {', '.join(index_names)}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
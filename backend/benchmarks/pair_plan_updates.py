@@ -0,0 +1,134 @@
+"""
+增量重新配對測試
+啟動 main.py，兩個資料夾各放入 --files 個按名稱配對的視頻（清理後匹配），創建 --tasks 個使用它們的任務
+並打開一次（完整生成方案）。然後對比加入一個文件後重新打開所有任務的耗時：
+- 增量: 通過上傳接口加入，鉤子更新文件名索引並只修改各任務中受影響的視頻對
+- 完整: 直接寫入資料夾（沒有經過鉤子），打開任務時按資料夾版本變化完整重新生成
+打開任務的耗時大部分是返回整個方案，另外測一次沒有變化時打開所有任務的耗時作為基準，
+兩種方式的耗時都按超出基準的部分比較；並檢查增量修改後原有視頻對的 ID 和左右順序不變
+
+用法（在 backend 目錄下）:
+    python benchmarks/pair_plan_updates.py --files 3000 --tasks 5
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 文件以 MP4 的 ftyp box 開頭，能通過文件頭簽名檢查
+FTYP = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2"
+
+
+def request_json(base_url: str, method: str, path: str, payload=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return json.loads(response.read())
+
+
+def upload_file(base_url: str, folder: str, filename: str):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: video/mp4\r\n\r\n").encode() + FTYP + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(f"{base_url}/api/folders/{folder}/upload", data=body, method="POST",
+                                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(request, timeout=600) as response:
+        response.read()
+
+
+def open_tasks(base_url: str, task_ids):
+    return {task_id: request_json(base_url, "GET", f"/api/tasks/{task_id}")["data"]["video_pairs"]
+            for task_id in task_ids}
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="加入一個文件後增量修改與完整重新生成視頻對方案的耗時對比")
+    parser.add_argument("--files", type=int, default=3000, help="每個資料夾的文件數")
+    parser.add_argument("--tasks", type=int, default=5, help="使用這兩個資料夾的任務數")
+    parser.add_argument("--port", type=int, default=8773)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    work_dir = tempfile.mkdtemp(prefix="sbs-pair-updates-")
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(args.port)],
+        cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                request_json(base_url, "GET", "/api/health")
+                break
+            except Exception:
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError("服務啟動失敗")
+                time.sleep(0.2)
+
+        for folder in ("left", "right"):
+            request_json(base_url, "POST", "/api/folders/create", {"name": folder})
+            os.makedirs(os.path.join(work_dir, "uploads", folder), exist_ok=True)
+        # 兩側的種子號不同，沒有精確同名的文件，按清理後的名稱配對
+        for i in range(args.files):
+            for folder in ("left", "right"):
+                path = os.path.join(work_dir, "uploads", folder, f"shot{i:05d}_seed{rng.randrange(10 ** 6)}.mp4")
+                with open(path, "wb") as f:
+                    f.write(FTYP)
+        task_ids = [
+            request_json(base_url, "POST", "/api/tasks/",
+                         {"name": f"bench_{n}", "folder_a": "left", "folder_b": "right"})["data"]["id"]
+            for n in range(args.tasks)
+        ]
+        plans, elapsed = timed(open_tasks, base_url, task_ids)
+        print(f"✅ {args.tasks} 個任務各 {len(plans[task_ids[0]])} 個視頻對，首次打開 {elapsed:.2f}s")
+        _, baseline = timed(open_tasks, base_url, task_ids)
+        print(f"基準  沒有變化時打開任務 {baseline:6.3f}s")
+
+        # 增量：上傳鉤子修改方案，打開任務時直接返回
+        upload_file(base_url, "left", f"shot{args.files:05d}_seed1.mp4")
+        _, upload_time = timed(upload_file, base_url, "right", f"shot{args.files:05d}_seed2.mp4")
+        updated, open_time = timed(open_tasks, base_url, task_ids)
+        stable = all(
+            {p["id"]: p["is_swapped"] for p in plans[task_id]}.items()
+            <= {p["id"]: p["is_swapped"] for p in updated[task_id]}.items()
+            for task_id in task_ids
+        )
+        incremental = upload_time + max(open_time - baseline, 0.0)
+        print(f"增量  上傳 {upload_time:6.3f}s  打開任務 {open_time:6.3f}s  超出基準 {incremental:6.3f}s  "
+              f"視頻對 {len(updated[task_ids[0]])}  原有視頻對不變: {'✅' if stable else '❌'}")
+
+        # 完整：文件不經過鉤子加入，打開任務時重新生成
+        for folder, seed in (("left", 3), ("right", 4)):
+            with open(os.path.join(work_dir, "uploads", folder, f"shot{args.files + 1:05d}_seed{seed}.mp4"), "wb") as f:
+                f.write(FTYP)
+        rebuilt, rebuild_time = timed(open_tasks, base_url, task_ids)
+        full = max(rebuild_time - baseline, 0.0)
+        print(f"完整  打開任務 {rebuild_time:6.3f}s  超出基準 {full:6.3f}s  視頻對 {len(rebuilt[task_ids[0]])}  "
+              f"（增量快 {full / max(incremental, 1e-9):.1f}x）")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+上傳內存佔用測試
+啟動 main_railway.py，並發上傳多個大文件（客戶端流式發送 multipart 請求體），
+上傳結束後讀取服務進程的峰值常駐內存（/proc/<pid>/status 中的 VmHWM），
+檢查它不隨文件大小和並發數增長
+
+用法（在 backend 目錄下，僅支持 Linux）:
+    python benchmarks/upload_memory.py --size-mb 512 --uploaders 4
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import subprocess
+import http.client
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOCK = os.urandom(1024 * 1024)
+# 上傳內容以 MP4 的 ftyp box 開頭，能通過文件頭簽名檢查
+FTYP = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2"
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def request_json(base_url: str, method: str, path: str, payload=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def upload(port: int, folder: str, filename: str, size_mb: int) -> int:
+    """流式發送一個 size_mb 大小的文件，客戶端不在內存中構造整個請求體"""
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+        "Content-Type: video/mp4\r\n\r\n"
+    ).encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+    length = len(head) + len(FTYP) + size_mb * len(BLOCK) + len(tail)
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+    conn.putrequest("POST", f"/api/folders/{folder}/upload")
+    conn.putheader("Content-Type", f"multipart/form-data; boundary={boundary}")
+    conn.putheader("Content-Length", str(length))
+    conn.endheaders()
+    conn.send(head)
+    conn.send(FTYP)
+    for _ in range(size_mb):
+        conn.send(BLOCK)
+    conn.send(tail)
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上傳內存佔用測試")
+    parser.add_argument("--size-mb", type=int, default=512, help="每個上傳文件的大小（MB）")
+    parser.add_argument("--uploaders", type=int, default=4, help="並發上傳數")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="sbs-upload-memory-")
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, DATA_DIR=data_dir, PORT=str(args.port), WEB_CONCURRENCY="1")
+    server = subprocess.Popen([sys.executable, "-u", "main_railway.py"], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                request_json(base_url, "GET", "/api/health")
+                break
+            except Exception:
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError("服務啟動失敗")
+                time.sleep(0.2)
+
+        request_json(base_url, "POST", "/api/folders", {"name": "memory"})
+        baseline = peak_rss_mb(server.pid)
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.uploaders) as executor:
+            statuses = list(executor.map(
+                lambda i: upload(args.port, "memory", f"video_{i}.mp4", args.size_mb),
+                range(args.uploaders)
+            ))
+        elapsed = time.time() - started
+        peak = peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=15)
+
+    total_mb = args.size_mb * args.uploaders
+    print(f"上傳 {args.uploaders} x {args.size_mb}MB，狀態碼 {statuses}，用時 {elapsed:.1f}s "
+          f"({total_mb / elapsed:.0f} MB/s)")
+    print(f"服務峰值內存: 啟動後 {baseline:.0f}MB，上傳後 {peak:.0f}MB（增長 {peak - baseline:.0f}MB）")
+    if any(status != 200 for status in statuses):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+文件名模糊匹配測試
+生成兩組渲染輸出的文件名：大部分在標準化後同名（不同的處理後綴），一部分只是相似
+（種子號、拼寫不同），其餘沒有對應；B 組打亂順序。
+對比原來逐一計算 A×B 相似度的實現與 utils.video_matcher.match_videos（FuzzyNameIndex），
+並檢查兩者的結果完全一致。原實現是 O(n·m) 的，默認只在較小的規模上運行。
+--optimal-files 規模上再對比貪心匹配與 optimal_match_videos（相似度矩陣 + 最優配對）的
+耗時和總相似度，並檢查最優配對不受A的順序影響。
+
+用法（在 backend 目錄下）:
+    python benchmarks/video_matcher.py --files 10000 --legacy-files 1000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from utils.video_matcher import calculate_similarity, match_videos, optimal_match_videos  # noqa: E402
+
+SCENES = ["forest", "city_night", "ocean", "desert_storm", "portrait", "street", "snow", "interior"]
+SUFFIXES = ["_compressed", "_enhanced", "_1080p", "_final", "_output", "_v2", "(1)"]
+
+
+def legacy_match_videos(videos_a, videos_b, threshold=0.6):
+    """原來的實現：每個A視頻對每個未使用的B視頻計算一次 calculate_similarity"""
+    matched_pairs = []
+    used_b_videos = set()
+    for video_a in videos_a:
+        best_match = None
+        best_similarity = 0.0
+        for video_b in videos_b:
+            if video_b in used_b_videos:
+                continue
+            similarity = calculate_similarity(video_a, video_b)
+            if similarity > best_similarity and similarity >= threshold:
+                best_similarity = similarity
+                best_match = video_b
+        if best_match:
+            matched_pairs.append({
+                'video_a': video_a,
+                'video_b': best_match,
+                'similarity': best_similarity,
+                'completed': False
+            })
+            used_b_videos.add(best_match)
+    matched_pairs.sort(key=lambda x: x['similarity'], reverse=True)
+    return matched_pairs
+
+
+def typo(rng: random.Random, name: str) -> str:
+    position = rng.randrange(len(name))
+    return name[:position] + rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") + name[position + 1:]
+
+
+def generate(count: int, fuzzy_ratio: float, unmatched_ratio: float, seed: int):
+    rng = random.Random(seed)
+    videos_a, videos_b = [], []
+    for i in range(count):
+        stem = f"{rng.choice(SCENES)}_shot{i:05d}_seed{rng.randrange(10 ** 6)}"
+        videos_a.append(f"{stem}.mp4")
+        roll = rng.random()
+        if roll < unmatched_ratio:
+            videos_b.append(f"unrelated_{rng.randrange(10 ** 9)}_{i}.mp4")
+        elif roll < unmatched_ratio + fuzzy_ratio:
+            videos_b.append(f"{typo(rng, stem)}{rng.choice(SUFFIXES)}.mov")
+        else:
+            videos_b.append(f"{stem}{rng.choice(SUFFIXES)}.mp4")
+    rng.shuffle(videos_b)
+    return videos_a, videos_b
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模糊文件名匹配：原實現與索引實現的耗時和結果對比")
+    parser.add_argument("--files", type=int, default=10000, help="每組文件數")
+    parser.add_argument("--legacy-files", type=int, default=1000, help="運行原實現的每組文件數，0 表示不運行")
+    parser.add_argument("--optimal-files", type=int, default=2000, help="對比最優配對的每組文件數，0 表示不運行")
+    parser.add_argument("--fuzzy", type=float, default=0.15, help="只是相似（非同名）的比例")
+    parser.add_argument("--unmatched", type=float, default=0.05, help="沒有對應文件的比例")
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.legacy_files:
+        videos_a, videos_b = generate(args.legacy_files, args.fuzzy, args.unmatched, args.seed)
+        legacy, legacy_time = timed(legacy_match_videos, videos_a, videos_b, args.threshold)
+        indexed, indexed_time = timed(match_videos, videos_a, videos_b, args.threshold)
+        status = "✅ 結果一致" if legacy == indexed else "❌ 結果不一致"
+        print(f"{args.legacy_files} × {args.legacy_files}: 原實現 {legacy_time:8.2f}s  索引 {indexed_time:6.2f}s  "
+              f"加速 {legacy_time / indexed_time:6.0f}x  匹配 {len(indexed)} 對  {status}")
+
+    if args.optimal_files:
+        videos_a, videos_b = generate(args.optimal_files, args.fuzzy, args.unmatched, args.seed)
+        greedy, greedy_time = timed(match_videos, videos_a, videos_b, args.threshold)
+        optimal, optimal_time = timed(optimal_match_videos, videos_a, videos_b, args.threshold)
+        reversed_pairs = optimal_match_videos(videos_a[::-1], videos_b, args.threshold)
+        same = {(p["video_a"], p["video_b"]) for p in optimal} == {(p["video_a"], p["video_b"]) for p in reversed_pairs}
+        for label, pairs, elapsed in (("貪心", greedy, greedy_time), ("最優", optimal, optimal_time)):
+            total = sum(p["similarity"] for p in pairs)
+            print(f"{args.optimal_files} × {args.optimal_files} {label}: {elapsed:6.2f}s  匹配 {len(pairs)} 對  "
+                  f"總相似度 {total:9.3f}  平均 {total / max(len(pairs), 1):.4f}")
+        print(f"最優配對與A的順序無關: {'✅' if same else '❌'}")
+
+    videos_a, videos_b = generate(args.files, args.fuzzy, args.unmatched, args.seed)
+    indexed, indexed_time = timed(match_videos, videos_a, videos_b, args.threshold)
+    estimate = legacy_time * (args.files / args.legacy_files) ** 2 if args.legacy_files else None
+    line = f"{args.files} × {args.files}: 索引 {indexed_time:6.2f}s  匹配 {len(indexed)} 對"
+    if estimate is not None:
+        line += f"  （原實現按 O(n·m) 估計約 {estimate / 60:.0f} 分鐘）"
+    print(line)
+
+
+if __name__ == "__main__":
+    main()
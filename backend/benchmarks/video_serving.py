@@ -0,0 +1,184 @@
+"""
+視頻服務對比：StaticFiles 掛載 vs 專門的視頻路由（utils/video_serving.py）
+模擬盲測播放器的 seek：並發發送隨機位置的 Range 請求，並穿插帶 If-None-Match 的重新驗證請求，
+分別統計吞吐量、傳輸量和 p50/p99 延遲。
+（本項目使用的 Starlette 版本中 StaticFiles 不支持 Range，每次 seek 都會返回整個文件）
+
+用法（在 backend 目錄下）:
+    python benchmarks/video_serving.py --size-mb 64 --requests 400 --concurrency 16
+    python benchmarks/video_serving.py --size-mb 64 --requests 100 --full
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_app(mode: str, directory: str):
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.staticfiles import StaticFiles
+
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if mode == "staticfiles":
+        app.mount("/uploads", StaticFiles(directory=directory), name="uploads")
+        return app
+
+    from utils.video_serving import StatCache, resolve_served_path, serve_file
+    stat_cache = StatCache()
+
+    @app.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+    async def serve_upload(file_path: str, request: Request):
+        path = resolve_served_path(directory, file_path)
+        if path is None:
+            raise HTTPException(status_code=404)
+        return await serve_file(request, path, stat_cache)
+
+    return app
+
+
+def serve(mode: str, port: int, directory: str):
+    import uvicorn
+    uvicorn.run(build_app(mode, directory), host="127.0.0.1", port=port, log_level="warning")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+_local = threading.local()
+
+
+def request(port: int, path: str, headers: dict):
+    """每個線程複用一個 keep-alive 連接，返回 (狀態碼, 響應體字節數, 響應頭)"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    conn.request("GET", path, headers=headers)
+    response = conn.getresponse()
+    received = 0
+    while True:
+        chunk = response.read(1024 * 1024)
+        if not chunk:
+            break
+        received += len(chunk)
+    return response.status, received, response.headers
+
+
+def run_mode(mode: str, args, directory: str, size: int) -> dict:
+    global _local
+    _local = threading.local()  # 不複用上一個服務的連接
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(args.port),
+         "--directory", directory],
+        cwd=BACKEND_DIR
+    )
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", args.port, timeout=1)
+                conn.request("GET", "/ping")
+                conn.getresponse().read()
+                break
+            except Exception:
+                if server.poll() is not None or time.time() > deadline:
+                    raise RuntimeError(f"{mode} 服務啟動失敗")
+                time.sleep(0.2)
+
+        path = "/uploads/bench.mp4"
+        _, _, headers = request(args.port, path, {"Range": "bytes=0-0"})
+        etag = headers.get("etag") or '"none"'
+
+        rng = random.Random(42)
+        range_bytes = args.range_kb * 1024
+        plans = []
+        for i in range(args.requests):
+            if args.full:
+                plans.append({})
+            elif i % 5 == 4:
+                # 播放器重新打開同一個視頻時的緩存驗證
+                plans.append({"If-None-Match": etag})
+            else:
+                start = rng.randrange(0, max(size - range_bytes, 1))
+                plans.append({"Range": f"bytes={start}-{start + range_bytes - 1}"})
+
+        def timed(headers):
+            started = time.perf_counter()
+            status, received, _ = request(args.port, path, headers)
+            return (time.perf_counter() - started) * 1000, status, received
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(timed, plans))
+        elapsed = time.time() - started
+
+        latencies = [r[0] for r in results]
+        statuses = {}
+        for _, status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        transferred = sum(r[2] for r in results)
+        return {
+            "throughput": args.requests / elapsed,
+            "transferred_mb": transferred / 1024 / 1024,
+            "p50": statistics.median(latencies),
+            "p99": percentile(latencies, 0.99),
+            "statuses": statuses,
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StaticFiles 與視頻路由的範圍請求對比")
+    parser.add_argument("--size-mb", type=int, default=64, help="測試視頻大小（MB）")
+    parser.add_argument("--range-kb", type=int, default=512, help="每次 seek 請求的範圍大小（KB）")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--full", action="store_true", help="只請求整個文件（對比純傳輸吞吐）")
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--serve", choices=("staticfiles", "video_route"), help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        sys.path.insert(0, BACKEND_DIR)
+        serve(args.serve, args.port, args.directory)
+        return
+
+    directory = tempfile.mkdtemp(prefix="sbs-video-serving-")
+    size = args.size_mb * 1024 * 1024
+    with open(os.path.join(directory, "bench.mp4"), "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(block)
+    workload = "整個文件" if args.full else "Range 請求（每 5 個中 1 個為 If-None-Match）"
+    print(f"✅ 測試視頻 {args.size_mb}MB，{args.requests} 個{workload}，並發 {args.concurrency}")
+
+    for mode in ("staticfiles", "video_route"):
+        result = run_mode(mode, args, directory, size)
+        print(f"{mode:12s} 吞吐 {result['throughput']:7.1f} req/s  傳輸 {result['transferred_mb']:8.1f}MB  "
+              f"p50 {result['p50']:7.1f}ms  p99 {result['p99']:7.1f}ms  狀態碼 {result['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
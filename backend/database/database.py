@@ -1,9 +1,13 @@
 """
 數據庫配置和連接管理
 使用 SQLAlchemy 進行 ORM 操作
+同步引擎（SessionLocal）用於腳本和初始化，API 路由使用異步引擎（AsyncSessionLocal），
+查詢不會阻塞事件循環
 """
 
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, event, MetaData
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -11,6 +15,27 @@ import os
 # 數據庫配置
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./side_by_side.db")
 
+# 同步驅動對應的異步驅動
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def to_async_url(url: str) -> str:
+    """把同步數據庫 URL 轉換為對應異步驅動的 URL（已指定驅動的保持不變）"""
+    parsed = make_url(url)
+    if "+" in parsed.drivername:
+        return url
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        raise ValueError(f"不支持的數據庫類型: {parsed.drivername}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
 # 創建數據庫引擎
 engine = create_engine(
     DATABASE_URL,
@@ -21,6 +46,31 @@ engine = create_engine(
 # 創建會話工廠
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 異步引擎（SQLite 使用 aiosqlite，查詢在驅動的後台線程中執行）
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+
+# 異步會話工廠；提交後不過期對象，避免在響應序列化時觸發隱式 IO
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    """SQLite 連接使用 WAL 和忙等待，並發讀寫時不會立即報 database is locked"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+if "sqlite" in DATABASE_URL:
+    event.listen(engine, "connect", _configure_sqlite)
+if "sqlite" in ASYNC_DATABASE_URL:
+    event.listen(async_engine.sync_engine, "connect", _configure_sqlite)
+
 # 創建基礎模型類
 Base = declarative_base()
 
@@ -40,12 +90,30 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """
+    獲取異步數據庫會話
+    用於依賴注入
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _create_missing_indexes(connection):
+    """create_all 不會給已存在的表補建索引，這裡逐個補上"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+
 def init_db():
     """
     初始化數據庫
-    創建所有表
+    創建所有表和索引
     """
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        _create_missing_indexes(connection)
     print("✅ 數據庫表創建完成")
 
 
@@ -56,4 +124,15 @@ def reset_db():
     """
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
-    print("🔄 數據庫已重置") 
\ No newline at end of file
+    print("🔄 數據庫已重置") 
+
+
+async def init_async_db():
+    """
+    使用異步引擎初始化數據庫
+    創建所有表和索引
+    """
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+    print("✅ 數據庫表創建完成")
@@ -0,0 +1,90 @@
+"""
+進程內共享的 JSON 文檔緩存
+同一路徑的文件在整個進程中只保留一份解析結果，只有文件的
+(mtime, size, inode) 變化時才重新解析；通過 save() 寫入的數據立即對後續讀取可見
+"""
+
+import os
+import json
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.file_utils import atomic_write_json
+
+
+class CachedDocument:
+    """單個 JSON 文件的緩存"""
+
+    def __init__(self, path: str, default_factory: Callable[[], Any] = dict):
+        self.path = path
+        self.default_factory = default_factory
+        self._lock = threading.Lock()
+        self._data: Any = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._loaded = False
+
+    def _stat_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        # 原子寫入（rename）會換 inode，即使 mtime 精度不足也能發現變化
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self) -> Any:
+        """
+        返回文檔內容（進程內共享的對象）
+
+        只有文件簽名變化時才重新讀取和解析，未變化時只有一次 stat
+        """
+        signature = self._stat_signature()
+        with self._lock:
+            if self._loaded and signature == self._signature:
+                return self._data
+
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    # 簽名取自實際打開的文件：讀取後才被替換時，下次讀取能發現變化
+                    st = os.fstat(f.fileno())
+                    signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+                    data = json.load(f)
+            except FileNotFoundError:
+                data = self.default_factory()
+                signature = None
+
+            self._data = data
+            self._signature = signature
+            self._loaded = True
+            return data
+
+    def save(self, data: Any, indent: Optional[int] = 2):
+        """原子化寫入文件並更新緩存（寫後讀一致）"""
+        with self._lock:
+            try:
+                atomic_write_json(self.path, data, indent=indent)
+            except Exception:
+                # 調用方可能已經修改了緩存中的共享對象，寫入失敗時丟棄緩存
+                self._loaded = False
+                raise
+            self._data = data
+            self._signature = self._stat_signature()
+            self._loaded = True
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+
+_documents: Dict[str, CachedDocument] = {}
+_documents_lock = threading.Lock()
+
+
+def get_document(path: str, default_factory: Callable[[], Any] = dict) -> CachedDocument:
+    """按絕對路徑返回進程內共享的文檔緩存，不同模塊讀取同一文件時共用一份解析結果"""
+    key = os.path.abspath(path)
+    with _documents_lock:
+        document = _documents.get(key)
+        if document is None:
+            document = CachedDocument(path, default_factory)
+            _documents[key] = document
+        return document
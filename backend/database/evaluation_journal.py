@@ -0,0 +1,270 @@
+"""
+評估數據的追加式日誌（journal）
+每次投票只追加一行 JSONL，並由後台線程合併 fsync（group commit），
+日誌過長時再在後台壓縮（compaction）成完整快照
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+from typing import Dict, List, Optional, Set
+
+from database.repository import EvaluationExists
+from utils.file_utils import atomic_write_json
+
+
+class EvaluationJournal:
+    """
+    評估數據的 快照 + 追加日誌 持久化
+
+    - 快照文件（如 evaluations.json）仍是原來的評估列表格式
+    - 日誌文件（快照路徑 + ".journal"）每行一條新增的評估
+    - 啟動時先載入快照，再重放日誌尾部
+    - 追加已存在的評估ID時拋出 EvaluationExists（與 SQLite 後端一致，不覆蓋已有的投票）
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        commit_interval: float = 0.05,
+        compact_threshold: int = 10000
+    ):
+        """
+        Args:
+            snapshot_path: 快照文件路徑
+            commit_interval: group commit 的最長等待時間（秒）
+            compact_threshold: 日誌累積多少條後觸發後台壓縮
+        """
+        self.snapshot_path = snapshot_path
+        self.journal_path = f"{snapshot_path}.journal"
+        # 壓縮進行中時，舊日誌會被輪換到這個路徑
+        self.compacting_path = f"{snapshot_path}.journal.compacting"
+        self.commit_interval = commit_interval
+        self.compact_threshold = compact_threshold
+
+        # 鎖順序固定為 _compact_lock -> _sync_lock -> _write_lock，避免死鎖
+        self._compact_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._durable = threading.Condition()
+
+        self._file = None
+        self._written_seq = 0
+        self._durable_seq = 0
+        self._journal_entries = 0
+        # 已寫入的評估ID（load/rewrite 時重置）
+        self._ids: Set[str] = set()
+
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    # ---------- 載入 ----------
+
+    def load(self) -> List[Dict]:
+        """載入快照並重放日誌，返回完整的評估列表"""
+        evaluations = []
+        try:
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    evaluations = json.load(f)
+        except Exception as e:
+            print(f"❌ 載入評估快照失敗: {e}")
+
+        seen_ids = {e.get("id") for e in evaluations}
+        replayed = 0
+        for path in (self.compacting_path, self.journal_path):
+            for record in self._read_journal(path):
+                # 快照寫入後、舊日誌刪除前崩潰時，同一條記錄可能同時出現在兩邊
+                if record.get("id") in seen_ids:
+                    continue
+                seen_ids.add(record.get("id"))
+                evaluations.append(record)
+                replayed += 1
+
+        self._journal_entries = replayed
+        with self._write_lock:
+            self._ids = seen_ids
+        print(f"✅ 載入了 {len(evaluations)} 個評估（日誌重放 {replayed} 條）")
+        return evaluations
+
+    def _read_journal(self, path: str) -> List[Dict]:
+        """讀取一個日誌文件，忽略崩潰時寫了一半的最後一行"""
+        records = []
+        if not os.path.exists(path):
+            return records
+
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"⚠️ 日誌 {path} 第 {line_no} 行不完整，已忽略")
+        return records
+
+    # ---------- 生命週期 ----------
+
+    def start(self):
+        """打開日誌文件並啟動後台 flush 線程"""
+        if self._flusher is not None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        # 上次壓縮中途退出時，先把遺留的輪換日誌合併進快照
+        if os.path.exists(self.compacting_path):
+            with self._compact_lock:
+                self._merge_compacting()
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        self._stop.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name="evaluation-journal", daemon=True)
+        self._flusher.start()
+
+    def close(self):
+        """停止後台線程，並保證所有已追加的記錄落盤"""
+        if self._flusher is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._flusher.join()
+        self._flusher = None
+        self._sync()
+        with self._write_lock:
+            self._file.close()
+            self._file = None
+
+    # ---------- 寫入 ----------
+
+    def append(self, record: Dict) -> int:
+        """
+        追加一條評估記錄（只寫入緩衝區，不等待落盤）
+
+        Returns:
+            該記錄的序號，可用於 wait_durable
+
+        Raises:
+            EvaluationExists: 相同ID的評估已經寫入過
+        """
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+        with self._write_lock:
+            if self._file is None:
+                raise RuntimeError("評估日誌尚未啟動")
+            if record.get("id") in self._ids:
+                raise EvaluationExists(record.get("id"))
+            self._file.write(line)
+            self._ids.add(record.get("id"))
+            self._written_seq += 1
+            self._journal_entries += 1
+            seq = self._written_seq
+        self._wakeup.set()
+        return seq
+
+    def wait_durable(self, seq: int, timeout: Optional[float] = None) -> bool:
+        """阻塞直到序號 seq 之前的記錄都已 fsync"""
+        with self._durable:
+            return self._durable.wait_for(lambda: self._durable_seq >= seq, timeout=timeout)
+
+    async def append_async(self, record: Dict) -> int:
+        """追加記錄並在不阻塞事件循環的情況下等待 group commit 完成"""
+        seq = self.append(record)
+        await asyncio.get_running_loop().run_in_executor(None, self.wait_durable, seq)
+        return seq
+
+    def rewrite(self, evaluations: List[Dict]):
+        """
+        用完整列表覆蓋快照並清空日誌
+
+        用於刪除、清空等無法用追加表示的操作
+        """
+        with self._compact_lock, self._sync_lock, self._write_lock:
+            atomic_write_json(self.snapshot_path, evaluations)
+            if self._file is not None:
+                self._file.close()
+                self._file = open(self.journal_path, 'w', encoding='utf-8')
+            elif os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            if os.path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+            self._journal_entries = 0
+            self._ids = {e.get("id") for e in evaluations}
+            seq = self._written_seq
+
+        with self._durable:
+            self._durable_seq = max(self._durable_seq, seq)
+            self._durable.notify_all()
+        print(f"✅ 保存了 {len(evaluations)} 個評估（快照重寫）")
+
+    # ---------- 後台線程 ----------
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
+            # 等待一小段時間，讓同一時間窗口內的投票合併到一次 fsync
+            time.sleep(self.commit_interval)
+            try:
+                self._sync()
+                if self._journal_entries >= self.compact_threshold and not self._compact_lock.locked():
+                    # 壓縮在獨立線程進行，期間新投票的 fsync 不受影響
+                    threading.Thread(target=self.compact, name="evaluation-compaction", daemon=True).start()
+            except Exception as e:
+                print(f"❌ 評估日誌 flush 失敗: {e}")
+
+    def _sync(self):
+        """把緩衝區寫入內核並 fsync，一次覆蓋所有已追加的記錄"""
+        with self._sync_lock:
+            with self._write_lock:
+                if self._file is None or self._written_seq == self._durable_seq:
+                    return
+                self._file.flush()
+                target_seq = self._written_seq
+                fd = self._file.fileno()
+            # fsync 期間不持有寫鎖，新的投票可以繼續追加
+            os.fsync(fd)
+
+        with self._durable:
+            self._durable_seq = max(self._durable_seq, target_seq)
+            self._durable.notify_all()
+
+    def compact(self):
+        """把 快照 + 日誌 合併成新的快照，然後刪除舊日誌"""
+        with self._compact_lock:
+            # 上一次合併失敗遺留的輪換日誌要先合併，輪換時不能覆蓋它；合併失敗時拋出異常，不輪換
+            if os.path.exists(self.compacting_path):
+                self._merge_compacting()
+            with self._sync_lock, self._write_lock:
+                if self._file is None:
+                    return
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                synced_seq = self._written_seq
+                # 輪換日誌：之後的追加寫入新文件，舊文件在後台合併
+                os.replace(self.journal_path, self.compacting_path)
+                self._file = open(self.journal_path, 'a', encoding='utf-8')
+                self._journal_entries = 0
+
+            with self._durable:
+                self._durable_seq = max(self._durable_seq, synced_seq)
+                self._durable.notify_all()
+
+            self._merge_compacting()
+
+    def _merge_compacting(self):
+        """把輪換出來的舊日誌合併進快照（調用方需持有 _compact_lock）"""
+        snapshot = []
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        seen_ids = {e.get("id") for e in snapshot}
+        for record in self._read_journal(self.compacting_path):
+            if record.get("id") not in seen_ids:
+                seen_ids.add(record.get("id"))
+                snapshot.append(record)
+
+        atomic_write_json(self.snapshot_path, snapshot)
+        os.remove(self.compacting_path)
+        print(f"✅ 評估日誌已壓縮，快照包含 {len(snapshot)} 個評估")
@@ -0,0 +1,261 @@
+"""
+緊湊的評估表
+評估不再以字典保存，而是按列存放在並行的 array 中：評估ID和視頻對ID拆成整數，
+任務ID和重複出現的字符串（如 user_agent）只保存一份，選擇結果只佔 1 個字節。
+只有在 API 邊界才按原來的 JSON 結構（包括鍵順序）還原成字典。
+"""
+
+import re
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 選擇結果的 1 字節編碼
+CHOICES = (None, "A", "B", "tie")
+CHOICE_CODES = {choice: code for code, choice in enumerate(CHOICES)}
+
+# 三種應用生成的視頻對ID格式
+PAIR_ID_FORMATS = (
+    "{task}_pair_{n}",   # main.py
+    "pair_{task}_{n}",   # main_railway.py
+    "{task}_{n}",        # api 路由
+)
+_PAIR_ID_PATTERNS = (
+    re.compile(r"^(?P<task>.+)_pair_(?P<n>\d+)$"),
+    re.compile(r"^pair_(?P<task>.+)_(?P<n>\d+)$"),
+    re.compile(r"^(?P<task>.+)_(?P<n>\d+)$"),
+)
+_EVAL_ID_PATTERN = re.compile(r"^eval_(?P<n>\d+)(?:_(?P<ts>\d+))?$")
+
+# 值為重複字符串的字段，按下標引用字符串表
+INTERNED_FIELDS = ("task_id", "user_agent")
+
+# 可以按列保存的字段，其他字段出現時整條評估按原字典保存
+COLUMN_FIELDS = frozenset(("id", "video_pair_id", "choice", "is_blind", "created_time") + INTERNED_FIELDS)
+
+_FALLBACK_SHAPE = 0
+_UINT32_MAX = 0xFFFFFFFF
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class EvaluationTable:
+    """按列存放的評估表，行號即插入順序"""
+
+    def __init__(self, evaluations: Iterable[Dict] = ()):
+        # 鍵順序表，下標 0 表示該行無法按列保存，原字典在 _fallback 中
+        self._shapes: List[Optional[Tuple[str, ...]]] = [None]
+        self._shape_codes: Dict[Tuple[str, ...], int] = {}
+        self._strings: List[str] = []
+        self._string_codes: Dict[str, int] = {}
+        self._fallback: Dict[int, Dict] = {}
+
+        self._shape = array('B')
+        self._id_num = array('Q')
+        self._id_ts = array('q')        # -1 表示ID沒有時間戳後綴
+        self._task = array('I')         # 視頻對所屬任務在字符串表中的下標
+        self._pair_no = array('I')
+        self._pair_format = array('B')
+        self._choice = array('B')
+        self._blind = array('B')
+        self._created = array('q')
+        self._interned = {field: array('I') for field in INTERNED_FIELDS}
+
+        for evaluation in evaluations:
+            self.append(evaluation)
+
+    def __len__(self) -> int:
+        return len(self._shape)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for row in range(len(self)):
+            yield self.materialize(row)
+
+    # ---------- 編碼 ----------
+
+    def _intern(self, value: str) -> int:
+        code = self._string_codes.get(value)
+        if code is None:
+            code = len(self._strings)
+            self._strings.append(value)
+            self._string_codes[value] = code
+        return code
+
+    def _shape_code(self, keys: Tuple[str, ...]) -> Optional[int]:
+        code = self._shape_codes.get(keys)
+        if code is None:
+            if len(self._shapes) > 255:
+                return None
+            code = len(self._shapes)
+            self._shapes.append(keys)
+            self._shape_codes[keys] = code
+        return code
+
+    @staticmethod
+    def _split_pair_id(pair_id: str) -> Optional[Tuple[str, int, int]]:
+        """把視頻對ID拆成 (任務ID, 序號, 格式)，只接受能原樣還原的ID"""
+        for fmt, pattern in enumerate(_PAIR_ID_PATTERNS):
+            match = pattern.match(pair_id)
+            if not match:
+                continue
+            task, n = match.group("task"), int(match.group("n"))
+            if n <= _UINT32_MAX and PAIR_ID_FORMATS[fmt].format(task=task, n=n) == pair_id:
+                return task, n, fmt
+        return None
+
+    def _encode(self, evaluation: Dict) -> Optional[tuple]:
+        """返回各列的值；無法無損編碼時返回 None"""
+        keys = tuple(evaluation)
+        if not COLUMN_FIELDS.issuperset(keys):
+            return None
+
+        id_num, id_ts = 0, -1
+        if "id" in evaluation:
+            match = _EVAL_ID_PATTERN.match(str(evaluation["id"]))
+            if not match or not isinstance(evaluation["id"], str):
+                return None
+            id_num = int(match.group("n"))
+            id_ts = int(match.group("ts")) if match.group("ts") is not None else -1
+            # 前導零等無法原樣還原的寫法按原字典保存
+            rebuilt = f"eval_{id_num}" if id_ts < 0 else f"eval_{id_num}_{id_ts}"
+            if rebuilt != evaluation["id"] or id_num >= 2 ** 63 or id_ts >= 2 ** 63:
+                return None
+
+        task, pair_no, pair_format = "", 0, 0
+        if "video_pair_id" in evaluation:
+            pair_id = evaluation["video_pair_id"]
+            split = self._split_pair_id(pair_id) if isinstance(pair_id, str) else None
+            if split is None:
+                return None
+            task, pair_no, pair_format = split
+
+        choice = evaluation.get("choice")
+        if choice not in CHOICE_CODES:
+            return None
+
+        is_blind = evaluation.get("is_blind", False)
+        if not isinstance(is_blind, bool):
+            return None
+
+        created = evaluation.get("created_time", 0)
+        if not _is_int(created) or not -2 ** 63 <= created < 2 ** 63:
+            return None
+
+        interned = {}
+        for field in INTERNED_FIELDS:
+            value = evaluation.get(field, "")
+            if not isinstance(value, str):
+                return None
+            interned[field] = value
+
+        shape = self._shape_code(keys)
+        if shape is None:
+            return None
+        return shape, id_num, id_ts, task, pair_no, pair_format, CHOICE_CODES[choice], is_blind, created, interned
+
+    # ---------- 寫入 ----------
+
+    def append(self, evaluation: Dict) -> int:
+        """追加一條評估，返回行號"""
+        row = len(self)
+        encoded = self._encode(evaluation)
+        if encoded is None:
+            self._fallback[row] = dict(evaluation)
+            encoded = (_FALLBACK_SHAPE, 0, -1, "", 0, 0, 0, False, 0, {f: "" for f in INTERNED_FIELDS})
+
+        shape, id_num, id_ts, task, pair_no, pair_format, choice, is_blind, created, interned = encoded
+        self._shape.append(shape)
+        self._id_num.append(id_num)
+        self._id_ts.append(id_ts)
+        self._task.append(self._intern(task))
+        self._pair_no.append(pair_no)
+        self._pair_format.append(pair_format)
+        self._choice.append(choice)
+        self._blind.append(1 if is_blind else 0)
+        self._created.append(created)
+        for field in INTERNED_FIELDS:
+            self._interned[field].append(self._intern(interned[field]))
+        return row
+
+    def keep_rows(self, keep: Iterable[int]) -> List[int]:
+        """
+        只保留指定的行（用於刪除），其餘行被移除
+
+        Returns:
+            舊行號到新行號的映射列表，被刪除的行為 -1
+        """
+        keep = sorted(set(keep))
+        mapping = [-1] * len(self)
+        fallback = {}
+        columns = [self._shape, self._id_num, self._id_ts, self._task, self._pair_no,
+                   self._pair_format, self._choice, self._blind, self._created] + list(self._interned.values())
+        new_columns = [array(column.typecode) for column in columns]
+        for new_row, old_row in enumerate(keep):
+            mapping[old_row] = new_row
+            for column, new_column in zip(columns, new_columns):
+                new_column.append(column[old_row])
+            if old_row in self._fallback:
+                fallback[new_row] = self._fallback[old_row]
+
+        (self._shape, self._id_num, self._id_ts, self._task, self._pair_no,
+         self._pair_format, self._choice, self._blind, self._created) = new_columns[:9]
+        self._interned = dict(zip(self._interned, new_columns[9:]))
+        self._fallback = fallback
+        return mapping
+
+    # ---------- 讀取 ----------
+
+    def pair_id(self, row: int) -> str:
+        evaluation = self._fallback.get(row)
+        if evaluation is not None:
+            return evaluation.get("video_pair_id", "")
+        if "video_pair_id" not in self._shapes[self._shape[row]]:
+            return ""
+        return PAIR_ID_FORMATS[self._pair_format[row]].format(task=self._strings[self._task[row]], n=self._pair_no[row])
+
+    def evaluation_id(self, row: int):
+        evaluation = self._fallback.get(row)
+        if evaluation is not None:
+            return evaluation.get("id")
+        if "id" not in self._shapes[self._shape[row]]:
+            return None
+        id_ts = self._id_ts[row]
+        return f"eval_{self._id_num[row]}" if id_ts < 0 else f"eval_{self._id_num[row]}_{id_ts}"
+
+    def choice(self, row: int) -> Optional[str]:
+        evaluation = self._fallback.get(row)
+        if evaluation is not None:
+            return evaluation.get("choice")
+        return CHOICES[self._choice[row]]
+
+    def is_fallback(self, row: int) -> bool:
+        return row in self._fallback
+
+    def materialize(self, row: int) -> Dict:
+        """按原來的 JSON 結構還原一條評估"""
+        evaluation = self._fallback.get(row)
+        if evaluation is not None:
+            return dict(evaluation)
+
+        record = {}
+        for key in self._shapes[self._shape[row]]:
+            if key == "id":
+                record[key] = self.evaluation_id(row)
+            elif key == "video_pair_id":
+                record[key] = self.pair_id(row)
+            elif key == "choice":
+                record[key] = CHOICES[self._choice[row]]
+            elif key == "is_blind":
+                record[key] = bool(self._blind[row])
+            elif key == "created_time":
+                record[key] = self._created[row]
+            else:
+                record[key] = self._strings[self._interned[key][row]]
+        return record
+
+    def materialize_rows(self, rows: Iterable[int]) -> List[Dict]:
+        return [self.materialize(row) for row in rows]
+
+    def to_list(self) -> List[Dict]:
+        return [self.materialize(row) for row in range(len(self))]
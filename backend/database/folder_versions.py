@@ -0,0 +1,73 @@
+"""
+資料夾內容版本
+資料夾的內容版本是其中可見文件名列表（不含 . 開頭的臨時文件和索引）的指紋，
+只在文件被加入、刪除或改名時變化。目錄的 mtime 沒有變化時直接使用緩存的版本，
+不需要列目錄；上傳/刪除等鉤子調用 changed() 後下一次查詢會重新列目錄。
+
+mtime 的精度有限：緩存時目錄 mtime 距現在不到 RACY_WINDOW_NS 的項不被信任，
+下次查詢仍然重新列目錄（與 git 處理 "racy" 索引項的方式相同），其他 worker 的寫入也能被發現
+"""
+
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, List, Tuple
+
+MISSING_VERSION = "missing"
+RACY_WINDOW_NS = 2 * 1000 ** 3
+
+
+def fingerprint(filenames: List[str]) -> str:
+    """文件名列表的指紋（與順序無關）"""
+    return hashlib.sha1("\0".join(sorted(filenames)).encode("utf-8")).hexdigest()[:16]
+
+
+class FolderVersions:
+    """按資料夾名緩存 (目錄 mtime, 內容版本)"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        # 資料夾名 -> (目錄 mtime_ns, 版本, 是否可信)
+        self._cache: Dict[str, Tuple[int, str, bool]] = {}
+        self.stats = {"hits": 0, "scans": 0}
+
+    def changed(self, folder_name: str):
+        """資料夾中的文件被加入或刪除後調用"""
+        with self._lock:
+            self._cache.pop(folder_name, None)
+
+    def version(self, folder_name: str) -> str:
+        """資料夾當前的內容版本，資料夾不存在時返回 MISSING_VERSION"""
+        path = os.path.join(self.root, folder_name)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self.changed(folder_name)
+            return MISSING_VERSION
+
+        with self._lock:
+            cached = self._cache.get(folder_name)
+            if cached is not None and cached[0] == mtime_ns and cached[2]:
+                self.stats["hits"] += 1
+                return cached[1]
+
+        try:
+            names = [name for name in os.listdir(path) if not name.startswith(".")]
+        except FileNotFoundError:
+            self.changed(folder_name)
+            return MISSING_VERSION
+        version = fingerprint(names)
+        trusted = time.time_ns() - mtime_ns >= RACY_WINDOW_NS
+        with self._lock:
+            self._cache[folder_name] = (mtime_ns, version, trusted)
+            self.stats["scans"] += 1
+        return version
+
+    def versions(self, *folder_names: str) -> Dict[str, str]:
+        return {name: self.version(name) for name in folder_names}
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "cached_folders": len(self._cache)}
@@ -0,0 +1,211 @@
+"""
+帶索引的內存存儲
+資料夾按名稱、任務按ID保存在字典中，評估按列存放在緊湊的 EvaluationTable 中，
+另外按任務ID和視頻對ID建立行號索引，每次增刪都同步更新索引，避免在請求中線性掃描整個列表
+"""
+
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from database.evaluation_table import EvaluationTable
+from database.repository import task_id_from_pair_id
+
+
+def _row_index() -> array:
+    return array('I')
+
+
+class IndexedStore:
+    """資料夾 / 任務 / 評估的內存存儲及其索引"""
+
+    def __init__(self, track_changes: bool = False):
+        """
+        Args:
+            track_changes: 記錄新增/修改/刪除過的資料夾和任務鍵，
+                供按行持久化的後端（SQLite）只寫入變化的行
+        """
+        # 字典保持插入順序，序列化時與原來的列表順序一致
+        self.folders: Dict[str, Dict] = {}
+        self.tasks: Dict[str, Dict] = {}
+        # 評估只在 API 邊界才還原成字典（evaluation_list / evaluations_for_*）
+        self.evaluations = EvaluationTable()
+        self._evaluations_by_task: Dict[str, array] = defaultdict(_row_index)
+        self._evaluations_by_pair: Dict[str, array] = defaultdict(_row_index)
+
+        self.track_changes = track_changes
+        self._changed = {"folders": set(), "tasks": set()}
+        self._removed = {"folders": set(), "tasks": set()}
+
+    def load(self, folders: List[Dict], tasks: List[Dict], evaluations: List[Dict]):
+        """用持久化數據重建存儲和全部索引"""
+        self.replace_folders(folders)
+        self.replace_tasks(tasks)
+        self.replace_evaluations(evaluations)
+
+    def clear(self):
+        for name in list(self.folders):
+            self._record_removed("folders", name)
+        for task_id in list(self.tasks):
+            self._record_removed("tasks", task_id)
+        self.folders = {}
+        self.tasks = {}
+        self.replace_evaluations([])
+
+    # ---------- 變更記錄 ----------
+
+    def _record_changed(self, kind: str, key: str):
+        if self.track_changes:
+            self._changed[kind].add(key)
+            self._removed[kind].discard(key)
+
+    def _record_removed(self, kind: str, key: str):
+        if self.track_changes:
+            self._removed[kind].add(key)
+            self._changed[kind].discard(key)
+
+    def _take_changes(self, kind: str, records: Dict[str, Dict]) -> Tuple[List[Dict], List[str]]:
+        changed = self._changed[kind]
+        # 按存儲中的順序寫入，新增的行在數據庫中保持創建順序
+        upserts = [record for key, record in records.items() if key in changed] if changed else []
+        deletes = list(self._removed[kind])
+        self._changed[kind] = set()
+        self._removed[kind] = set()
+        return upserts, deletes
+
+    def _requeue_changes(self, kind: str, changes: Tuple[List[Dict], List[str]]):
+        """寫入失敗的變更放回變更記錄（之後又被修改/刪除的鍵以較新的記錄為準）"""
+        upserts, deletes = changes
+        key = "name" if kind == "folders" else "id"
+        for record in upserts:
+            if record[key] not in self._removed[kind]:
+                self._changed[kind].add(record[key])
+        for removed in deletes:
+            if removed not in self._changed[kind]:
+                self._removed[kind].add(removed)
+
+    def requeue_folder_changes(self, changes: Tuple[List[Dict], List[str]]):
+        self._requeue_changes("folders", changes)
+
+    def requeue_task_changes(self, changes: Tuple[List[Dict], List[str]]):
+        self._requeue_changes("tasks", changes)
+
+    def take_folder_changes(self) -> Tuple[List[Dict], List[str]]:
+        """取出並清空資料夾的變更：(新增或修改的資料夾, 刪除的資料夾名稱)"""
+        return self._take_changes("folders", self.folders)
+
+    def take_task_changes(self) -> Tuple[List[Dict], List[str]]:
+        """取出並清空任務的變更：(新增或修改的任務, 刪除的任務ID)"""
+        return self._take_changes("tasks", self.tasks)
+
+    # ---------- 資料夾 ----------
+
+    def folder_list(self) -> List[Dict]:
+        return list(self.folders.values())
+
+    def get_folder(self, name: str) -> Optional[Dict]:
+        return self.folders.get(name)
+
+    def add_folder(self, folder: Dict):
+        self.folders[folder["name"]] = folder
+        self._record_changed("folders", folder["name"])
+
+    def touch_folder(self, name: str):
+        """標記資料夾對象已被原地修改"""
+        self._record_changed("folders", name)
+
+    def remove_folder(self, name: str) -> Optional[Dict]:
+        self._record_removed("folders", name)
+        return self.folders.pop(name, None)
+
+    def replace_folders(self, folders: List[Dict]):
+        """用持久化數據替換全部資料夾（不記錄為變更）"""
+        self.folders = {f["name"]: f for f in folders}
+        self._changed["folders"] = set()
+        self._removed["folders"] = set()
+
+    # ---------- 任務 ----------
+
+    def task_list(self) -> List[Dict]:
+        return list(self.tasks.values())
+
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        return self.tasks.get(task_id)
+
+    def add_task(self, task: Dict):
+        self.tasks[task["id"]] = task
+        self._record_changed("tasks", task["id"])
+
+    def touch_task(self, task_id: str):
+        """標記任務對象已被原地修改"""
+        self._record_changed("tasks", task_id)
+
+    def remove_task(self, task_id: str) -> Optional[Dict]:
+        self._record_removed("tasks", task_id)
+        return self.tasks.pop(task_id, None)
+
+    def replace_tasks(self, tasks: List[Dict]):
+        """用持久化數據替換全部任務（不記錄為變更）"""
+        self.tasks = {t["id"]: t for t in tasks}
+        self._changed["tasks"] = set()
+        self._removed["tasks"] = set()
+
+    # ---------- 評估 ----------
+
+    @staticmethod
+    def evaluation_task_id(evaluation: Dict) -> Optional[str]:
+        """評估所屬的任務ID（精確解析，不再用 startswith 前綴匹配）"""
+        return evaluation.get("task_id") or task_id_from_pair_id(evaluation.get("video_pair_id", ""))
+
+    def replace_evaluations(self, evaluations: List[Dict]):
+        """重建評估表和索引"""
+        self.evaluations = EvaluationTable()
+        self._evaluations_by_task = defaultdict(_row_index)
+        self._evaluations_by_pair = defaultdict(_row_index)
+        for evaluation in evaluations:
+            self.add_evaluation(evaluation)
+
+    def evaluation_list(self) -> List[Dict]:
+        """按原來的 JSON 結構返回全部評估"""
+        return self.evaluations.to_list()
+
+    def has_evaluation(self, evaluation: Dict) -> bool:
+        """同一視頻對下是否已有相同ID的評估"""
+        rows = self._evaluations_by_pair.get(evaluation.get("video_pair_id", ""), ())
+        return any(self.evaluations.evaluation_id(row) == evaluation.get("id") for row in rows)
+
+    def add_evaluation(self, evaluation: Dict):
+        row = self.evaluations.append(evaluation)
+        self._evaluations_by_pair[evaluation.get("video_pair_id", "")].append(row)
+        task_id = self.evaluation_task_id(evaluation)
+        if task_id:
+            self._evaluations_by_task[task_id].append(row)
+
+    def evaluations_for_task(self, task_id: str) -> List[Dict]:
+        return self.evaluations.materialize_rows(self._evaluations_by_task.get(task_id, ()))
+
+    def evaluations_for_pair(self, video_pair_id: str) -> List[Dict]:
+        return self.evaluations.materialize_rows(self._evaluations_by_pair.get(video_pair_id, ()))
+
+    def evaluation_count(self, task_id: str) -> int:
+        return len(self._evaluations_by_task.get(task_id, ()))
+
+    def remove_task_evaluations(self, task_id: str) -> List[Dict]:
+        """刪除任務的全部評估，返回被刪除的評估"""
+        removed_rows = self._evaluations_by_task.pop(task_id, None)
+        if not removed_rows:
+            return []
+
+        removed = self.evaluations.materialize_rows(removed_rows)
+        removed_set = set(removed_rows)
+        mapping = self.evaluations.keep_rows(r for r in range(len(self.evaluations)) if r not in removed_set)
+
+        # 行號變化後重新映射所有索引
+        for index in (self._evaluations_by_task, self._evaluations_by_pair):
+            for key in list(index):
+                rows = array('I', (mapping[r] for r in index[key] if mapping[r] >= 0))
+                if rows:
+                    index[key] = rows
+                else:
+                    del index[key]
+        return removed
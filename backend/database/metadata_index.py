@@ -0,0 +1,154 @@
+"""
+資料夾視頻元數據索引
+上傳完成後把文件交給後台線程池探測元數據（utils.video_probe），結果寫入資料夾目錄下的
+.metadata.json 邊車文件：{文件名: {"size", "mtime_ns", "metadata"}}。
+列出文件時按 (size, mtime_ns) 校驗索引項，不需要再打開視頻文件；
+缺失或過期的項會重新排隊探測。
+上傳完成時排隊的文件可以在探測前先執行後處理（如 utils.faststart），探測到的是處理後的文件；
+列出文件時因索引缺失/過期觸發的重新探測不做後處理，不會改寫不是剛上傳的文件
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from database.document_cache import get_document
+from utils.video_probe import probe_video
+
+METADATA_FILENAME = ".metadata.json"
+METADATA_PROBE_WORKERS = int(os.environ.get("METADATA_PROBE_WORKERS", "2"))
+
+
+def _signature(stat_result: os.stat_result) -> Tuple[int, int]:
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+class MetadataIndex:
+    """每個資料夾一個 .metadata.json，由後台線程池填充"""
+
+    def __init__(self, max_workers: int = METADATA_PROBE_WORKERS,
+                 before_probe: Optional[Callable[[str], object]] = None):
+        """
+        Args:
+            before_probe: 探測前對文件執行的後處理，參數為文件路徑；只用於 schedule(post_process=True) 的文件
+        """
+        self._before_probe = before_probe
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = max_workers
+        self._pending: Set[Tuple[str, str, bool]] = set()
+        self._pending_lock = threading.Lock()
+        self._folder_locks: Dict[str, threading.Lock] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._pending_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="metadata-probe"
+                )
+            return self._executor
+
+    def _folder_lock(self, folder_path: str) -> threading.Lock:
+        key = os.path.abspath(folder_path)
+        with self._pending_lock:
+            lock = self._folder_locks.get(key)
+            if lock is None:
+                lock = self._folder_locks[key] = threading.Lock()
+            return lock
+
+    @staticmethod
+    def _document(folder_path: str):
+        return get_document(os.path.join(folder_path, METADATA_FILENAME))
+
+    def folder_entries(self, folder_path: str) -> Dict[str, Dict]:
+        """讀取資料夾的索引（進程內共享的緩存對象，調用方不應修改）"""
+        try:
+            return self._document(folder_path).get()
+        except Exception as e:
+            print(f"⚠️ 讀取元數據索引失敗 {folder_path}: {e}")
+            return {}
+
+    def lookup(self, folder_path: str, filename: str, stat_result: os.stat_result,
+               entries: Optional[Dict[str, Dict]] = None) -> Optional[Dict]:
+        """
+        返回文件的元數據；索引中沒有或文件已變化時排隊重新探測並返回 None
+
+        Args:
+            stat_result: 文件的 stat 結果（列目錄時已經取得）
+            entries: 已讀取的 folder_entries，列出整個資料夾時避免重複讀取
+        """
+        entries = self.folder_entries(folder_path) if entries is None else entries
+        entry = entries.get(filename)
+        if entry and (entry.get("size"), entry.get("mtime_ns")) == _signature(stat_result):
+            return entry.get("metadata")
+        self.schedule(folder_path, [filename])
+        return None
+
+    def schedule(self, folder_path: str, filenames: Iterable[str], post_process: bool = False):
+        """
+        把文件加入探測隊列（同一文件排隊中時不重複加入）
+
+        Args:
+            post_process: 探測前執行 before_probe（只應由上傳完成的鉤子傳入）
+        """
+        executor = self._get_executor()
+        for filename in filenames:
+            key = (os.path.abspath(folder_path), filename, post_process)
+            with self._pending_lock:
+                if key in self._pending:
+                    continue
+                self._pending.add(key)
+            executor.submit(self._probe, folder_path, filename, key)
+
+    def _probe(self, folder_path: str, filename: str, key: Tuple[str, str, bool]):
+        try:
+            file_path = os.path.join(folder_path, filename)
+            if key[2] and self._before_probe is not None:
+                try:
+                    self._before_probe(file_path)
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    print(f"⚠️ 視頻後處理失敗 {file_path}: {e}")
+            try:
+                stat_result = os.stat(file_path)
+                metadata = probe_video(file_path)
+            except FileNotFoundError:
+                stat_result, metadata = None, None
+            except Exception as e:
+                print(f"⚠️ 探測視頻元數據失敗 {file_path}: {e}")
+                stat_result, metadata = os.stat(file_path), None
+
+            if not os.path.isdir(folder_path):
+                return
+            with self._folder_lock(folder_path):
+                document = self._document(folder_path)
+                entries = dict(document.get())
+                if stat_result is None:
+                    entries.pop(filename, None)
+                else:
+                    size, mtime_ns = _signature(stat_result)
+                    entries[filename] = {"size": size, "mtime_ns": mtime_ns, "metadata": metadata}
+                document.save(entries, indent=None)
+        except Exception as e:
+            print(f"❌ 更新元數據索引失敗 {folder_path}/{filename}: {e}")
+        finally:
+            with self._pending_lock:
+                self._pending.discard(key)
+
+    def wait_idle(self, timeout: float = 30.0) -> bool:
+        """等待隊列中的探測全部完成（用於關閉前和測試腳本）"""
+        import time
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._pending_lock:
+                if not self._pending:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def shutdown(self):
+        with self._pending_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
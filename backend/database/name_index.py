@@ -0,0 +1,154 @@
+"""
+資料夾文件名匹配索引
+每個資料夾目錄下一個 .name_index.json 邊車文件，按規則集（utils.name_rules）保存標準化名稱到文件名的映射：
+    {"version": 資料夾內容版本,
+     "rulesets": {規則集 key: {"config": 規則集配置, "groups": {標準化名稱: [文件名（排序）]}}}}
+按文件名配對視頻時直接查表，不需要逐個文件重新標準化。
+
+上傳/刪除鉤子調用 update() 只修改受影響的項，返回每個規則集中變化的標準化名稱，
+PairPlanBuilder 據此只修改依賴該資料夾的任務方案中相應的視頻對。
+索引記錄對應的資料夾內容版本（database.folder_versions）：增量修改後的文件名集合與資料夾的
+實際內容不一致時（鉤子之外的修改、並發的上傳），索引標記為過期，下一次 entries() 重新列目錄生成
+"""
+
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from database.document_cache import get_document
+from database.folder_versions import MISSING_VERSION, fingerprint
+from utils.name_rules import NameRuleSet, get_ruleset
+
+NAME_INDEX_FILENAME = ".name_index.json"
+
+
+def group_filenames(ruleset: NameRuleSet, filenames: Iterable[str]) -> Dict[str, List[str]]:
+    """標準化名稱 -> 文件名列表（排序）"""
+    groups: Dict[str, List[str]] = {}
+    for filename in sorted(filenames):
+        groups.setdefault(ruleset.normalize(filename), []).append(filename)
+    return groups
+
+
+class FolderNameIndex:
+    """每個資料夾一個 .name_index.json，按需為用到的規則集生成"""
+
+    def __init__(self, root: str, folder_versions):
+        """
+        Args:
+            root: 資料夾的上級目錄（uploads）
+            folder_versions: FolderVersions，校驗索引是否與資料夾內容一致
+        """
+        self.root = root
+        self.folder_versions = folder_versions
+        self._lock = threading.Lock()
+        self._folder_locks: Dict[str, threading.Lock] = {}
+        self.stats = {"scans": 0, "updates": 0, "stale": 0}
+
+    def _folder_lock(self, folder_name: str) -> threading.Lock:
+        with self._lock:
+            lock = self._folder_locks.get(folder_name)
+            if lock is None:
+                lock = self._folder_locks[folder_name] = threading.Lock()
+            return lock
+
+    def _document(self, folder_name: str):
+        return get_document(os.path.join(self.root, folder_name, NAME_INDEX_FILENAME))
+
+    def _save(self, folder_name: str, data: Dict):
+        try:
+            self._document(folder_name).save(data, indent=None)
+        except Exception as e:
+            print(f"⚠️ 保存文件名索引失敗 {folder_name}: {e}")
+
+    def entries(self, folder_name: str, ruleset: NameRuleSet) -> Dict[str, List[str]]:
+        """
+        資料夾中的文件按規則集標準化後的分組（包含所有不以 . 開頭的文件，調用方自行過濾擴展名）
+
+        Returns:
+            標準化名稱 -> 文件名列表（排序）；進程內共享的對象，調用方不應修改
+        """
+        version = self.folder_versions.version(folder_name)
+        if version == MISSING_VERSION:
+            return {}
+        data = self._document(folder_name).get()
+        if data.get("version") == version and ruleset.key in data.get("rulesets", {}):
+            return data["rulesets"][ruleset.key]["groups"]
+
+        with self._folder_lock(folder_name):
+            folder_path = os.path.join(self.root, folder_name)
+            try:
+                filenames = [name for name in os.listdir(folder_path) if not name.startswith(".")]
+            except FileNotFoundError:
+                return {}
+            # 記錄實際列出的文件名的版本：列目錄期間有變化時，下次校驗會發現不一致
+            listed_version = fingerprint(filenames)
+            data = self._document(folder_name).get()
+            rulesets = dict(data.get("rulesets", {}))
+            if data.get("version") != listed_version:
+                # 過期：已有的規則集按保存的配置重新生成
+                rulesets = {
+                    key: {"config": entry["config"],
+                          "groups": group_filenames(get_ruleset(entry["config"]), filenames)}
+                    for key, entry in rulesets.items()
+                }
+                self.stats["scans"] += 1
+            if ruleset.key not in rulesets:
+                rulesets[ruleset.key] = {"config": ruleset.to_config(), "groups": group_filenames(ruleset, filenames)}
+            self._save(folder_name, {"version": listed_version, "rulesets": rulesets})
+            return rulesets[ruleset.key]["groups"]
+
+    def update(self, folder_name: str, added: Iterable[str] = (), removed: Iterable[str] = ()) -> Optional[Dict]:
+        """
+        文件被加入/刪除後只修改受影響的項（文件已經寫入或刪除，FolderVersions.changed() 已調用）
+
+        Returns:
+            {"previous": 修改前的版本, "version": 修改後的版本,
+             "changed": {規則集 key: 變化的標準化名稱集合}}；
+            資料夾還沒有索引，或修改後與資料夾的實際內容不一致（索引已標記為過期）時返回 None
+        """
+        added, removed = list(added), list(removed)
+        with self._folder_lock(folder_name):
+            data = self._document(folder_name).get()
+            previous = data.get("version")
+            if not previous or not data.get("rulesets"):
+                return None
+
+            rulesets: Dict[str, Dict] = {}
+            changed: Dict[str, Set[str]] = {}
+            for key, entry in data["rulesets"].items():
+                ruleset = get_ruleset(entry["config"])
+                groups = dict(entry["groups"])  # 共享的緩存對象：只替換受影響的列表
+                keys = set()
+                for filename in removed:
+                    name = ruleset.normalize(filename)
+                    files = groups.get(name)
+                    if files and filename in files:
+                        remaining = [f for f in files if f != filename]
+                        if remaining:
+                            groups[name] = remaining
+                        else:
+                            del groups[name]
+                        keys.add(name)
+                for filename in added:
+                    name = ruleset.normalize(filename)
+                    files = groups.get(name, [])
+                    if filename not in files:
+                        groups[name] = sorted(files + [filename])
+                        keys.add(name)
+                rulesets[key] = {"config": entry["config"], "groups": groups}
+                changed[key] = keys
+
+            version = self.folder_versions.version(folder_name)
+            any_groups = next(iter(rulesets.values()))["groups"]
+            if fingerprint([f for files in any_groups.values() for f in files]) != version:
+                self.stats["stale"] += 1
+                self._save(folder_name, {"version": None, "rulesets": data["rulesets"]})
+                print(f"⚠️ 文件名索引與資料夾 '{folder_name}' 的內容不一致，下次使用時重新生成")
+                return None
+            self._save(folder_name, {"version": version, "rulesets": rulesets})
+            self.stats["updates"] += 1
+        return {"previous": previous, "version": version, "changed": changed}
+
+    def snapshot(self) -> Dict:
+        return dict(self.stats)
@@ -0,0 +1,473 @@
+"""
+任務視頻對方案（pair plan）存儲
+每個任務的視頻對單獨保存（JSON 後端每任務一個文件，SQLite 後端為 pairs 表中的行），
+按需載入並用有容量上限的 LRU 緩存，tasks.json 只保留任務的基本信息
+
+PairPlanBuilder 在任務創建時於後台生成方案，任務記錄中保存生成時兩個資料夾的內容版本
+（database.folder_versions），打開任務時版本沒有變化就直接返回已保存的方案，不再列目錄。
+提供文件名索引（database.name_index）時，上傳/刪除文件後只修改依賴該資料夾的方案中
+受影響的視頻對並更新記錄的版本，其餘視頻對（ID、左右順序）保持不變。
+上傳/刪除的請求用 schedule_folder_changed() 把增量修改放到後台，按調用順序依次執行
+
+文件被刪除或重新配對後，舊的視頻對不從方案中刪除，而是標記為 retired 保留下來：
+已有的評估仍然引用它們的 ID，統計時需要它們的左右資料夾才能還原真實的偏好，
+新的視頻對也不會重用這些 ID。評估者看到的方案只包含 active_pairs()
+"""
+
+import os
+import re
+import json
+import asyncio
+import threading
+import traceback
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.file_utils import atomic_write_json
+
+PAIR_PLAN_CACHE_SIZE = int(os.environ.get("PAIR_PLAN_CACHE_SIZE", "32"))
+# 視頻對ID = 前綴 + 編號（"{task_id}_pair_{n}" / "pair_{task_id}_{n}"）
+_PAIR_NUMBER = re.compile(r"^(.*_)(\d+)$")
+
+
+class PairPlanStore:
+    """按任務ID存取視頻對列表，最近使用的方案保存在內存中"""
+
+    def __init__(self, plans_dir: str, repository=None, cache_size: int = PAIR_PLAN_CACHE_SIZE):
+        """
+        Args:
+            plans_dir: JSON 後端的方案目錄（每個任務一個 {task_id}.json）
+            repository: SQLiteRepository，提供時方案保存在 pairs 表中
+            cache_size: LRU 緩存最多保存的任務數
+        """
+        self.plans_dir = plans_dir
+        self.repository = repository
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # JSON 後端比較並寫入方案時持有（只在進程內互斥）
+        self._write_lock = threading.Lock()
+
+    def _plan_path(self, task_id: str) -> str:
+        if not task_id or os.path.basename(task_id) != task_id or task_id.startswith("."):
+            raise ValueError(f"無效的任務ID: {task_id!r}")
+        return os.path.join(self.plans_dir, f"{task_id}.json")
+
+    # ---------- LRU ----------
+
+    def _cache_get(self, task_id: str) -> Optional[List[Dict]]:
+        with self._lock:
+            pairs = self._cache.get(task_id)
+            if pairs is not None:
+                self._cache.move_to_end(task_id)
+            return pairs
+
+    def _cache_put(self, task_id: str, pairs: List[Dict]):
+        with self._lock:
+            self._cache[task_id] = pairs
+            self._cache.move_to_end(task_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ---------- 讀寫 ----------
+
+    def _read(self, task_id: str) -> Optional[List[Dict]]:
+        if self.repository:
+            return self.repository.get_pairs(task_id)
+        path = self._plan_path(task_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"❌ 載入任務 {task_id} 的視頻對失敗: {e}")
+            return None
+
+    def _write(self, task_id: str, pairs: List[Dict]):
+        if self.repository:
+            self.repository.replace_pairs(task_id, pairs)
+        else:
+            atomic_write_json(self._plan_path(task_id), pairs)
+
+    def get(self, task_id: str) -> Optional[List[Dict]]:
+        """
+        獲取任務的視頻對列表（調用方不應修改返回的列表）
+
+        Returns:
+            視頻對列表，任務還沒有保存方案時返回 None
+        """
+        pairs = self._cache_get(task_id)
+        if pairs is not None:
+            return pairs
+        pairs = self._read(task_id)
+        if pairs is not None:
+            self._cache_put(task_id, pairs)
+        return pairs
+
+    def has(self, task_id: str) -> bool:
+        if self._cache_get(task_id) is not None:
+            return True
+        if self.repository:
+            return self.repository.get_pairs(task_id) is not None
+        return os.path.exists(self._plan_path(task_id))
+
+    def save(self, task_id: str, pairs: List[Dict]):
+        """保存任務的視頻對方案"""
+        self._cache_put(task_id, pairs)
+        self._write(task_id, pairs)
+        print(f"✅ 保存了任務 {task_id} 的 {len(pairs)} 個視頻對")
+
+    async def save_async(self, task_id: str, pairs: List[Dict]):
+        """先更新緩存，寫盤放到線程池中進行"""
+        self._cache_put(task_id, pairs)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, task_id, pairs)
+        print(f"✅ 保存了任務 {task_id} 的 {len(pairs)} 個視頻對")
+
+    def _write_if(self, task_id: str, pairs: List[Dict], expected: Optional[List[Dict]]) -> List[Dict]:
+        if self.repository:
+            return self.repository.replace_pairs_if(task_id, pairs, expected)
+        with self._write_lock:
+            path = self._plan_path(task_id)
+            stored = None
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+            if stored != (expected or None):
+                return stored or []
+            atomic_write_json(path, pairs)
+            return pairs
+
+    async def save_if_unchanged_async(self, task_id: str, pairs: List[Dict],
+                                      expected: Optional[List[Dict]]) -> Optional[List[Dict]]:
+        """
+        保存的方案仍是 expected（生成時讀到的方案，None 表示還沒有方案）時才保存 pairs。
+        多個 worker 同時生成同一任務的方案時只有一個被保存，其餘的改用保存的方案，
+        所有 worker 提供相同的視頻對順序和左右順序
+
+        Returns:
+            保存成功時返回 None，否則返回已保存的方案
+        """
+        stored = await asyncio.get_running_loop().run_in_executor(None, self._write_if, task_id, pairs, expected)
+        self._cache_put(task_id, stored)
+        if stored is not pairs:
+            print(f"⚠️ 任務 {task_id} 的方案已被其他進程保存，改用保存的方案")
+            return stored
+        print(f"✅ 保存了任務 {task_id} 的 {len(pairs)} 個視頻對")
+        return None
+
+    def delete(self, task_id: str):
+        """刪除任務的視頻對方案"""
+        with self._lock:
+            self._cache.pop(task_id, None)
+        if self.repository:
+            self.repository.replace_pairs(task_id, [])
+        else:
+            path = self._plan_path(task_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def invalidate(self):
+        """只清空內存緩存（其他進程修改了方案時使用）"""
+        with self._lock:
+            self._cache.clear()
+
+    def clear(self):
+        """刪除全部方案"""
+        with self._lock:
+            self._cache.clear()
+        if self.repository:
+            self.repository.clear_pairs()
+            return
+        if os.path.isdir(self.plans_dir):
+            for filename in os.listdir(self.plans_dir):
+                if filename.endswith(".json"):
+                    os.remove(os.path.join(self.plans_dir, filename))
+
+    def migrate_embedded(self, tasks: List[Dict]) -> int:
+        """
+        把舊格式中嵌在任務裡的 video_pairs 移到方案存儲
+
+        Returns:
+            遷移的任務數；大於 0 時調用方需要重新保存任務列表
+        """
+        migrated = 0
+        for task in tasks:
+            pairs = task.pop("video_pairs", None)
+            if pairs is None:
+                continue
+            if not self.has(task["id"]):
+                self._write(task["id"], pairs)
+            migrated += 1
+        if migrated:
+            print(f"✅ 已把 {migrated} 個任務的視頻對移到獨立存儲")
+        return migrated
+
+
+def active_pairs(pairs: Optional[List[Dict]]) -> List[Dict]:
+    """方案中仍在使用的視頻對（去掉已退役的）"""
+    return [pair for pair in pairs or () if not pair.get("retired")]
+
+
+def retired_pairs(pairs: Optional[List[Dict]]) -> List[Dict]:
+    return [pair for pair in pairs or () if pair.get("retired")]
+
+
+def retire(pair: Dict) -> Dict:
+    return pair if pair.get("retired") else dict(pair, retired=True)
+
+
+def merge_stable_pairs(previous: Optional[List[Dict]], pairs: List[Dict],
+                       evaluated_ids: Iterable[str] = ()) -> List[Dict]:
+    """
+    重新生成方案時，兩側視頻與舊方案相同的視頻對沿用舊的記錄（ID 和左右順序不變，
+    匹配信息 match_* 取自新方案）；舊方案中不再出現的視頻對標記為退役並保留在方案末尾。
+    新的視頻對不使用任何發出過的 ID（包括退役的）和評估引用的 ID：生成的 ID 已被佔用時
+    改用同一前綴下比所有用過的編號都大的編號，ID 仍能被 task_id_from_pair_id 解析
+
+    Args:
+        evaluated_ids: 任務的評估引用的視頻對 ID
+    """
+    taken = set(evaluated_ids)
+    if not previous and not taken:
+        return pairs
+    previous = previous or []
+
+    def key(pair: Dict):
+        return frozenset((pair.get("video_a_path"), pair.get("video_b_path")))
+
+    def reuse(old: Dict, pair: Dict) -> Dict:
+        kept = {field: value for field, value in old.items() if not field.startswith("match_")}
+        kept.update({field: value for field, value in pair.items() if field.startswith("match_")})
+        return kept
+
+    # 同樣的兩側視頻有多條記錄（退役後又重新配對過）時，優先沿用仍在使用的
+    old_pairs = {}
+    for pair in previous:
+        if key(pair) not in old_pairs or not pair.get("retired"):
+            old_pairs[key(pair)] = pair
+    taken.update(pair["id"] for pair in previous)
+    reused = set()
+    merged = []
+    for pair in pairs:
+        old = old_pairs.pop(key(pair), None)
+        if old is None:
+            merged.append(dict(pair, id=None, _new_id=pair["id"]))
+            continue
+        reused.add(old["id"])
+        old = {field: value for field, value in old.items() if field != "retired"}
+        merged.append(reuse(old, pair))
+    # 每個前綴下用過的最大編號（也包括新方案生成的 ID，避免分配給後面的新視頻對）
+    highest: Dict[str, int] = {}
+    for pair_id in list(taken) + [pair["_new_id"] for pair in merged if pair["id"] is None]:
+        match = _PAIR_NUMBER.match(pair_id or "")
+        if match:
+            highest[match.group(1)] = max(highest.get(match.group(1), 0), int(match.group(2)))
+    for pair in merged:
+        if pair["id"] is not None:
+            continue
+        pair_id = pair.pop("_new_id")
+        match = _PAIR_NUMBER.match(pair_id)
+        if pair_id in taken and match:
+            highest[match.group(1)] += 1
+            pair_id = f"{match.group(1)}{highest[match.group(1)]}"
+        pair["id"] = pair_id
+        taken.add(pair_id)
+    return merged + [retire(pair) for pair in previous if pair["id"] not in reused]
+
+
+class PairPlanBuilder:
+    """物化的視頻對方案：生成一次並持久化，資料夾內容版本變化時才重新生成"""
+
+    VERSIONS_KEY = "pair_plan_versions"
+    # 增量修改時新視頻對的下一個編號（只增不減，由 update 返回、在事件循環中寫入任務記錄）
+    NEXT_NUMBER_KEY = "next_pair_number"
+
+    def __init__(self, pair_plans: PairPlanStore, folder_versions, store,
+                 build: Callable[[Dict], List[Dict]], on_saved: Optional[Callable[[str], None]] = None,
+                 name_index=None,
+                 update: Optional[Callable[[Dict, List[Dict], Dict[str, Set[str]], Set[str]],
+                                           Optional[Tuple[List[Dict], int]]]] = None):
+        """
+        Args:
+            pair_plans: 方案存儲
+            folder_versions: FolderVersions
+            store: IndexedStore，生成後把資料夾版本寫入任務記錄
+            build: 生成視頻對的同步函數（會列目錄，在線程池中執行），參數為任務
+            on_saved: 任務記錄被修改後調用，參數為任務ID（用於持久化任務列表）
+            name_index: FolderNameIndex，提供時 folder_changed() 增量修改方案
+            update: 增量修改方案的同步函數（在線程池中執行，不能修改任務），
+                參數為 (任務, 仍在使用的視頻對, {規則集 key: 變化的標準化名稱}, 不能使用的視頻對 ID)，
+                返回 (新的視頻對列表, 下一個編號)，無法增量修改（需要完整生成）時返回 None
+        """
+        self.pair_plans = pair_plans
+        self.folder_versions = folder_versions
+        self.store = store
+        self._build_pairs = build
+        self._on_saved = on_saved
+        self.name_index = name_index
+        self._update_pairs = update
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._changes: Set[asyncio.Future] = set()
+        self._last_change: Optional[asyncio.Future] = None
+        self.stats = {"served": 0, "builds": 0, "updates": 0}
+
+    def _current_versions(self, task: Dict) -> Dict[str, str]:
+        return self.folder_versions.versions(task["folder_a"], task["folder_b"])
+
+    def cached(self, task: Dict) -> Optional[List[Dict]]:
+        """資料夾版本沒有變化時返回已保存的方案（不含退役的視頻對），否則返回 None"""
+        recorded = task.get(self.VERSIONS_KEY)
+        if not recorded or task["id"] in self._inflight or recorded != self._current_versions(task):
+            return None
+        pairs = self.pair_plans.get(task["id"])
+        return None if pairs is None else active_pairs(pairs)
+
+    def schedule(self, task: Dict) -> asyncio.Future:
+        """在後台生成任務的方案（同一任務正在生成時返回同一個 Future）"""
+        task_id = task["id"]
+        future = self._inflight.get(task_id)
+        if future is None:
+            future = asyncio.ensure_future(self._build(task_id, dict(task)))
+            self._inflight[task_id] = future
+            future.add_done_callback(lambda _: self._inflight.pop(task_id, None))
+        return future
+
+    async def get(self, task: Dict) -> List[Dict]:
+        """任務仍在使用的視頻對：版本沒有變化時直接返回，否則等待重新生成"""
+        if self._changes:
+            # 後台還有增量修改時先等它們完成，避免因為記錄的版本暫時過期而完整生成
+            await asyncio.wait(list(self._changes))
+        pairs = self.cached(task)
+        if pairs is not None:
+            self.stats["served"] += 1
+            return pairs
+        return await self.schedule(task)
+
+    async def _build(self, task_id: str, task: Dict) -> List[Dict]:
+        """生成並保存方案，返回仍在使用的視頻對；生成失敗時保留原來的方案"""
+        loop = asyncio.get_running_loop()
+        previous = None
+        try:
+            previous = await loop.run_in_executor(None, self.pair_plans.get, task_id)
+            # 先取版本再列目錄：生成期間資料夾有變化時，下次打開任務會再生成一次
+            versions = await loop.run_in_executor(None, self._current_versions, task)
+            pairs = await loop.run_in_executor(None, self._build_pairs, task)
+            evaluated_ids = {e.get("video_pair_id") for e in self.store.evaluations_for_task(task_id)}
+            pairs = merge_stable_pairs(previous, pairs, evaluated_ids)
+            self.stats["builds"] += 1
+
+            current = self.store.get_task(task_id)
+            if current is None:
+                return active_pairs(pairs)  # 生成期間任務已被刪除
+            stored = await self.pair_plans.save_if_unchanged_async(task_id, pairs, previous)
+            if stored is not None:
+                # 其他 worker 先保存了方案：使用它，記錄的版本由那個 worker 寫入任務並同步過來
+                return active_pairs(stored)
+            current[self.VERSIONS_KEY] = versions
+            self.store.touch_task(task_id)
+            if self._on_saved is not None:
+                self._on_saved(task_id)
+            return active_pairs(pairs)
+        except Exception as e:
+            # 不保存也不更新記錄的版本：下次打開任務時重試
+            print(f"❌ 生成任務 {task_id} 的視頻對失敗，保留原來的方案: {e}")
+            print(traceback.format_exc())
+            return active_pairs(previous)
+
+    def schedule_folder_changed(self, folder_name: str, added: Iterable[str] = (),
+                                removed: Iterable[str] = ()) -> asyncio.Future:
+        """在後台調用 folder_changed()，不阻塞上傳/刪除的請求；多次調用按順序依次執行"""
+        previous = self._last_change
+        added, removed = list(added), list(removed)
+
+        async def run() -> int:
+            if previous is not None and not previous.done():
+                await asyncio.wait([previous])
+            return await self.folder_changed(folder_name, added, removed)
+
+        future = asyncio.ensure_future(run())
+        self._last_change = future
+        self._changes.add(future)
+        future.add_done_callback(self._changes.discard)
+        return future
+
+    async def wait_changes(self):
+        """等待所有已排入後台的 folder_changed() 完成"""
+        while self._changes:
+            await asyncio.wait(list(self._changes))
+
+    async def folder_changed(self, folder_name: str, added: Iterable[str] = (), removed: Iterable[str] = ()) -> int:
+        """
+        資料夾中的文件被加入/刪除後調用（FolderVersions.changed() 之後）：
+        更新文件名索引，並只修改依賴該資料夾、方案仍對應修改前版本的任務中受影響的視頻對。
+        無法增量修改的任務保持原樣，記錄的版本已經過期，打開任務時會完整生成
+
+        Returns:
+            增量修改的任務數
+        """
+        if self.name_index is None or self._update_pairs is None:
+            return 0
+        loop = asyncio.get_running_loop()
+        try:
+            change = await loop.run_in_executor(None, self.name_index.update, folder_name, added, removed)
+        except Exception as e:
+            print(f"⚠️ 更新資料夾 '{folder_name}' 的文件名索引失敗: {e}")
+            return 0
+        if change is None:
+            return 0
+
+        updated = 0
+        for task in self.store.task_list():
+            task_id = task["id"]
+            if folder_name not in (task["folder_a"], task["folder_b"]) or task["folder_a"] == task["folder_b"]:
+                continue
+            recorded = task.get(self.VERSIONS_KEY)
+            # 方案必須正好對應修改前的索引，另一個資料夾也沒有變化
+            if not recorded or task_id in self._inflight or recorded.get(folder_name) != change["previous"]:
+                continue
+            other = task["folder_b"] if folder_name == task["folder_a"] else task["folder_a"]
+            try:
+                if recorded.get(other) != await loop.run_in_executor(None, self.folder_versions.version, other):
+                    continue
+                previous = await loop.run_in_executor(None, self.pair_plans.get, task_id)
+                if previous is None:
+                    continue
+                active = active_pairs(previous)
+                # 發出過的 ID（包括退役的）和評估引用的 ID 都不能再分配給新的視頻對
+                taken = {pair["id"] for pair in previous}
+                taken.update(e.get("video_pair_id") for e in self.store.evaluations_for_task(task_id))
+                result = await loop.run_in_executor(
+                    None, self._update_pairs, task, active, change["changed"], taken
+                )
+            except Exception as e:
+                print(f"⚠️ 增量更新任務 {task_id} 的視頻對失敗: {e}")
+                continue
+            if result is None or task_id in self._inflight or self.store.get_task(task_id) is not task:
+                continue
+            pairs, next_number = result
+            if pairs is not active:
+                # 被替換或移除的視頻對標記為退役，原來退役的視頻對原樣保留
+                kept = {pair["id"] for pair in pairs}
+                stored = await self.pair_plans.save_if_unchanged_async(
+                    task_id,
+                    pairs + [retire(pair) for pair in active if pair["id"] not in kept] + retired_pairs(previous),
+                    previous
+                )
+                if stored is not None:
+                    continue  # 方案已被其他進程修改，記錄的版本不變，打開任務時再處理
+            task[self.NEXT_NUMBER_KEY] = max(next_number, task.get(self.NEXT_NUMBER_KEY) or 0)
+            task[self.VERSIONS_KEY] = {**recorded, folder_name: change["version"]}
+            self.store.touch_task(task_id)
+            if self._on_saved is not None:
+                self._on_saved(task_id)
+            self.stats["updates"] += 1
+            updated += 1
+        return updated
+
+    def snapshot(self) -> Dict:
+        snapshot = {**self.stats, "building": len(self._inflight), "pending_changes": len(self._changes),
+                    "folders": self.folder_versions.snapshot()}
+        if self.name_index is not None:
+            snapshot["name_index"] = self.name_index.snapshot()
+        return snapshot
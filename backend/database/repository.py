@@ -0,0 +1,718 @@
+"""
+存儲倉庫層
+為資料夾、任務、視頻對和評估提供統一的存取接口，並提供 WAL 模式的 SQLite 實現
+"""
+
+import os
+import json
+import sqlite3
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+# 存儲後端: "json"（默認，沿用原來的 JSON 文件）或 "sqlite"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json").lower()
+
+
+# api/ 路由模塊（tasks_data.json / evaluations_data.json）在 SQLite 後端下使用的數據庫文件
+API_ROUTES_DB_FILE = os.environ.get("API_ROUTES_DB_FILE", "storage_data.db")
+
+
+def use_sqlite_storage() -> bool:
+    """是否使用 SQLite 存儲後端"""
+    return STORAGE_BACKEND == "sqlite"
+
+
+def task_id_from_pair_id(pair_id: str) -> Optional[str]:
+    """
+    從視頻對ID解析出任務ID
+
+    支持目前使用的三種格式：
+    - main.py:          "{task_id}_pair_{n}"
+    - main_railway.py:  "pair_{task_id}_{n}"
+    - api/tasks.py:     "{task_id}_{n}"
+
+    Args:
+        pair_id: 視頻對ID
+
+    Returns:
+        任務ID，無法解析時返回 None
+    """
+    if not pair_id:
+        return None
+
+    if "_pair_" in pair_id:
+        task_id, _, number = pair_id.rpartition("_pair_")
+    elif pair_id.startswith("pair_"):
+        task_id, _, number = pair_id[len("pair_"):].rpartition("_")
+    else:
+        task_id, _, number = pair_id.rpartition("_")
+
+    if not task_id or not number.isdigit():
+        return None
+    return task_id
+
+
+class EvaluationExists(ValueError):
+    """新增的評估ID已經存在（不覆蓋已有的投票）"""
+
+    def __init__(self, evaluation_id: Optional[str]):
+        super().__init__(f"評估 '{evaluation_id}' 已存在")
+        self.evaluation_id = evaluation_id
+
+
+class Repository(ABC):
+    """
+    存儲倉庫接口
+
+    所有記錄都以 dict 形式進出，字段與原來 JSON 文件中的結構一致。
+    """
+
+    # ---------- 資料夾 ----------
+
+    @abstractmethod
+    def list_folders(self) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def get_folder(self, name: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def upsert_folder(self, folder: Dict):
+        ...
+
+    @abstractmethod
+    def delete_folder(self, name: str):
+        ...
+
+    @abstractmethod
+    def replace_folders(self, folders: List[Dict]):
+        """用完整列表同步資料夾（只寫入有變化的行）"""
+        ...
+
+    # ---------- 任務 ----------
+
+    @abstractmethod
+    def list_tasks(self, include_pairs: bool = False) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def get_task(self, task_id: str, include_pairs: bool = False) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def upsert_task(self, task: Dict):
+        ...
+
+    @abstractmethod
+    def delete_task(self, task_id: str):
+        ...
+
+    @abstractmethod
+    def replace_tasks(self, tasks: List[Dict]):
+        """用完整列表同步任務（只寫入有變化的行）"""
+        ...
+
+    # ---------- 視頻對 ----------
+
+    @abstractmethod
+    def get_pairs(self, task_id: str) -> Optional[List[Dict]]:
+        ...
+
+    @abstractmethod
+    def replace_pairs(self, task_id: str, pairs: List[Dict]):
+        ...
+
+    @abstractmethod
+    def replace_pairs_if(self, task_id: str, pairs: List[Dict], expected: Optional[List[Dict]]) -> List[Dict]:
+        """
+        只有保存的方案仍是 expected（None 表示還沒有方案）時才寫入 pairs
+
+        Returns:
+            寫入後保存的方案：寫入成功時是 pairs，否則是其他進程已保存的方案
+        """
+        ...
+
+    @abstractmethod
+    def clear_pairs(self):
+        ...
+
+    # ---------- 評估 ----------
+
+    @abstractmethod
+    def list_evaluations(self, task_id: Optional[str] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def add_evaluation(self, evaluation: Dict):
+        ...
+
+    @abstractmethod
+    def delete_evaluations(self, task_id: str) -> int:
+        ...
+
+    @abstractmethod
+    def replace_evaluations(self, evaluations: List[Dict]):
+        """用完整列表同步評估（只寫入有變化的行）"""
+        ...
+
+    @abstractmethod
+    def is_empty(self) -> bool:
+        ...
+
+    # ---------- 多進程共享 ----------
+
+    @abstractmethod
+    def apply_folder_changes(self, upserts: List[Dict], deletes: List[str]):
+        """按行寫入新增/修改的資料夾並刪除指定資料夾（不影響其他進程寫入的行）"""
+        ...
+
+    @abstractmethod
+    def update_folder_stats(
+        self, name: str, video_count: int, total_size: int, absolute: bool = False
+    ) -> Optional[Dict]:
+        """
+        原子化更新資料夾的視頻數/總大小（absolute 為 False 時按增量累加，結果不小於 0）
+
+        Returns:
+            更新後的資料夾；資料夾不存在時返回 None
+        """
+        ...
+
+    @abstractmethod
+    def apply_task_changes(self, upserts: List[Dict], deletes: List[str]):
+        """按行寫入新增/修改的任務並刪除指定任務"""
+        ...
+
+    @abstractmethod
+    def data_version(self) -> int:
+        """其他連接提交寫入後會變化的版本號"""
+        ...
+
+    @abstractmethod
+    def change_seqs(self) -> Dict[str, int]:
+        """各張表的變更序號"""
+        ...
+
+    @abstractmethod
+    def list_evaluations_since(self, seq: int) -> List[tuple]:
+        """返回 seq 之後新增的 (seq, 評估) 列表"""
+        ...
+
+    @abstractmethod
+    def max_evaluation_seq(self) -> int:
+        ...
+
+    @abstractmethod
+    def next_counter(self, name: str, floor: int = 0) -> int:
+        """跨進程遞增的計數器，返回值至少為 floor + 1"""
+        ...
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pairs (
+    task_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (task_id, position)
+);
+CREATE TABLE IF NOT EXISTS evaluations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    task_id TEXT,
+    video_pair_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_evaluations_task_id ON evaluations(task_id);
+CREATE INDEX IF NOT EXISTS idx_evaluations_video_pair_id ON evaluations(video_pair_id);
+CREATE TABLE IF NOT EXISTS change_seq (
+    name TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO change_seq (name) VALUES ('folders'), ('tasks'), ('pairs'), ('evaluations_removed');
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# 每張表的寫入都會遞增 change_seq 中對應的序號，其他 worker 據此判斷需要重新載入哪些數據；
+# 新增的評估按 seq 增量載入，只有修改/刪除評估時才需要整體重新載入
+_CHANGE_TRIGGERS = [
+    ("folders", "folders", ("INSERT", "UPDATE", "DELETE")),
+    ("tasks", "tasks", ("INSERT", "UPDATE", "DELETE")),
+    ("pairs", "pairs", ("INSERT", "UPDATE", "DELETE")),
+    ("evaluations", "evaluations_removed", ("UPDATE", "DELETE")),
+]
+SCHEMA += "".join(
+    f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()} AFTER {event} ON {table} "
+    f"BEGIN UPDATE change_seq SET seq = seq + 1 WHERE name = '{name}'; END;\n"
+    for table, name, events in _CHANGE_TRIGGERS
+    for event in events
+)
+
+
+def _dumps(record: Dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+
+class SQLiteRepository(Repository):
+    """WAL 模式的 SQLite 倉庫實現，每個線程使用獨立的連接"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+        # PRAGMA data_version 只在同一個連接上可比較：固定用一個專用連接讀取，
+        # 否則不同線程的連接返回的版本號互不相關，會漏掉其他進程的寫入
+        self._version_conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._version_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ---------- 通用的按行同步 ----------
+
+    def _sync_rows(self, conn, table: str, key: str, rows: List[tuple]):
+        """
+        把 (key, position, data) 行同步到表中
+
+        只有內容或位置變化的行才會被寫入，不在列表中的行會被刪除。
+        """
+        self._delete_missing(conn, table, key, [r[0] for r in rows])
+        conn.executemany(
+            f"""
+            INSERT INTO {table} ({key}, position, data) VALUES (?, ?, ?)
+            ON CONFLICT({key}) DO UPDATE SET position = excluded.position, data = excluded.data
+            WHERE {table}.data != excluded.data OR {table}.position != excluded.position
+            """,
+            rows
+        )
+
+    def _delete_missing(self, conn, table: str, key: str, keys: List[str]):
+        """刪除表中鍵不在 keys 裏的行"""
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS _sync_keys (k TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM _sync_keys")
+        conn.executemany("INSERT OR IGNORE INTO _sync_keys (k) VALUES (?)", [(k,) for k in keys])
+        conn.execute(f"DELETE FROM {table} WHERE {key} NOT IN (SELECT k FROM _sync_keys)")
+
+    def _next_position(self, conn, table: str) -> int:
+        row = conn.execute(f"SELECT COALESCE(MAX(position), -1) + 1 FROM {table}").fetchone()
+        return row[0]
+
+    # ---------- 資料夾 ----------
+
+    def list_folders(self) -> List[Dict]:
+        rows = self._connection().execute("SELECT data FROM folders ORDER BY position").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def get_folder(self, name: str) -> Optional[Dict]:
+        row = self._connection().execute("SELECT data FROM folders WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def upsert_folder(self, folder: Dict):
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO folders (name, position, data) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET data = excluded.data
+                """,
+                (folder["name"], self._next_position(conn, "folders"), _dumps(folder))
+            )
+
+    def delete_folder(self, name: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM folders WHERE name = ?", (name,))
+
+    def replace_folders(self, folders: List[Dict]):
+        rows = [(f["name"], i, _dumps(f)) for i, f in enumerate(folders)]
+        with self._transaction() as conn:
+            self._sync_rows(conn, "folders", "name", rows)
+
+    # ---------- 任務 ----------
+
+    def _task_with_pairs(self, conn, task: Dict) -> Dict:
+        pairs = self._load_pairs(conn, task["id"])
+        if pairs is not None:
+            task["video_pairs"] = pairs
+        return task
+
+    def list_tasks(self, include_pairs: bool = False) -> List[Dict]:
+        conn = self._connection()
+        tasks = [json.loads(r[0]) for r in conn.execute("SELECT data FROM tasks ORDER BY position")]
+        if include_pairs:
+            tasks = [self._task_with_pairs(conn, t) for t in tasks]
+        return tasks
+
+    def get_task(self, task_id: str, include_pairs: bool = False) -> Optional[Dict]:
+        conn = self._connection()
+        row = conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if not row:
+            return None
+        task = json.loads(row[0])
+        return self._task_with_pairs(conn, task) if include_pairs else task
+
+    def _split_pairs(self, task: Dict):
+        """視頻對單獨存放在 pairs 表中，任務行只保存基本信息"""
+        task = dict(task)
+        pairs = task.pop("video_pairs", None)
+        return task, pairs
+
+    def upsert_task(self, task: Dict):
+        task, pairs = self._split_pairs(task)
+        with self._transaction() as conn:
+            conn.execute(
+                """
+                INSERT INTO tasks (id, position, data) VALUES (?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET data = excluded.data
+                """,
+                (task["id"], self._next_position(conn, "tasks"), _dumps(task))
+            )
+            if pairs is not None:
+                self._write_pairs(conn, task["id"], pairs)
+
+    def delete_task(self, task_id: str):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+            conn.execute("DELETE FROM pairs WHERE task_id = ?", (task_id,))
+
+    def replace_tasks(self, tasks: List[Dict]):
+        rows = []
+        pairs_by_task = {}
+        for i, task in enumerate(tasks):
+            task, pairs = self._split_pairs(task)
+            rows.append((task["id"], i, _dumps(task)))
+            if pairs is not None:
+                pairs_by_task[task["id"]] = pairs
+
+        with self._transaction() as conn:
+            self._sync_rows(conn, "tasks", "id", rows)
+            conn.execute("DELETE FROM pairs WHERE task_id NOT IN (SELECT id FROM tasks)")
+            for task_id, pairs in pairs_by_task.items():
+                self._write_pairs(conn, task_id, pairs)
+
+    # ---------- 視頻對 ----------
+
+    def _load_pairs(self, conn, task_id: str) -> Optional[List[Dict]]:
+        rows = conn.execute(
+            "SELECT data FROM pairs WHERE task_id = ? ORDER BY position", (task_id,)
+        ).fetchall()
+        return [json.loads(r[0]) for r in rows] if rows else None
+
+    def _write_pairs(self, conn, task_id: str, pairs: List[Dict]):
+        conn.execute("DELETE FROM pairs WHERE task_id = ? AND position >= ?", (task_id, len(pairs)))
+        conn.executemany(
+            """
+            INSERT INTO pairs (task_id, position, data) VALUES (?, ?, ?)
+            ON CONFLICT(task_id, position) DO UPDATE SET data = excluded.data
+            WHERE pairs.data != excluded.data
+            """,
+            [(task_id, i, _dumps(p)) for i, p in enumerate(pairs)]
+        )
+
+    def get_pairs(self, task_id: str) -> Optional[List[Dict]]:
+        return self._load_pairs(self._connection(), task_id)
+
+    def replace_pairs(self, task_id: str, pairs: List[Dict]):
+        with self._transaction() as conn:
+            self._write_pairs(conn, task_id, pairs)
+
+    def replace_pairs_if(self, task_id: str, pairs: List[Dict], expected: Optional[List[Dict]]) -> List[Dict]:
+        # BEGIN IMMEDIATE 持有寫鎖，比較和寫入之間其他進程不能修改方案
+        with self._transaction() as conn:
+            stored = self._load_pairs(conn, task_id)
+            if stored != (expected or None):
+                return stored or []
+            self._write_pairs(conn, task_id, pairs)
+            return pairs
+
+    def clear_pairs(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM pairs")
+
+    # ---------- 評估 ----------
+
+    def list_evaluations(self, task_id: Optional[str] = None) -> List[Dict]:
+        conn = self._connection()
+        if task_id is None:
+            rows = conn.execute("SELECT data FROM evaluations ORDER BY seq")
+        else:
+            rows = conn.execute("SELECT data FROM evaluations WHERE task_id = ? ORDER BY seq", (task_id,))
+        return [json.loads(r[0]) for r in rows]
+
+    def _evaluation_row(self, evaluation: Dict) -> tuple:
+        pair_id = evaluation.get("video_pair_id") or ""
+        return (
+            evaluation["id"],
+            evaluation.get("task_id") or task_id_from_pair_id(pair_id),
+            pair_id,
+            _dumps(evaluation)
+        )
+
+    def add_evaluation(self, evaluation: Dict):
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO evaluations (id, task_id, video_pair_id, data) VALUES (?, ?, ?, ?)",
+                    self._evaluation_row(evaluation)
+                )
+        except sqlite3.IntegrityError:
+            raise EvaluationExists(evaluation.get("id"))
+
+    def delete_evaluations(self, task_id: str) -> int:
+        with self._transaction() as conn:
+            cursor = conn.execute("DELETE FROM evaluations WHERE task_id = ?", (task_id,))
+            return cursor.rowcount
+
+    def replace_evaluations(self, evaluations: List[Dict]):
+        rows = [self._evaluation_row(e) for e in evaluations]
+        with self._transaction() as conn:
+            self._delete_missing(conn, "evaluations", "id", [r[0] for r in rows])
+            conn.executemany(
+                """
+                INSERT INTO evaluations (id, task_id, video_pair_id, data) VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    task_id = excluded.task_id,
+                    video_pair_id = excluded.video_pair_id,
+                    data = excluded.data
+                WHERE evaluations.data != excluded.data
+                """,
+                rows
+            )
+
+    def is_empty(self) -> bool:
+        conn = self._connection()
+        for table in ("folders", "tasks", "evaluations"):
+            if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                return False
+        return True
+
+    # ---------- 多進程共享 ----------
+
+    def _apply_changes(
+        self, conn, table: str, key: str, upserts: List[Dict], deletes: List[str], updated_data: str = "excluded.data"
+    ):
+        """updated_data: 衝突時寫入的數據（SQL 表達式，默認為新記錄本身）"""
+        if deletes:
+            conn.executemany(f"DELETE FROM {table} WHERE {key} = ?", [(k,) for k in deletes])
+        position = self._next_position(conn, table)
+        conn.executemany(
+            f"""
+            INSERT INTO {table} ({key}, position, data) VALUES (?, ?, ?)
+            ON CONFLICT({key}) DO UPDATE SET data = {updated_data}
+            WHERE {table}.data != {updated_data}
+            """,
+            [(record[key], position + i, _dumps(record)) for i, record in enumerate(upserts)]
+        )
+
+    def apply_folder_changes(self, upserts: List[Dict], deletes: List[str]):
+        # 統計字段只由 update_folder_stats 原子化修改，整行寫入時保留數據庫中的值，
+        # 避免用本進程較舊的統計覆蓋其他 worker 並發累加的結果
+        keep_stats = (
+            "json_set(excluded.data, "
+            "'$.video_count', COALESCE(json_extract(folders.data, '$.video_count'), 0), "
+            "'$.total_size', COALESCE(json_extract(folders.data, '$.total_size'), 0))"
+        )
+        with self._transaction() as conn:
+            self._apply_changes(conn, "folders", "name", upserts, deletes, updated_data=keep_stats)
+
+    def update_folder_stats(
+        self, name: str, video_count: int, total_size: int, absolute: bool = False
+    ) -> Optional[Dict]:
+        if absolute:
+            count_expr, size_expr = "?", "?"
+        else:
+            count_expr = "COALESCE(json_extract(data, '$.video_count'), 0) + ?"
+            size_expr = "COALESCE(json_extract(data, '$.total_size'), 0) + ?"
+        with self._transaction() as conn:
+            conn.execute(
+                f"""
+                UPDATE folders SET data = json_set(
+                    data, '$.video_count', MAX(0, {count_expr}), '$.total_size', MAX(0, {size_expr})
+                ) WHERE name = ?
+                """,
+                (video_count, total_size, name)
+            )
+            row = conn.execute("SELECT data FROM folders WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def apply_task_changes(self, upserts: List[Dict], deletes: List[str]):
+        upserts = [self._split_pairs(t)[0] for t in upserts]
+        with self._transaction() as conn:
+            self._apply_changes(conn, "tasks", "id", upserts, deletes)
+            if deletes:
+                conn.executemany("DELETE FROM pairs WHERE task_id = ?", [(k,) for k in deletes])
+
+    def data_version(self) -> int:
+        with self._version_lock:
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def change_seqs(self) -> Dict[str, int]:
+        return dict(self._connection().execute("SELECT name, seq FROM change_seq").fetchall())
+
+    def list_evaluations_since(self, seq: int) -> List[tuple]:
+        rows = self._connection().execute(
+            "SELECT seq, data FROM evaluations WHERE seq > ? ORDER BY seq", (seq,)
+        )
+        return [(r[0], json.loads(r[1])) for r in rows]
+
+    def max_evaluation_seq(self) -> int:
+        return self._connection().execute("SELECT COALESCE(MAX(seq), 0) FROM evaluations").fetchone()[0]
+
+    def next_counter(self, name: str, floor: int = 0) -> int:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", (name,))
+            conn.execute("UPDATE counters SET value = MAX(value, ?) + 1 WHERE name = ?", (floor, name))
+            return conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK 上下文管理器"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+_repositories: Dict[str, SQLiteRepository] = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(db_path: str) -> SQLiteRepository:
+    """獲取（並緩存）指定數據庫文件的倉庫實例"""
+    key = os.path.abspath(db_path)
+    with _repositories_lock:
+        if key not in _repositories:
+            _repositories[key] = SQLiteRepository(db_path)
+        return _repositories[key]
+
+
+# ---------- JSON -> SQLite 遷移 ----------
+
+def _read_json(path: Optional[str], default):
+    if not path or not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def migrate_json_storage(
+    repository: Repository,
+    folders_file: Optional[str] = None,
+    tasks_file: Optional[str] = None,
+    evaluations_file: Optional[str] = None,
+    tasks_data_file: Optional[str] = None,
+    evaluations_data_file: Optional[str] = None,
+    pair_plans_dir: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    一次性把現有的 JSON 存儲批量導入倉庫
+
+    支持兩種格式：
+    - data/*.json 中的列表（main.py / main_railway.py）
+    - tasks_data.json / evaluations_data.json 中以ID為鍵的字典（api 路由模塊）
+
+    Args:
+        repository: 目標倉庫
+        folders_file: data/folders.json
+        tasks_file: data/tasks.json
+        evaluations_file: data/evaluations.json（會一併重放其追加日誌）
+        tasks_data_file: tasks_data.json
+        evaluations_data_file: evaluations_data.json
+        pair_plans_dir: data/pair_plans（每個任務一個 {task_id}.json 的視頻對方案）
+
+    Returns:
+        各類記錄的導入數量
+    """
+    folders = list(_read_json(folders_file, []))
+    tasks = list(_read_json(tasks_file, []))
+    tasks.extend(_read_json(tasks_data_file, {}).values())
+    if pair_plans_dir:
+        # 已保存的方案必須原樣導入：重新生成會重新隨機左右順序，已有的評估會對應到錯誤的一側
+        tasks = [
+            task if task.get("video_pairs") is not None
+            else dict(task, video_pairs=_read_json(os.path.join(pair_plans_dir, f"{task['id']}.json"), None))
+            for task in tasks
+        ]
+
+    evaluations = []
+    if evaluations_file:
+        from database.evaluation_journal import EvaluationJournal
+        evaluations.extend(EvaluationJournal(evaluations_file).load())
+    evaluations.extend(_read_json(evaluations_data_file, {}).values())
+
+    repository.replace_folders(folders)
+    repository.replace_tasks(tasks)
+    repository.replace_evaluations(evaluations)
+
+    counts = {
+        "folders": len(folders),
+        "tasks": len(tasks),
+        "pairs": sum(len(t.get("video_pairs") or []) for t in tasks),
+        "evaluations": len(evaluations)
+    }
+    print(f"✅ JSON 數據遷移完成: {counts}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把 JSON 存儲一次性遷移到 SQLite")
+    parser.add_argument("--db", required=True, help="目標 SQLite 文件，例如 data/storage.db")
+    parser.add_argument("--data-dir", help="包含 folders.json / tasks.json / evaluations.json 的目錄")
+    parser.add_argument("--tasks-data", help="以ID為鍵的 tasks_data.json")
+    parser.add_argument("--evaluations-data", help="以ID為鍵的 evaluations_data.json")
+    args = parser.parse_args()
+
+    data_file = lambda name: os.path.join(args.data_dir, name) if args.data_dir else None
+    migrate_json_storage(
+        get_repository(args.db),
+        folders_file=data_file("folders.json"),
+        tasks_file=data_file("tasks.json"),
+        evaluations_file=data_file("evaluations.json"),
+        tasks_data_file=args.tasks_data,
+        evaluations_data_file=args.evaluations_data,
+        pair_plans_dir=data_file("pair_plans")
+    )
+
+
+if __name__ == "__main__":
+    main()
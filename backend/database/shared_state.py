@@ -0,0 +1,126 @@
+"""
+多 worker 共享狀態
+SQLite（WAL）數據庫是所有 worker 進程的唯一數據源：寫入按行直接落庫，
+每個請求前用 PRAGMA data_version 和 change_seq 判斷其他進程是否寫入過，
+只重新載入變化的部分（新增的評估按 seq 增量載入）
+"""
+
+import asyncio
+import threading
+from typing import Dict, Optional
+
+from database.indexed_store import IndexedStore
+
+
+class SharedStateSync:
+    """把 SQLite 中其他 worker 寫入的變化同步到本進程的 IndexedStore"""
+
+    def __init__(self, repository, store: IndexedStore, pair_plans=None):
+        """
+        Args:
+            repository: SQLiteRepository
+            store: 本進程的內存存儲
+            pair_plans: PairPlanStore，視頻對變化時清空其緩存
+        """
+        self.repository = repository
+        self.store = store
+        self.pair_plans = pair_plans
+        self._lock = threading.Lock()
+        self._data_version: Optional[int] = None
+        self._seqs: Dict[str, int] = {}
+        self._evaluation_seq = 0
+        # fetch() 的批次號，以及每類數據已應用到內存的最新批次
+        self._generation = 0
+        self._applied: Dict[str, int] = {}
+
+    def load(self):
+        """從數據庫完整載入資料夾、任務和評估"""
+        with self._lock:
+            # 先記錄序號再讀數據：讀取期間的寫入最多導致下次多載入一次
+            self._data_version = self.repository.data_version()
+            self._seqs = self.repository.change_seqs()
+            self._evaluation_seq = self.repository.max_evaluation_seq()
+            self.store.load(
+                self.repository.list_folders(),
+                self.repository.list_tasks(),
+                self.repository.list_evaluations()
+            )
+            self._applied = dict.fromkeys(("folders", "tasks", "evaluations"), self._generation)
+            if self.pair_plans is not None:
+                self.pair_plans.invalidate()
+
+    def fetch(self) -> Optional[Dict]:
+        """
+        讀取其他進程的寫入（數據庫 I/O，在線程池中調用，不修改內存存儲）
+
+        Returns:
+            交給 apply() 的變化；數據庫沒有變化時返回 None
+        """
+        with self._lock:
+            data_version = self.repository.data_version()
+            if data_version == self._data_version:
+                return None
+            self._data_version = data_version
+
+            seqs = self.repository.change_seqs()
+            changed = {name for name, seq in seqs.items() if self._seqs.get(name) != seq}
+            self._seqs = seqs
+            self._generation += 1
+
+            changes = {"generation": self._generation, "pairs": "pairs" in changed}
+            if "folders" in changed:
+                changes["folders"] = self.repository.list_folders()
+            if "tasks" in changed:
+                changes["tasks"] = self.repository.list_tasks()
+            if "evaluations_removed" in changed:
+                self._evaluation_seq = self.repository.max_evaluation_seq()
+                changes["evaluations"] = self.repository.list_evaluations()
+            else:
+                new_evaluations = []
+                for seq, evaluation in self.repository.list_evaluations_since(self._evaluation_seq):
+                    self._evaluation_seq = seq
+                    new_evaluations.append(evaluation)
+                changes["new_evaluations"] = new_evaluations
+            return changes
+
+    def apply(self, changes: Optional[Dict]) -> bool:
+        """
+        把 fetch() 讀到的變化寫入內存存儲（在事件循環中調用）
+
+        並發請求的 fetch() 完成順序和 apply() 順序可能不同，較舊的結果不覆蓋已應用的較新結果
+
+        Returns:
+            是否有數據被重新載入
+        """
+        if changes is None:
+            return False
+        generation = changes["generation"]
+        if "folders" in changes and generation > self._applied.get("folders", 0):
+            self._applied["folders"] = generation
+            self.store.replace_folders(changes["folders"])
+        if "tasks" in changes and generation > self._applied.get("tasks", 0):
+            self._applied["tasks"] = generation
+            self.store.replace_tasks(changes["tasks"])
+        if changes["pairs"] and self.pair_plans is not None:
+            self.pair_plans.invalidate()
+
+        if "evaluations" in changes:
+            if generation > self._applied.get("evaluations", 0):
+                self._applied["evaluations"] = generation
+                self.store.replace_evaluations(changes["evaluations"])
+        elif generation > self._applied.get("evaluations", 0):
+            # 較新的完整載入已經包含這些評估
+            for evaluation in changes["new_evaluations"]:
+                # 本進程寫入的評估已經在內存中
+                if not self.store.has_evaluation(evaluation):
+                    self.store.add_evaluation(evaluation)
+        return True
+
+    def sync(self) -> bool:
+        """載入其他進程的寫入（同步版本，用於啟動腳本等不在事件循環中的場景）"""
+        return self.apply(self.fetch())
+
+    async def sync_async(self) -> bool:
+        """載入其他進程的寫入，數據庫讀取在線程池中進行，不阻塞事件循環"""
+        changes = await asyncio.get_running_loop().run_in_executor(None, self.fetch)
+        return self.apply(changes)
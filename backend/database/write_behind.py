@@ -0,0 +1,182 @@
+"""
+寫後（write-behind）持久化管理
+請求處理中只把存儲標記為髒，在一個可配置的時間窗口內合併多次修改，
+再在線程池中原子化地寫盤，不阻塞事件循環
+"""
+
+import os
+import copy
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+PERSIST_DEBOUNCE_SECONDS = float(os.environ.get("PERSIST_DEBOUNCE_SECONDS", "0.5"))
+PERSIST_MAX_DELAY_SECONDS = float(os.environ.get("PERSIST_MAX_DELAY_SECONDS", "5"))
+# 寫入失敗後重試的間隔
+PERSIST_RETRY_SECONDS = float(os.environ.get("PERSIST_RETRY_SECONDS", "1"))
+
+
+class WriteBehindPersister:
+    """
+    按名稱註冊的存儲的延遲合併寫入
+
+    - mark_dirty(name) 只記錄髒標記並（重新）安排一次 flush
+    - 連續修改會不斷推遲 flush，但距離第一次修改不會超過 max_delay
+    - flush 時在事件循環上深拷貝一份快照，寫盤在線程池中進行
+    - close() 在應用關閉時做最後一次 flush，保證不丟數據
+    - writer 拋出異常時，失敗的存儲在事件循環上重新標記為髒，並在 PERSIST_RETRY_SECONDS 後重試
+    - debounce_seconds <= 0 時為直寫模式，mark_dirty 不等待防抖，立即在線程池中寫入，
+      請求返回前用 wait_idle() 等待寫入完成（多 worker 共享 SQLite 時使用，其他進程能馬上讀到修改）
+    """
+
+    def __init__(
+        self,
+        debounce_seconds: float = PERSIST_DEBOUNCE_SECONDS,
+        max_delay_seconds: float = PERSIST_MAX_DELAY_SECONDS
+    ):
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+
+        self._sources: Dict[str, Callable[[], Any]] = {}
+        self._writers: Dict[str, Callable[[Any], None]] = {}
+        self._requeue: Dict[str, Callable[[Any], None]] = {}
+        self._dirty = set()
+        self._first_dirty_at: Optional[float] = None
+        self._timer: Optional[asyncio.Handle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        # 快照按代數編號，較舊的快照不會覆蓋已寫入的較新快照
+        self._io_lock = threading.Lock()
+        self._generation = 0
+        self._written_generation: Dict[str, int] = {}
+
+    def register(self, name: str, source: Callable[[], Any], writer: Callable[[Any], None],
+                 requeue: Optional[Callable[[Any], None]] = None):
+        """
+        註冊一個存儲
+
+        Args:
+            name: 存儲名稱，如 "folders"
+            source: 返回當前內存數據的函數（在事件循環上調用）
+            writer: 把快照寫入持久化存儲的函數（在線程池中調用），失敗時拋出異常
+            requeue: 寫入失敗時把快照交還給存儲的函數（source 會取走數據時需要，如按行的變更記錄）
+        """
+        self._sources[name] = source
+        self._writers[name] = writer
+        if requeue is not None:
+            self._requeue[name] = requeue
+
+    def mark_dirty(self, *names: str):
+        """標記存儲已修改，稍後合併寫入"""
+        self._dirty.update(names)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循環中（啟動腳本、命令行等），直接同步寫入
+            self.flush_sync()
+            return
+        if self.debounce_seconds <= 0:
+            # 直寫：同一輪事件循環中的多次修改合併為一次寫入
+            if self._timer is None:
+                self._timer = loop.call_soon(self._schedule_flush)
+            return
+
+        now = loop.time()
+        if self._first_dirty_at is None:
+            self._first_dirty_at = now
+        delay = min(self.debounce_seconds, self._first_dirty_at + self.max_delay_seconds - now)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(max(delay, 0), self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._timer = None
+        previous = self._flush_task
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_after(previous))
+
+    async def _flush_after(self, previous: Optional[asyncio.Task]):
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        await self.flush()
+
+    def _take_snapshots(self, names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        names = set(self._dirty if names is None else names)
+        self._dirty.difference_update(names)
+        if not self._dirty:
+            self._first_dirty_at = None
+        self._generation += 1
+        return {name: copy.deepcopy(self._sources[name]()) for name in names if name in self._sources}
+
+    def _write_snapshots(self, generation: int, snapshots: Dict[str, Any]) -> List[str]:
+        """寫入快照（可在線程池中執行），返回寫入失敗的存儲名稱"""
+        failed = []
+        with self._io_lock:
+            for name, data in snapshots.items():
+                if self._written_generation.get(name, 0) > generation:
+                    continue
+                try:
+                    self._writers[name](data)
+                    self._written_generation[name] = generation
+                except Exception as e:
+                    print(f"❌ 寫後持久化 {name} 失敗: {e}")
+                    failed.append(name)
+        return failed
+
+    def _retry(self, failed: List[str], snapshots: Dict[str, Any]):
+        """在調用 flush 的線程（事件循環）上恢復失敗存儲的髒標記，並安排重試"""
+        for name in failed:
+            if name in self._requeue:
+                self._requeue[name](snapshots[name])
+        self._dirty.update(failed)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # 不在事件循環中：保留髒標記，下次寫入或 close() 時重試
+        if self._first_dirty_at is None:
+            self._first_dirty_at = loop.time()
+        if self._timer is None:
+            self._timer = loop.call_later(PERSIST_RETRY_SECONDS, self._schedule_flush)
+
+    async def flush(self, names: Optional[Iterable[str]] = None):
+        """立即寫入髒存儲（names 為 None 時寫入全部髒存儲）"""
+        snapshots = self._take_snapshots(names)
+        if not snapshots:
+            return
+        generation = self._generation
+        failed = await asyncio.get_running_loop().run_in_executor(
+            None, self._write_snapshots, generation, snapshots
+        )
+        if failed:
+            self._retry(failed, snapshots)
+
+    async def wait_idle(self):
+        """等待已標記的修改寫入完成（不等待失敗後的重試）"""
+        if self._timer is not None and self.debounce_seconds <= 0:
+            await asyncio.sleep(0)  # 讓 call_soon 安排的 flush 開始
+        task = self._flush_task
+        if task is not None and not task.done():
+            await asyncio.wait([task])
+
+    def flush_sync(self):
+        """在當前線程同步寫入全部髒存儲"""
+        snapshots = self._take_snapshots()
+        if snapshots:
+            failed = self._write_snapshots(self._generation, snapshots)
+            if failed:
+                self._retry(failed, snapshots)
+
+    async def close(self):
+        """取消待定的定時器，等待進行中的寫入，並做最後一次 flush"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flush_task is not None:
+            if not self._flush_task.done():
+                await asyncio.wait([self._flush_task])
+            self._flush_task = None
+        await self.flush()
+        if self._timer is not None:
+            # 最後一次寫入失敗時不再重試
+            self._timer.cancel()
+            self._timer = None
+        self._first_dirty_at = None
@@ -3,23 +3,51 @@ Side-by-Side 視頻盲測服務 - 主應用程式
 提供視頻對比和盲測功能的 FastAPI 服務
 """
 
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
 import uvicorn
 import os
+import asyncio
 from contextlib import asynccontextmanager
 import time
 import json
 import shutil
 import random
+import bisect
 from urllib.parse import quote, unquote
-from typing import List
+from typing import List, Optional
 import sys
 import traceback
 import pandas as pd
 
+from database.evaluation_journal import EvaluationJournal
+from database.repository import EvaluationExists, get_repository, migrate_json_storage, use_sqlite_storage
+from database.indexed_store import IndexedStore
+from database.write_behind import WriteBehindPersister
+from database.pair_plans import PairPlanBuilder, PairPlanStore, active_pairs
+from database.folder_versions import FolderVersions
+from database.name_index import FolderNameIndex
+from database.shared_state import SharedStateSync
+from database.metadata_index import MetadataIndex
+from utils.file_utils import atomic_write_json, video_signature_validator
+from utils.blob_store import BlobStore
+from utils.bulk_ingest import BulkIngestJobs, IngestJobNotFound
+from utils.name_rules import BUILTIN_RULESETS, get_ruleset, preview_rules
+from utils.faststart import FASTSTART_UPLOADS, make_faststart_stage
+from utils.page_cache import PageCacheWarmer
+from utils.video_serving import (
+    VIDEO_ACCEL_REDIRECT, StatCache, accel_redirect, resolve_served_path, serve_file
+)
+from utils.resumable_upload import (
+    ChecksumMismatch, InvalidChunk, ResumableUploads, UploadIncomplete, UploadSessionNotFound
+)
+from utils.upload_stream import (
+    UPLOAD_CHUNK_SIZE, InvalidVideoFile, UploadTooLarge, content_length_exceeds, safe_upload_name,
+    stream_upload_to_file, upload_size_limit
+)
+
 # --- 1. Top-level Debug Logging ---
 print("--- [DEBUG] App is starting up... ---")
 print(f"--- [DEBUG] Python Version: {sys.version}")
@@ -31,11 +59,25 @@ DATA_DIR = "data"
 FOLDERS_FILE = os.path.join(DATA_DIR, "folders.json")
 TASKS_FILE = os.path.join(DATA_DIR, "tasks.json")
 EVALUATIONS_FILE = os.path.join(DATA_DIR, "evaluations.json")
+PAIR_PLANS_DIR = os.path.join(DATA_DIR, "pair_plans")
+UPLOAD_SESSIONS_DIR = os.path.join(DATA_DIR, "upload_sessions")
+INGEST_JOBS_DIR = os.path.join(DATA_DIR, "ingest_jobs")
+# 內容尋址的 blob 放在對外提供的 uploads 目錄之外，只能通過資料夾中的硬鏈接訪問
+BLOB_DIR = os.path.join(DATA_DIR, "blobs")
+LEGACY_BLOB_DIR = os.path.join("uploads", ".blobs")
 SUPPORTED_FORMATS = [".mp4", ".mov", ".avi", ".mkv", ".webm"]
 
+# STORAGE_BACKEND=sqlite 時，load_/save_ 函數改為按行讀寫 WAL 模式的 SQLite
+STORAGE_DB_FILE = os.path.join(DATA_DIR, "storage.db")
+repository = get_repository(STORAGE_DB_FILE) if use_sqlite_storage() else None
+
 def load_folders():
     """從文件載入資料夾數據"""
     try:
+        if repository:
+            data = repository.list_folders()
+            print(f"✅ 載入了 {len(data)} 個資料夾")
+            return data
         if os.path.exists(FOLDERS_FILE):
             with open(FOLDERS_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -46,17 +88,20 @@ def load_folders():
     return []
 
 def save_folders(folders_data):
-    """保存資料夾數據到文件"""
-    try:
-        with open(FOLDERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(folders_data, f, ensure_ascii=False, indent=2)
-        print(f"✅ 保存了 {len(folders_data)} 個資料夾")
-    except Exception as e:
-        print(f"❌ 保存資料夾數據失敗: {e}")
+    """保存資料夾數據到文件（失敗時拋出異常，由 write_behind 重試）"""
+    if repository:
+        repository.replace_folders(folders_data)  # 只寫入有變化的行
+    else:
+        atomic_write_json(FOLDERS_FILE, folders_data, indent=2)
+    print(f"✅ 保存了 {len(folders_data)} 個資料夾")
 
 def load_tasks():
     """從文件載入任務數據"""
     try:
+        if repository:
+            data = repository.list_tasks()
+            print(f"✅ 載入了 {len(data)} 個任務")
+            return data
         if os.path.exists(TASKS_FILE):
             with open(TASKS_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -67,35 +112,100 @@ def load_tasks():
     return []
 
 def save_tasks(tasks_data):
-    """保存任務數據到文件"""
-    try:
-        with open(TASKS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(tasks_data, f, ensure_ascii=False, indent=2)
-        print(f"✅ 保存了 {len(tasks_data)} 個任務")
-    except Exception as e:
-        print(f"❌ 保存任務數據失敗: {e}")
+    """保存任務數據到文件（失敗時拋出異常，由 write_behind 重試）"""
+    if repository:
+        repository.replace_tasks(tasks_data)  # 只寫入有變化的行
+    else:
+        atomic_write_json(TASKS_FILE, tasks_data, indent=2)
+    print(f"✅ 保存了 {len(tasks_data)} 個任務")
+
+def save_folder_changes(changes):
+    """按行寫入資料夾的變更（SQLite 後端，不會覆蓋其他 worker 寫入的行；失敗時拋出異常，由 write_behind 重試）"""
+    upserts, deletes = changes
+    repository.apply_folder_changes(upserts, deletes)
+    print(f"✅ 保存了 {len(upserts)} 個資料夾，刪除了 {len(deletes)} 個資料夾")
+
+def save_task_changes(changes):
+    """按行寫入任務的變更（SQLite 後端，不會覆蓋其他 worker 寫入的行；失敗時拋出異常，由 write_behind 重試）"""
+    upserts, deletes = changes
+    repository.apply_task_changes(upserts, deletes)
+    print(f"✅ 保存了 {len(upserts)} 個任務，刪除了 {len(deletes)} 個任務")
+
+async def update_folder_stats(folder, video_count=0, total_size=0, absolute=False):
+    """
+    更新資料夾的視頻數/總大小（absolute 為 False 時按增量累加）
+    SQLite 後端在數據庫中原子化累加（線程池中執行），多個 worker 並發上傳不會互相覆蓋統計
+    """
+    if repository:
+        updated = await asyncio.get_running_loop().run_in_executor(
+            None, repository.update_folder_stats, folder["name"], video_count, total_size, absolute
+        )
+        if updated is not None:
+            folder["video_count"] = updated["video_count"]
+            folder["total_size"] = updated["total_size"]
+            return
+    if absolute:
+        folder["video_count"], folder["total_size"] = video_count, total_size
+    else:
+        folder["video_count"] = max(0, folder.get("video_count", 0) + video_count)
+        folder["total_size"] = max(0, folder.get("total_size", 0) + total_size)
+    store.touch_folder(folder["name"])
+    write_behind.mark_dirty("folders")
+
+# JSON 後端的進程內計數器 {名稱: 上一次分配的編號}
+local_sequences = {}
+
+async def next_sequence(name, current_count):
+    """生成遞增編號；SQLite 後端使用跨進程計數器（線程池中執行），多個 worker 不會生成相同的ID"""
+    if repository:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, repository.next_counter, name, current_count
+        )
+    # JSON 後端在進程內分配：編號在任何 await 之前確定，並發的請求不會拿到相同的編號
+    value = max(local_sequences.get(name, 0), current_count) + 1
+    local_sequences[name] = value
+    return value
+
+# 評估數據使用 快照 + 追加日誌，每次投票只追加一行而不是重寫整個文件
+evaluation_journal = EvaluationJournal(
+    EVALUATIONS_FILE,
+    commit_interval=float(os.environ.get("EVALUATION_COMMIT_INTERVAL", "0.05")),
+    compact_threshold=int(os.environ.get("EVALUATION_COMPACT_THRESHOLD", "10000"))
+)
 
 def load_evaluations():
-    """從文件載入評估數據"""
+    """從快照載入評估數據並重放日誌"""
     try:
-        if os.path.exists(EVALUATIONS_FILE):
-            with open(EVALUATIONS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                print(f"✅ 載入了 {len(data)} 個評估")
-                return data
+        if repository:
+            data = repository.list_evaluations()
+            print(f"✅ 載入了 {len(data)} 個評估")
+            return data
+        return evaluation_journal.load()
     except Exception as e:
         print(f"❌ 載入評估數據失敗: {e}")
     return []
 
 def save_evaluations(evaluations_data):
-    """保存評估數據到文件"""
+    """整體重寫評估快照（僅用於刪除、清空等操作，新增評估請使用 append_evaluation）"""
     try:
-        with open(EVALUATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(evaluations_data, f, ensure_ascii=False, indent=2)
-        print(f"✅ 保存了 {len(evaluations_data)} 個評估")
+        if repository:
+            repository.replace_evaluations(evaluations_data)
+            print(f"✅ 保存了 {len(evaluations_data)} 個評估")
+        else:
+            evaluation_journal.rewrite(evaluations_data)
     except Exception as e:
         print(f"❌ 保存評估數據失敗: {e}")
 
+# 新評估的ID與已有評估衝突時最多重新分配的次數
+EVALUATION_ID_ATTEMPTS = 3
+
+async def append_evaluation(evaluation):
+    """持久化一條新評估：SQLite 後端插入一行，JSON 後端追加到日誌"""
+    if repository:
+        await asyncio.get_running_loop().run_in_executor(None, repository.add_evaluation, evaluation)
+    else:
+        await evaluation_journal.append_async(evaluation)
+
 # 修復導入問題，先註釋掉可能有問題的導入
 # from database.database import engine, SessionLocal, Base
 # from api import folders
@@ -119,12 +229,21 @@ async def lifespan(app: FastAPI):
         
         # 啟動時載入持久化數據
         print("--- [DEBUG] Loading data from JSON files...")
-        global folders_storage, tasks_storage, evaluations_storage
-        folders_storage = load_folders()
-        tasks_storage = load_tasks()
-        evaluations_storage = load_evaluations()
+        if repository and repository.is_empty():
+            # 首次切換到 SQLite 時，一次性導入現有的 JSON 數據
+            migrate_json_storage(
+                repository, FOLDERS_FILE, TASKS_FILE, EVALUATIONS_FILE, pair_plans_dir=PAIR_PLANS_DIR
+            )
+        if shared_state:
+            shared_state.load()
+        else:
+            store.load(load_folders(), load_tasks(), load_evaluations())
+            if pair_plans.migrate_embedded(store.task_list()):
+                write_behind.mark_dirty("tasks")
+        if not repository:
+            evaluation_journal.start()
 
-        print(f"--- [SUCCESS] Lifespan startup complete. Loaded {len(folders_storage)} folders, {len(tasks_storage)} tasks.")
+        print(f"--- [SUCCESS] Lifespan startup complete. Loaded {len(store.folders)} folders, {len(store.tasks)} tasks.")
         
         yield
         
@@ -136,6 +255,11 @@ async def lifespan(app: FastAPI):
     finally:
         # 關閉時的清理工作
         print("--- [DEBUG] Lifespan context shutting down...")
+        await pair_plan_builder.wait_changes()  # 後台的方案增量修改會標記任務列表需要保存
+        await write_behind.close()  # 寫入所有尚未落盤的修改
+        evaluation_journal.close()
+        metadata_index.shutdown()
+        bulk_ingest.shutdown()
 
 
 # 創建 FastAPI 應用實例
@@ -172,11 +296,8 @@ if os.path.exists("static"):
 else:
     print("⚠️  Warning: static directory not found, skipping static files mount")
 
-if os.path.exists("uploads"):
-    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-else:
-    os.makedirs("uploads", exist_ok=True)
-    app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# 上傳的視頻由 serve_upload 路由提供（範圍請求、ETag/304），不再掛載 StaticFiles
+os.makedirs("uploads", exist_ok=True)
 
 if os.path.exists("exports"):
     app.mount("/exports", StaticFiles(directory="exports"), name="exports")  
@@ -225,9 +346,9 @@ async def health_check():
         
         # 檢查存儲狀態
         storage_status = {
-            "folders": len(folders_storage),
-            "tasks": len(tasks_storage),
-            "evaluations": len(evaluations_storage)
+            "folders": len(store.folders),
+            "tasks": len(store.tasks),
+            "evaluations": len(store.evaluations)
         }
         
         return {
@@ -253,13 +374,18 @@ async def api_health_check():
     print("--- [HEALTH CHECK] /api/health endpoint was hit! ---")
     return {"status": "healthy", "version": "1.0.0", "message": "Health check successful"}
 
+@app.get("/api/prefetch/stats")
+async def get_prefetch_stats():
+    """視頻預熱的命中/未命中統計，用於調整 PREFETCH_PAIRS 和 PREFETCH_HEAD_BYTES"""
+    return {"success": True, "data": page_cache_warmer.snapshot()}
+
 @app.get("/api/test/upload/{folder_name}")
 async def test_upload_route(folder_name: str):
     """測試上傳路由是否工作"""
     return {
         "message": f"Upload route test for folder: {folder_name}",
-        "available_folders": [f['name'] for f in folders_storage],
-        "folder_exists": any(f['name'] == folder_name for f in folders_storage)
+        "available_folders": list(store.folders),
+        "folder_exists": folder_name in store.folders
     }
 
 @app.post("/api/quick-setup")
@@ -271,7 +397,7 @@ async def quick_setup():
         
         for folder_name in common_folders:
             # 檢查是否已存在
-            if not any(f["name"] == folder_name for f in folders_storage):
+            if folder_name not in store.folders:
                 new_folder = {
                     "name": folder_name,
                     "path": f"/uploads/{folder_name}",
@@ -279,22 +405,22 @@ async def quick_setup():
                     "total_size": 0,
                     "created_time": int(time.time())
                 }
-                folders_storage.append(new_folder)
+                store.add_folder(new_folder)
                 created_folders.append(folder_name)
                 
                 # 創建物理目錄
                 os.makedirs(f"uploads/{folder_name}", exist_ok=True)
         
         # 保存到文件
-        save_folders(folders_storage)
+        write_behind.mark_dirty("folders")
         
         return {
             "success": True,
             "message": f"快速設置完成",
             "data": {
                 "created_folders": created_folders,
-                "total_folders": len(folders_storage),
-                "all_folders": [f['name'] for f in folders_storage]
+                "total_folders": len(store.folders),
+                "all_folders": list(store.folders)
             }
         }
     except Exception as e:
@@ -303,15 +429,82 @@ async def quick_setup():
             "error": f"快速設置失敗: {str(e)}"
         }
 
-# 持久化存儲會在startup時初始化
-folders_storage = []
-tasks_storage = []
-evaluations_storage = []
+# 持久化存儲會在startup時初始化（資料夾/任務/評估均帶索引）
+store = IndexedStore(track_changes=repository is not None)
+
+# 每個任務的視頻對單獨存放、按需載入，tasks.json 不再內嵌 video_pairs
+pair_plans = PairPlanStore(PAIR_PLANS_DIR, repository)
+
+# 資料夾內容版本（可見文件名列表的指紋），版本不變時任務的視頻對方案不需要重新生成
+folder_versions = FolderVersions("uploads")
+
+# 每個資料夾按標準化名稱保存的文件名索引，上傳/刪除文件時只修改受影響的項和視頻對
+name_index = FolderNameIndex("uploads", folder_versions)
+
+# 上傳的視頻按內容哈希保存一份，資料夾中的文件是指向 blob 的硬鏈接
+blob_store = BlobStore(BLOB_DIR, legacy_root=LEGACY_BLOB_DIR)
+
+# 可續傳的分塊上傳會話
+resumable_uploads = ResumableUploads(UPLOAD_SESSIONS_DIR, blob_store)
+
+# 把服務器本地目錄/壓縮包導入資料夾的後台任務（reflink/硬鏈接，不支持時複製）
+bulk_ingest = BulkIngestJobs(INGEST_JOBS_DIR, "uploads")
+bulk_ingest_tasks = set()
+
+# 視頻路由緩存的 stat 結果（ETag/Last-Modified），文件寫入後清除
+video_stat_cache = StatCache()
+
+# 按任務的視頻對順序預熱評估者接下來要看的視頻（PREFETCH_PAIRS=0 關閉）
+page_cache_warmer = PageCacheWarmer("uploads")
+
+# 上傳完成後在後台探測視頻元數據，列出文件時直接讀取資料夾中的索引
+# 可選：上傳完成的 MP4 在探測前把末尾的 moov 移到文件開頭（FASTSTART_UPLOADS=1 開啟，只處理新上傳的文件）
+metadata_index = MetadataIndex(
+    before_probe=make_faststart_stage(
+        blob_store, on_rewrite=lambda path: video_stat_cache.invalidate()
+    ) if FASTSTART_UPLOADS else None
+)
+
+if repository:
+    # SQLite 後端是所有 worker 共享的數據源：修改按行直寫，請求前同步其他 worker 的寫入
+    write_behind = WriteBehindPersister(debounce_seconds=0)
+    write_behind.register("folders", store.take_folder_changes, save_folder_changes,
+                          requeue=store.requeue_folder_changes)
+    write_behind.register("tasks", store.take_task_changes, save_task_changes,
+                          requeue=store.requeue_task_changes)
+    shared_state = SharedStateSync(repository, store, pair_plans)
+else:
+    # 資料夾/任務的修改只標記為髒，由 write_behind 合併後在線程池中原子化寫盤
+    write_behind = WriteBehindPersister()
+    write_behind.register("folders", store.folder_list, save_folders)
+    write_behind.register("tasks", store.task_list, save_tasks)
+    shared_state = None
+
+@app.middleware("http")
+async def sync_shared_state(request, call_next):
+    """多 worker 模式下，處理 API 請求前載入其他 worker 的寫入，返回前等待本請求的修改寫入數據庫"""
+    if not (shared_state and request.url.path.startswith("/api/")):
+        return await call_next(request)
+    await shared_state.sync_async()
+    response = await call_next(request)
+    await write_behind.wait_idle()
+    return response
+
+@app.middleware("http")
+async def reject_oversized_upload(request, call_next):
+    """上傳請求的 Content-Length 超過上限時，在解析請求體之前直接拒絕"""
+    if request.method == "POST" and request.url.path.endswith("/upload") \
+            and content_length_exceeds(request.headers.get("content-length")):
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"上傳內容超過大小上限 {upload_size_limit()} 字節"}
+        )
+    return await call_next(request)
 
 # 簡單的folders API端點用於測試
 @app.get("/api/folders/")
 async def get_folders():
-    return {"success": True, "data": folders_storage, "message": "Folder list"}
+    return {"success": True, "data": store.folder_list(), "message": "Folder list"}
 
 @app.post("/api/folders/create")
 async def create_folder(data: dict):
@@ -320,7 +513,7 @@ async def create_folder(data: dict):
         return {"success": False, "error": "Folder name cannot be empty"}
     
     # 檢查是否已存在
-    if any(folder["name"] == folder_name for folder in folders_storage):
+    if folder_name in store.folders:
         return {"success": False, "error": f"Folder '{folder_name}' already exists"}
     
     # 創建資料夾對象並保存到文件
@@ -331,8 +524,8 @@ async def create_folder(data: dict):
         "total_size": 0,
         "created_time": int(time.time()) if 'time' in globals() else 1686123456
     }
-    folders_storage.append(new_folder)
-    save_folders(folders_storage)  # 持久化保存
+    store.add_folder(new_folder)
+    write_behind.mark_dirty("folders")  # 持久化保存
     
     return {
         "success": True, 
@@ -344,10 +537,10 @@ async def create_folder(data: dict):
 async def get_folder_files(folder_name: str):
     try:
         print(f"🔧 DEBUG: Looking for folder files, folder name: '{folder_name}'")
-        print(f"🔧 DEBUG: Current stored folders: {[f['name'] for f in folders_storage]}")
+        print(f"🔧 DEBUG: Current stored folders: {list(store.folders)}")
         
         # 檢查資料夾是否存在
-        folder = next((f for f in folders_storage if f["name"] == folder_name), None)
+        folder = store.get_folder(folder_name)
         if not folder:
             print(f"❌ DEBUG: Folder '{folder_name}' not found")
             return {"success": False, "error": f"Folder '{folder_name}' does not exist"}
@@ -359,23 +552,27 @@ async def get_folder_files(folder_name: str):
         files = []
         
         if os.path.exists(folder_path):
+            # 元數據來自資料夾的索引，不打開視頻文件；尚未探測完成的文件返回 None
+            metadata_entries = metadata_index.folder_entries(folder_path)
             for file in os.listdir(folder_path):
+                if file.startswith("."):
+                    continue  # 上傳中的臨時文件和元數據索引
                 if file.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv', '.m4v', '.3gp', '.ts')):
                     file_path = os.path.join(folder_path, file)
-                    file_size = os.path.getsize(file_path)
                     file_stat = os.stat(file_path)
                     
                     files.append({
                         "filename": file,
-                        "size": file_size,
+                        "size": file_stat.st_size,
                         "path": file_path,
-                        "created_time": int(file_stat.st_ctime)
+                        "created_time": int(file_stat.st_ctime),
+                        "metadata": metadata_index.lookup(folder_path, file, file_stat, metadata_entries)
                     })
         
-        # 更新資料夾的文件統計
-        folder["video_count"] = len(files)
-        folder["total_size"] = sum(f["size"] for f in files)
-        save_folders(folders_storage)
+        # 更新資料夾的文件統計（只有統計變化時才需要持久化）
+        total_size = sum(f["size"] for f in files)
+        if folder.get("video_count") != len(files) or folder.get("total_size") != total_size:
+            await update_folder_stats(folder, len(files), total_size, absolute=True)
         
         print(f"✅ DEBUG: Found {len(files)} files in folder")
         
@@ -391,11 +588,11 @@ async def get_folder_files(folder_name: str):
 @app.post("/api/folders/{folder_name}/upload")
 async def upload_files(folder_name: str, files: list[UploadFile] = File(...)):
     print(f"🔧 DEBUG: Upload request for folder: '{folder_name}'")
-    print(f"🔧 DEBUG: Available folders: {[f['name'] for f in folders_storage]}")
+    print(f"🔧 DEBUG: Available folders: {list(store.folders)}")
     print(f"🔧 DEBUG: Number of files to upload: {len(files)}")
     
     # 檢查資料夾是否存在
-    folder = next((f for f in folders_storage if f["name"] == folder_name), None)
+    folder = store.get_folder(folder_name)
     if not folder:
         print(f"❌ DEBUG: Folder '{folder_name}' not found in storage")
         raise HTTPException(status_code=404, detail=f"資料夾 '{folder_name}' 不存在")
@@ -408,33 +605,72 @@ async def upload_files(folder_name: str, files: list[UploadFile] = File(...)):
         uploaded_count = 0
         total_size = 0
         uploaded_files = []
+        rejected_files = []
+        size_limit = upload_size_limit()
+        too_large = None
         
-        # 保存每個文件
+        # 逐個文件按塊流式寫盤，不把整個文件讀進內存
         for file in files:
             if file.filename:
-                file_path = os.path.join(folder_path, file.filename)
+                try:
+                    filename = safe_upload_name(file.filename)
+                except ValueError:
+                    # 無效的文件名（如 ".."）與非視頻文件一樣拒絕，全部被拒絕時返回 400
+                    rejected_files.append(file.filename)
+                    print(f"⚠️ 跳過無效的文件名: {file.filename!r}")
+                    continue
+                file_path = os.path.join(folder_path, filename)
+                
+                # 按文件頭簽名檢查容器類型，非視頻文件在寫盤前就被拒絕
+                validator = video_signature_validator(filename)
+                if validator is None:
+                    rejected_files.append(filename)
+                    print(f"⚠️ 跳過不支持的文件: {filename}")
+                    continue
                 
-                # 讀取文件內容並保存
-                contents = await file.read()
-                with open(file_path, "wb") as f:
-                    f.write(contents)
+                remaining = None if size_limit is None else size_limit - total_size
+                try:
+                    file_size = await stream_upload_to_file(
+                        file, file_path, limit=remaining, blob_store=blob_store, validate_head=validator
+                    )
+                except UploadTooLarge as e:
+                    too_large = e
+                    break
+                except InvalidVideoFile as e:
+                    rejected_files.append(filename)
+                    print(f"⚠️ {e}")
+                    continue
                 
                 uploaded_count += 1
-                file_size = len(contents)
                 total_size += file_size
                 
                 uploaded_files.append({
-                    "filename": file.filename,
+                    "filename": filename,
                     "size": file_size,
                     "path": file_path
                 })
                 
-                print(f"✅ 上傳文件: {file.filename} ({file_size} bytes)")
+                print(f"✅ 上傳文件: {filename} ({file_size} bytes)")
         
         # 更新資料夾統計並保存
-        folder["video_count"] += uploaded_count
-        folder["total_size"] += total_size
-        save_folders(folders_storage)  # 持久化保存
+        await update_folder_stats(folder, uploaded_count, total_size)  # 持久化保存
+        video_stat_cache.invalidate()
+        folder_versions.changed(folder_name)
+        metadata_index.schedule(folder_path, [f["filename"] for f in uploaded_files], post_process=True)
+        # 只修改依賴該資料夾的任務方案中受影響的視頻對（在後台進行，不等待）
+        pair_plan_builder.schedule_folder_changed(folder_name, added=[f["filename"] for f in uploaded_files])
+        
+        if too_large is not None:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{too_large}，已保存前 {uploaded_count} 個文件"
+            )
+        
+        if rejected_files and not uploaded_count:
+            raise HTTPException(
+                status_code=400,
+                detail=f"沒有成功上傳任何視頻文件，不是有效視頻的文件: {', '.join(rejected_files)}"
+            )
         
         return {
             "success": True, 
@@ -442,19 +678,268 @@ async def upload_files(folder_name: str, files: list[UploadFile] = File(...)):
                 "uploaded_files": uploaded_count,
                 "folder_name": folder_name,
                 "total_size": total_size,
-                "files": uploaded_files
+                "files": uploaded_files,
+                "rejected_files": rejected_files
             },
             "message": f"成功上傳 {uploaded_count} 個文件到資料夾 '{folder_name}'"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ 上傳錯誤: {e}")
         raise HTTPException(status_code=500, detail=f"上傳失敗: {str(e)}")
 
+@app.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_upload(file_path: str, request: Request):
+    """
+    視頻文件服務：支持單/多範圍請求、條件請求（304），?v=<ETag> 的 URL 可永久緩存
+    設置 VIDEO_ACCEL_REDIRECT 時由 nginx 發送文件內容
+    """
+    path = resolve_served_path("uploads", file_path)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    page_cache_warmer.file_requested(path)
+    if VIDEO_ACCEL_REDIRECT:
+        return await accel_redirect(request, "uploads", path, video_stat_cache)
+    return await serve_file(request, path, video_stat_cache)
+
+def get_upload_session(folder_name: str, upload_id: str) -> dict:
+    """獲取屬於指定資料夾的上傳會話，不存在時返回 404"""
+    try:
+        session = resumable_uploads.get(upload_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    if session["folder_name"] != folder_name:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    return session
+
+@app.post("/api/folders/{folder_name}/uploads")
+async def create_upload_session(folder_name: str, data: dict):
+    """創建可續傳的上傳會話，之後按偏移分塊 PUT 文件內容"""
+    if not store.get_folder(folder_name):
+        raise HTTPException(status_code=404, detail=f"資料夾 '{folder_name}' 不存在")
+    try:
+        session = resumable_uploads.create(
+            folder_name, f"uploads/{folder_name}", data.get("filename", ""), int(data.get("size", -1)),
+            sha256=data.get("sha256")
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "data": {
+            "upload_id": session["id"],
+            "filename": session["filename"],
+            "size": session["size"],
+            "chunk_size": UPLOAD_CHUNK_SIZE
+        },
+        "message": f"已創建上傳會話 '{session['id']}'"
+    }
+
+@app.put("/api/folders/{folder_name}/uploads/{upload_id}")
+async def upload_chunk(folder_name: str, upload_id: str, offset: int, request: Request):
+    """把請求體作為一個塊寫入 offset 處，塊可以並行上傳和重傳"""
+    get_upload_session(folder_name, upload_id)
+    try:
+        written = await resumable_uploads.write_chunk(upload_id, offset, request.stream())
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    except (InvalidChunk, InvalidVideoFile) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "data": {"offset": offset, "written": written}}
+
+@app.get("/api/folders/{folder_name}/uploads/{upload_id}")
+async def get_upload_status(folder_name: str, upload_id: str):
+    """查詢已收到的範圍，斷線後據此只重傳缺失的部分"""
+    get_upload_session(folder_name, upload_id)
+    return {"success": True, "data": resumable_uploads.status(upload_id)}
+
+@app.post("/api/folders/{folder_name}/uploads/{upload_id}/finalize")
+async def finalize_upload_session(folder_name: str, upload_id: str):
+    """所有塊上傳完成後，把文件放到資料夾中並更新統計"""
+    folder = store.get_folder(folder_name)
+    if not folder:
+        raise HTTPException(status_code=404, detail=f"資料夾 '{folder_name}' 不存在")
+    get_upload_session(folder_name, upload_id)
+    try:
+        session = await asyncio.get_running_loop().run_in_executor(
+            None, resumable_uploads.finalize, upload_id
+        )
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    except UploadIncomplete as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(e), "missing": [list(r) for r in e.missing]}
+        )
+    except (ChecksumMismatch, InvalidVideoFile) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    await update_folder_stats(folder, 1, session["size"])
+    video_stat_cache.invalidate()
+    folder_versions.changed(folder_name)
+    metadata_index.schedule(os.path.dirname(session["target_path"]), [session["filename"]], post_process=True)
+    pair_plan_builder.schedule_folder_changed(folder_name, added=[session["filename"]])
+    
+    print(f"✅ 上傳文件: {session['filename']} ({session['size']} bytes)")
+    return {
+        "success": True,
+        "data": {
+            "filename": session["filename"],
+            "size": session["size"],
+            "folder_name": folder_name,
+            "deduplicated": session["deduplicated"]
+        },
+        "message": f"成功上傳文件 '{session['filename']}' 到資料夾 '{folder_name}'"
+    }
+
+@app.delete("/api/folders/{folder_name}/uploads/{upload_id}")
+async def abort_upload_session(folder_name: str, upload_id: str):
+    """取消上傳並刪除已收到的數據"""
+    get_upload_session(folder_name, upload_id)
+    try:
+        resumable_uploads.abort(upload_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    return {"success": True, "message": f"已取消上傳會話 '{upload_id}'"}
+
+async def finish_bulk_ingest(future, folder_name: str, folder_path: str):
+    """導入任務結束後按資料夾中的實際文件重新統計"""
+    job = await asyncio.wrap_future(future)
+    folder = store.get_folder(folder_name)
+    if folder is None or not os.path.isdir(folder_path):
+        return
+    video_count, total_size = 0, 0
+    for entry in os.scandir(folder_path):
+        if not entry.name.startswith(".") and entry.is_file() and video_signature_validator(entry.name):
+            video_count += 1
+            total_size += entry.stat().st_size
+    await update_folder_stats(folder, video_count, total_size, absolute=True)
+    print(f"✅ 導入任務 {job['id']} 結束，資料夾 '{folder_name}' 共 {video_count} 個視頻")
+
+def on_ingested_files(folder_path: str, filenames: list):
+    """導入線程每放入一批文件調用一次"""
+    video_stat_cache.invalidate()
+    folder_versions.changed(os.path.basename(folder_path))
+    metadata_index.schedule(folder_path, filenames)
+
+@app.post("/api/folders/{folder_name}/ingest")
+async def start_bulk_ingest(folder_name: str, data: dict):
+    """
+    把服務器本地的目錄或 zip/tar 壓縮包導入資料夾（資料夾不存在時創建），在後台執行
+    mode: auto（reflink → 硬鏈接 → 複製）、reflink（reflink → 複製）、copy
+    """
+    if not folder_name or folder_name.startswith(".") or os.path.basename(folder_name) != folder_name:
+        raise HTTPException(status_code=400, detail=f"無效的資料夾名稱: {folder_name}")
+    folder_path = f"uploads/{folder_name}"
+    try:
+        job = bulk_ingest.create(folder_name, folder_path, data.get("source", ""), data.get("mode", "auto"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not store.get_folder(folder_name):
+        store.add_folder({
+            "name": folder_name,
+            "path": f"/uploads/{folder_name}",
+            "video_count": 0,
+            "total_size": 0,
+            "created_time": int(time.time())
+        })
+        write_behind.mark_dirty("folders")
+    
+    future = bulk_ingest.start(job["id"], on_files=on_ingested_files)
+    task = asyncio.create_task(finish_bulk_ingest(future, folder_name, folder_path))
+    bulk_ingest_tasks.add(task)
+    task.add_done_callback(bulk_ingest_tasks.discard)
+    return {
+        "success": True,
+        "data": job,
+        "message": f"已開始導入 '{job['source']}' 到資料夾 '{folder_name}'"
+    }
+
+@app.get("/api/folders/{folder_name}/ingest/{job_id}")
+async def get_bulk_ingest(folder_name: str, job_id: str):
+    """查詢導入進度"""
+    try:
+        job = bulk_ingest.get(job_id)
+    except IngestJobNotFound:
+        raise HTTPException(status_code=404, detail=f"導入任務 '{job_id}' 不存在")
+    if job["folder_name"] != folder_name:
+        raise HTTPException(status_code=404, detail=f"導入任務 '{job_id}' 不存在")
+    return {"success": True, "data": job}
+
+@app.delete("/api/folders/{folder_name}/ingest/{job_id}")
+async def cancel_bulk_ingest(folder_name: str, job_id: str):
+    """取消導入，已經放入資料夾的文件保留"""
+    await get_bulk_ingest(folder_name, job_id)
+    job = bulk_ingest.cancel(job_id)
+    return {"success": True, "data": job, "message": f"已請求取消導入任務 '{job_id}'"}
+
+@app.get("/api/name-rules")
+async def list_name_rules():
+    """內置的文件名清理規則集"""
+    return {"success": True, "data": {name: ruleset.to_config() for name, ruleset in BUILTIN_RULESETS.items()}}
+
+def list_folder_videos(folder_name: str) -> list:
+    folder_path = f"uploads/{folder_name}"
+    return sorted(
+        f for f in os.listdir(folder_path)
+        if not f.startswith(".") and f.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv', '.m4v', '.3gp', '.ts'))
+    )
+
+@app.post("/api/folders/{folder_name}/name-rules/preview")
+async def preview_name_rules(folder_name: str, data: dict):
+    """
+    預覽文件名清理規則在資料夾上的效果（不修改任何數據）
+    rules: 內置規則集名稱或配置，默認 render；compare_folder: 可選，統計與另一個資料夾按清理後名稱能配對的數量
+    """
+    try:
+        ruleset = get_ruleset(data.get("rules"), default="render")
+    except ValueError as e:
+        return {"success": False, "error": f"文件名規則無效: {e}"}
+    
+    compare_folder = data.get("compare_folder")
+    for name in filter(None, (folder_name, compare_folder)):
+        if not store.get_folder(name) or not os.path.isdir(f"uploads/{name}"):
+            return {"success": False, "error": f"資料夾 '{name}' 不存在"}
+    
+    compare_files = list_folder_videos(compare_folder) if compare_folder else None
+    return {"success": True, "data": preview_rules(ruleset, list_folder_videos(folder_name), compare_files)}
+
+@app.delete("/api/folders/{folder_name}/files/{filename}")
+async def delete_folder_file(folder_name: str, filename: str):
+    """刪除資料夾中的一個視頻，依賴該資料夾的任務只移除/替換相應的視頻對"""
+    folder = store.get_folder(folder_name)
+    if not folder:
+        raise HTTPException(status_code=404, detail=f"資料夾 '{folder_name}' 不存在")
+    try:
+        filename = safe_upload_name(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    file_path = os.path.join(f"uploads/{folder_name}", filename)
+    if filename.startswith(".") or not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail=f"文件 '{filename}' 不存在")
+    
+    file_size = os.path.getsize(file_path)
+    os.remove(file_path)
+    if filename.lower().endswith(VIDEO_EXTENSIONS):
+        await update_folder_stats(folder, -1, -file_size)
+    video_stat_cache.invalidate()
+    folder_versions.changed(folder_name)
+    pair_plan_builder.schedule_folder_changed(folder_name, removed=[filename])
+    # 只回收不再被任何資料夾引用的 blob
+    await asyncio.get_running_loop().run_in_executor(None, blob_store.collect_garbage)
+    
+    print(f"✅ 刪除文件: {file_path}")
+    return {"success": True, "message": f"文件 '{filename}' 已從資料夾 '{folder_name}' 刪除"}
+
 @app.delete("/api/folders/{folder_name}")
 async def delete_folder(folder_name: str):
     # 檢查資料夾是否存在
-    global folders_storage
-    folder = next((f for f in folders_storage if f["name"] == folder_name), None)
+    folder = store.get_folder(folder_name)
     if not folder:
         return {"success": False, "error": "資料夾不存在"}
     
@@ -462,12 +947,18 @@ async def delete_folder(folder_name: str):
         # 刪除物理文件夾和文件
         folder_path = f"uploads/{folder_name}"
         if os.path.exists(folder_path):
-            shutil.rmtree(folder_path)
+            loop = asyncio.get_running_loop()
+            # 刪除目錄和掃描 blob 都是阻塞的文件系統操作，放到線程池中執行
+            await loop.run_in_executor(None, shutil.rmtree, folder_path)
+            video_stat_cache.invalidate()
+            folder_versions.changed(folder_name)
             print(f"✅ 刪除物理資料夾: {folder_path}")
+            # 只回收不再被任何資料夾引用的 blob
+            await loop.run_in_executor(None, blob_store.collect_garbage)
         
         # 從存儲中移除並保存
-        folders_storage = [f for f in folders_storage if f["name"] != folder_name]
-        save_folders(folders_storage)  # 持久化保存
+        store.remove_folder(folder_name)
+        write_behind.mark_dirty("folders")  # 持久化保存
         
         return {
             "success": True,
@@ -495,24 +986,22 @@ async def init_test_data():
     """初始化測試數據（僅創建空的資料夾結構）"""
     
     # 清空現有數據
-    folders_storage.clear()
-    tasks_storage.clear()
-    evaluations_storage.clear()
+    store.clear()
+    pair_plans.clear()
     
     # 只創建基本的空資料夾（用戶可以自己上傳文件）
     
     # 保存到文件
-    save_folders(folders_storage)
-    save_tasks(tasks_storage)
-    save_evaluations(evaluations_storage)
+    write_behind.mark_dirty("folders", "tasks")
+    save_evaluations(store.evaluation_list())
     
     return {
         "success": True,
         "message": "數據已清空，請自行創建資料夾並上傳視頻文件",
         "data": {
-            "folders": len(folders_storage),
-            "tasks": len(tasks_storage),
-            "evaluations": len(evaluations_storage)
+            "folders": len(store.folders),
+            "tasks": len(store.tasks),
+            "evaluations": len(store.evaluations)
         }
     }
 
@@ -521,7 +1010,7 @@ async def create_demo_task():
     """創建外部視頻演示任務"""
     
     # 檢查是否已存在演示任務
-    demo_task = next((t for t in tasks_storage if t["id"] == "task_demo"), None)
+    demo_task = store.get_task("task_demo")
     if demo_task:
         return {"success": True, "message": "演示任務已存在", "data": demo_task}
     
@@ -541,8 +1030,8 @@ async def create_demo_task():
         "use_external_videos": True
     }
     
-    tasks_storage.append(demo_task)
-    save_tasks(tasks_storage)
+    store.add_task(demo_task)
+    write_behind.mark_dirty("tasks")
     
     return {
         "success": True,
@@ -553,12 +1042,12 @@ async def create_demo_task():
 # Tasks API端點
 @app.get("/api/tasks/")
 async def get_tasks():
-    return {"success": True, "data": tasks_storage, "message": "任務列表"}
+    return {"success": True, "data": store.task_list(), "message": "任務列表"}
 
 @app.get("/api/tasks/{task_id}")
 async def get_task(task_id: str):
     """獲取單個任務詳情"""
-    task = next((t for t in tasks_storage if t["id"] == task_id), None)
+    task = store.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail=f"任務 '{task_id}' 不存在")
     
@@ -578,6 +1067,87 @@ async def get_task(task_id: str):
         task_with_pairs = {**task, "video_pairs": video_pairs}
         return {"success": True, "data": task_with_pairs, "message": f"任務 '{task['name']}' 詳情（外部視頻）"}
     
+    # 視頻對在創建任務時已在後台生成，兩個資料夾的內容沒有變化時直接返回保存的方案
+    video_pairs = await pair_plan_builder.get(task)
+    
+    # 評估者會按這個順序觀看，提前預熱最前面的視頻對
+    page_cache_warmer.track_task(task_id, video_pairs)
+    
+    # 添加視頻對到任務數據
+    task_with_pairs = {**task, "video_pairs": video_pairs}
+    
+    return {"success": True, "data": task_with_pairs, "message": f"任務 '{task['name']}' 詳情"}
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv', '.m4v', '.3gp', '.ts')
+
+def latest_video(filenames) -> Optional[str]:
+    """同一標準化名稱下排序最後的視頻（與按排序逐個寫入映射、後者覆蓋前者的結果相同）"""
+    videos = [f for f in filenames if f.lower().endswith(VIDEO_EXTENSIONS)]
+    return videos[-1] if videos else None
+
+def video_name_map(folder_name: str, ruleset) -> dict:
+    """{標準化名稱: 視頻文件名}，來自資料夾的文件名索引"""
+    name_map = {}
+    for name, filenames in name_index.entries(folder_name, ruleset).items():
+        file = latest_video(filenames)
+        if file is not None:
+            name_map[name] = file
+    return name_map
+
+def make_video_pair(task: dict, pair_id: str, file_a: str, file_b: str,
+                    match_rules: Optional[str] = None, match_key: Optional[str] = None) -> dict:
+    """
+    生成一個視頻對，隨機決定左右順序（盲測的關鍵特性）
+    按文件名配對時記錄使用的規則集和標準化名稱，文件變化時據此增量修改方案
+    """
+    # URL編碼文件名以處理特殊字符
+    encoded_file_a = quote(file_a)
+    encoded_file_b = quote(file_b)
+    
+    swap_sides = random.choice([True, False])
+    
+    if swap_sides:
+        # 交換左右：B資料夾在左，A資料夾在右
+        left_path = f"uploads/{task['folder_b']}/{encoded_file_b}"
+        right_path = f"uploads/{task['folder_a']}/{encoded_file_a}"
+        left_name = file_b
+        right_name = file_a
+        left_folder = task['folder_b']
+        right_folder = task['folder_a']
+    else:
+        # 正常順序：A資料夾在左，B資料夾在右
+        left_path = f"uploads/{task['folder_a']}/{encoded_file_a}"
+        right_path = f"uploads/{task['folder_b']}/{encoded_file_b}"
+        left_name = file_a
+        right_name = file_b
+        left_folder = task['folder_a']
+        right_folder = task['folder_b']
+    
+    pair = {
+        "id": pair_id,
+        "task_id": task["id"],
+        "video_a_path": left_path,  # 左側視頻（隨機A或B）
+        "video_b_path": right_path, # 右側視頻（隨機B或A）
+        "video_a_name": left_name,
+        "video_b_name": right_name,
+        "is_evaluated": False,
+        # 記錄真實的資料夾映射，用於統計分析
+        "left_folder": left_folder,
+        "right_folder": right_folder,
+        "is_swapped": swap_sides  # 記錄是否交換了順序
+    }
+    if match_key is not None:
+        pair["match_rules"] = match_rules
+        pair["match_key"] = match_key
+    return pair
+
+def build_video_pairs(task: dict) -> list:
+    """
+    列出兩個資料夾的視頻並生成視頻對（隨機決定每對的左右順序）
+    只在 PairPlanBuilder 生成方案時調用，結果會被持久化
+    """
+    task_id = task["id"]
+    
     # 獲取實際的文件列表
     folder_a_path = f"uploads/{task['folder_a']}"
     folder_b_path = f"uploads/{task['folder_b']}"
@@ -596,7 +1166,7 @@ async def get_task(task_id: str):
         
         if os.path.exists(folder_a_path):
             all_files_a = os.listdir(folder_a_path)
-            files_a = [f for f in all_files_a if f.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv', '.m4v', '.3gp', '.ts'))]
+            files_a = [f for f in all_files_a if f.lower().endswith(VIDEO_EXTENSIONS)]
             print(f"🔧 DEBUG: 資料夾A所有文件: {all_files_a}")
             print(f"🔧 DEBUG: 資料夾A視頻文件: {files_a}")
         else:
@@ -604,7 +1174,7 @@ async def get_task(task_id: str):
         
         if os.path.exists(folder_b_path):
             all_files_b = os.listdir(folder_b_path)
-            files_b = [f for f in all_files_b if f.lower().endswith(('.mp4', '.mov', '.avi', '.mkv', '.webm', '.flv', '.wmv', '.m4v', '.3gp', '.ts'))]
+            files_b = [f for f in all_files_b if f.lower().endswith(VIDEO_EXTENSIONS)]
             print(f"🔧 DEBUG: 資料夾B所有文件: {all_files_b}")
             print(f"🔧 DEBUG: 資料夾B視頻文件: {files_b}")
         else:
@@ -619,36 +1189,17 @@ async def get_task(task_id: str):
             print(f"🔧 DEBUG: 資料夾A視頻文件: {files_a}")
             print(f"🔧 DEBUG: 資料夾B視頻文件: {files_b}")
             
-            # 建立文件名映射（去除擴展名）
-            files_a_map = {}  # {base_name: full_filename}
-            files_b_map = {}  # {base_name: full_filename}
-            
-            # 也建立清理過的文件名映射（用於更靈活的匹配）
-            files_a_clean_map = {}  # {cleaned_name: full_filename}
-            files_b_clean_map = {}  # {cleaned_name: full_filename}
+            # 文件名映射來自資料夾的文件名索引（按規則集保存，上傳/刪除時增量更新）
+            exact_rules = BUILTIN_RULESETS["exact"]
+            # 清理規則：任務創建時記錄的規則集；沒有記錄的舊任務沿用規則引擎之前的清理方式
+            clean_rules = get_ruleset(task.get("name_rules"), default="legacy")
             
-            def clean_filename_for_matching(filename):
-                """清理文件名用於匹配，去除常見的變化部分"""
-                base = os.path.splitext(filename)[0]
-                # 移除常見的後綴模式
-                import re
-                # 移除像 _seed123456, _share 等後綴
-                cleaned = re.sub(r'_seed\d+', '', base)
-                cleaned = re.sub(r'_share$', '', cleaned)
-                cleaned = re.sub(r'_\d+$', '', cleaned)  # 移除末尾數字
-                return cleaned.strip()
+            files_a_map = video_name_map(task['folder_a'], exact_rules)  # {base_name: full_filename}
+            files_b_map = video_name_map(task['folder_b'], exact_rules)  # {base_name: full_filename}
             
-            for file_a in files_a:
-                base_name = os.path.splitext(file_a)[0]
-                clean_name = clean_filename_for_matching(file_a)
-                files_a_map[base_name] = file_a
-                files_a_clean_map[clean_name] = file_a
-                
-            for file_b in files_b:
-                base_name = os.path.splitext(file_b)[0]
-                clean_name = clean_filename_for_matching(file_b)
-                files_b_map[base_name] = file_b
-                files_b_clean_map[clean_name] = file_b
+            # 也建立清理過的文件名映射（用於更靈活的匹配）
+            files_a_clean_map = video_name_map(task['folder_a'], clean_rules)  # {cleaned_name: full_filename}
+            files_b_clean_map = video_name_map(task['folder_b'], clean_rules)  # {cleaned_name: full_filename}
             
             print(f"🔧 DEBUG: 資料夾A文件映射: {files_a_map}")
             print(f"🔧 DEBUG: 資料夾B文件映射: {files_b_map}")
@@ -671,11 +1222,13 @@ async def get_task(task_id: str):
                 common_names = exact_common_names
                 using_map = files_a_map
                 using_map_b = files_b_map
+                using_rules = exact_rules
                 match_type = "精確匹配"
             elif clean_common_names:
                 common_names = clean_common_names
                 using_map = files_a_clean_map
                 using_map_b = files_b_clean_map
+                using_rules = clean_rules
                 match_type = "清理後匹配"
             else:
                 common_names = []
@@ -687,46 +1240,10 @@ async def get_task(task_id: str):
                 # 有相同基礎名稱的視頻，按名稱配對
                 print(f"✅ DEBUG: 找到 {len(common_names)} 個相同基礎名稱的視頻，使用1:1配對 ({match_type})")
                 for i, base_name in enumerate(common_names):
-                    file_a = using_map[base_name]
-                    file_b = using_map_b[base_name]
-                    
-                    # URL編碼文件名以處理特殊字符
-                    encoded_file_a = quote(file_a)
-                    encoded_file_b = quote(file_b)
-                    
-                    # 隨機決定左右順序（盲測的關鍵特性）
-                    swap_sides = random.choice([True, False])
-                    
-                    if swap_sides:
-                        # 交換左右：B資料夾在左，A資料夾在右
-                        left_path = f"uploads/{task['folder_b']}/{encoded_file_b}"
-                        right_path = f"uploads/{task['folder_a']}/{encoded_file_a}"
-                        left_name = file_b
-                        right_name = file_a
-                        left_folder = task['folder_b']
-                        right_folder = task['folder_a']
-                    else:
-                        # 正常順序：A資料夾在左，B資料夾在右
-                        left_path = f"uploads/{task['folder_a']}/{encoded_file_a}"
-                        right_path = f"uploads/{task['folder_b']}/{encoded_file_b}"
-                        left_name = file_a
-                        right_name = file_b
-                        left_folder = task['folder_a']
-                        right_folder = task['folder_b']
-                    
-                    video_pairs.append({
-                        "id": f"{task_id}_pair_{i+1}",
-                        "task_id": task_id,
-                        "video_a_path": left_path,  # 左側視頻（隨機A或B）
-                        "video_b_path": right_path, # 右側視頻（隨機B或A）
-                        "video_a_name": left_name,
-                        "video_b_name": right_name,
-                        "is_evaluated": False,
-                        # 記錄真實的資料夾映射，用於統計分析
-                        "left_folder": left_folder,
-                        "right_folder": right_folder,
-                        "is_swapped": swap_sides  # 記錄是否交換了順序
-                    })
+                    video_pairs.append(make_video_pair(
+                        task, f"{task_id}_pair_{i+1}", using_map[base_name], using_map_b[base_name],
+                        match_rules=using_rules.key, match_key=base_name
+                    ))
                 
                 print(f"✅ DEBUG: 任務 {task_id} 生成了 {len(video_pairs)} 個視頻對 (基礎名稱配對)")
                 for pair in video_pairs:
@@ -736,59 +1253,20 @@ async def get_task(task_id: str):
                     print(f"     右側視頻: {pair['video_b_name']} (來自{pair['right_folder']}) -> {pair['video_b_path']}")
                 
                 # 報告未配對的文件
-                unmatched_a = set(files_a_map.keys()) - common_names
-                unmatched_b = set(files_b_map.keys()) - common_names
+                unmatched_a = set(using_map.keys()) - set(common_names)
+                unmatched_b = set(using_map_b.keys()) - set(common_names)
                 
                 if unmatched_a:
-                    print(f"📋 DEBUG: 資料夾A中未配對的文件: {[files_a_map[name] for name in unmatched_a]}")
+                    print(f"📋 DEBUG: 資料夾A中未配對的文件: {[using_map[name] for name in unmatched_a]}")
                 if unmatched_b:
-                    print(f"📋 DEBUG: 資料夾B中未配對的文件: {[files_b_map[name] for name in unmatched_b]}")
+                    print(f"📋 DEBUG: 資料夾B中未配對的文件: {[using_map_b[name] for name in unmatched_b]}")
             else:
                 # 沒有相同基礎名稱，改為按順序配對
                 print(f"🔄 DEBUG: 沒有找到相同基礎名稱的視頻，改為按順序配對")
                 pair_count = min(len(files_a), len(files_b))
                 
                 for i in range(pair_count):
-                    file_a = files_a[i]
-                    file_b = files_b[i]
-                    
-                    # URL編碼文件名以處理特殊字符
-                    encoded_file_a = quote(file_a)
-                    encoded_file_b = quote(file_b)
-                    
-                    # 隨機決定左右順序（盲測的關鍵特性）
-                    swap_sides = random.choice([True, False])
-                    
-                    if swap_sides:
-                        # 交換左右：B資料夾在左，A資料夾在右
-                        left_path = f"uploads/{task['folder_b']}/{encoded_file_b}"
-                        right_path = f"uploads/{task['folder_a']}/{encoded_file_a}"
-                        left_name = file_b
-                        right_name = file_a
-                        left_folder = task['folder_b']
-                        right_folder = task['folder_a']
-                    else:
-                        # 正常順序：A資料夾在左，B資料夾在右
-                        left_path = f"uploads/{task['folder_a']}/{encoded_file_a}"
-                        right_path = f"uploads/{task['folder_b']}/{encoded_file_b}"
-                        left_name = file_a
-                        right_name = file_b
-                        left_folder = task['folder_a']
-                        right_folder = task['folder_b']
-                    
-                    video_pairs.append({
-                        "id": f"{task_id}_pair_{i+1}",
-                        "task_id": task_id,
-                        "video_a_path": left_path,  # 左側視頻（隨機A或B）
-                        "video_b_path": right_path, # 右側視頻（隨機B或A）
-                        "video_a_name": left_name,
-                        "video_b_name": right_name,
-                        "is_evaluated": False,
-                        # 記錄真實的資料夾映射，用於統計分析
-                        "left_folder": left_folder,
-                        "right_folder": right_folder,
-                        "is_swapped": swap_sides  # 記錄是否交換了順序
-                    })
+                    video_pairs.append(make_video_pair(task, f"{task_id}_pair_{i+1}", files_a[i], files_b[i]))
                 
                 print(f"✅ DEBUG: 任務 {task_id} 生成了 {len(video_pairs)} 個視頻對 (順序配對)")
                 for pair in video_pairs:
@@ -807,29 +1285,95 @@ async def get_task(task_id: str):
                 
         else:
             print(f"❌ DEBUG: 沒有找到視頻文件")
-            raise Exception("沒有找到視頻文件")
+            print(f"❌ 任務 {task_id} 無法生成有效的視頻對，請檢查資料夾中是否有視頻文件")
             
     except Exception as e:
+        # 讀取失敗時拋出，由 PairPlanBuilder 保留原來的方案，而不是把方案替換為空
         print(f"❌ 讀取視頻文件錯誤: {e}")
-        print(f"❌ 任務 {task_id} 無法生成有效的視頻對，請檢查資料夾中是否有視頻文件")
-    
-    # 如果是第一次生成視頻對且有數據，保存到任務中
-    if video_pairs and "video_pairs" not in task:
-        print(f"✅ DEBUG: 首次生成視頻對，保存到任務數據中: {len(video_pairs)} 個視頻對")
-        # 更新任務數據，包含視頻對信息
-        for i, stored_task in enumerate(tasks_storage):
-            if stored_task["id"] == task_id:
-                tasks_storage[i]["video_pairs"] = video_pairs
-                save_tasks(tasks_storage)  # 持久化保存
-                break
-        
-        # 更新當前任務對象
-        task["video_pairs"] = video_pairs
+        raise
     
-    # 添加視頻對到任務數據
-    task_with_pairs = {**task, "video_pairs": video_pairs}
+    return video_pairs
+
+def update_video_pairs(task: dict, pairs: list, changed: dict, taken: set) -> Optional[tuple]:
+    """
+    按文件名索引中變化的標準化名稱增量修改方案（PairPlanBuilder.folder_changed 在線程池中調用，不修改任務）
+    只替換、移除或加入這些名稱對應的視頻對，其餘視頻對的 ID 和左右順序不變；
+    結果與按當前文件完整生成的方案配對相同。按順序配對的方案、匹配策略會改變
+    或方案會變為空時返回 None（由打開任務時的完整生成處理）
+
+    Args:
+        taken: 不能分配給新視頻對的 ID（發出過的和評估引用的）
+
+    Returns:
+        (新的視頻對列表, 下一個視頻對編號)；被移除的視頻對由 PairPlanBuilder 標記為退役
+    """
+    if not pairs or any("match_key" not in pair for pair in pairs):
+        return None
+    exact_rules = BUILTIN_RULESETS["exact"]
+    clean_rules = get_ruleset(task.get("name_rules"), default="legacy")
+    rules_by_key = {exact_rules.key: exact_rules, clean_rules.key: clean_rules}
+    ruleset = rules_by_key.get(pairs[0]["match_rules"])
+    if ruleset is None or ruleset.key not in changed:
+        return None
     
-    return {"success": True, "data": task_with_pairs, "message": f"任務 '{task['name']}' 詳情"}
+    if ruleset is not exact_rules:
+        # 清理後匹配的前提是沒有精確同名的視頻：變化的名稱出現精確同名時改用精確匹配
+        exact_a = name_index.entries(task['folder_a'], exact_rules)
+        exact_b = name_index.entries(task['folder_b'], exact_rules)
+        for name in changed.get(exact_rules.key, ()):
+            if latest_video(exact_a.get(name, ())) and latest_video(exact_b.get(name, ())):
+                return None
+    
+    groups_a = name_index.entries(task['folder_a'], ruleset)
+    groups_b = name_index.entries(task['folder_b'], ruleset)
+    by_key = {pair["match_key"]: pair for pair in pairs}
+    replaced = {}
+    for name in changed[ruleset.key]:
+        file_a = latest_video(groups_a.get(name, ()))
+        file_b = latest_video(groups_b.get(name, ()))
+        target = (file_a, file_b) if file_a and file_b else None
+        pair = by_key.get(name)
+        if pair is not None:
+            files = (pair["video_b_name"], pair["video_a_name"]) if pair["is_swapped"] \
+                else (pair["video_a_name"], pair["video_b_name"])
+            if files == target:
+                continue
+        elif target is None:
+            continue
+        replaced[name] = target
+    # 新視頻對的編號只增不減：接在任務記錄的編號和所有用過的 ID（包括退役和評估引用的）之後
+    number = max(task.get("next_pair_number") or 1, 1 + max(
+        (int(n) for n in (pair_id.rpartition("_pair_")[2].split("_")[0] for pair_id in taken if pair_id)
+         if n.isdigit()),
+        default=0
+    ))
+    if not replaced:
+        return pairs, number
+    
+    updated = [pair for pair in pairs if pair["match_key"] not in replaced]
+    keys = [pair["match_key"] for pair in updated]
+    for name in sorted(replaced):
+        if replaced[name] is None:
+            continue
+        while f"{task['id']}_pair_{number}" in taken:
+            number += 1
+        position = bisect.bisect_left(keys, name)
+        keys.insert(position, name)
+        updated.insert(position, make_video_pair(
+            task, f"{task['id']}_pair_{number}", *replaced[name], match_rules=ruleset.key, match_key=name
+        ))
+        number += 1
+    if not updated:
+        return None
+    print(f"✅ 增量更新任務 {task['id']} 的視頻對: 變化 {len(replaced)} 個名稱，共 {len(updated)} 對")
+    return updated, number
+
+# 物化的視頻對方案（需要在 build_video_pairs 定義之後創建）
+pair_plan_builder = PairPlanBuilder(
+    pair_plans, folder_versions, store, build_video_pairs,
+    on_saved=lambda task_id: write_behind.mark_dirty("tasks"),
+    name_index=name_index, update=update_video_pairs
+)
 
 @app.post("/api/tasks/")
 async def create_task(data: dict):
@@ -848,9 +1392,17 @@ async def create_task(data: dict):
     if folder_a == folder_b:
         return {"success": False, "error": "請選擇兩個不同的資料夾"}
     
+    # 文件名清理規則（內置規則集名稱或配置），生成視頻對時使用；
+    # 總是記錄在任務上，以後修改內置規則的默認值不會改變已有任務的配對
+    name_rules = data.get("name_rules") or "render"
+    try:
+        get_ruleset(name_rules)
+    except ValueError as e:
+        return {"success": False, "error": f"文件名規則無效: {e}"}
+    
     # 檢查資料夾是否存在
-    folder_a_obj = next((f for f in folders_storage if f["name"] == folder_a), None)
-    folder_b_obj = next((f for f in folders_storage if f["name"] == folder_b), None)
+    folder_a_obj = store.get_folder(folder_a)
+    folder_b_obj = store.get_folder(folder_b)
     
     if not folder_a_obj:
         return {"success": False, "error": f"資料夾 '{folder_a}' 不存在"}
@@ -863,7 +1415,7 @@ async def create_task(data: dict):
     
     # 創建任務對象
     new_task = {
-        "id": f"task_{len(tasks_storage) + 1}",
+        "id": f"task_{await next_sequence('tasks', len(store.tasks))}",
         "name": task_name,
         "description": description,
         "folder_a": folder_a,
@@ -873,11 +1425,13 @@ async def create_task(data: dict):
         "status": "active",
         "created_time": int(time.time()),
         "total_evaluations": 0,
-        "completed_evaluations": 0
+        "completed_evaluations": 0,
+        "name_rules": name_rules
     }
     
-    tasks_storage.append(new_task)
-    save_tasks(tasks_storage)  # 持久化保存
+    store.add_task(new_task)
+    write_behind.mark_dirty("tasks")  # 持久化保存
+    pair_plan_builder.schedule(new_task)  # 在後台生成並保存視頻對方案
     
     return {
         "success": True,
@@ -889,7 +1443,7 @@ async def create_task(data: dict):
 @app.get("/api/evaluations/")
 async def get_evaluations():
     """獲取所有評估"""
-    return {"success": True, "data": evaluations_storage, "message": "評估列表"}
+    return {"success": True, "data": store.evaluation_list(), "message": "評估列表"}
 
 @app.post("/api/evaluations/")
 async def create_evaluation(data: dict):
@@ -904,18 +1458,26 @@ async def create_evaluation(data: dict):
     if choice not in ["A", "B", "tie"]:
         return {"success": False, "error": "選擇必須是A、B或tie"}
     
-    # 創建評估對象
-    new_evaluation = {
-        "id": f"eval_{len(evaluations_storage) + 1}",
-        "video_pair_id": video_pair_id,
-        "choice": choice,
-        "is_blind": is_blind,
-        "created_time": int(time.time()),
-        "user_agent": "web_client"
-    }
+    # 創建評估對象；ID 已被佔用時（計數器落後於其他 worker 寫入的評估）換一個ID，不覆蓋已有的投票
+    for attempt in range(EVALUATION_ID_ATTEMPTS):
+        new_evaluation = {
+            "id": f"eval_{await next_sequence('evaluations', len(store.evaluations))}",
+            "video_pair_id": video_pair_id,
+            "choice": choice,
+            "is_blind": is_blind,
+            "created_time": int(time.time()),
+            "user_agent": "web_client"
+        }
+        try:
+            await append_evaluation(new_evaluation)  # 只持久化這一條評估
+            break
+        except EvaluationExists as e:
+            print(f"⚠️ {e}，重新分配評估ID")
+    else:
+        raise HTTPException(status_code=409, detail="無法分配新的評估ID，請重試")
     
-    evaluations_storage.append(new_evaluation)
-    save_evaluations(evaluations_storage)  # 持久化保存
+    store.add_evaluation(new_evaluation)
+    page_cache_warmer.pair_completed(video_pair_id)  # 評估者將切換到下一對
     
     print(f"✅ DEBUG: 收到評估 - 視頻對: {video_pair_id}, 選擇: {choice}")
     
@@ -928,7 +1490,8 @@ async def create_evaluation(data: dict):
 @app.get("/api/evaluations/{video_pair_id}")
 async def get_evaluation_by_pair(video_pair_id: str):
     """根據視頻對ID獲取評估"""
-    evaluation = next((e for e in evaluations_storage if e["video_pair_id"] == video_pair_id), None)
+    pair_evaluations = store.evaluations_for_pair(video_pair_id)
+    evaluation = pair_evaluations[0] if pair_evaluations else None
     if not evaluation:
         raise HTTPException(status_code=404, detail=f"未找到視頻對 '{video_pair_id}' 的評估")
     
@@ -938,13 +1501,13 @@ async def get_evaluation_by_pair(video_pair_id: str):
 async def get_task_detailed_results(task_id: str):
     """獲取任務的詳細評估結果，用於回顧功能"""
     # 檢查任務是否存在
-    task = next((t for t in tasks_storage if t["id"] == task_id), None)
+    task = store.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found")
     
     try:
-        # 直接從任務數據獲取視頻對信息，避免循環調用
-        video_pairs = task.get("video_pairs", [])
+        # 直接從任務的視頻對存儲獲取，避免循環調用
+        video_pairs = pair_plans.get(task_id) or []
         
         # 如果任務中沒有video_pairs，嘗試動態生成
         if not video_pairs:
@@ -973,7 +1536,7 @@ async def get_task_detailed_results(task_id: str):
                         video_pairs.append(pair)
         
         # 獲取該任務的所有評估
-        task_evaluations = [e for e in evaluations_storage if e["video_pair_id"].startswith(task_id)]
+        task_evaluations = store.evaluations_for_task(task_id)
         print(f"🔧 DEBUG: 找到 {len(task_evaluations)} 個評估記錄")
         
         # 創建視頻對ID到評估的映射
@@ -986,6 +1549,8 @@ async def get_task_detailed_results(task_id: str):
         for i, pair in enumerate(video_pairs):
             pair_id = pair.get("id", f"{task_id}_pair_{i+1}")
             evaluation = evaluation_map.get(pair_id)
+            if pair.get("retired") and evaluation is None:
+                continue  # 文件已刪除或重新配對、也沒有評估的視頻對不需要回顧
             
             print(f"🔧 DEBUG: 視頻對 {i}: pair_id={pair_id}, evaluation={evaluation}")
             
@@ -1017,22 +1582,24 @@ async def get_task_detailed_results(task_id: str):
                 "actual_chosen_folder": actual_chosen_folder,
                 "evaluation_id": evaluation["id"] if evaluation else None,
                 "evaluation_timestamp": evaluation.get("created_time") if evaluation else None,
-                "is_evaluated": evaluation is not None
+                "is_evaluated": evaluation is not None,
+                "retired": pair.get("retired", False)
             }
             
             detailed_results.append(result_item)
         
-        # 計算總體統計
-        evaluated_count = len([r for r in detailed_results if r["is_evaluated"]])
+        # 計算總體統計（只計仍在使用的視頻對）
+        total_pairs = len(active_pairs(video_pairs))
+        evaluated_count = len([r for r in detailed_results if r["is_evaluated"] and not r["retired"]])
         
         response_data = {
             "task_id": task_id,
             "task_name": task["name"],
             "folder_a": task["folder_a"],
             "folder_b": task["folder_b"],
-            "total_pairs": len(video_pairs),
+            "total_pairs": total_pairs,
             "evaluated_pairs": evaluated_count,
-            "completion_rate": round((evaluated_count / len(video_pairs) * 100) if video_pairs else 0, 1),
+            "completion_rate": round((evaluated_count / total_pairs * 100) if total_pairs else 0, 1),
             "results": detailed_results
         }
         
@@ -1047,13 +1614,14 @@ async def get_task_detailed_results(task_id: str):
 # 輔助函數：同步獲取任務視頻對數據
 def get_task_video_pairs_sync(task_id: str):
     """同步獲取任務的視頻對數據，用於統計分析"""
-    task = next((t for t in tasks_storage if t["id"] == task_id), None)
+    task = store.get_task(task_id)
     if not task:
         return []
     
     # 如果任務已經有視頻對數據，直接返回
-    if "video_pairs" in task:
-        return task["video_pairs"]
+    video_pairs = pair_plans.get(task_id)
+    if video_pairs is not None:
+        return video_pairs
     
     # 否則動態生成（但這種情況下不會有隨機化信息）
     try:
@@ -1075,12 +1643,12 @@ def get_task_video_pairs_sync(task_id: str):
 async def get_task_statistics(task_id: str):
     """獲取任務統計數據"""
     # 檢查任務是否存在
-    task = next((t for t in tasks_storage if t["id"] == task_id), None)
+    task = store.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found")
     
     # 獲取該任務的評估數據和視頻對映射
-    task_evaluations = [e for e in evaluations_storage if e["video_pair_id"].startswith(task_id)]
+    task_evaluations = store.evaluations_for_task(task_id)
     
     # 獲取任務的視頻對數據以了解隨機化情況
     task_video_pairs = []
@@ -1172,9 +1740,8 @@ async def get_all_statistics():
     """獲取所有任務的統計概覽"""
     all_stats = []
     
-    for task in tasks_storage:
-        task_evaluations = [e for e in evaluations_storage if e["video_pair_id"].startswith(task["id"])]
-        total_evaluations = len(task_evaluations)
+    for task in store.tasks.values():
+        total_evaluations = store.evaluation_count(task["id"])
         completion_rate = (total_evaluations / task["video_pairs_count"] * 100) if task["video_pairs_count"] > 0 else 0
         
         all_stats.append({
@@ -3,12 +3,13 @@ Side-by-Side 視頻盲測服務 - Railway部署版本
 使用Volume持久化存储
 """
 
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, JSONResponse
 import uvicorn
 import os
+import stat
+import asyncio
 from contextlib import asynccontextmanager
 import time
 import json
@@ -20,6 +21,31 @@ import sys
 import traceback
 import pandas as pd
 
+from database.evaluation_journal import EvaluationJournal
+from database.repository import EvaluationExists, get_repository, migrate_json_storage, use_sqlite_storage
+from database.indexed_store import IndexedStore
+from database.write_behind import WriteBehindPersister
+from database.pair_plans import PairPlanBuilder, PairPlanStore, active_pairs
+from database.folder_versions import FolderVersions
+from database.shared_state import SharedStateSync
+from database.metadata_index import MetadataIndex
+from utils.file_utils import atomic_write_json, video_signature_validator
+from utils.blob_store import BlobStore
+from utils.bulk_ingest import BulkIngestJobs, IngestJobNotFound
+from utils.name_rules import BUILTIN_RULESETS, get_ruleset, preview_rules
+from utils.faststart import FASTSTART_UPLOADS, make_faststart_stage
+from utils.page_cache import PageCacheWarmer
+from utils.video_serving import (
+    VIDEO_ACCEL_REDIRECT, StatCache, accel_redirect, resolve_served_path, serve_file
+)
+from utils.resumable_upload import (
+    ChecksumMismatch, InvalidChunk, ResumableUploads, UploadIncomplete, UploadSessionNotFound
+)
+from utils.upload_stream import (
+    UPLOAD_CHUNK_SIZE, InvalidVideoFile, UploadTooLarge, content_length_exceeds, safe_upload_name,
+    stream_upload_to_file, upload_size_limit
+)
+
 # --- Railway Volume配置 ---
 # 使用环境变量配置存储路径，默认为本地路径（开发环境）
 BASE_DATA_DIR = os.environ.get("DATA_DIR", "/app/data")
@@ -30,6 +56,12 @@ EXPORT_DIR = os.environ.get("EXPORT_PATH", os.path.join(BASE_DATA_DIR, "exports"
 FOLDERS_FILE = os.path.join(BASE_DATA_DIR, "folders.json")
 TASKS_FILE = os.path.join(BASE_DATA_DIR, "tasks.json")
 EVALUATIONS_FILE = os.path.join(BASE_DATA_DIR, "evaluations.json")
+PAIR_PLANS_DIR = os.path.join(BASE_DATA_DIR, "pair_plans")
+UPLOAD_SESSIONS_DIR = os.path.join(BASE_DATA_DIR, "upload_sessions")
+INGEST_JOBS_DIR = os.path.join(BASE_DATA_DIR, "ingest_jobs")
+# 内容寻址的 blob 放在对外提供的上传目录之外，只能通过资料夹中的硬链接访问（需与上传目录在同一文件系统才能去重）
+BLOB_DIR = os.environ.get("BLOB_PATH", os.path.join(BASE_DATA_DIR, "blobs"))
+LEGACY_BLOB_DIR = os.path.join(UPLOAD_DIR, ".blobs")
 
 # 服务器配置
 PORT = int(os.environ.get("PORT", 8000))
@@ -50,9 +82,17 @@ ensure_directories()
 
 SUPPORTED_FORMATS = [".mp4", ".mov", ".avi", ".mkv", ".webm"]
 
+# STORAGE_BACKEND=sqlite 时，load_/save_ 函数改为按行读写 WAL 模式的 SQLite
+STORAGE_DB_FILE = os.path.join(BASE_DATA_DIR, "storage.db")
+repository = get_repository(STORAGE_DB_FILE) if use_sqlite_storage() else None
+
 def load_folders():
     """從文件載入資料夾數據"""
     try:
+        if repository:
+            data = repository.list_folders()
+            print(f"✅ 載入了 {len(data)} 個資料夾")
+            return data
         if os.path.exists(FOLDERS_FILE):
             with open(FOLDERS_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -63,18 +103,21 @@ def load_folders():
     return []
 
 def save_folders(folders_data):
-    """保存資料夾數據到文件"""
-    try:
-        ensure_directories()  # 确保目录存在
-        with open(FOLDERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(folders_data, f, ensure_ascii=False, indent=2)
-        print(f"✅ 保存了 {len(folders_data)} 個資料夾")
-    except Exception as e:
-        print(f"❌ 保存資料夾數據失敗: {e}")
+    """保存資料夾數據到文件（失敗時拋出異常，由 write_behind 重試）"""
+    ensure_directories()  # 确保目录存在
+    if repository:
+        repository.replace_folders(folders_data)  # 只写入有变化的行
+    else:
+        atomic_write_json(FOLDERS_FILE, folders_data, indent=2)
+    print(f"✅ 保存了 {len(folders_data)} 個資料夾")
 
 def load_tasks():
     """從文件載入任務數據"""
     try:
+        if repository:
+            data = repository.list_tasks()
+            print(f"✅ 載入了 {len(data)} 個任務")
+            return data
         if os.path.exists(TASKS_FILE):
             with open(TASKS_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
@@ -85,45 +128,162 @@ def load_tasks():
     return []
 
 def save_tasks(tasks_data):
-    """保存任務數據到文件"""
-    try:
-        ensure_directories()  # 确保目录存在
-        with open(TASKS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(tasks_data, f, ensure_ascii=False, indent=2)
-        print(f"✅ 保存了 {len(tasks_data)} 個任務")
-    except Exception as e:
-        print(f"❌ 保存任務數據失敗: {e}")
+    """保存任務數據到文件（失敗時拋出異常，由 write_behind 重試）"""
+    ensure_directories()  # 确保目录存在
+    if repository:
+        repository.replace_tasks(tasks_data)  # 只写入有变化的行
+    else:
+        atomic_write_json(TASKS_FILE, tasks_data, indent=2)
+    print(f"✅ 保存了 {len(tasks_data)} 個任務")
+
+def save_folder_changes(changes):
+    """按行寫入資料夾的變更（SQLite 後端，不會覆蓋其他 worker 寫入的行；失敗時拋出異常，由 write_behind 重試）"""
+    upserts, deletes = changes
+    repository.apply_folder_changes(upserts, deletes)
+    print(f"✅ 保存了 {len(upserts)} 個資料夾，刪除了 {len(deletes)} 個資料夾")
+
+def save_task_changes(changes):
+    """按行寫入任務的變更（SQLite 後端，不會覆蓋其他 worker 寫入的行；失敗時拋出異常，由 write_behind 重試）"""
+    upserts, deletes = changes
+    repository.apply_task_changes(upserts, deletes)
+    print(f"✅ 保存了 {len(upserts)} 個任務，刪除了 {len(deletes)} 個任務")
+
+async def update_folder_stats(folder, video_count=0, total_size=0, absolute=False):
+    """
+    更新资料夹的视频数/总大小（absolute 为 False 时按增量累加）
+    SQLite 后端在数据库中原子化累加（线程池中执行），多个 worker 并发上传不会互相覆盖统计
+    """
+    if repository:
+        updated = await asyncio.get_running_loop().run_in_executor(
+            None, repository.update_folder_stats, folder["name"], video_count, total_size, absolute
+        )
+        if updated is not None:
+            folder["video_count"] = updated["video_count"]
+            folder["total_size"] = updated["total_size"]
+            return
+    if absolute:
+        folder["video_count"], folder["total_size"] = video_count, total_size
+    else:
+        folder["video_count"] = max(0, folder.get("video_count", 0) + video_count)
+        folder["total_size"] = max(0, folder.get("total_size", 0) + total_size)
+    store.touch_folder(folder["name"])
+    write_behind.mark_dirty("folders")
+
+# JSON 后端的进程内计数器 {名称: 上一次分配的编号}
+local_sequences = {}
+
+async def next_sequence(name, current_count):
+    """生成遞增編號；SQLite 後端使用跨進程計數器（線程池中執行），多個 worker 不會生成相同的ID"""
+    if repository:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, repository.next_counter, name, current_count
+        )
+    # JSON 后端在进程内分配：编号在任何 await 之前确定，并发的请求不会拿到相同的编号
+    value = max(local_sequences.get(name, 0), current_count) + 1
+    local_sequences[name] = value
+    return value
+
+# 评估数据使用 快照 + 追加日志，每次投票只追加一行而不是重写整个文件
+evaluation_journal = EvaluationJournal(
+    EVALUATIONS_FILE,
+    commit_interval=float(os.environ.get("EVALUATION_COMMIT_INTERVAL", "0.05")),
+    compact_threshold=int(os.environ.get("EVALUATION_COMPACT_THRESHOLD", "10000"))
+)
 
 def load_evaluations():
-    """從文件載入評估數據"""
+    """從快照載入評估數據並重放日誌"""
     try:
-        if os.path.exists(EVALUATIONS_FILE):
-            with open(EVALUATIONS_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                print(f"✅ 載入了 {len(data)} 個評估")
-                return data
+        if repository:
+            data = repository.list_evaluations()
+            print(f"✅ 載入了 {len(data)} 個評估")
+            return data
+        return evaluation_journal.load()
     except Exception as e:
         print(f"❌ 載入評估數據失敗: {e}")
     return []
 
 def save_evaluations(evaluations_data):
-    """保存評估數據到文件"""
+    """整體重寫評估快照（僅用於刪除等操作，新增評估請使用 append_evaluation）"""
     try:
         ensure_directories()  # 确保目录存在
-        with open(EVALUATIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(evaluations_data, f, ensure_ascii=False, indent=2)
-        print(f"✅ 保存了 {len(evaluations_data)} 個評估")
+        if repository:
+            repository.replace_evaluations(evaluations_data)
+            print(f"✅ 保存了 {len(evaluations_data)} 個評估")
+        else:
+            evaluation_journal.rewrite(evaluations_data)
     except Exception as e:
         print(f"❌ 保存評估數據失敗: {e}")
 
-# 初始化数据存储
-folders_storage = load_folders()
-tasks_storage = load_tasks()
-evaluations_storage = load_evaluations()
+# 新评估的 ID 与已有评估冲突时最多重新分配的次数
+EVALUATION_ID_ATTEMPTS = 3
+
+async def append_evaluation(evaluation):
+    """持久化一条新评估：SQLite 后端插入一行，JSON 后端追加到日志"""
+    if repository:
+        await asyncio.get_running_loop().run_in_executor(None, repository.add_evaluation, evaluation)
+    else:
+        await evaluation_journal.append_async(evaluation)
+
+if repository and repository.is_empty():
+    # 首次切换到 SQLite 时，一次性导入现有的 JSON 数据
+    migrate_json_storage(
+        repository, FOLDERS_FILE, TASKS_FILE, EVALUATIONS_FILE, pair_plans_dir=PAIR_PLANS_DIR
+    )
+
+# 初始化数据存储（JSON 后端的评估数据在 lifespan 中载入快照并重放日志）
+store = IndexedStore(track_changes=repository is not None)
+
+# 每个任务的视频对单独存放、按需载入，tasks.json 不再内嵌 video_pairs
+pair_plans = PairPlanStore(PAIR_PLANS_DIR, repository)
+
+# 资料夹内容版本（可见文件名列表的指纹），版本不变时任务的视频对方案不需要重新生成
+folder_versions = FolderVersions(UPLOAD_DIR)
+
+# 上传的视频按内容哈希保存一份，资料夹中的文件是指向 blob 的硬链接
+blob_store = BlobStore(BLOB_DIR, legacy_root=LEGACY_BLOB_DIR)
 
-print(f"✅ 载入 {len(folders_storage)} 个文件夹")
-print(f"✅ 载入 {len(tasks_storage)} 个任务") 
-print(f"✅ 载入 {len(evaluations_storage)} 个评估")
+# 可续传的分块上传会话
+resumable_uploads = ResumableUploads(UPLOAD_SESSIONS_DIR, blob_store)
+
+# 把服务器本地目录/压缩包导入资料夹的后台任务（reflink/硬链接，不支持时复制）
+bulk_ingest = BulkIngestJobs(INGEST_JOBS_DIR, UPLOAD_DIR)
+bulk_ingest_tasks = set()
+
+# 视频路由缓存的 stat 结果（ETag/Last-Modified），文件写入后清除
+video_stat_cache = StatCache()
+
+# 按任务的视频对顺序预热评估者接下来要看的视频（PREFETCH_PAIRS=0 关闭）
+page_cache_warmer = PageCacheWarmer(UPLOAD_DIR)
+
+# 上传完成后在后台探测视频元数据，列出文件时直接读取资料夹中的索引
+# 可选：上传完成的 MP4 在探测前把末尾的 moov 移到文件开头（FASTSTART_UPLOADS=1 开启，只处理新上传的文件）
+metadata_index = MetadataIndex(
+    before_probe=make_faststart_stage(
+        blob_store, on_rewrite=lambda path: video_stat_cache.invalidate()
+    ) if FASTSTART_UPLOADS else None
+)
+
+if repository:
+    # SQLite 后端是所有 worker 共享的数据源：修改按行直写，请求前同步其他 worker 的写入
+    write_behind = WriteBehindPersister(debounce_seconds=0)
+    write_behind.register("folders", store.take_folder_changes, save_folder_changes,
+                          requeue=store.requeue_folder_changes)
+    write_behind.register("tasks", store.take_task_changes, save_task_changes,
+                          requeue=store.requeue_task_changes)
+    shared_state = SharedStateSync(repository, store, pair_plans)
+    shared_state.load()
+else:
+    # 资料夹/任务的修改只标记为脏，由 write_behind 合并后在线程池中原子化写盘
+    write_behind = WriteBehindPersister()
+    write_behind.register("folders", store.folder_list, save_folders)
+    write_behind.register("tasks", store.task_list, save_tasks)
+    shared_state = None
+    store.load(load_folders(), load_tasks(), [])
+    if pair_plans.migrate_embedded(store.task_list()):
+        write_behind.mark_dirty("tasks")
+
+print(f"✅ 载入 {len(store.folders)} 个文件夹")
+print(f"✅ 载入 {len(store.tasks)} 个任务") 
 print(f"🔍 Volume持久化测试: 重新部署时间 {time.time()}")
 print(f"🔍 Volume状态检查:")
 print(f"  - DATA_DIR ({BASE_DATA_DIR}) exists: {os.path.exists(BASE_DATA_DIR)}")
@@ -138,7 +298,7 @@ else:
     print(f"  - DATA_DIR not found - Volume may not be mounted!")
 
 # 临时方案：如果没有数据，创建示例数据
-if len(folders_storage) == 0:
+if len(store.folders) == 0:
     print("⚠️ 检测到数据丢失，创建示例数据...")
     sample_folders = [
         {
@@ -154,8 +314,9 @@ if len(folders_storage) == 0:
             "total_size": 0
         }
     ]
-    folders_storage.extend(sample_folders)
-    save_folders(folders_storage)
+    for sample_folder in sample_folders:
+        store.add_folder(sample_folder)
+    write_behind.mark_dirty("folders")
     print(f"✅ 创建了 {len(sample_folders)} 个示例文件夹")
 
 @asynccontextmanager
@@ -164,14 +325,21 @@ async def lifespan(app: FastAPI):
     print("🚀 应用程序启动中...")
     ensure_directories()
     
-    # 为uploads目录提供静态文件服务
-    if os.path.exists(UPLOAD_DIR):
-        app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
-        print(f"✅ 挂载上传目录: {UPLOAD_DIR}")
+    if shared_state:
+        shared_state.load()
+    else:
+        # 载入评估快照，再重放日志尾部
+        store.replace_evaluations(load_evaluations())
+        evaluation_journal.start()
+    print(f"✅ 载入 {len(store.evaluations)} 个评估")
     
     yield
     
     print("🔄 应用程序正在关闭...")
+    await write_behind.close()  # 写入所有尚未落盘的修改
+    evaluation_journal.close()
+    metadata_index.shutdown()
+    bulk_ingest.shutdown()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -181,6 +349,27 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+@app.middleware("http")
+async def sync_shared_state(request, call_next):
+    """多 worker 模式下，处理 API 请求前载入其他 worker 的写入，返回前等待本请求的修改写入数据库"""
+    if not (shared_state and request.url.path.startswith("/api/")):
+        return await call_next(request)
+    await shared_state.sync_async()
+    response = await call_next(request)
+    await write_behind.wait_idle()
+    return response
+
+@app.middleware("http")
+async def reject_oversized_upload(request, call_next):
+    """上传请求的 Content-Length 超过上限时，在解析请求体之前直接拒绝"""
+    if request.method == "POST" and request.url.path.endswith("/upload") \
+            and content_length_exceeds(request.headers.get("content-length")):
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"上傳內容超過大小上限 {upload_size_limit()} 字節"}
+        )
+    return await call_next(request)
+
 # CORS配置
 app.add_middleware(
     CORSMiddleware,
@@ -205,14 +394,19 @@ async def health_check():
         }
     }
 
+@app.get("/api/prefetch/stats")
+async def get_prefetch_stats():
+    """视频预热的命中/未命中统计，用于调整 PREFETCH_PAIRS 和 PREFETCH_HEAD_BYTES"""
+    return {"success": True, "data": page_cache_warmer.snapshot()}
+
 @app.get("/api/folders")
 async def get_folders():
     """獲取所有資料夾"""
     try:
         return {
             "success": True,
-            "data": folders_storage,
-            "count": len(folders_storage)
+            "data": store.folder_list(),
+            "count": len(store.folders)
         }
     except Exception as e:
         print(f"❌ 獲取資料夾失敗: {e}")
@@ -227,7 +421,7 @@ async def create_folder(data: dict):
             raise HTTPException(status_code=400, detail="資料夾名稱不能為空")
         
         # 檢查是否已存在
-        if any(f["name"] == folder_name for f in folders_storage):
+        if folder_name in store.folders:
             raise HTTPException(status_code=400, detail="資料夾名稱已存在")
         
         # 創建資料夾記錄
@@ -238,8 +432,8 @@ async def create_folder(data: dict):
             "total_size": 0
         }
         
-        folders_storage.append(new_folder)
-        save_folders(folders_storage)
+        store.add_folder(new_folder)
+        write_behind.mark_dirty("folders")
         
         # 創建物理目錄
         folder_path = os.path.join(UPLOAD_DIR, folder_name)
@@ -266,16 +460,20 @@ async def get_folder_files(folder_name: str):
             raise HTTPException(status_code=404, detail="資料夾不存在")
         
         files = []
+        # 元数据来自资料夹的索引，不打开视频文件；尚未探测完成的文件返回 None
+        metadata_entries = metadata_index.folder_entries(folder_path)
         for filename in os.listdir(folder_path):
+            if filename.startswith("."):
+                continue  # 上传中的临时文件和元数据索引
             file_path = os.path.join(folder_path, filename)
-            if os.path.isfile(file_path):
-                # 获取文件创建时间
-                created_time = os.path.getctime(file_path)
+            file_stat = os.stat(file_path)
+            if stat.S_ISREG(file_stat.st_mode):
                 files.append({
                     "filename": filename,  # 匹配前端接口
-                    "size": os.path.getsize(file_path),
+                    "size": file_stat.st_size,
                     "path": f"/uploads/{folder_name}/{quote(filename)}",  # 匹配前端接口
-                    "created_time": created_time  # 添加创建时间
+                    "created_time": file_stat.st_ctime,  # 添加创建时间
+                    "metadata": metadata_index.lookup(folder_path, filename, file_stat, metadata_entries)
                 })
         
         return {
@@ -299,7 +497,7 @@ async def upload_files(folder_name: str, files: list[UploadFile] = File(...)):
     print(f"🔧 DEBUG: Upload request for folder: '{folder_name}'")
     
     # 檢查資料夾是否存在
-    folder = next((f for f in folders_storage if f["name"] == folder_name), None)
+    folder = store.get_folder(folder_name)
     if not folder:
         print(f"❌ DEBUG: Folder '{folder_name}' not found in storage")
         raise HTTPException(status_code=404, detail=f"資料夾 '{folder_name}' 不存在")
@@ -312,33 +510,70 @@ async def upload_files(folder_name: str, files: list[UploadFile] = File(...)):
         uploaded_count = 0
         total_size = 0
         uploaded_files = []
+        rejected_files = []
+        size_limit = upload_size_limit()
+        too_large = None
         
-        # 保存每個文件
+        # 逐個文件按塊流式寫盤，不把整個文件讀進內存
         for file in files:
             if file.filename:
-                file_path = os.path.join(folder_path, file.filename)
+                try:
+                    filename = safe_upload_name(file.filename)
+                except ValueError:
+                    # 無效的文件名（如 ".."）與非視頻文件一樣拒絕，全部被拒絕時返回 400
+                    rejected_files.append(file.filename)
+                    print(f"⚠️ 跳過無效的文件名: {file.filename!r}")
+                    continue
+                file_path = os.path.join(folder_path, filename)
+                
+                # 按文件頭簽名檢查容器類型，非視頻文件在寫盤前就被拒絕
+                validator = video_signature_validator(filename)
+                if validator is None:
+                    rejected_files.append(filename)
+                    print(f"⚠️ 跳過不支持的文件: {filename}")
+                    continue
                 
-                # 讀取文件內容並保存
-                contents = await file.read()
-                with open(file_path, "wb") as f:
-                    f.write(contents)
+                remaining = None if size_limit is None else size_limit - total_size
+                try:
+                    file_size = await stream_upload_to_file(
+                        file, file_path, limit=remaining, blob_store=blob_store, validate_head=validator
+                    )
+                except UploadTooLarge as e:
+                    too_large = e
+                    break
+                except InvalidVideoFile as e:
+                    rejected_files.append(filename)
+                    print(f"⚠️ {e}")
+                    continue
                 
                 uploaded_count += 1
-                file_size = len(contents)
                 total_size += file_size
                 
                 uploaded_files.append({
-                    "filename": file.filename,
+                    "filename": filename,
                     "size": file_size,
-                    "url": f"/uploads/{folder_name}/{quote(file.filename)}"
+                    "url": f"/uploads/{folder_name}/{quote(filename)}"
                 })
                 
-                print(f"✅ 上傳文件: {file.filename} ({file_size} bytes)")
+                print(f"✅ 上傳文件: {filename} ({file_size} bytes)")
         
         # 更新資料夾統計並保存
-        folder["video_count"] += uploaded_count
-        folder["total_size"] += total_size
-        save_folders(folders_storage)  # 持久化保存
+        await update_folder_stats(folder, uploaded_count, total_size)  # 持久化保存
+        video_stat_cache.invalidate()
+        folder_versions.changed(folder_name)
+        metadata_index.schedule(folder_path, [f["filename"] for f in uploaded_files], post_process=True)
+        
+        if too_large is not None:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{too_large}，已保存前 {uploaded_count} 個文件"
+            )
+        
+        if rejected_files and not uploaded_count:
+            raise HTTPException(
+                status_code=400,
+                detail=f"沒有成功上傳任何視頻文件，不是有效視頻的文件: {', '.join(rejected_files)}"
+            )
         
         return {
             "success": True,
@@ -346,32 +581,259 @@ async def upload_files(folder_name: str, files: list[UploadFile] = File(...)):
                 "uploaded_files": uploaded_count,
                 "folder_name": folder_name,
                 "total_size": total_size,
-                "files": uploaded_files
+                "files": uploaded_files,
+                "rejected_files": rejected_files
             },
             "message": f"成功上傳 {uploaded_count} 個文件到資料夾 '{folder_name}'"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ 上傳錯誤: {e}")
         raise HTTPException(status_code=500, detail=f"上傳失敗: {str(e)}")
 
+@app.api_route("/uploads/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_upload(file_path: str, request: Request):
+    """
+    视频文件服务：支持单/多范围请求、条件请求（304），?v=<ETag> 的 URL 可永久缓存
+    设置 VIDEO_ACCEL_REDIRECT 时由 nginx 发送文件内容
+    """
+    path = resolve_served_path(UPLOAD_DIR, file_path)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    page_cache_warmer.file_requested(path)
+    if VIDEO_ACCEL_REDIRECT:
+        return await accel_redirect(request, UPLOAD_DIR, path, video_stat_cache)
+    return await serve_file(request, path, video_stat_cache)
+
+def get_upload_session(folder_name: str, upload_id: str) -> dict:
+    """獲取屬於指定資料夾的上傳會話，不存在時返回 404"""
+    try:
+        session = resumable_uploads.get(upload_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    if session["folder_name"] != folder_name:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    return session
+
+@app.post("/api/folders/{folder_name}/uploads")
+async def create_upload_session(folder_name: str, data: dict):
+    """創建可續傳的上傳會話，之後按偏移分塊 PUT 文件內容"""
+    if not store.get_folder(folder_name):
+        raise HTTPException(status_code=404, detail=f"資料夾 '{folder_name}' 不存在")
+    try:
+        session = resumable_uploads.create(
+            folder_name, os.path.join(UPLOAD_DIR, folder_name), data.get("filename", ""), int(data.get("size", -1)),
+            sha256=data.get("sha256")
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "data": {
+            "upload_id": session["id"],
+            "filename": session["filename"],
+            "size": session["size"],
+            "chunk_size": UPLOAD_CHUNK_SIZE
+        },
+        "message": f"已創建上傳會話 '{session['id']}'"
+    }
+
+@app.put("/api/folders/{folder_name}/uploads/{upload_id}")
+async def upload_chunk(folder_name: str, upload_id: str, offset: int, request: Request):
+    """把請求體作為一個塊寫入 offset 處，塊可以並行上傳和重傳"""
+    get_upload_session(folder_name, upload_id)
+    try:
+        written = await resumable_uploads.write_chunk(upload_id, offset, request.stream())
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    except (InvalidChunk, InvalidVideoFile) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "data": {"offset": offset, "written": written}}
+
+@app.get("/api/folders/{folder_name}/uploads/{upload_id}")
+async def get_upload_status(folder_name: str, upload_id: str):
+    """查詢已收到的範圍，斷線後據此只重傳缺失的部分"""
+    get_upload_session(folder_name, upload_id)
+    return {"success": True, "data": resumable_uploads.status(upload_id)}
+
+@app.post("/api/folders/{folder_name}/uploads/{upload_id}/finalize")
+async def finalize_upload_session(folder_name: str, upload_id: str):
+    """所有塊上傳完成後，把文件放到資料夾中並更新統計"""
+    folder = store.get_folder(folder_name)
+    if not folder:
+        raise HTTPException(status_code=404, detail=f"資料夾 '{folder_name}' 不存在")
+    get_upload_session(folder_name, upload_id)
+    try:
+        session = await asyncio.get_running_loop().run_in_executor(
+            None, resumable_uploads.finalize, upload_id
+        )
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    except UploadIncomplete as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(e), "missing": [list(r) for r in e.missing]}
+        )
+    except (ChecksumMismatch, InvalidVideoFile) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    await update_folder_stats(folder, 1, session["size"])
+    video_stat_cache.invalidate()
+    folder_versions.changed(folder_name)
+    metadata_index.schedule(os.path.dirname(session["target_path"]), [session["filename"]], post_process=True)
+    
+    print(f"✅ 上傳文件: {session['filename']} ({session['size']} bytes)")
+    return {
+        "success": True,
+        "data": {
+            "filename": session["filename"],
+            "size": session["size"],
+            "folder_name": folder_name,
+            "deduplicated": session["deduplicated"]
+        },
+        "message": f"成功上傳文件 '{session['filename']}' 到資料夾 '{folder_name}'"
+    }
+
+@app.delete("/api/folders/{folder_name}/uploads/{upload_id}")
+async def abort_upload_session(folder_name: str, upload_id: str):
+    """取消上傳並刪除已收到的數據"""
+    get_upload_session(folder_name, upload_id)
+    try:
+        resumable_uploads.abort(upload_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"上傳會話 '{upload_id}' 不存在")
+    return {"success": True, "message": f"已取消上傳會話 '{upload_id}'"}
+
+async def finish_bulk_ingest(future, folder_name: str, folder_path: str):
+    """导入任务结束后按资料夹中的实际文件重新统计"""
+    job = await asyncio.wrap_future(future)
+    folder = store.get_folder(folder_name)
+    if folder is None or not os.path.isdir(folder_path):
+        return
+    video_count, total_size = 0, 0
+    for entry in os.scandir(folder_path):
+        if not entry.name.startswith(".") and entry.is_file() and video_signature_validator(entry.name):
+            video_count += 1
+            total_size += entry.stat().st_size
+    await update_folder_stats(folder, video_count, total_size, absolute=True)
+    print(f"✅ 导入任务 {job['id']} 结束，资料夹 '{folder_name}' 共 {video_count} 个视频")
+
+def on_ingested_files(folder_path: str, filenames: list):
+    """导入线程每放入一批文件调用一次"""
+    video_stat_cache.invalidate()
+    folder_versions.changed(os.path.basename(folder_path))
+    metadata_index.schedule(folder_path, filenames)
+
+@app.post("/api/folders/{folder_name}/ingest")
+async def start_bulk_ingest(folder_name: str, data: dict):
+    """
+    把服務器本地的目錄或 zip/tar 壓縮包導入資料夾（資料夾不存在時創建），在後台執行
+    mode: auto（reflink → 硬鏈接 → 複製）、reflink（reflink → 複製）、copy
+    """
+    if not folder_name or folder_name.startswith(".") or os.path.basename(folder_name) != folder_name:
+        raise HTTPException(status_code=400, detail=f"無效的資料夾名稱: {folder_name}")
+    folder_path = os.path.join(UPLOAD_DIR, folder_name)
+    try:
+        job = bulk_ingest.create(folder_name, folder_path, data.get("source", ""), data.get("mode", "auto"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not store.get_folder(folder_name):
+        store.add_folder({
+            "name": folder_name,
+            "created_time": time.time(),
+            "video_count": 0,
+            "total_size": 0
+        })
+        write_behind.mark_dirty("folders")
+    
+    future = bulk_ingest.start(job["id"], on_files=on_ingested_files)
+    task = asyncio.create_task(finish_bulk_ingest(future, folder_name, folder_path))
+    bulk_ingest_tasks.add(task)
+    task.add_done_callback(bulk_ingest_tasks.discard)
+    return {
+        "success": True,
+        "data": job,
+        "message": f"已開始導入 '{job['source']}' 到資料夾 '{folder_name}'"
+    }
+
+@app.get("/api/folders/{folder_name}/ingest/{job_id}")
+async def get_bulk_ingest(folder_name: str, job_id: str):
+    """查詢導入進度"""
+    try:
+        job = bulk_ingest.get(job_id)
+    except IngestJobNotFound:
+        raise HTTPException(status_code=404, detail=f"導入任務 '{job_id}' 不存在")
+    if job["folder_name"] != folder_name:
+        raise HTTPException(status_code=404, detail=f"導入任務 '{job_id}' 不存在")
+    return {"success": True, "data": job}
+
+@app.delete("/api/folders/{folder_name}/ingest/{job_id}")
+async def cancel_bulk_ingest(folder_name: str, job_id: str):
+    """取消導入，已經放入資料夾的文件保留"""
+    await get_bulk_ingest(folder_name, job_id)
+    job = bulk_ingest.cancel(job_id)
+    return {"success": True, "data": job, "message": f"已請求取消導入任務 '{job_id}'"}
+
+@app.get("/api/name-rules")
+async def list_name_rules():
+    """内置的文件名清理规则集"""
+    return {"success": True, "data": {name: ruleset.to_config() for name, ruleset in BUILTIN_RULESETS.items()}}
+
+def list_folder_videos(folder_name: str) -> list:
+    folder_path = os.path.join(UPLOAD_DIR, folder_name)
+    return sorted(
+        f for f in os.listdir(folder_path)
+        if not f.startswith(".") and any(f.lower().endswith(ext) for ext in SUPPORTED_FORMATS)
+    )
+
+@app.post("/api/folders/{folder_name}/name-rules/preview")
+async def preview_name_rules(folder_name: str, data: dict):
+    """
+    预览文件名清理规则在资料夹上的效果（不修改任何数据）
+    rules: 内置规则集名称或配置，默认 render；compare_folder: 可选，统计与另一个资料夹按清理后名称能配对的数量
+    """
+    try:
+        ruleset = get_ruleset(data.get("rules"), default="render")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"文件名規則無效: {e}")
+    
+    compare_folder = data.get("compare_folder")
+    for name in filter(None, (folder_name, compare_folder)):
+        if not store.get_folder(name) or not os.path.isdir(os.path.join(UPLOAD_DIR, name)):
+            raise HTTPException(status_code=404, detail=f"資料夾 '{name}' 不存在")
+    
+    compare_files = list_folder_videos(compare_folder) if compare_folder else None
+    return {"success": True, "data": preview_rules(ruleset, list_folder_videos(folder_name), compare_files)}
+
 @app.delete("/api/folders/{folder_name}")
 async def delete_folder(folder_name: str):
     """刪除資料夾"""
     try:
         # 檢查資料夾是否存在
-        folder = next((f for f in folders_storage if f["name"] == folder_name), None)
+        folder = store.get_folder(folder_name)
         if not folder:
             raise HTTPException(status_code=404, detail=f"資料夾 '{folder_name}' 不存在")
         
         # 刪除物理目錄
         folder_path = os.path.join(UPLOAD_DIR, folder_name)
         if os.path.exists(folder_path):
-            shutil.rmtree(folder_path)
+            loop = asyncio.get_running_loop()
+            # 刪除目錄和掃描 blob 都是阻塞的文件系統操作，放到線程池中執行
+            await loop.run_in_executor(None, shutil.rmtree, folder_path)
+            video_stat_cache.invalidate()
+            folder_versions.changed(folder_name)
             print(f"✅ 刪除物理目錄: {folder_path}")
+            # 只回收不再被任何資料夾引用的 blob
+            await loop.run_in_executor(None, blob_store.collect_garbage)
         
         # 從存儲中移除資料夾記錄
-        folders_storage.remove(folder)
-        save_folders(folders_storage)
+        store.remove_folder(folder_name)
+        write_behind.mark_dirty("folders")
         
         return {
             "success": True,
@@ -391,8 +853,8 @@ async def get_tasks():
     try:
         return {
             "success": True,
-            "data": tasks_storage,
-            "count": len(tasks_storage)
+            "data": store.task_list(),
+            "count": len(store.tasks)
         }
     except Exception as e:
         print(f"❌ 获取任务列表错误: {e}")
@@ -419,8 +881,8 @@ async def create_task(data: dict):
             return {"success": False, "error": "請選擇兩個不同的資料夾"}
         
         # 检查文件夹是否存在
-        folder_a_obj = next((f for f in folders_storage if f["name"] == folder_a), None)
-        folder_b_obj = next((f for f in folders_storage if f["name"] == folder_b), None)
+        folder_a_obj = store.get_folder(folder_a)
+        folder_b_obj = store.get_folder(folder_b)
         
         if not folder_a_obj:
             return {"success": False, "error": f"資料夾 '{folder_a}' 不存在"}
@@ -433,7 +895,7 @@ async def create_task(data: dict):
         
         # 创建任务对象
         new_task = {
-            "id": f"task_{len(tasks_storage) + 1}_{int(time.time())}",
+            "id": f"task_{await next_sequence('tasks', len(store.tasks))}_{int(time.time())}",
             "name": task_name,
             "description": description,
             "folder_a": folder_a,
@@ -446,8 +908,9 @@ async def create_task(data: dict):
             "completed_evaluations": 0
         }
         
-        tasks_storage.append(new_task)
-        save_tasks(tasks_storage)  # 持久化保存
+        store.add_task(new_task)
+        write_behind.mark_dirty("tasks")  # 持久化保存
+        pair_plan_builder.schedule(new_task)  # 在后台生成并保存视频对方案
         
         print(f"✅ 创建任务: {task_name}")
         
@@ -466,18 +929,20 @@ async def create_task(data: dict):
 async def get_task(task_id: str):
     """获取单个任务详情，包含动态生成的视频对"""
     try:
-        task = next((t for t in tasks_storage if t["id"] == task_id), None)
+        task = store.get_task(task_id)
         if not task:
             raise HTTPException(status_code=404, detail="任务不存在")
         
-        # 生成视频对
-        video_pairs = generate_video_pairs(task)
+        # 视频对在创建任务时已在后台生成，两个资料夹的内容没有变化时直接返回保存的方案
+        video_pairs = await pair_plan_builder.get(task)
+        # 评估者会按这个顺序观看，提前预热最前面的视频对
+        page_cache_warmer.track_task(task_id, video_pairs)
         
         # 返回包含视频对的任务数据
         task_with_pairs = task.copy()
         task_with_pairs["video_pairs"] = video_pairs
         
-        print(f"✅ 任务 {task_id} 生成了 {len(video_pairs)} 个视频对")
+        print(f"✅ 任务 {task_id} 返回 {len(video_pairs)} 个视频对")
         
         return {
             "success": True,
@@ -491,7 +956,7 @@ async def get_task(task_id: str):
         return {"success": False, "error": f"获取任务失败: {str(e)}"}
 
 def generate_video_pairs(task):
-    """为任务生成视频对"""
+    """为任务生成视频对（只在 PairPlanBuilder 生成方案时调用，结果会被持久化）"""
     try:
         folder_a_name = task["folder_a"]
         folder_b_name = task["folder_b"]
@@ -506,21 +971,21 @@ def generate_video_pairs(task):
             print(f"❌ 文件夹不存在: {folder_a_path} 或 {folder_b_path}")
             return []
         
-        # 获取视频文件
-        files_a = [f for f in os.listdir(folder_a_path) 
-                  if os.path.isfile(os.path.join(folder_a_path, f)) and 
-                  any(f.lower().endswith(ext) for ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm'])]
+        # 获取视频文件（排序：os.listdir 的顺序取决于文件系统，按索引配对时配对和 ID 必须与目录顺序无关）
+        files_a = sorted(f for f in os.listdir(folder_a_path)
+                         if os.path.isfile(os.path.join(folder_a_path, f)) and
+                         any(f.lower().endswith(ext) for ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm']))
         
-        files_b = [f for f in os.listdir(folder_b_path) 
-                  if os.path.isfile(os.path.join(folder_b_path, f)) and 
-                  any(f.lower().endswith(ext) for ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm'])]
+        files_b = sorted(f for f in os.listdir(folder_b_path)
+                         if os.path.isfile(os.path.join(folder_b_path, f)) and
+                         any(f.lower().endswith(ext) for ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm']))
         
         print(f"🔧 文件夹A有 {len(files_a)} 个视频: {files_a}")
         print(f"🔧 文件夹B有 {len(files_b)} 个视频: {files_b}")
         
         video_pairs = []
         
-        # 简单匹配：按索引配对
+        # 简单匹配：按排序后的索引配对
         max_pairs = min(len(files_a), len(files_b))
         
         for i in range(max_pairs):
@@ -546,9 +1011,15 @@ def generate_video_pairs(task):
         return video_pairs
         
     except Exception as e:
+        # 读取失败时抛出，由 PairPlanBuilder 保留原来的方案，而不是把方案替换为空
         print(f"❌ 生成视频对错误: {e}")
-        print(f"❌ 错误详情: {traceback.format_exc()}")
-        return []
+        raise
+
+# 物化的视频对方案（需要在 generate_video_pairs 定义之后创建）
+pair_plan_builder = PairPlanBuilder(
+    pair_plans, folder_versions, store, generate_video_pairs,
+    on_saved=lambda task_id: write_behind.mark_dirty("tasks")
+)
 
 @app.post("/api/evaluations")
 async def create_evaluation(data: dict):
@@ -563,17 +1034,25 @@ async def create_evaluation(data: dict):
         if not video_pair_id or not choice:
             return {"success": False, "error": "缺少必要参数"}
         
-        # 创建评估对象
-        evaluation = {
-            "id": f"eval_{len(evaluations_storage) + 1}_{int(time.time())}",
-            "video_pair_id": video_pair_id,
-            "choice": choice,
-            "is_blind": is_blind,
-            "created_time": int(time.time())
-        }
+        # 创建评估对象；ID 已被占用时换一个 ID，不覆盖已有的投票
+        for attempt in range(EVALUATION_ID_ATTEMPTS):
+            evaluation = {
+                "id": f"eval_{await next_sequence('evaluations', len(store.evaluations))}_{int(time.time())}",
+                "video_pair_id": video_pair_id,
+                "choice": choice,
+                "is_blind": is_blind,
+                "created_time": int(time.time())
+            }
+            try:
+                await append_evaluation(evaluation)  # 只持久化这一条评估
+                break
+            except EvaluationExists as e:
+                print(f"⚠️ {e}，重新分配评估 ID")
+        else:
+            return {"success": False, "error": "无法分配新的评估 ID，请重试"}
         
-        evaluations_storage.append(evaluation)
-        save_evaluations(evaluations_storage)
+        store.add_evaluation(evaluation)
+        page_cache_warmer.pair_completed(video_pair_id)  # 评估者将切换到下一对
         
         print(f"✅ 评估已保存: {evaluation['id']}")
         
@@ -594,8 +1073,8 @@ async def get_evaluations():
     try:
         return {
             "success": True,
-            "data": evaluations_storage,
-            "count": len(evaluations_storage)
+            "data": store.evaluation_list(),
+            "count": len(store.evaluations)
         }
     except Exception as e:
         print(f"❌ 获取评估错误: {e}")
@@ -604,13 +1083,14 @@ async def get_evaluations():
 # 辅助函数：同步获取任务视频对数据
 def get_task_video_pairs_sync(task_id: str):
     """同步获取任务的视频对数据，用于统计分析"""
-    task = next((t for t in tasks_storage if t["id"] == task_id), None)
+    task = store.get_task(task_id)
     if not task:
         return []
     
     # 如果任务已经有视频对数据，直接返回
-    if "video_pairs" in task:
-        return task["video_pairs"]
+    video_pairs = pair_plans.get(task_id)
+    if video_pairs is not None:
+        return video_pairs
     
     # 否则动态生成（但这种情况下不会有随机化信息）
     try:
@@ -626,13 +1106,13 @@ def get_task_video_pairs_sync(task_id: str):
 async def get_task_statistics(task_id: str):
     """获取任务统计数据"""
     # 检查任务是否存在
-    task = next((t for t in tasks_storage if t["id"] == task_id), None)
+    task = store.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found")
     
     # 获取该任务的评估数据和视频对映射
-    # 修复：video_pair_id格式是 "pair_task_1_1756203256_0"，需要包含task_id
-    task_evaluations = [e for e in evaluations_storage if task_id in e["video_pair_id"]]
+    # video_pair_id格式是 "pair_task_1_1756203256_0"，按解析出的task_id精确索引
+    task_evaluations = store.evaluations_for_task(task_id)
     
     # 获取任务的视频对数据以了解随机化情况
     task_video_pairs = []
@@ -724,10 +1204,8 @@ async def get_all_statistics():
     """获取所有任务的统计概览"""
     all_stats = []
     
-    for task in tasks_storage:
-        # 修复：video_pair_id格式是 "pair_task_1_1756203256_0"，需要包含task_id
-        task_evaluations = [e for e in evaluations_storage if task["id"] in e["video_pair_id"]]
-        total_evaluations = len(task_evaluations)
+    for task in store.tasks.values():
+        total_evaluations = store.evaluation_count(task["id"])
         completion_rate = (total_evaluations / task["video_pairs_count"] * 100) if task["video_pairs_count"] > 0 else 0
         
         all_stats.append({
@@ -746,38 +1224,24 @@ async def delete_task(task_id: str):
     """删除任务及其相关的评估数据"""
     try:
         # 检查任务是否存在
-        task_index = None
-        for i, task in enumerate(tasks_storage):
-            if task["id"] == task_id:
-                task_index = i
-                break
-        
-        if task_index is None:
+        task = store.get_task(task_id)
+        if task is None:
             raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found")
         
-        # 获取任务信息用于日志
-        task = tasks_storage[task_index]
         print(f"🔧 删除任务: {task_id} (名称: {task['name']})")
         
-        # 删除任务
-        deleted_task = tasks_storage.pop(task_index)
-        
-        # 删除相关的评估数据
-        deleted_evaluations = []
-        evaluations_to_keep = []
-        
-        for evaluation in evaluations_storage:
-            if task_id in evaluation["video_pair_id"]:
-                deleted_evaluations.append(evaluation)
-            else:
-                evaluations_to_keep.append(evaluation)
-        
-        # 更新评估存储
-        evaluations_storage[:] = evaluations_to_keep
+        # 删除任务及相关的评估数据（索引同步更新）
+        deleted_task = store.remove_task(task_id)
+        deleted_evaluations = store.remove_task_evaluations(task_id)
+        pair_plans.delete(task_id)
         
         # 保存更新后的数据
-        save_tasks(tasks_storage)
-        save_evaluations(evaluations_storage)
+        write_behind.mark_dirty("tasks")
+        if repository:
+            # 只删除该任务的评估行，不会覆盖其他 worker 新写入的评估
+            await asyncio.get_running_loop().run_in_executor(None, repository.delete_evaluations, task_id)
+        else:
+            save_evaluations(store.evaluation_list())
         
         print(f"✅ 成功删除任务 {task_id}")
         print(f"✅ 删除了 {len(deleted_evaluations)} 个相关评估")
@@ -800,13 +1264,13 @@ async def delete_task(task_id: str):
 async def get_task_detailed_results(task_id: str):
     """获取任务的详细评估结果，用于回顾功能"""
     # 检查任务是否存在
-    task = next((t for t in tasks_storage if t["id"] == task_id), None)
+    task = store.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found")
     
     try:
-        # 直接从任务数据获取视频对信息，避免循环调用
-        video_pairs = task.get("video_pairs", [])
+        # 直接从任务的视频对存储获取，避免循环调用
+        video_pairs = pair_plans.get(task_id) or []
         
         # 如果任务中没有video_pairs，尝试动态生成
         if not video_pairs:
@@ -834,8 +1298,8 @@ async def get_task_detailed_results(task_id: str):
                         }
                         video_pairs.append(pair)
         
-        # 获取该任务的所有评估 - 修复过滤逻辑
-        task_evaluations = [e for e in evaluations_storage if task_id in e["video_pair_id"]]
+        # 获取该任务的所有评估
+        task_evaluations = store.evaluations_for_task(task_id)
         print(f"🔧 DEBUG: 找到 {len(task_evaluations)} 个评估记录")
         
         # 创建视频对ID到评估的映射
@@ -848,6 +1312,8 @@ async def get_task_detailed_results(task_id: str):
         for i, pair in enumerate(video_pairs):
             pair_id = pair.get("id", f"pair_{task_id}_{i}")
             evaluation = evaluation_map.get(pair_id)
+            if pair.get("retired") and evaluation is None:
+                continue  # 文件已删除或重新配对、也没有评估的视频对不需要回顾
             
             print(f"🔧 DEBUG: 视频对 {i}: pair_id={pair_id}, evaluation={evaluation}")
             
@@ -879,22 +1345,24 @@ async def get_task_detailed_results(task_id: str):
                 "actual_chosen_folder": actual_chosen_folder,
                 "evaluation_id": evaluation["id"] if evaluation else None,
                 "evaluation_timestamp": evaluation.get("created_time") if evaluation else None,
-                "is_evaluated": evaluation is not None
+                "is_evaluated": evaluation is not None,
+                "retired": pair.get("retired", False)
             }
             
             detailed_results.append(result_item)
         
-        # 计算总体统计
-        evaluated_count = len([r for r in detailed_results if r["is_evaluated"]])
+        # 计算总体统计（只计仍在使用的视频对）
+        total_pairs = len(active_pairs(video_pairs))
+        evaluated_count = len([r for r in detailed_results if r["is_evaluated"] and not r["retired"]])
         
         response_data = {
             "task_id": task_id,
             "task_name": task["name"],
             "folder_a": task["folder_a"],
             "folder_b": task["folder_b"],
-            "total_pairs": len(video_pairs),
+            "total_pairs": total_pairs,
             "evaluated_pairs": evaluated_count,
-            "completion_rate": round((evaluated_count / len(video_pairs) * 100) if video_pairs else 0, 1),
+            "completion_rate": round((evaluated_count / total_pairs * 100) if total_pairs else 0, 1),
             "results": detailed_results
         }
         
@@ -915,6 +1383,19 @@ async def not_found_handler(request, exc):
         content={"error": "未找到請求的資源", "status_code": 404}
     )
 
+def get_worker_count():
+    """WEB_CONCURRENCY 指定 worker 数（auto 为 CPU 核数）；只有 SQLite 共享状态时才允许多 worker"""
+    value = os.environ.get("WEB_CONCURRENCY", "1").strip().lower()
+    workers = (os.cpu_count() or 1) if value == "auto" else max(int(value or "1"), 1)
+    if workers > 1 and not repository:
+        print("⚠️ JSON 存储不支持多进程共享状态，设置 STORAGE_BACKEND=sqlite 才能使用多个 worker")
+        return 1
+    return workers
+
 if __name__ == "__main__":
-    print(f"🚀 启动Railway应用程序，端口: {PORT}")
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
+    workers = get_worker_count()
+    print(f"🚀 启动Railway应用程序，端口: {PORT}，worker 数: {workers}")
+    if workers > 1:
+        uvicorn.run("main_railway:app", host="0.0.0.0", port=PORT, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
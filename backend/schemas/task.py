@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List, Union
 from datetime import datetime
 from enum import Enum
 
@@ -17,6 +17,7 @@ class TaskCreate(BaseModel):
     folder_a: str  # A組資料夾名稱
     folder_b: str  # B組資料夾名稱
     is_blind: bool = True  # 是否為盲測
+    name_rules: Optional[Union[str, Dict[str, Any]]] = None  # 文件名清理規則（utils.name_rules 的規則集名稱或配置）
 
 class VideoPairResponse(BaseModel):
     """視頻對響應模型"""
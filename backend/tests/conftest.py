@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 測試按 backend 目錄導入模塊（與應用相同）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,65 @@
+from database.pair_plans import active_pairs, merge_stable_pairs, retired_pairs
+from database.repository import task_id_from_pair_id
+
+
+def make_pair(pair_id, video_a, video_b):
+    return {"id": pair_id, "video_a_path": video_a, "video_b_path": video_b, "is_swapped": False}
+
+
+def test_merged_ids_stay_parseable_for_main_ids():
+    previous = [make_pair("task_1_pair_1", "L/a", "R/a"), make_pair("task_1_pair_2", "L/b", "R/b")]
+    # b 的右側被替換：新生成的 task_1_pair_2 與退役的舊 ID 衝突
+    rebuilt = [make_pair("task_1_pair_1", "L/a", "R/a"), make_pair("task_1_pair_2", "L/b", "R/b2")]
+
+    merged = merge_stable_pairs(previous, rebuilt)
+
+    assert [pair["id"] for pair in active_pairs(merged)] == ["task_1_pair_1", "task_1_pair_3"]
+    assert [pair["id"] for pair in retired_pairs(merged)] == ["task_1_pair_2"]
+    assert all(task_id_from_pair_id(pair["id"]) == "task_1" for pair in merged)
+
+
+def test_merged_ids_stay_parseable_for_railway_ids():
+    previous = [make_pair("pair_task_1_0", "L/a", "R/a")]
+    rebuilt = [make_pair("pair_task_1_0", "L/a", "R/x"), make_pair("pair_task_1_1", "L/b", "R/b")]
+
+    merged = merge_stable_pairs(previous, rebuilt)
+
+    ids = [pair["id"] for pair in merged]
+    assert len(ids) == len(set(ids))
+    assert "pair_task_1_0" not in [pair["id"] for pair in active_pairs(merged)]
+    assert all(task_id_from_pair_id(pair_id) == "task_1" for pair_id in ids)
+
+
+def test_evaluated_ids_are_not_reused():
+    rebuilt = [make_pair("task_1_pair_1", "L/a", "R/a"), make_pair("task_1_pair_2", "L/b", "R/b")]
+
+    merged = merge_stable_pairs(None, rebuilt, evaluated_ids={"task_1_pair_2", "task_1_pair_7"})
+
+    assert [pair["id"] for pair in merged] == ["task_1_pair_1", "task_1_pair_8"]
+    assert all(task_id_from_pair_id(pair["id"]) == "task_1" for pair in merged)
+
+
+def test_only_the_first_worker_saves_a_new_plan(tmp_path):
+    import asyncio
+    from database.pair_plans import PairPlanStore
+    from database.repository import get_repository
+
+    def stores(repository):
+        # 兩個 worker 各自的方案存儲，共用同一份數據
+        return (PairPlanStore(str(tmp_path / "plans"), repository),
+                PairPlanStore(str(tmp_path / "plans"), repository))
+
+    for repository in (None, get_repository(str(tmp_path / "storage.db"))):
+        first, second = stores(repository)
+        plan_1 = [make_pair("task_1_pair_1", "L/a", "R/a")]
+        plan_2 = [dict(plan_1[0], is_swapped=True)]
+
+        assert asyncio.run(first.save_if_unchanged_async("task_1", plan_1, None)) is None
+        assert asyncio.run(second.save_if_unchanged_async("task_1", plan_2, None)) == plan_1
+        assert second.get("task_1") == plan_1
+
+        # 基於保存的方案重新生成時可以替換它
+        assert asyncio.run(second.save_if_unchanged_async("task_1", plan_2, plan_1)) is None
+        first.invalidate()
+        assert first.get("task_1") == plan_2
+        first.clear()
@@ -0,0 +1,31 @@
+import json
+import os
+
+from database.repository import get_repository, migrate_json_storage
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def test_migration_imports_stored_pair_plans(tmp_path):
+    data_dir = tmp_path / "data"
+    plan = [
+        {"id": "task_1_pair_1", "video_a_path": "/uploads/L/a.mp4", "video_b_path": "/uploads/R/a.mp4",
+         "is_swapped": True},
+        {"id": "task_1_pair_2", "video_a_path": "/uploads/L/b.mp4", "video_b_path": "/uploads/R/b.mp4",
+         "is_swapped": False, "retired": True},
+    ]
+    write_json(str(data_dir / "tasks.json"), [{"id": "task_1", "name": "t", "folder_a": "L", "folder_b": "R"}])
+    write_json(str(data_dir / "pair_plans" / "task_1.json"), plan)
+    repository = get_repository(str(tmp_path / "storage.db"))
+
+    counts = migrate_json_storage(
+        repository, tasks_file=str(data_dir / "tasks.json"), pair_plans_dir=str(data_dir / "pair_plans")
+    )
+
+    assert counts["pairs"] == 2
+    assert repository.get_pairs("task_1") == plan
+    assert "video_pairs" not in repository.list_tasks()[0]
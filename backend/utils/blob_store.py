@@ -0,0 +1,144 @@
+"""
+內容尋址的視頻存儲
+上傳的文件按 SHA-256 保存在 blobs 目錄中（{root}/{digest[:2]}/{digest}），
+資料夾中的文件是指向 blob 的硬鏈接：同樣內容上傳到多少個資料夾都只佔一份磁盤空間。
+
+引用計數直接使用文件系統的鏈接數：blob 的 st_nlink - 1 就是引用它的資料夾文件數，
+刪除資料夾後鏈接數降為 1 的 blob 沒有任何引用，可以回收。
+不支持硬鏈接的文件系統上退化為普通文件（不去重）。
+"""
+
+import os
+import errno
+import hashlib
+import threading
+from typing import Optional
+
+# 這些錯誤表示文件系統不支持（或不允許）硬鏈接
+_LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """計算文件的 SHA-256（十六進制）"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def is_sha256(value: str) -> bool:
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+class BlobStore:
+    """按內容哈希保存文件，資料夾文件以硬鏈接引用 blob"""
+
+    def __init__(self, root: str, legacy_root: Optional[str] = None):
+        """
+        Args:
+            root: blob 目錄（不能位於對外提供的目錄中）
+            legacy_root: 舊版本的 blob 目錄，root 還不存在時整體移動過來
+        """
+        self.root = root
+        if legacy_root and os.path.isdir(legacy_root) and not os.path.exists(root):
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(root)), exist_ok=True)
+                os.rename(legacy_root, root)
+                print(f"✅ 已把 blob 目錄從 {legacy_root} 移動到 {root}")
+            except OSError as e:
+                print(f"⚠️ 無法移動舊的 blob 目錄 {legacy_root}: {e}")
+        os.makedirs(root, exist_ok=True)
+        self._link_supported: Optional[bool] = None
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest: str) -> str:
+        if not is_sha256(digest):
+            raise ValueError(f"無效的 SHA-256: {digest!r}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest: str) -> bool:
+        return is_sha256(digest) and os.path.exists(self.blob_path(digest))
+
+    def references(self, digest: str) -> int:
+        """引用該 blob 的資料夾文件數"""
+        try:
+            return os.stat(self.blob_path(digest)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def _link_to(self, source: str, target_path: str):
+        """把 source 硬鏈接到 target_path（原子化替換已有文件）"""
+        link_tmp = f"{target_path}.link-{os.getpid()}-{threading.get_ident()}"
+        os.link(source, link_tmp)
+        try:
+            os.replace(link_tmp, target_path)
+        except BaseException:
+            os.remove(link_tmp)
+            raise
+
+    def store(self, tmp_path: str, digest: str, target_path: str) -> bool:
+        """
+        把寫完的臨時文件放入存儲並鏈接到 target_path，臨時文件被消耗
+
+        Returns:
+            內容已存在（去重，沒有保留新寫入的數據）時返回 True
+        """
+        blob = self.blob_path(digest)
+        if self._link_supported is False:
+            os.replace(tmp_path, target_path)
+            return False
+
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            while True:
+                try:
+                    os.link(tmp_path, blob)
+                    deduplicated = False
+                except FileExistsError:
+                    deduplicated = True
+                try:
+                    # 臨時文件在鏈接完成前一直存在，blob 的鏈接數不會降到 1 被回收
+                    self._link_to(blob, target_path)
+                    break
+                except FileNotFoundError:
+                    # 已有的 blob 剛好被回收，重新用臨時文件建立
+                    continue
+        except OSError as e:
+            if e.errno not in _LINK_UNSUPPORTED:
+                raise
+            print(f"⚠️ 上傳目錄不支持硬鏈接，不進行去重: {e}")
+            self._link_supported = False
+            os.replace(tmp_path, target_path)
+            return False
+
+        self._link_supported = True
+        os.remove(tmp_path)
+        return deduplicated
+
+    def collect_garbage(self) -> int:
+        """
+        刪除沒有被任何資料夾文件引用的 blob
+
+        Returns:
+            刪除的 blob 數
+        """
+        removed = 0
+        with self._lock:
+            for prefix in os.listdir(self.root):
+                prefix_dir = os.path.join(self.root, prefix)
+                if not os.path.isdir(prefix_dir):
+                    continue
+                for name in os.listdir(prefix_dir):
+                    if not is_sha256(name):
+                        continue
+                    path = os.path.join(prefix_dir, name)
+                    try:
+                        if os.stat(path).st_nlink <= 1:
+                            os.remove(path)
+                            removed += 1
+                    except FileNotFoundError:
+                        continue
+        if removed:
+            print(f"✅ 回收了 {removed} 個未被引用的視頻 blob")
+        return removed
@@ -0,0 +1,453 @@
+"""
+服務器本地目錄的批量導入
+把服務器上已有的目錄（或 zip/tar 壓縮包）中的視頻放入 uploads/<資料夾>，不經過 HTTP 上傳：
+目錄中的文件優先 reflink（寫時複製，與源文件互不影響），其次硬鏈接，
+文件系統不支持或跨設備時退化為複製；壓縮包中的視頻直接解壓到資料夾。
+每個文件先寫入資料夾中的隱藏臨時名，再原子化重命名為目標文件。
+
+導入作為後台任務在專用線程池中執行，進度保存在 jobs_dir/{job_id}.json，
+多個 worker 進程都可以查詢和取消。
+
+注意：硬鏈接的文件與源文件是同一個 inode，源文件被原地修改時資料夾中的視頻也會改變；
+不希望共享 inode 時使用 mode="reflink"（不支持 reflink 時複製）
+"""
+
+import os
+import re
+import copy
+import json
+import time
+import uuid
+import errno
+import shutil
+import tarfile
+import zipfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.file_utils import VIDEO_SIGNATURE_BYTES, atomic_write_json, video_signature_validator
+from utils.upload_stream import UPLOAD_CHUNK_SIZE, safe_upload_name
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 允許導入的服務器目錄（os.pathsep 分隔），為空時不限制
+INGEST_ROOTS = [root for root in os.environ.get("INGEST_ROOTS", "").split(os.pathsep) if root]
+# 同時執行的導入任務數，其餘任務排隊
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "1"))
+# 進度寫盤和通知新文件的間隔（秒）
+PROGRESS_INTERVAL = 0.5
+# 任務記錄中最多保留的跳過文件明細
+MAX_REPORTED_SKIPS = 100
+
+INGEST_MODES = ("auto", "reflink", "copy")
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# linux/fs.h: FICLONE = _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
+# 這些錯誤表示文件系統不支持 reflink / 硬鏈接，改用下一種方式
+_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP,
+                errno.EINVAL, errno.ENOTTY, errno.ENOSYS}
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class IngestSourceError(ValueError):
+    """導入源不存在、不允許或不是目錄/壓縮包"""
+
+
+class IngestJobNotFound(KeyError):
+    """導入任務不存在"""
+
+
+def is_archive(path: str) -> bool:
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _within(path: str, root: str) -> bool:
+    root = os.path.realpath(root)
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def reflink(source: str, target: str):
+    """用 FICLONE 創建寫時複製的副本（btrfs/XFS 等），不支持時拋出 OSError"""
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "reflink 只支持 Linux")
+    with open(source, "rb") as src, open(target, "xb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+
+def copy_file(source: str, target: str):
+    """複製文件內容並 fsync（Linux 上 shutil 使用 sendfile，不經過用戶態緩衝）"""
+    shutil.copyfile(source, target)
+    with open(target, "rb+") as f:
+        os.fsync(f.fileno())
+
+
+class _Placement:
+    """一個任務內記住哪些方式不可用，避免每個文件都先失敗一次"""
+
+    def __init__(self, mode: str):
+        self.reflink = mode in ("auto", "reflink")
+        self.hardlink = mode == "auto"
+
+    def place(self, source: str, tmp_path: str) -> str:
+        """把 source 放到 tmp_path，返回使用的方式"""
+        if self.reflink:
+            try:
+                reflink(source, tmp_path)
+                return "reflink"
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                self.reflink = False
+        if self.hardlink:
+            try:
+                os.link(source, tmp_path)
+                return "hardlink"
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                self.hardlink = False
+        copy_file(source, tmp_path)
+        return "copy"
+
+
+def _directory_entries(source: str) -> Iterator[Tuple[str, str, int]]:
+    """目錄中的視頻文件 (相對路徑, 絕對路徑, 大小)，跳過隱藏文件和目錄"""
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if name.startswith(".") or video_signature_validator(name) is None:
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                stat_result = os.stat(path)
+            except OSError:
+                continue
+            yield os.path.relpath(path, source), path, stat_result.st_size
+
+
+class BulkIngestJobs:
+    """管理導入任務，任務記錄保存在 jobs_dir/{job_id}.json"""
+
+    def __init__(self, jobs_dir: str, uploads_root: str, max_workers: int = INGEST_WORKERS):
+        """
+        Args:
+            jobs_dir: 任務記錄目錄
+            uploads_root: 上傳根目錄，不允許把它（或其中的目錄）作為導入源
+        """
+        self.jobs_dir = jobs_dir
+        self.uploads_root = uploads_root
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # 本進程中未結束的任務 -> 取消標記
+        self._live: Dict[str, threading.Event] = {}
+        self._jobs: Dict[str, Dict] = {}
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _job_path(self, job_id: str) -> str:
+        if not isinstance(job_id, str) or not _JOB_ID.fullmatch(job_id):
+            raise IngestJobNotFound(job_id)
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job: Dict):
+        job["updated_time"] = time.time()
+        atomic_write_json(self._job_path(job["id"]), job)
+
+    def get(self, job_id: str) -> Dict:
+        """讀取任務記錄（本進程執行中的任務返回內存中的最新進度）"""
+        path = self._job_path(job_id)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return copy.deepcopy(job)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise IngestJobNotFound(job_id)
+
+    def validate_source(self, source: str) -> str:
+        """返回導入源的真實路徑，不允許時拋出 IngestSourceError"""
+        if not source or not isinstance(source, str):
+            raise IngestSourceError("導入源路徑不能為空")
+        real = os.path.realpath(source)
+        if not os.path.exists(real):
+            raise IngestSourceError(f"導入源不存在: {source}")
+        if INGEST_ROOTS and not any(_within(real, root) for root in INGEST_ROOTS):
+            raise IngestSourceError(f"導入源不在允許的目錄（INGEST_ROOTS）中: {source}")
+        if _within(real, self.uploads_root):
+            raise IngestSourceError(f"不能從上傳目錄導入: {source}")
+        if not os.path.isdir(real) and not (os.path.isfile(real) and is_archive(real)):
+            raise IngestSourceError(f"導入源必須是目錄或 zip/tar 壓縮包: {source}")
+        return real
+
+    def create(self, folder_name: str, folder_path: str, source: str, mode: str = "auto") -> Dict:
+        """
+        創建導入任務（不執行，由 start 放入線程池）
+
+        Raises:
+            IngestSourceError: 導入源無效
+            ValueError: mode 無效
+        """
+        if mode not in INGEST_MODES:
+            raise ValueError(f"無效的導入方式: {mode}（可選 {', '.join(INGEST_MODES)}）")
+        real = self.validate_source(source)
+        job = {
+            "id": uuid.uuid4().hex,
+            "folder_name": folder_name,
+            "folder_path": folder_path,
+            "source": real,
+            "archive": os.path.isfile(real),
+            "mode": mode,
+            "status": "queued",
+            "total_files": None,
+            "total_bytes": None,
+            "processed_files": 0,
+            "processed_bytes": 0,
+            "ingested_files": 0,
+            "unchanged_files": 0,
+            "skipped_files": 0,
+            "skipped": [],
+            "methods": {"reflink": 0, "hardlink": 0, "copy": 0, "extract": 0},
+            "current_file": None,
+            "error": None,
+            "created_time": time.time(),
+            "started_time": None,
+            "finished_time": None
+        }
+        self._save(job)
+        return job
+
+    def start(self, job_id: str, on_files: Optional[Callable[[str, List[str]], None]] = None) -> Future:
+        """
+        把任務放入線程池執行
+
+        Args:
+            on_files: 每批新文件放入資料夾後調用，參數為 (資料夾路徑, 文件名列表)
+        """
+        job = self.get(job_id)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._live[job_id] = threading.Event()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="bulk-ingest"
+                )
+            return self._executor.submit(self._run, job, self._live[job_id], on_files)
+
+    def cancel(self, job_id: str) -> Dict:
+        """請求取消任務；任務在其他 worker 中執行時通過標記文件通知"""
+        job = self.get(job_id)
+        if job["status"] in ("queued", "running"):
+            with self._lock:
+                event = self._live.get(job_id)
+            if event is not None:
+                event.set()
+            else:
+                open(self._job_path(job_id) + ".cancel", "w").close()
+        return job
+
+    def shutdown(self):
+        """取消本進程中所有未結束的任務"""
+        with self._lock:
+            for event in self._live.values():
+                event.set()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    # ---------- 執行 ----------
+
+    def _run(self, job: Dict, cancelled: threading.Event, on_files) -> Dict:
+        folder_path = job["folder_path"]
+        pending: List[str] = []
+        last_flush = [time.monotonic()]
+        cancel_marker = self._job_path(job["id"]) + ".cancel"
+
+        def flush(force: bool = False):
+            now = time.monotonic()
+            if not force and now - last_flush[0] < PROGRESS_INTERVAL:
+                return
+            last_flush[0] = now
+            if pending and on_files is not None:
+                try:
+                    on_files(folder_path, list(pending))
+                except Exception as e:
+                    print(f"⚠️ 導入文件的後續處理失敗: {e}")
+            pending.clear()
+            if os.path.exists(cancel_marker):
+                cancelled.set()
+            with self._lock:
+                self._save(job)
+
+        try:
+            if os.path.exists(cancel_marker):
+                cancelled.set()
+            job["status"] = "running"
+            job["started_time"] = time.time()
+            os.makedirs(folder_path, exist_ok=True)
+            if job["archive"]:
+                self._ingest_archive(job, cancelled, pending, flush)
+            else:
+                self._ingest_directory(job, cancelled, pending, flush)
+            job["status"] = "cancelled" if cancelled.is_set() else "completed"
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"❌ 導入失敗 {job['source']}: {e}")
+        finally:
+            job["current_file"] = None
+            job["finished_time"] = time.time()
+            flush(force=True)
+            with self._lock:
+                self._live.pop(job["id"], None)
+                self._jobs.pop(job["id"], None)
+            try:
+                os.remove(cancel_marker)
+            except FileNotFoundError:
+                pass
+
+        elapsed = job["finished_time"] - job["started_time"]
+        print(f"✅ 導入 {job['source']} -> {folder_path}: {job['ingested_files']} 個文件，"
+              f"{job['processed_bytes']} 字節，用時 {elapsed:.1f}s，狀態 {job['status']}")
+        return job
+
+    def _skip(self, job: Dict, name: str, reason: str):
+        job["skipped_files"] += 1
+        if len(job["skipped"]) < MAX_REPORTED_SKIPS:
+            job["skipped"].append({"file": name, "reason": reason})
+
+    def _target_name(self, job: Dict, rel_path: str, seen: set) -> Optional[str]:
+        """資料夾中的文件名（不保留子目錄），同一任務內重名的文件跳過"""
+        try:
+            filename = safe_upload_name(rel_path)
+        except ValueError:
+            self._skip(job, rel_path, "無效的文件名")
+            return None
+        if filename.startswith(".") or video_signature_validator(filename) is None:
+            self._skip(job, rel_path, "不支持的文件")
+            return None
+        if filename in seen:
+            self._skip(job, rel_path, f"與已導入的 {filename} 重名")
+            return None
+        seen.add(filename)
+        return filename
+
+    def _tmp_path(self, folder_path: str, filename: str) -> str:
+        return os.path.join(folder_path, f".{filename}.ingest-{os.getpid()}-{threading.get_ident()}")
+
+    def _ingest_directory(self, job: Dict, cancelled: threading.Event, pending: List[str], flush):
+        entries = list(_directory_entries(job["source"]))
+        job["total_files"] = len(entries)
+        job["total_bytes"] = sum(size for _, _, size in entries)
+        placement = _Placement(job["mode"])
+        folder_path = job["folder_path"]
+        seen: set = set()
+
+        for rel_path, source, size in entries:
+            if cancelled.is_set():
+                break
+            job["current_file"] = rel_path
+            try:
+                filename = self._target_name(job, rel_path, seen)
+                if filename is None:
+                    continue
+                target_path = os.path.join(folder_path, filename)
+                if INGEST_ROOTS and not any(_within(os.path.realpath(source), r) for r in INGEST_ROOTS):
+                    self._skip(job, rel_path, "鏈接指向允許的目錄之外")
+                    continue
+                try:
+                    if os.path.samefile(source, target_path):
+                        # 之前已經硬鏈接導入過
+                        job["unchanged_files"] += 1
+                        continue
+                except FileNotFoundError:
+                    pass
+                with open(source, "rb") as f:
+                    if not video_signature_validator(filename)(f.read(VIDEO_SIGNATURE_BYTES)):
+                        self._skip(job, rel_path, "文件頭不是對應格式的視頻")
+                        continue
+
+                tmp_path = self._tmp_path(folder_path, filename)
+                try:
+                    method = placement.place(source, tmp_path)
+                    os.replace(tmp_path, target_path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                job["methods"][method] += 1
+                job["ingested_files"] += 1
+                pending.append(filename)
+            except OSError as e:
+                self._skip(job, rel_path, str(e))
+            finally:
+                job["processed_files"] += 1
+                job["processed_bytes"] += size
+                flush()
+
+    def _archive_members(self, archive) -> List[Tuple[str, int, object]]:
+        if isinstance(archive, zipfile.ZipFile):
+            return [(info.filename, info.file_size, info) for info in archive.infolist() if not info.is_dir()]
+        return [(member.name, member.size, member) for member in archive.getmembers() if member.isfile()]
+
+    def _ingest_archive(self, job: Dict, cancelled: threading.Event, pending: List[str], flush):
+        source = job["source"]
+        if source.lower().endswith(".zip"):
+            archive = zipfile.ZipFile(source)
+            open_member = archive.open
+        else:
+            archive = tarfile.open(source, "r:*")
+            open_member = archive.extractfile
+        with archive:
+            members = [
+                m for m in self._archive_members(archive)
+                if not os.path.basename(m[0]).startswith(".") and video_signature_validator(m[0]) is not None
+            ]
+            job["total_files"] = len(members)
+            job["total_bytes"] = sum(size for _, size, _ in members)
+            folder_path = job["folder_path"]
+            seen: set = set()
+
+            for name, size, member in members:
+                if cancelled.is_set():
+                    break
+                job["current_file"] = name
+                try:
+                    filename = self._target_name(job, name, seen)
+                    if filename is None:
+                        continue
+                    tmp_path = self._tmp_path(folder_path, filename)
+                    try:
+                        with open_member(member) as src, open(tmp_path, "wb") as dst:
+                            head = src.read(VIDEO_SIGNATURE_BYTES)
+                            if not video_signature_validator(filename)(head):
+                                self._skip(job, name, "文件頭不是對應格式的視頻")
+                                continue
+                            dst.write(head)
+                            shutil.copyfileobj(src, dst, UPLOAD_CHUNK_SIZE)
+                            dst.flush()
+                            os.fsync(dst.fileno())
+                        os.replace(tmp_path, os.path.join(folder_path, filename))
+                    finally:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                    job["methods"]["extract"] += 1
+                    job["ingested_files"] += 1
+                    pending.append(filename)
+                except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                    self._skip(job, name, str(e))
+                finally:
+                    job["processed_files"] += 1
+                    job["processed_bytes"] += size
+                    flush()
@@ -0,0 +1,223 @@
+"""
+MP4 faststart 後處理
+編碼器常把 moov 寫在文件末尾，瀏覽器必須先請求文件尾部才能開始播放。
+這裡把 moov 移到第一個 mdat 之前，並相應調整 stco/co64 中的 chunk 偏移
+（32 位偏移放不下時升級為 co64）。
+新文件按塊流式寫入同目錄下的臨時文件，完成後原子化替換原文件；只有 moov 讀入內存
+"""
+
+import os
+import struct
+import hashlib
+import tempfile
+from typing import BinaryIO, Callable, List, Optional, Tuple
+
+from utils.video_probe import MAX_MOOV_SIZE, iter_boxes, iter_file_boxes
+
+# 上傳完成後是否自動執行 faststart（可選，設為 1 開啟）
+FASTSTART_UPLOADS = os.environ.get("FASTSTART_UPLOADS", "0") == "1"
+FASTSTART_CHUNK_SIZE = 1024 * 1024
+
+# 從 moov 到 stco/co64 路徑上的容器 box
+_CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+
+def _box_header(box_type: bytes, payload_size: int) -> bytes:
+    if payload_size + 8 <= 0xFFFFFFFF:
+        return struct.pack(">I4s", payload_size + 8, box_type)
+    return struct.pack(">I4sQ", 1, box_type, payload_size + 16)
+
+
+def _rewrite_chunk_offsets(data: bytes, start: int, end: int, box_type: bytes,
+                           relocate: Callable[[int], int], use_co64: bool) -> Tuple[bytes, bytes]:
+    """返回改寫後的 (box 類型, 內容)"""
+    version_flags = data[start:start + 4]
+    count = struct.unpack_from(">I", data, start + 4)[0]
+    entry_format = ">Q" if box_type == b'co64' else ">I"
+    entry_size = struct.calcsize(entry_format)
+    if start + 8 + count * entry_size > end:
+        raise ValueError(f"{box_type.decode()} 條目數超出 box 範圍")
+    offsets = struct.unpack_from(f">{count}{entry_format[1]}", data, start + 8)
+    offsets = [relocate(offset) for offset in offsets]
+
+    if box_type == b'co64' or use_co64:
+        return b'co64', version_flags + struct.pack(f">I{count}Q", count, *offsets)
+    return b'stco', version_flags + struct.pack(f">I{count}I", count, *offsets)
+
+
+def _rewrite_container(data: bytes, start: int, end: int,
+                       relocate: Callable[[int], int], use_co64: bool) -> bytes:
+    """重建容器內容：沿容器路徑遞歸，改寫 stco/co64，其他 box 原樣複製"""
+    parts: List[bytes] = []
+    position = start
+    for box_type, content_start, content_end in iter_boxes(data, start, end):
+        if box_type in _CONTAINER_BOXES:
+            payload = _rewrite_container(data, content_start, content_end, relocate, use_co64)
+            parts.append(_box_header(box_type, len(payload)) + payload)
+        elif box_type in (b'stco', b'co64'):
+            new_type, payload = _rewrite_chunk_offsets(
+                data, content_start, content_end, box_type, relocate, use_co64
+            )
+            parts.append(_box_header(new_type, len(payload)) + payload)
+        elif box_type == b'cmov':
+            raise ValueError("不支持壓縮的 moov")
+        else:
+            parts.append(data[position:content_end])
+        position = content_end
+    if position != end:
+        raise ValueError("moov 結構不完整")
+    return b"".join(parts)
+
+
+def _max_stco_offset(data: bytes, start: int, end: int) -> int:
+    """moov 中 32 位 stco 的最大偏移（沒有 stco 時返回 0）"""
+    largest = 0
+    for box_type, content_start, content_end in iter_boxes(data, start, end):
+        if box_type in _CONTAINER_BOXES:
+            largest = max(largest, _max_stco_offset(data, content_start, content_end))
+        elif box_type == b'stco':
+            count = struct.unpack_from(">I", data, content_start + 4)[0]
+            if count and content_start + 8 + count * 4 <= content_end:
+                largest = max(largest, max(struct.unpack_from(f">{count}I", data, content_start + 8)))
+    return largest
+
+
+def plan_faststart(f: BinaryIO, file_size: int):
+    """
+    檢查文件是否需要 faststart
+
+    Returns:
+        需要時返回 (頂層 box 列表, moov 的索引, 第一個 mdat 的索引)，
+        box 為 (類型, 起點, 大小)；moov 已在 mdat 之前、沒有 moov 或不支持的結構返回 None
+    """
+    boxes = []
+    end = 0
+    for box_type, start, _header_size, size in iter_file_boxes(f, file_size):
+        if start + size > file_size:
+            return None
+        boxes.append((box_type, start, size))
+        end = start + size
+    if end != file_size:
+        return None
+
+    types = [box[0] for box in boxes]
+    if b'moov' not in types or b'mdat' not in types or b'moof' in types:
+        return None
+    moov_index = types.index(b'moov')
+    mdat_index = types.index(b'mdat')
+    if moov_index < mdat_index or boxes[moov_index][2] > MAX_MOOV_SIZE:
+        return None
+    return boxes, moov_index, mdat_index
+
+
+def _copy_range(src: BinaryIO, dst: BinaryIO, start: int, size: int, hasher, chunk_size: int):
+    src.seek(start)
+    remaining = size
+    while remaining > 0:
+        chunk = src.read(min(chunk_size, remaining))
+        if not chunk:
+            raise IOError("讀取源文件時遇到意外的文件結尾")
+        if hasher is not None:
+            hasher.update(chunk)
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+def faststart(path: str, blob_store=None, chunk_size: int = FASTSTART_CHUNK_SIZE) -> bool:
+    """
+    把 moov 在文件末尾的 MP4 改寫為 moov 在前
+
+    Args:
+        path: 視頻文件路徑
+        blob_store: BlobStore，提供時改寫後的文件按新的內容哈希保存
+
+    Returns:
+        文件被改寫時返回 True；不需要或無法處理時返回 False，原文件保持不變
+    """
+    with open(path, "rb") as src:
+        source_stat = os.fstat(src.fileno())
+        plan = plan_faststart(src, source_stat.st_size)
+        if plan is None:
+            return False
+        boxes, moov_index, mdat_index = plan
+
+        _, moov_start, moov_size = boxes[moov_index]
+        src.seek(moov_start)
+        moov = src.read(moov_size)
+        header_size = 16 if struct.unpack_from(">I", moov)[0] == 1 else 8
+        mdat_start = boxes[mdat_index][1]
+
+        def build(use_co64: bool, new_moov_size: int) -> bytes:
+            def relocate(offset: int) -> int:
+                # mdat 到 moov 之間的數據後移新 moov 的長度，moov 之後的數據只受 moov 長度變化影響
+                if mdat_start <= offset < moov_start:
+                    return offset + new_moov_size
+                if offset >= moov_start + moov_size:
+                    return offset + new_moov_size - moov_size
+                return offset
+            payload = _rewrite_container(moov, header_size, moov_size, relocate, use_co64)
+            return _box_header(b'moov', len(payload)) + payload
+
+        # 偏移不影響 box 大小，先按原始大小構建一次得到新 moov 的長度
+        new_size = len(build(False, 0))
+        use_co64 = _max_stco_offset(moov, header_size, moov_size) + new_size > 0xFFFFFFFF
+        if use_co64:
+            new_size = len(build(True, 0))
+        new_moov = build(use_co64, new_size)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".faststart", dir=directory)
+        hasher = hashlib.sha256() if blob_store is not None else None
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for index, (_box_type, start, size) in enumerate(boxes):
+                    if index == mdat_index:
+                        if hasher is not None:
+                            hasher.update(new_moov)
+                        out.write(new_moov)
+                    if index != moov_index:
+                        _copy_range(src, out, start, size, hasher, chunk_size)
+                out.flush()
+                os.fsync(out.fileno())
+            os.chmod(tmp_path, source_stat.st_mode & 0o7777)
+
+            # 改寫期間文件被重新上傳時放棄，避免用舊內容覆蓋新文件
+            current = os.stat(path)
+            if (current.st_ino, current.st_size, current.st_mtime_ns) != \
+                    (source_stat.st_ino, source_stat.st_size, source_stat.st_mtime_ns):
+                os.remove(tmp_path)
+                return False
+
+            if blob_store is not None:
+                blob_store.store(tmp_path, hasher.hexdigest(), path)
+            else:
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    print(f"✅ faststart: 已把 moov 移到文件開頭 {os.path.basename(path)}")
+    return True
+
+
+# ISO BMFF 容器的擴展名
+FASTSTART_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.3gp')
+
+
+def make_faststart_stage(blob_store=None,
+                         on_rewrite: Optional[Callable[[str], object]] = None) -> Callable[[str], bool]:
+    """
+    返回上傳後處理函數：只處理 ISO BMFF 文件，其他格式直接跳過
+
+    Args:
+        on_rewrite: 文件被改寫後的回調（如清除視頻路由的 stat 緩存）
+    """
+    def stage(path: str) -> bool:
+        if not path.lower().endswith(FASTSTART_EXTENSIONS):
+            return False
+        rewritten = faststart(path, blob_store)
+        if rewritten and on_rewrite is not None:
+            on_rewrite(path)
+        return rewritten
+    return stage
@@ -4,9 +4,11 @@
 """
 
 import os
+import json
 import shutil
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, Dict, Iterable, List, Optional
 import mimetypes
 
 # 支持的視頻格式
@@ -133,7 +135,81 @@ def validate_video_file(file_path: str) -> bool:
     if os.path.getsize(file_path) == 0:
         return False
     
-    return True
+    # 檢查文件頭的容器簽名
+    with open(file_path, 'rb') as f:
+        head = f.read(VIDEO_SIGNATURE_BYTES)
+    return validate_video_header(file_path, head)
+
+
+# ---------- 容器簽名（magic bytes）檢查 ----------
+
+# 檢查簽名需要的文件頭字節數（MPEG-TS 需要看到第二個包的同步字節）
+VIDEO_SIGNATURE_BYTES = 512
+
+# 擴展名 -> 文件頭校驗函數
+_video_signature_validators: Dict[str, Callable[[bytes], bool]] = {}
+
+
+def register_video_signature(extensions: Iterable[str], validator: Callable[[bytes], bool]):
+    """
+    為一組擴展名註冊文件頭校驗函數
+
+    Args:
+        extensions: 擴展名列表（帶點，如 '.mp4'）
+        validator: 接收文件開頭最多 VIDEO_SIGNATURE_BYTES 個字節，簽名正確時返回 True
+    """
+    for extension in extensions:
+        _video_signature_validators[extension.lower()] = validator
+
+
+def video_signature_validator(filename: str) -> Optional[Callable[[bytes], bool]]:
+    """返回文件擴展名對應的校驗函數，不支持的擴展名返回 None"""
+    return _video_signature_validators.get(Path(filename).suffix.lower())
+
+
+def validate_video_header(filename: str, head: bytes) -> bool:
+    """按擴展名檢查文件頭是否是對應的視頻容器"""
+    validator = video_signature_validator(filename)
+    return validator is not None and bool(head) and validator(head)
+
+
+# ISO BMFF（MP4/MOV）文件開頭可能出現的頂層 box
+_ISOBMFF_LEADING_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot'}
+_ASF_HEADER_GUID = bytes.fromhex('3026b2758e66cf11a6d900aa0062ce6c')
+
+
+def _is_isobmff(head: bytes) -> bool:
+    return len(head) >= 8 and head[4:8] in _ISOBMFF_LEADING_BOXES
+
+
+def _is_matroska(head: bytes) -> bool:
+    # EBML 頭，MKV 和 WebM 相同（DocType 在後面，不區分）
+    return head[:4] == b'\x1a\x45\xdf\xa3'
+
+
+def _is_avi(head: bytes) -> bool:
+    return head[:4] == b'RIFF' and head[8:12] == b'AVI '
+
+
+def _is_flv(head: bytes) -> bool:
+    return head[:3] == b'FLV'
+
+
+def _is_asf(head: bytes) -> bool:
+    return head[:16] == _ASF_HEADER_GUID
+
+
+def _is_mpegts(head: bytes) -> bool:
+    # 188 字節一個包，每個包以 0x47 開頭
+    return head[:1] == b'\x47' and (len(head) <= 188 or head[188:189] == b'\x47')
+
+
+register_video_signature(('.mp4', '.mov', '.m4v', '.3gp'), _is_isobmff)
+register_video_signature(('.mkv', '.webm'), _is_matroska)
+register_video_signature(('.avi',), _is_avi)
+register_video_signature(('.flv',), _is_flv)
+register_video_signature(('.wmv',), _is_asf)
+register_video_signature(('.ts',), _is_mpegts)
 
 
 def get_file_info(file_path: str) -> dict:
@@ -212,6 +288,32 @@ def ensure_directory(directory_path: str) -> bool:
         return False
 
 
+def atomic_write_json(file_path: str, data, indent: Optional[int] = None) -> None:
+    """
+    原子化寫入 JSON 文件（臨時文件 + fsync + rename）
+
+    寫入過程中崩潰不會留下半截的文件，讀取方要麼看到舊內容，要麼看到新內容。
+
+    Args:
+        file_path: 目標文件路徑
+        data: 可序列化為 JSON 的數據
+        indent: JSON 縮進，None 表示緊湊格式
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{file_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 def copy_file(source_path: str, destination_path: str) -> bool:
     """
     複製文件
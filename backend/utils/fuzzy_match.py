@@ -0,0 +1,294 @@
+"""
+文件名模糊匹配索引
+相似度定義與 utils.video_matcher.calculate_similarity 相同：
+兩個（已標準化的）名稱相同時為 1.0，否則為 1 - 編輯距離 / 較長名稱的長度。
+
+查找某個名稱的最佳匹配時：
+1. 標準化後完全相同的名稱直接通過哈希表找到（相似度 1.0，不可能更好）
+2. 其餘名稱用字符 2-gram（首尾加哨兵）倒排索引產生候選。編輯距離不超過 k 的兩個名稱
+   至少共享 max(len) + 1 - 2k 個 2-gram（計重複），按全局出現次數從少到多只探查名稱
+   最前面的 |Q| - T + 1 個 2-gram，就能找到所有可能達到當前最佳相似度的候選
+3. 共享的 2-gram 數給出編輯距離的下界，也就是相似度的上界：候選按上界從高到低驗證，
+   上界低於已找到的最佳相似度時停止；驗證用位並行的編輯距離，超過上限時提前結束
+
+過濾只排除不可能達到要求的候選，結果與逐一計算所有名稱對完全一致
+"""
+
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+# 首尾哨兵（不會出現在文件名中）
+_START = "\x00"
+_END = "\x01"
+# 先用最稀有的幾個 2-gram 找一個較好的匹配，收緊後面的過濾條件
+SEED_GRAMS = 3
+SEED_CANDIDATES = 8
+
+
+def qgrams(name: str) -> List[str]:
+    """名稱的 2-gram 列表（首尾加哨兵，共 len(name) + 1 個）"""
+    padded = _START + name + _END
+    return [padded[i:i + 2] for i in range(len(padded) - 1)]
+
+
+def gram_tokens(name: str) -> FrozenSet[str]:
+    """
+    2-gram 多重集合表示為「2-gram + 第幾次出現」的集合，
+    兩個名稱共享的 2-gram 數（計重複）就是集合交集的大小（字符串的哈希值有緩存，求交集很快）
+    """
+    seen: Dict[str, int] = {}
+    tokens = []
+    for gram in qgrams(name):
+        occurrence = seen.get(gram, 0)
+        seen[gram] = occurrence + 1
+        tokens.append(f"{gram}{occurrence}")
+    return frozenset(tokens)
+
+
+def bounded_levenshtein(s1: str, s2: str, limit: int) -> int:
+    """
+    編輯距離（Myers/Hyyrö 位並行算法），確定超過 limit 時返回 limit + 1
+    """
+    over = limit + 1
+    if limit < 0 or abs(len(s1) - len(s2)) > limit:
+        return over
+    if len(s1) > len(s2):
+        s1, s2 = s2, s1
+    if not s1:
+        return len(s2) if len(s2) <= limit else over
+
+    length = len(s1)
+    match_masks: Dict[str, int] = {}
+    for i, char in enumerate(s1):
+        match_masks[char] = match_masks.get(char, 0) | (1 << i)
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    positive, negative = full, 0
+    distance = length
+    remaining = len(s2)
+    for char in s2:
+        eq = match_masks.get(char, 0)
+        x = eq | negative
+        diagonal = (((x & positive) + positive) ^ positive) | x
+        horizontal_pos = negative | (~(diagonal | positive) & full)
+        horizontal_neg = positive & diagonal
+        if horizontal_pos & last:
+            distance += 1
+        elif horizontal_neg & last:
+            distance -= 1
+        horizontal_pos = ((horizontal_pos << 1) | 1) & full
+        horizontal_neg = (horizontal_neg << 1) & full
+        positive = horizontal_neg | (~(diagonal | horizontal_pos) & full)
+        negative = horizontal_pos & diagonal
+        remaining -= 1
+        # 剩下的字符每個最多讓距離減少 1
+        if distance - remaining > limit:
+            return over
+    return distance if distance <= limit else over
+
+
+def similarity_from_distance(distance: int, max_len: int) -> float:
+    """與 calculate_similarity 相同的浮點計算"""
+    if max_len == 0:
+        return 1.0
+    return 1.0 - (distance / max_len)
+
+
+def max_distance(max_len: int, floor: float) -> int:
+    """
+    相似度不低於 floor（且大於 0）時允許的最大編輯距離，沒有時返回 -1
+
+    按與 similarity_from_distance 完全相同的浮點表達式判斷，不會因為捨入漏掉邊界上的候選
+    """
+    if max_len == 0:
+        return -1
+    distance = min(max_len - 1, int((1.0 - floor) * max_len) + 1)
+    while distance >= 0 and 1.0 - (distance / max_len) < floor:
+        distance -= 1
+    return distance
+
+
+class FuzzyNameIndex:
+    """
+    對一組已標準化的名稱建立索引，按位置查找/移除
+
+    best_match 返回相似度最高的未移除名稱，相似度相同時返回位置最靠前的一個
+    """
+
+    def __init__(self, names: List[str]):
+        # 標準化後相同的名稱為一組，組內按原始位置排列
+        self._group_ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._positions: List[List[int]] = []
+        self._group_of: List[int] = []
+        for position, name in enumerate(names):
+            group_id = self._group_ids.get(name)
+            if group_id is None:
+                group_id = self._group_ids[name] = len(self._names)
+                self._names.append(name)
+                self._positions.append([])
+            self._positions[group_id].append(position)
+            self._group_of.append(group_id)
+        self._heads = [0] * len(self._names)
+        self._lengths = [len(name) for name in self._names]
+        self._tokens = [gram_tokens(name) for name in self._names]
+        self._removed: Set[int] = set()
+        self._dead: Set[int] = set()  # 所有位置都已移除的組
+
+        self._postings: Dict[str, List[int]] = {}
+        self._by_length: Dict[int, List[int]] = {}
+        for group_id, name in enumerate(self._names):
+            for gram in set(qgrams(name)):
+                self._postings.setdefault(gram, []).append(group_id)
+            self._by_length.setdefault(len(name), []).append(group_id)
+        self.stats = {"exact": 0, "fuzzy": 0, "candidates": 0, "verified": 0}
+
+    def _first_alive(self, group_id: int) -> Optional[int]:
+        positions = self._positions[group_id]
+        head = self._heads[group_id]
+        while head < len(positions) and positions[head] in self._removed:
+            head += 1
+        self._heads[group_id] = head
+        if head == len(positions):
+            self._dead.add(group_id)
+            return None
+        return positions[head]
+
+    def remove(self, position: int):
+        self._removed.add(position)
+        self._first_alive(self._group_of[position])
+
+    def _length_limits(self, length: int, floor: float) -> Dict[int, Tuple[int, int]]:
+        """可能達到 floor 的長度 -> (較長的長度, 允許的編輯距離)"""
+        limits = {}
+        for other in self._by_length:
+            max_len = max(length, other)
+            limit = max_distance(max_len, floor)
+            if limit >= 0 and abs(length - other) <= limit:
+                limits[other] = (max_len, limit)
+        return limits
+
+    def _sharing(self, grams: List[str]) -> Set[int]:
+        """至少包含 grams 中一個 2-gram 的（未全部移除的）組"""
+        found: Set[int] = set()
+        for gram in set(grams):
+            found.update(self._postings.get(gram, ()))
+        return found - self._dead
+
+    def _candidate_groups(self, ordered: List[str], limits: Dict[int, Tuple[int, int]]) -> Set[int]:
+        """可能在 limits 內的所有組（ordered 為按出現次數從少到多排列的 2-gram）"""
+        if not limits:
+            return set()
+        required = min(max_len + 1 - 2 * limit for max_len, limit in limits.values())
+        if required <= 0:
+            # 計數過濾不起作用：這些長度的名稱都需要直接比較
+            return {g for other in limits for g in self._by_length[other]} - self._dead
+        return self._sharing(ordered[:len(ordered) - required + 1])
+
+    def _bounded(self, length: int, tokens: FrozenSet[str], group_ids,
+                 limits: Dict[int, Tuple[int, int]]) -> List[Tuple[int, int, int, int]]:
+        """通過長度和共享 2-gram 數過濾的候選：(編輯距離下界, 組, 較長的長度, 允許的編輯距離)"""
+        if not limits:
+            return []
+        # 每次編輯最多破壞 2 個 2-gram：先用所有長度中最低的共享數要求粗篩
+        minimum = min(max_len + 1 - 2 * limit for max_len, limit in limits.values())
+        group_ids = list(group_ids)
+        shared_counts = [len(tokens & self._tokens[g]) for g in group_ids]
+        bounded = []
+        for candidate, shared in zip(group_ids, shared_counts):
+            if shared < minimum:
+                continue
+            other = self._lengths[candidate]
+            if other not in limits:
+                continue
+            max_len, limit = limits[other]
+            lower = max(abs(length - other), (max_len + 2 - shared) // 2)
+            if lower <= limit:
+                bounded.append((lower, candidate, max_len, limit))
+        self.stats["candidates"] += len(bounded)
+        return bounded
+
+    def _ordered_grams(self, name: str) -> List[str]:
+        """按全局出現次數從少到多排列的 2-gram（計重複）"""
+        return sorted(qgrams(name), key=lambda g: len(self._postings.get(g, ())))
+
+    def best_match(self, name: str, threshold: float) -> Optional[Tuple[int, float]]:
+        """
+        相似度 ≥ threshold 且大於 0 的最佳匹配
+
+        Returns:
+            (位置, 相似度)，沒有時返回 None
+        """
+        if threshold > 1.0:
+            return None
+        group_id = self._group_ids.get(name)
+        if group_id is not None:
+            position = self._first_alive(group_id)
+            if position is not None:
+                self.stats["exact"] += 1
+                return position, 1.0
+
+        length = len(name)
+        tokens = gram_tokens(name)
+        ordered = self._ordered_grams(name)
+        best: Optional[Tuple[float, int]] = None  # (相似度, 位置)
+        verified: Set[int] = set()
+
+        def rank(group_ids, floor: float) -> List[Tuple[float, int, int, int]]:
+            """(相似度上界, 位置, 組, 較長的長度)，按上界從高到低、位置從前到後排列"""
+            ranked = []
+            for lower, candidate, max_len, _ in self._bounded(
+                    length, tokens, group_ids - verified, self._length_limits(length, floor)):
+                position = self._first_alive(candidate)
+                if position is not None:
+                    ranked.append((similarity_from_distance(lower, max_len), position, candidate, max_len))
+            ranked.sort(key=lambda item: (-item[0], item[1]))
+            return ranked
+
+        def verify(ranked):
+            nonlocal best
+            for upper, position, candidate, max_len in ranked:
+                verified.add(candidate)
+                if best is not None and (upper < best[0] or (upper == best[0] and position > best[1])):
+                    break
+                floor = threshold if best is None else best[0]
+                limit = max_distance(max_len, floor)
+                self.stats["verified"] += 1
+                distance = bounded_levenshtein(name, self._names[candidate], limit)
+                if distance > limit:
+                    continue
+                similarity = similarity_from_distance(distance, max_len)
+                if similarity < threshold or similarity <= 0.0:
+                    continue
+                if best is None or similarity > best[0] or (similarity == best[0] and position < best[1]):
+                    best = (similarity, position)
+
+        verify(rank(self._sharing(ordered[:SEED_GRAMS]), threshold)[:SEED_CANDIDATES])
+
+        floor = threshold if best is None else best[0]
+        verify(rank(self._candidate_groups(ordered, self._length_limits(length, floor)), floor))
+
+        if best is None:
+            return None
+        self.stats["fuzzy"] += 1
+        return best[1], best[0]
+
+    def candidates(self, name: str, threshold: float) -> List[int]:
+        """
+        可能達到 threshold 的所有未移除位置（相似度矩陣一行中需要計算的列）
+
+        只做長度和共享 2-gram 數的過濾，不計算編輯距離；標準化後相同的名稱也包含在內
+
+        Returns:
+            位置列表，按位置排列
+        """
+        if threshold > 1.0:
+            return []
+        length = len(name)
+        limits = self._length_limits(length, threshold)
+        group_ids = {candidate for _, candidate, _, _ in self._bounded(
+            length, gram_tokens(name), self._candidate_groups(self._ordered_grams(name), limits), limits)}
+        exact = self._group_ids.get(name)
+        if exact is not None:
+            group_ids.add(exact)
+        return sorted(position for group_id in group_ids for position in self._positions[group_id]
+                      if position not in self._removed)
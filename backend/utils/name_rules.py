@@ -0,0 +1,288 @@
+"""
+文件名標準化規則引擎
+一個規則集（NameRuleSet）把文件名轉換為匹配用的名稱，規則類型：
+
+- suffix: 移除名稱末尾的後綴（可以疊加，如 _final_compressed）
+- prefix: 移除名稱開頭的前綴（可以疊加）
+- remove: 移除名稱中任意位置出現的文本
+- regex:  移除名稱中任意位置匹配正則表達式的部分（需要錨定時自行加 ^ / $）
+
+suffix/prefix/remove 默認是字面文本，"regex": true 時按正則表達式處理。
+所有規則編譯為一個交替正則表達式，一次 re.sub 完成（不會因為移除了一部分而再匹配一輪）；
+"sequential": true 時改為按順序每條規則各做一次 re.sub（後綴/前綴不疊加），與舊版的清理代碼一致。
+每個規則集按文件名緩存結果。
+
+自定義的正則表達式長度不能超過 MAX_PATTERN_LENGTH，也不能包含嵌套的量詞（如 (a+)+），
+避免回溯爆炸（ReDoS）拖住事件循環。
+
+規則集配置:
+    {
+        "rules": [{"type": "suffix", "value": "_compressed"},
+                  {"type": "regex", "value": "_seed\\d+"}],
+        "lowercase": true,             # 先轉小寫（規則匹配也不區分大小寫）
+        "strip_extension": true,       # 先去掉擴展名
+        "collapse_separators": false,  # 連續的下劃線/空白合併為一個下劃線，並去掉首尾的下劃線
+        "sequential": false            # 按順序逐條應用規則
+    }
+任務可以用內置規則集的名稱（BUILTIN_RULESETS）或上面的配置指定規則
+"""
+
+import os
+import re
+import json
+import hashlib
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Union
+
+try:
+    import re._parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse
+
+RULE_TYPES = ("suffix", "prefix", "remove", "regex")
+NAME_CACHE_SIZE = int(os.environ.get("NAME_RULES_CACHE_SIZE", "65536"))
+# 按配置緩存的自定義規則集數
+RULESET_CACHE_SIZE = 64
+# 自定義正則表達式的最大長度
+MAX_PATTERN_LENGTH = 200
+_SEPARATORS = re.compile(r"[_\s]+")
+_REPEATS = (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT, getattr(_sre_parse, "POSSESSIVE_REPEAT", None))
+
+
+def _has_nested_quantifier(parsed, inside_repeat: bool = False) -> bool:
+    """解析後的正則表達式中是否有量詞套在另一個可重複多次的量詞裡"""
+    for op, av in parsed:
+        if op in _REPEATS:
+            low, high, body = av
+            if inside_repeat:
+                return True
+            if _has_nested_quantifier(body, inside_repeat or high > 1):
+                return True
+        elif op is _sre_parse.SUBPATTERN:
+            if _has_nested_quantifier(av[-1], inside_repeat):
+                return True
+        elif op is _sre_parse.BRANCH:
+            if any(_has_nested_quantifier(branch, inside_repeat) for branch in av[1]):
+                return True
+        elif op in (_sre_parse.ASSERT, _sre_parse.ASSERT_NOT):
+            if _has_nested_quantifier(av[1], inside_repeat):
+                return True
+    return False
+
+
+def validate_pattern(pattern: str):
+    """檢查自定義正則表達式，過長、無效或包含嵌套量詞時拋出 ValueError"""
+    if len(pattern) > MAX_PATTERN_LENGTH:
+        raise ValueError(f"正則表達式過長（最多 {MAX_PATTERN_LENGTH} 個字符）: {pattern[:40]!r}...")
+    try:
+        parsed = _sre_parse.parse(pattern)
+    except re.error as e:
+        raise ValueError(f"無效的正則表達式 {pattern!r}: {e}")
+    if _has_nested_quantifier(parsed):
+        raise ValueError(f"正則表達式不能包含嵌套的量詞: {pattern!r}")
+
+
+class NameRuleSet:
+    """編譯後的規則集，normalize() 的結果按文件名緩存"""
+
+    def __init__(self, rules: List[Dict], lowercase: bool = True, strip_extension: bool = True,
+                 collapse_separators: bool = False, sequential: bool = False, name: Optional[str] = None):
+        self.rules = [dict(rule) for rule in rules]
+        self.lowercase = lowercase
+        self.strip_extension = strip_extension
+        self.collapse_separators = collapse_separators
+        self.sequential = sequential
+        config = self.to_config()
+        self.key = hashlib.sha1(json.dumps(config, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+        self.name = name or f"custom:{self.key}"
+        self._patterns = self._compile_sequential() if sequential else [self._compile()]
+        self.normalize = lru_cache(maxsize=NAME_CACHE_SIZE)(self._normalize)
+
+    @classmethod
+    def from_config(cls, config: Dict, name: Optional[str] = None) -> "NameRuleSet":
+        """校驗並編譯配置，無效時拋出 ValueError"""
+        if not isinstance(config, dict):
+            raise ValueError("規則集配置必須是對象")
+        rules = config.get("rules", [])
+        if not isinstance(rules, list):
+            raise ValueError("rules 必須是列表")
+        for rule in rules:
+            if not isinstance(rule, dict) or rule.get("type") not in RULE_TYPES:
+                raise ValueError(f"無效的規則: {rule!r}（type 必須是 {' / '.join(RULE_TYPES)}）")
+            if not isinstance(rule.get("value"), str) or not rule["value"]:
+                raise ValueError(f"規則缺少 value: {rule!r}")
+        rules = [{"type": rule["type"], "value": rule["value"], "regex": rule["type"] == "regex" or bool(rule.get("regex"))}
+                 for rule in rules]
+        for rule in rules:
+            if rule["regex"]:
+                validate_pattern(rule["value"])
+        return cls(
+            rules,
+            lowercase=bool(config.get("lowercase", True)),
+            strip_extension=bool(config.get("strip_extension", True)),
+            collapse_separators=bool(config.get("collapse_separators", False)),
+            sequential=bool(config.get("sequential", False)),
+            name=name,
+        )
+
+    def to_config(self) -> Dict:
+        return {
+            "rules": self.rules,
+            "lowercase": self.lowercase,
+            "strip_extension": self.strip_extension,
+            "collapse_separators": self.collapse_separators,
+            "sequential": self.sequential,
+        }
+
+    def _compile(self) -> Optional["re.Pattern"]:
+        """所有規則合併為一個交替正則表達式"""
+        def fragment(rule: Dict) -> str:
+            return rule["value"] if rule["regex"] else re.escape(rule["value"])
+
+        def alternation(rules: List[Dict]) -> str:
+            # 字面文本按長度從長到短排列，同一位置優先移除較長的
+            ordered = sorted(rules, key=lambda rule: 0 if rule["regex"] else -len(rule["value"]))
+            return "|".join(f"(?:{fragment(rule)})" for rule in ordered)
+
+        anywhere = [rule for rule in self.rules if rule["type"] in ("remove", "regex")]
+        suffixes = [rule for rule in self.rules if rule["type"] == "suffix"]
+        prefixes = [rule for rule in self.rules if rule["type"] == "prefix"]
+        parts = []
+        if prefixes:
+            parts.append(f"^(?:{alternation(prefixes)})+")
+        if anywhere:
+            parts.append(alternation(anywhere))
+        if suffixes:
+            parts.append(f"(?:{alternation(suffixes)})+$")
+        if not parts:
+            return None
+        try:
+            return re.compile("|".join(parts), re.IGNORECASE if self.lowercase else 0)
+        except re.error as e:
+            raise ValueError(f"無效的正則表達式: {e}")
+
+    def _compile_sequential(self) -> List["re.Pattern"]:
+        """每條規則各編譯為一個正則表達式，按順序應用"""
+        patterns = []
+        for rule in self.rules:
+            fragment = rule["value"] if rule["regex"] else re.escape(rule["value"])
+            if rule["type"] == "suffix":
+                fragment = f"(?:{fragment})$"
+            elif rule["type"] == "prefix":
+                fragment = f"^(?:{fragment})"
+            try:
+                patterns.append(re.compile(fragment, re.IGNORECASE if self.lowercase else 0))
+            except re.error as e:
+                raise ValueError(f"無效的正則表達式: {e}")
+        return patterns
+
+    def _normalize(self, filename: str) -> str:
+        name = os.path.basename(filename)
+        if self.strip_extension:
+            name = os.path.splitext(name)[0]
+        if self.lowercase:
+            name = name.lower()
+        for pattern in self._patterns:
+            if pattern is not None:
+                name = pattern.sub("", name)
+        if self.collapse_separators:
+            name = _SEPARATORS.sub("_", name).strip("_")
+        return name.strip()
+
+
+def _literal_rules(rule_type: str, values: List[str]) -> List[Dict]:
+    return [{"type": rule_type, "value": value, "regex": False} for value in values]
+
+
+BUILTIN_RULESETS: Dict[str, NameRuleSet] = {
+    # 只去掉擴展名（區分大小寫），按基礎名稱精確配對
+    "exact": NameRuleSet([], lowercase=False, name="exact"),
+    # utils.video_matcher.normalize_filename：移除任意位置的常見處理後綴
+    "default": NameRuleSet(
+        _literal_rules("remove", [
+            "_compressed", "_enhanced", "_processed", "_output",
+            "_original", "_source", "_input", "_result",
+            "_720p", "_1080p", "_4k", "_hd",
+            "_final", "_v1", "_v2", "_v3",
+            "(1)", "(2)", "(3)",
+            "-1", "-2", "-3",
+            "_copy", "_new",
+        ]),
+        collapse_separators=True, name="default"),
+    # VideoMatcher.extract_base_name：只移除末尾的後綴
+    "base_name": NameRuleSet(
+        _literal_rules("suffix", ["_compressed", "_enhanced", "_baseline", "_original", "_final", "_output"])
+        + [{"type": "suffix", "value": r"_v\d+", "regex": True}, {"type": "suffix", "value": r"_\d+", "regex": True}],
+        name="base_name"),
+    # 生成模型的輸出：去掉種子號、分享標記和末尾序號（區分大小寫）
+    "render": NameRuleSet(
+        [{"type": "regex", "value": r"_seed\d+", "regex": True},
+         {"type": "suffix", "value": "_share", "regex": False},
+         {"type": "suffix", "value": r"_\d+", "regex": True}],
+        lowercase=False, name="render"),
+    # 規則引擎之前 main.py 的清理代碼：同樣的三條規則按順序各做一次，末尾的序號只去掉一個，
+    # 但先去掉種子號後露出的序號也會被去掉（render_001_seed42 -> render）。
+    # 沒有記錄規則集的舊任務使用它，保持原來的配對結果
+    "legacy": NameRuleSet(
+        [{"type": "regex", "value": r"_seed\d+", "regex": True},
+         {"type": "suffix", "value": "_share", "regex": False},
+         {"type": "suffix", "value": r"_\d+", "regex": True}],
+        lowercase=False, sequential=True, name="legacy"),
+}
+
+
+@lru_cache(maxsize=RULESET_CACHE_SIZE)
+def _ruleset_from_json(config_json: str) -> NameRuleSet:
+    return NameRuleSet.from_config(json.loads(config_json))
+
+
+def get_ruleset(spec: Union[None, str, Dict, NameRuleSet] = None, default: str = "default") -> NameRuleSet:
+    """
+    按內置規則集名稱或配置取得規則集（相同的配置共用同一個編譯結果和緩存）
+
+    Raises:
+        ValueError: 未知的規則集名稱或無效的配置
+    """
+    if isinstance(spec, NameRuleSet):
+        return spec
+    if spec is None or spec == "":
+        spec = default
+    if isinstance(spec, str):
+        if spec not in BUILTIN_RULESETS:
+            raise ValueError(f"未知的規則集: {spec}（可用: {', '.join(BUILTIN_RULESETS)}）")
+        return BUILTIN_RULESETS[spec]
+    if not isinstance(spec, dict):
+        raise ValueError("規則集必須是名稱或配置對象")
+    return _ruleset_from_json(json.dumps(spec, sort_keys=True, ensure_ascii=False))
+
+
+def preview_rules(ruleset: NameRuleSet, filenames: List[str], compare_filenames: Optional[List[str]] = None) -> Dict:
+    """
+    規則在一組文件名上的效果：每個文件的標準化名稱，以及標準化後重名（無法區分）的文件；
+    提供 compare_filenames 時再統計兩組按標準化名稱能配對的數量
+    """
+    normalized = {filename: ruleset.normalize(filename) for filename in filenames}
+    counts = Counter(normalized.values())
+    collisions = {}
+    for filename, name in normalized.items():
+        if counts[name] > 1:
+            collisions.setdefault(name, []).append(filename)
+
+    result = {
+        "ruleset": ruleset.name,
+        "config": ruleset.to_config(),
+        "files": [{"filename": filename, "normalized": name} for filename, name in normalized.items()],
+        "distinct_names": len(counts),
+        "collisions": [{"normalized": name, "files": files} for name, files in collisions.items()],
+    }
+    if compare_filenames is not None:
+        compare_names = {ruleset.normalize(filename) for filename in compare_filenames}
+        matched = set(counts) & compare_names
+        result["compare"] = {
+            "matched_names": len(matched),
+            "unmatched": sorted(filename for filename, name in normalized.items() if name not in matched),
+            "unmatched_compare": sorted(filename for filename in compare_filenames
+                                        if ruleset.normalize(filename) not in matched),
+        }
+    return result
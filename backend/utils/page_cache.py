@@ -0,0 +1,227 @@
+"""
+視頻頁緩存預熱
+評估者按任務的視頻對順序觀看：記錄每個任務返回給前端的視頻對順序，
+評估者打開任務、請求某個視頻對的視頻或提交評估時，預測接下來的 K 個視頻對，
+由後台線程對兩側視頻的開頭和 moov 區域調用 posix_fadvise(WILLNEED)，
+讓內核提前把這些數據讀入頁緩存，切換到下一對時的首批範圍請求不再等待冷磁盤。
+
+命中統計：被跟蹤的視頻文件第一次被請求時，如果已經預熱過記為命中，否則記為未命中
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+from utils.video_probe import MAX_MOOV_SIZE, iter_file_boxes
+from utils.video_serving import resolve_served_path
+
+# 預熱接下來多少個視頻對，0 表示關閉
+PREFETCH_PAIRS = int(os.environ.get("PREFETCH_PAIRS", "3"))
+# 每個視頻預熱的開頭字節數
+PREFETCH_HEAD_BYTES = int(os.environ.get("PREFETCH_HEAD_BYTES", str(8 * 1024 * 1024)))
+# 預熱過的文件在這段時間內不重複預熱，也在這段時間內計入命中（秒）
+PREFETCH_TTL = 600
+# 同一文件在這段時間內的後續請求（seek 產生的範圍請求）不重複計入命中統計（秒）
+ACCESS_WINDOW = 600
+MAX_TRACKED_TASKS = 64
+MAX_TRACKED_FILES = 4096
+
+
+def _bounded_put(mapping: OrderedDict, key, value, limit: int):
+    mapping[key] = value
+    mapping.move_to_end(key)
+    while len(mapping) > limit:
+        mapping.popitem(last=False)
+
+
+def pair_video_files(root: str, pair: Dict) -> List[str]:
+    """返回視頻對兩側在本地上傳目錄中的文件路徑（外部 URL 等跳過）"""
+    files = []
+    for key in ("video_a_path", "video_b_path"):
+        url = (pair.get(key) or "").lstrip("/")
+        if not url.startswith("uploads/"):
+            continue
+        path = resolve_served_path(root, unquote(url[len("uploads/"):]))
+        if path is not None:
+            files.append(path)
+    return files
+
+
+class PageCacheWarmer:
+    """按視頻對順序預熱接下來要看的視頻"""
+
+    def __init__(self, root: str, lookahead: int = PREFETCH_PAIRS, head_bytes: int = PREFETCH_HEAD_BYTES):
+        self.root = root
+        self.lookahead = lookahead
+        self.head_bytes = head_bytes
+        self.enabled = lookahead > 0 and hasattr(os, "posix_fadvise")
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._queue: deque = deque()
+        self._queued = set()
+
+        # 任務 -> 按順序的每個視頻對的文件路徑
+        self._tasks: "OrderedDict[str, List[List[str]]]" = OrderedDict()
+        # 視頻對ID / 文件路徑 -> (任務ID, 在順序中的位置)
+        self._pairs: Dict[str, Tuple[str, int]] = {}
+        self._files: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._warmed: "OrderedDict[str, float]" = OrderedDict()
+        self._accessed: "OrderedDict[str, float]" = OrderedDict()
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "warmed_files": 0,
+            "advised_bytes": 0,
+            "errors": 0,
+        }
+
+    # ---------- 評估者的位置 ----------
+
+    def track_task(self, task_id: str, pairs: List[Dict]):
+        """記錄任務返回給前端的視頻對順序，並預熱最前面的視頻對"""
+        if not self.enabled:
+            return
+        order = [pair_video_files(self.root, pair) for pair in pairs]
+        with self._lock:
+            self._tasks[task_id] = order
+            self._tasks.move_to_end(task_id)
+            while len(self._tasks) > MAX_TRACKED_TASKS:
+                # 被擠出的任務不再保留其視頻對索引
+                evicted, _ = self._tasks.popitem(last=False)
+                self._pairs = {k: v for k, v in self._pairs.items() if v[0] != evicted}
+            for index, (pair, files) in enumerate(zip(pairs, order)):
+                if pair.get("id"):
+                    self._pairs[pair["id"]] = (task_id, index)
+                for path in files:
+                    _bounded_put(self._files, path, (task_id, index), MAX_TRACKED_FILES)
+        self._warm_from(task_id, 0)
+
+    def pair_completed(self, pair_id: str):
+        """評估提交後，預熱該視頻對之後的 K 個視頻對"""
+        if not self.enabled:
+            return
+        with self._lock:
+            position = self._pairs.get(pair_id)
+        if position is not None:
+            self._warm_from(position[0], position[1] + 1)
+
+    def file_requested(self, path: str):
+        """視頻被請求時記錄命中情況，並預熱它所在視頻對之後的 K 個視頻對"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            position = self._files.get(path)
+            if position is None:
+                return
+            last_access = self._accessed.get(path)
+            if last_access is not None and now - last_access < ACCESS_WINDOW:
+                return
+            _bounded_put(self._accessed, path, now, MAX_TRACKED_FILES)
+            warmed_at = self._warmed.get(path)
+            if warmed_at is not None and now - warmed_at < PREFETCH_TTL:
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+        self._warm_from(position[0], position[1] + 1)
+
+    def _warm_from(self, task_id: str, start: int):
+        now = time.monotonic()
+        with self._lock:
+            order = self._tasks.get(task_id)
+            if not order:
+                return
+            for files in order[start:start + self.lookahead]:
+                for path in files:
+                    warmed_at = self._warmed.get(path)
+                    if path in self._queued or (warmed_at is not None and now - warmed_at < PREFETCH_TTL):
+                        continue
+                    self._queued.add(path)
+                    self._queue.append(path)
+            if self._queue:
+                self._ensure_thread()
+                self._wakeup.notify()
+
+    # ---------- 後台預熱 ----------
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="page-cache-warmer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._wakeup.wait()
+                path = self._queue.popleft()
+            try:
+                advised = self._advise(path)
+                with self._lock:
+                    _bounded_put(self._warmed, path, time.monotonic(), MAX_TRACKED_FILES)
+                    self.stats["warmed_files"] += 1
+                    self.stats["advised_bytes"] += advised
+            except OSError as e:
+                with self._lock:
+                    self.stats["errors"] += 1
+                if not isinstance(e, FileNotFoundError):
+                    print(f"⚠️ 預熱視頻失敗 {path}: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(path)
+
+    def _moov_range(self, f, file_size: int) -> Optional[Tuple[int, int]]:
+        """MP4 的 moov 位置 (起點, 大小)，不是 MP4 或找不到時返回 None"""
+        if not f.name.lower().endswith(('.mp4', '.mov', '.m4v', '.3gp')):
+            return None
+        for box_type, start, _header_size, size in iter_file_boxes(f, file_size):
+            if box_type == b'moov':
+                return start, min(size, MAX_MOOV_SIZE)
+        return None
+
+    def _advise(self, path: str) -> int:
+        """對開頭和 moov 區域發出 WILLNEED，返回建議讀入的字節數"""
+        with open(path, "rb") as f:
+            fd = f.fileno()
+            file_size = os.fstat(fd).st_size
+            head = min(self.head_bytes, file_size)
+            os.posix_fadvise(fd, 0, head, os.POSIX_FADV_WILLNEED)
+            advised = head
+
+            moov = self._moov_range(f, file_size)
+            if moov is not None and moov[0] + moov[1] > head:
+                start = max(moov[0], head)
+                length = moov[0] + moov[1] - start
+                os.posix_fadvise(fd, start, length, os.POSIX_FADV_WILLNEED)
+                advised += length
+        return advised
+
+    def wait_idle(self, timeout: float = 10.0) -> bool:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._lock:
+                if not self._queue and not self._queued:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def snapshot(self) -> Dict:
+        """預熱統計，用於調整 PREFETCH_PAIRS / PREFETCH_HEAD_BYTES"""
+        with self._lock:
+            stats = dict(self.stats)
+            requests = stats["hits"] + stats["misses"]
+            stats.update({
+                "enabled": self.enabled,
+                "lookahead_pairs": self.lookahead,
+                "head_bytes": self.head_bytes,
+                "hit_rate": round(stats["hits"] / requests, 4) if requests else None,
+                "queued": len(self._queue),
+                "tracked_tasks": len(self._tasks),
+            })
+        return stats
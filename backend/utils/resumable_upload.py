@@ -0,0 +1,302 @@
+"""
+可續傳的分塊上傳
+客戶端先創建上傳會話，再把文件按任意偏移分塊 PUT 上來（可以並行、可以重傳），
+服務端用 pwrite 直接寫入目標目錄中預先分配好大小的 .part 文件，最後 finalize 時
+檢查全部字節都已收到，fsync 後原子化重命名為目標文件（提供 BlobStore 時按內容去重保存）。
+
+每個已寫入並 fsync 的塊在會話目錄中留一個以 "起點-終點" 命名的空標記文件，
+查詢已收到的範圍只需列目錄合併區間；不需要鎖，多個 worker 進程可以同時接收同一會話的塊。
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from utils.blob_store import file_sha256, is_sha256
+from utils.file_utils import (
+    VIDEO_SIGNATURE_BYTES, atomic_write_json, validate_video_header, video_signature_validator
+)
+from utils.upload_stream import (
+    UPLOAD_CHUNK_SIZE, InvalidVideoFile, UploadTooLarge, finalize_upload, safe_upload_name, upload_size_limit
+)
+
+# 未完成的上傳會話保留時間（秒），超時的會話在創建新會話時清理
+UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", str(24 * 3600)))
+
+
+class UploadSessionNotFound(KeyError):
+    """上傳會話不存在或已過期"""
+
+
+class InvalidChunk(ValueError):
+    """塊的偏移或長度超出文件範圍"""
+
+
+class ChecksumMismatch(ValueError):
+    """收到的內容與創建會話時提供的 SHA-256 不一致"""
+
+
+class UploadIncomplete(Exception):
+    """finalize 時仍有字節未收到"""
+
+    def __init__(self, missing: List[Tuple[int, int]]):
+        super().__init__(f"還有 {len(missing)} 個範圍未上傳")
+        self.missing = missing
+
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """合併重疊或相鄰的半開區間 [start, end)"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(received: List[Tuple[int, int]], size: int) -> List[Tuple[int, int]]:
+    """返回 [0, size) 中還沒有收到的區間"""
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append((position, start))
+        position = max(position, end)
+    if position < size:
+        missing.append((position, size))
+    return missing
+
+
+class ResumableUploads:
+    """管理上傳會話，會話元數據保存在 sessions_dir/{upload_id}/session.json"""
+
+    def __init__(self, sessions_dir: str, blob_store=None):
+        """
+        Args:
+            sessions_dir: 會話目錄
+            blob_store: BlobStore，提供時完成的文件按內容去重保存
+        """
+        self.sessions_dir = sessions_dir
+        self.blob_store = blob_store
+        os.makedirs(sessions_dir, exist_ok=True)
+
+    def _session_dir(self, upload_id: str) -> str:
+        if not upload_id or os.path.basename(upload_id) != upload_id or upload_id.startswith("."):
+            raise UploadSessionNotFound(upload_id)
+        return os.path.join(self.sessions_dir, upload_id)
+
+    def _chunks_dir(self, upload_id: str) -> str:
+        return os.path.join(self._session_dir(upload_id), "chunks")
+
+    def get(self, upload_id: str) -> Dict:
+        """讀取會話元數據"""
+        try:
+            with open(os.path.join(self._session_dir(upload_id), "session.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            raise UploadSessionNotFound(upload_id)
+
+    def create(self, folder_name: str, folder_path: str, filename: str, size: int,
+               sha256: Optional[str] = None) -> Dict:
+        """
+        創建上傳會話並預先分配目標大小的 .part 文件
+
+        客戶端提供的 sha256 只用於 finalize 時校驗收到的內容；不會據此直接引用已有的 blob，
+        否則知道哈希就能把別人的內容鏈接到自己的資料夾（去重在 finalize 時按服務端計算的哈希進行）
+
+        Raises:
+            UploadTooLarge: size 超過 MAX_UPLOAD_SIZE
+            ValueError: 文件名、大小或 sha256 無效
+        """
+        self.prune_expired()
+        filename = safe_upload_name(filename)
+        if video_signature_validator(filename) is None:
+            raise ValueError(f"不支持的視頻格式: {filename}")
+        if size <= 0:
+            raise ValueError(f"無效的文件大小: {size}")
+        limit = upload_size_limit()
+        if limit is not None and size > limit:
+            raise UploadTooLarge(limit)
+        if isinstance(sha256, str):
+            sha256 = sha256.lower()
+        if sha256 is not None and not is_sha256(sha256):
+            raise ValueError(f"無效的 SHA-256: {sha256!r}")
+
+        os.makedirs(folder_path, exist_ok=True)
+        target_path = os.path.join(folder_path, filename)
+        upload_id = uuid.uuid4().hex
+        part_path = os.path.join(folder_path, f".{filename}.{upload_id}.part")
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+
+        session = {
+            "id": upload_id,
+            "folder_name": folder_name,
+            "filename": filename,
+            "size": size,
+            "part_path": part_path,
+            "target_path": target_path,
+            "sha256": sha256,
+            "created_time": time.time()
+        }
+        os.makedirs(self._chunks_dir(upload_id))
+        atomic_write_json(os.path.join(self._session_dir(upload_id), "session.json"), session)
+        return session
+
+    def received_ranges(self, upload_id: str) -> List[Tuple[int, int]]:
+        """已收到並落盤的範圍（合併後的半開區間）"""
+        try:
+            names = os.listdir(self._chunks_dir(upload_id))
+        except FileNotFoundError:
+            raise UploadSessionNotFound(upload_id)
+        ranges = []
+        for name in names:
+            start, _, end = name.partition("-")
+            if start.isdigit() and end.isdigit():
+                ranges.append((int(start), int(end)))
+        return merge_ranges(ranges)
+
+    def status(self, upload_id: str) -> Dict:
+        session = self.get(upload_id)
+        received = self.received_ranges(upload_id)
+        received_bytes = sum(end - start for start, end in received)
+        return {
+            "upload_id": upload_id,
+            "folder_name": session["folder_name"],
+            "filename": session["filename"],
+            "size": session["size"],
+            "received": [list(r) for r in received],
+            "received_bytes": received_bytes,
+            "complete": not missing_ranges(received, session["size"])
+        }
+
+    async def write_chunk(self, upload_id: str, offset: int, body: AsyncIterator[bytes],
+                          buffer_size: int = UPLOAD_CHUNK_SIZE) -> int:
+        """
+        把請求體從 offset 開始寫入 .part 文件
+
+        Args:
+            upload_id: 會話ID
+            offset: 塊在文件中的起始位置
+            body: 請求體的異步字節流（如 request.stream()）
+            buffer_size: 攢夠多少字節執行一次 pwrite
+
+        Returns:
+            寫入的字節數
+
+        Raises:
+            InvalidVideoFile: 從 0 開始的塊文件頭簽名不對，不會寫入任何數據
+        """
+        session = self.get(upload_id)
+        size = session["size"]
+        if offset < 0 or offset > size:
+            raise InvalidChunk(f"偏移 {offset} 超出文件大小 {size}")
+        # 文件開頭的塊必須包含完整的簽名區域，檢查通過後才開始寫入
+        validator = video_signature_validator(session["filename"]) if offset == 0 else None
+        head_size = min(VIDEO_SIGNATURE_BYTES, size)
+
+        loop = asyncio.get_running_loop()
+        fd = os.open(session["part_path"], os.O_WRONLY)
+        written = 0
+        try:
+            buffer = bytearray()
+
+            async def flush():
+                nonlocal written, validator
+                if validator is not None:
+                    if len(buffer) < head_size:
+                        raise InvalidChunk(f"文件開頭的塊至少需要 {head_size} 字節")
+                    if not validator(bytes(buffer[:head_size])):
+                        raise InvalidVideoFile(f"不是有效的視頻文件: {session['filename']}")
+                    validator = None
+                data = bytes(buffer)
+                buffer.clear()
+                while data:
+                    n = await loop.run_in_executor(None, os.pwrite, fd, data, offset + written)
+                    written += n
+                    data = data[n:]
+
+            async for piece in body:
+                if offset + written + len(buffer) + len(piece) > size:
+                    raise InvalidChunk(f"塊超出文件大小 {size}")
+                buffer.extend(piece)
+                if len(buffer) >= buffer_size:
+                    await flush()
+            await flush()
+            await loop.run_in_executor(None, os.fsync, fd)
+        finally:
+            os.close(fd)
+
+        # 只有落盤後才記錄範圍，中途斷開的塊不會被當作已收到
+        if written:
+            marker = os.path.join(self._chunks_dir(upload_id), f"{offset}-{offset + written}")
+            open(marker, "w").close()
+        return written
+
+    def finalize(self, upload_id: str) -> Dict:
+        """
+        確認所有字節都已收到，把 .part 文件重命名為目標文件並刪除會話
+        （使用 BlobStore 時需要讀一遍文件計算哈希，應在線程池中調用）
+
+        Returns:
+            會話元數據，deduplicated 表示內容已存在、沒有保留新上傳的數據
+
+        Raises:
+            UploadIncomplete: 還有範圍沒有收到
+            InvalidVideoFile: 組裝後的文件頭簽名不對（會話被刪除）
+            ChecksumMismatch: 內容與創建會話時提供的 sha256 不一致（會話被刪除）
+        """
+        session = self.get(upload_id)
+        missing = missing_ranges(self.received_ranges(upload_id), session["size"])
+        if missing:
+            raise UploadIncomplete(missing)
+        try:
+            # write_chunk 只在 offset 為 0 的塊檢查簽名，之後重傳或重疊的塊可能覆蓋了文件頭
+            with open(session["part_path"], "rb") as f:
+                head = f.read(VIDEO_SIGNATURE_BYTES)
+            if not validate_video_header(session["filename"], head):
+                self.abort(upload_id)
+                raise InvalidVideoFile(f"不是有效的視頻文件: {session['filename']}")
+            expected = session.get("sha256")
+            if self.blob_store is not None or expected:
+                digest = file_sha256(session["part_path"])
+                if expected and digest != expected:
+                    self.abort(upload_id)
+                    raise ChecksumMismatch(f"文件內容的 SHA-256 與提供的不一致: {digest}")
+            if self.blob_store is not None:
+                session["deduplicated"] = self.blob_store.store(session["part_path"], digest, session["target_path"])
+            else:
+                finalize_upload(session["part_path"], session["target_path"])
+                session["deduplicated"] = False
+        except FileNotFoundError:
+            # 另一個請求已經完成了這個會話
+            raise UploadSessionNotFound(upload_id)
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+        return session
+
+    def abort(self, upload_id: str):
+        """取消上傳，刪除 .part 文件和會話"""
+        session = self.get(upload_id)
+        if os.path.exists(session["part_path"]):
+            os.remove(session["part_path"])
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+
+    def prune_expired(self):
+        """刪除超過 UPLOAD_SESSION_TTL 仍未完成的會話"""
+        now = time.time()
+        for upload_id in os.listdir(self.sessions_dir):
+            try:
+                session = self.get(upload_id)
+            except UploadSessionNotFound:
+                continue
+            if now - session.get("created_time", now) > UPLOAD_SESSION_TTL:
+                try:
+                    self.abort(upload_id)
+                    print(f"🔧 清理過期的上傳會話: {upload_id}")
+                except Exception as e:
+                    print(f"⚠️ 清理上傳會話 {upload_id} 失敗: {e}")
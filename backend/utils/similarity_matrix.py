@@ -0,0 +1,223 @@
+"""
+文件名相似度矩陣與最優配對
+行為A組名稱、列為B組名稱（均為已標準化的名稱），只保存相似度 ≥ threshold 且大於 0 的項，
+相似度與 utils.video_matcher.calculate_similarity 相同（1 - 編輯距離 / 較長名稱的長度）。
+
+- 小規模（行數 × 列數不超過 DENSE_MAX_CELLS）計算所有組合的編輯距離
+- 大規模先通過 FuzzyNameIndex.candidates 排除不可能達到 threshold 的組合，只計算其餘的（稀疏）
+編輯距離用位並行算法對一批名稱對同時計算（NumPy 向量化）
+
+配對按總相似度最大求解（匈牙利算法，權重低於 threshold 的組合視為不配對），
+與逐個A選當前最佳B的貪心方式不同，結果不依賴A的順序
+"""
+
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+from utils.fuzzy_match import FuzzyNameIndex, bounded_levenshtein
+
+DENSE_MAX_CELLS = int(os.environ.get("MATCH_DENSE_MAX_CELLS", "4000000"))
+# 每批同時計算的名稱對數（控制臨時數組的內存）
+PAIR_CHUNK = 250000
+# 位並行算法中A名稱的長度上限（uint64 的位數），更長的名稱逐對計算
+WORD_BITS = 64
+
+
+class PairDistances:
+    """
+    名稱對的編輯距離
+
+    Myers/Hyyrö 位並行算法（與 utils.fuzzy_match.bounded_levenshtein 相同），
+    以A名稱為模式、逐個處理B名稱的字符，每一步對整批名稱對做 NumPy 位運算
+    """
+
+    def __init__(self, names_a: List[str], names_b: List[str]):
+        self.names_a = names_a
+        self.names_b = names_b
+        self.lengths_a = np.array([len(name) for name in names_a], dtype=np.int64)
+        self.lengths_b = np.array([len(name) for name in names_b], dtype=np.int64)
+
+        # 字符編號：A名稱中出現過的字符依次編號，其他字符共用最後一個編號（不匹配任何位置）
+        alphabet = {}
+        for name in names_a:
+            if len(name) <= WORD_BITS:
+                for char in name:
+                    alphabet.setdefault(char, len(alphabet))
+        other = len(alphabet)
+        self.match_masks = np.zeros((len(names_a), other + 1), dtype=np.uint64)
+        for i, name in enumerate(names_a):
+            if len(name) <= WORD_BITS:
+                for position, char in enumerate(name):
+                    self.match_masks[i, alphabet[char]] |= np.uint64(1 << position)
+        self.codes_b = np.full((len(names_b), int(self.lengths_b.max(initial=0))), other, dtype=np.int64)
+        for i, name in enumerate(names_b):
+            self.codes_b[i, :len(name)] = [alphabet.get(char, other) for char in name]
+
+    def __call__(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """(names_a[rows[k]], names_b[cols[k]]) 的編輯距離"""
+        distances = np.zeros(len(rows), dtype=np.int64)
+        for k in np.nonzero(self.lengths_a[rows] > WORD_BITS)[0]:
+            name_a, name_b = self.names_a[rows[k]], self.names_b[cols[k]]
+            distances[k] = bounded_levenshtein(name_a, name_b, max(len(name_a), len(name_b)))
+        short_pairs = np.nonzero(self.lengths_a[rows] <= WORD_BITS)[0]
+
+        one = np.uint64(1)
+        for start in range(0, len(short_pairs), PAIR_CHUNK):
+            pairs = short_pairs[start:start + PAIR_CHUNK]
+            chunk_rows, chunk_cols = rows[pairs], cols[pairs]
+            pattern_lengths = self.lengths_a[chunk_rows]
+            text_lengths = self.lengths_b[chunk_cols]
+            result = np.where(pattern_lengths == 0, text_lengths, pattern_lengths)
+
+            shifts = np.maximum(pattern_lengths, 1).astype(np.uint64)
+            full = np.where(pattern_lengths >= WORD_BITS, ~np.uint64(0),
+                            (one << np.minimum(shifts, WORD_BITS - 1)) - one)
+            last = one << (shifts - one)
+            positive = full.copy()
+            negative = np.zeros(len(pairs), dtype=np.uint64)
+            score = pattern_lengths.copy()
+            for j in range(int(text_lengths.max(initial=0))):
+                eq = self.match_masks[chunk_rows, self.codes_b[chunk_cols, j]]
+                x = eq | negative
+                diagonal = (((x & positive) + positive) ^ positive) | x
+                horizontal_pos = negative | (~(diagonal | positive) & full)
+                horizontal_neg = positive & diagonal
+                score += (horizontal_pos & last != 0).astype(np.int64) - (horizontal_neg & last != 0).astype(np.int64)
+                horizontal_pos = ((horizontal_pos << one) | one) & full
+                horizontal_neg = (horizontal_neg << one) & full
+                positive = horizontal_neg | (~(diagonal | horizontal_pos) & full)
+                negative = horizontal_pos & diagonal
+                done = (text_lengths == j + 1) & (pattern_lengths > 0)
+                result[done] = score[done]
+            distances[pairs] = result
+        return distances
+
+    def similarities(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """與 calculate_similarity 相同的浮點計算；兩個名稱都為空時為 1.0"""
+        max_lengths = np.maximum(self.lengths_a[rows], self.lengths_b[cols])
+        similarities = np.ones(len(rows))
+        np.subtract(1.0, self(rows, cols) / np.maximum(max_lengths, 1), out=similarities, where=max_lengths > 0)
+        return similarities
+
+
+def max_weight_assignment(weights: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    使總權重最大的一一配對（匈牙利算法，最短增廣路版本，每步對所有列向量化）
+
+    Args:
+        weights: 非負權重矩陣，0 表示不能配對
+
+    Returns:
+        [(行, 列)]，只包含權重大於 0 的配對，按行排列
+    """
+    transposed = weights.shape[0] > weights.shape[1]
+    cost = -(weights.T if transposed else weights).astype(np.float64)
+    n, m = cost.shape
+    if n == 0:
+        return []
+
+    # 行、列的勢（1 開始編號，0 為虛擬列）
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # 列 -> 配對的行（0 表示空閒）
+    way = np.zeros(m + 1, dtype=np.int64)
+    for row in range(1, n + 1):
+        owner[0] = row
+        column = 0
+        slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current = owner[column]
+            reduced = cost[current - 1] - u[current] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < slack[1:])
+            slack[1:][better] = reduced[better]
+            way[1:][better] = column
+            candidates = np.where(free, slack[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            slack[1:][free] -= delta
+            column = next_column
+            if owner[column] == 0:
+                break
+        # 沿增廣路翻轉配對
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+
+    pairs = []
+    for column in range(1, m + 1):
+        row = owner[column] - 1
+        if row < 0:
+            continue
+        pair = (column - 1, row) if transposed else (row, column - 1)
+        if weights[pair] > 0:
+            pairs.append(pair)
+    pairs.sort()
+    return pairs
+
+
+class SimilarityMatrix:
+    """稀疏（COO）保存的相似度矩陣：rows/cols/values 按 (行, 列) 排列"""
+
+    def __init__(self, shape: Tuple[int, int], rows: np.ndarray, cols: np.ndarray,
+                 values: np.ndarray, kind: str):
+        self.shape = shape
+        self.rows = rows
+        self.cols = cols
+        self.values = values
+        self.kind = kind  # "dense" / "sparse"：構建方式
+
+    @classmethod
+    def build(cls, names_a: List[str], names_b: List[str], threshold: float) -> "SimilarityMatrix":
+        shape = (len(names_a), len(names_b))
+        kind = "dense" if shape[0] * shape[1] <= DENSE_MAX_CELLS else "sparse"
+        # 只有稀疏矩陣需要索引：排除不可能達到 threshold 的組合
+        index = FuzzyNameIndex(names_b) if kind == "sparse" else None
+        pair_distances = PairDistances(names_a, names_b)
+        block = max(1, PAIR_CHUNK // max(shape[1], 1))
+        found_rows, found_cols, found_values = [], [], []
+        for start in range(0, shape[0], block):
+            block_rows = np.arange(start, min(start + block, shape[0]))
+            if index is None:
+                rows = np.repeat(block_rows, shape[1])
+                cols = np.tile(np.arange(shape[1]), len(block_rows))
+            else:
+                candidates = [index.candidates(names_a[row], threshold) for row in block_rows]
+                rows = np.repeat(block_rows, [len(found) for found in candidates])
+                cols = np.fromiter((col for found in candidates for col in found), dtype=np.int64, count=len(rows))
+            similarities = pair_distances.similarities(rows, cols)
+            keep = (similarities >= threshold) & (similarities > 0.0)
+            found_rows.append(rows[keep])
+            found_cols.append(cols[keep])
+            found_values.append(similarities[keep])
+        if not found_rows:
+            return cls(shape, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), kind)
+        return cls(shape, np.concatenate(found_rows), np.concatenate(found_cols), np.concatenate(found_values), kind)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.values)
+
+    def optimal_pairs(self) -> List[Tuple[int, int, float]]:
+        """
+        總相似度最大的配對
+
+        Returns:
+            [(行, 列, 相似度)]，按行排列
+        """
+        if not self.nnz:
+            return []
+        # 只在有候選的行、列上求解
+        active_rows, row_index = np.unique(self.rows, return_inverse=True)
+        active_cols, col_index = np.unique(self.cols, return_inverse=True)
+        weights = np.zeros((len(active_rows), len(active_cols)))
+        weights[row_index, col_index] = self.values
+        return [(int(active_rows[r]), int(active_cols[c]), float(weights[r, c]))
+                for r, c in max_weight_assignment(weights)]
@@ -0,0 +1,129 @@
+"""
+流式上傳寫盤
+上傳文件按固定大小的塊讀取並用異步文件 IO 寫入同目錄下的臨時文件，
+完成後 fsync 並原子化重命名為目標文件；內存佔用與文件大小和並發上傳數無關。
+寫入的同時增量計算 SHA-256，提供 BlobStore 時按內容去重保存。
+提供文件頭校驗函數時，先讀取文件頭檢查容器簽名，不是視頻的上傳在寫盤前就被拒絕
+"""
+
+import os
+import asyncio
+import hashlib
+import tempfile
+from typing import Callable, Optional
+
+import aiofiles
+
+from utils.file_utils import VIDEO_SIGNATURE_BYTES
+
+# 每次讀寫的塊大小
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# 單個上傳請求的總大小上限（字節），0 表示不限制
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", str(10 * 1024 ** 3)))
+
+
+class UploadTooLarge(Exception):
+    """上傳內容超過大小上限"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"上傳內容超過大小上限 {limit} 字節")
+        self.limit = limit
+
+
+class InvalidVideoFile(ValueError):
+    """文件頭不是支持的視頻容器"""
+
+
+def upload_size_limit() -> Optional[int]:
+    """返回單個請求的大小上限，None 表示不限制"""
+    return MAX_UPLOAD_SIZE if MAX_UPLOAD_SIZE > 0 else None
+
+
+def content_length_exceeds(content_length: Optional[str], limit: Optional[int] = None) -> bool:
+    """根據請求頭 Content-Length 提前判斷是否超過上限（不解析請求體）"""
+    limit = upload_size_limit() if limit is None else limit
+    if limit is None or not content_length:
+        return False
+    try:
+        return int(content_length) > limit
+    except ValueError:
+        return False
+
+
+def safe_upload_name(filename: str) -> str:
+    """只保留文件名部分，防止上傳文件名中的路徑跳出目標目錄"""
+    name = os.path.basename(filename.replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise ValueError(f"無效的文件名: {filename!r}")
+    return name
+
+
+def finalize_upload(tmp_path: str, target_path: str):
+    """把已寫完並 fsync 的臨時文件原子化地替換為目標文件"""
+    os.replace(tmp_path, target_path)
+
+
+async def stream_upload_to_file(upload, target_path: str, limit: Optional[int] = None,
+                                chunk_size: int = UPLOAD_CHUNK_SIZE, blob_store=None,
+                                validate_head: Optional[Callable[[bytes], bool]] = None) -> int:
+    """
+    把 UploadFile 流式寫入目標路徑
+
+    Args:
+        upload: FastAPI/Starlette 的 UploadFile
+        target_path: 目標文件路徑
+        limit: 允許寫入的最大字節數，None 表示不限制
+        chunk_size: 每次讀寫的塊大小
+        blob_store: BlobStore，提供時文件按內容哈希保存，目標路徑為指向 blob 的硬鏈接
+        validate_head: 文件頭校驗函數（見 utils.file_utils.video_signature_validator）
+
+    Returns:
+        寫入的字節數
+
+    Raises:
+        UploadTooLarge: 超過 limit 時中止，臨時文件被刪除，目標文件保持不變
+        InvalidVideoFile: 文件頭校驗失敗，此時還沒有寫入任何數據
+    """
+    pending = b""
+    if validate_head is not None:
+        while len(pending) < VIDEO_SIGNATURE_BYTES:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            pending += chunk
+        if not validate_head(pending[:VIDEO_SIGNATURE_BYTES]):
+            raise InvalidVideoFile(f"不是有效的視頻文件: {os.path.basename(target_path)}")
+
+    directory = os.path.dirname(os.path.abspath(target_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(target_path)}.", suffix=".part", dir=directory)
+    os.close(fd)
+
+    size = 0
+    hasher = hashlib.sha256() if blob_store is not None else None
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                if pending:
+                    chunk, pending = pending, b""
+                else:
+                    chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    raise UploadTooLarge(limit)
+                if hasher is not None:
+                    hasher.update(chunk)
+                await out.write(chunk)
+            await out.flush()
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, out.fileno())
+        if blob_store is not None:
+            if blob_store.store(tmp_path, hasher.hexdigest(), target_path):
+                print(f"✅ 內容已存在，直接引用: {os.path.basename(target_path)}")
+        else:
+            finalize_upload(tmp_path, target_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size
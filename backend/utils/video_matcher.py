@@ -4,10 +4,19 @@
 """
 
 import os
-import re
+import threading
+from collections import OrderedDict
 from typing import List, Dict, Tuple
 from pathlib import Path
 
+from utils.fuzzy_match import FuzzyNameIndex
+from utils.name_rules import get_ruleset
+from utils.similarity_matrix import SimilarityMatrix
+
+# 兩邊文件數都不超過此值時按總相似度求最優配對，否則用 match_videos 的貪心方式
+OPTIMAL_MATCH_MAX_SIZE = int(os.environ.get("MATCH_OPTIMAL_MAX_SIZE", "3000"))
+MATRIX_CACHE_SIZE = int(os.environ.get("MATCH_MATRIX_CACHE_SIZE", "4"))
+
 
 class VideoMatcher:
     """視頻文件匹配器"""
@@ -18,7 +27,12 @@ class VideoMatcher:
         '.flv', '.wmv', '.m4v', '.3gp', '.ts'
     }
     
-    def __init__(self):
+    def __init__(self, rules=None):
+        """
+        Args:
+            rules: 文件名規則集（utils.name_rules 的內置名稱或配置），默認 base_name
+        """
+        self.rules = get_ruleset(rules, default="base_name")
         self.matched_pairs = []
         self.unmatched_a = []
         self.unmatched_b = []
@@ -65,25 +79,7 @@ class VideoMatcher:
         Returns:
             基礎文件名
         """
-        filename = os.path.basename(file_path)
-        base_name = os.path.splitext(filename)[0]
-        
-        # 移除常見的後綴模式
-        patterns_to_remove = [
-            r'_compressed$',
-            r'_enhanced$',
-            r'_baseline$',
-            r'_original$',
-            r'_v\d+$',
-            r'_\d+$',
-            r'_final$',
-            r'_output$'
-        ]
-        
-        for pattern in patterns_to_remove:
-            base_name = re.sub(pattern, '', base_name, flags=re.IGNORECASE)
-        
-        return base_name.lower().strip()
+        return self.rules.normalize(file_path)
     
     def match_videos(self, folder_a_path: str, folder_b_path: str) -> List[Dict[str, str]]:
         """
@@ -220,36 +216,14 @@ class VideoMatcher:
         
         return recommendations
 
-def normalize_filename(filename: str) -> str:
-    """標準化文件名，移除擴展名和常見後綴"""
-    # 移除擴展名
-    name = Path(filename).stem
-    
-    # 移除常見的處理後綴
-    suffixes_to_remove = [
-        '_compressed', '_enhanced', '_processed', '_output',
-        '_original', '_source', '_input', '_result',
-        '_720p', '_1080p', '_4k', '_hd',
-        '_final', '_v1', '_v2', '_v3',
-        '(1)', '(2)', '(3)',
-        '-1', '-2', '-3',
-        '_copy', '_new'
-    ]
-    
-    normalized = name.lower()
-    for suffix in suffixes_to_remove:
-        normalized = normalized.replace(suffix.lower(), '')
-    
-    # 移除多餘的空格和下劃線
-    normalized = re.sub(r'[_\s]+', '_', normalized)
-    normalized = normalized.strip('_')
-    
-    return normalized
+def normalize_filename(filename: str, rules=None) -> str:
+    """標準化文件名，移除擴展名和常見後綴（規則見 utils.name_rules，默認 default 規則集）"""
+    return get_ruleset(rules).normalize(filename)
 
-def calculate_similarity(name1: str, name2: str) -> float:
+def calculate_similarity(name1: str, name2: str, rules=None) -> float:
     """計算兩個文件名的相似度"""
-    norm1 = normalize_filename(name1)
-    norm2 = normalize_filename(name2)
+    norm1 = normalize_filename(name1, rules)
+    norm2 = normalize_filename(name2, rules)
     
     # 完全匹配
     if norm1 == norm2:
@@ -284,25 +258,28 @@ def calculate_similarity(name1: str, name2: str) -> float:
     
     return similarity
 
-def match_videos(videos_a: List[str], videos_b: List[str], threshold: float = 0.6) -> List[Dict]:
-    """匹配兩個資料夾中的視頻文件"""
+def match_videos(videos_a: List[str], videos_b: List[str], threshold: float = 0.6, rules=None) -> List[Dict]:
+    """
+    匹配兩個資料夾中的視頻文件
+
+    按順序為每個A視頻選擇尚未使用的B視頻中相似度最高的一個（相似度相同時取B中靠前的），
+    相似度需要 ≥ threshold。相似度與 calculate_similarity 相同，查找通過 FuzzyNameIndex
+    完成，不再對每個A×B組合計算編輯距離
+    """
     matched_pairs = []
-    used_b_videos = set()
+    
+    # 同名的B視頻被使用一次後全部視為已使用
+    unique_b = list(dict.fromkeys(videos_b))
+    ruleset = get_ruleset(rules)
+    index = FuzzyNameIndex([ruleset.normalize(video_b) for video_b in unique_b])
     
     # 為每個A視頻找到最佳匹配的B視頻
     for video_a in videos_a:
-        best_match = None
-        best_similarity = 0.0
-        
-        for video_b in videos_b:
-            if video_b in used_b_videos:
-                continue
-                
-            similarity = calculate_similarity(video_a, video_b)
-            
-            if similarity > best_similarity and similarity >= threshold:
-                best_similarity = similarity
-                best_match = video_b
+        found = index.best_match(ruleset.normalize(video_a), threshold)
+        if found is None:
+            continue
+        position, best_similarity = found
+        best_match = unique_b[position]
         
         if best_match:
             matched_pairs.append({
@@ -311,16 +288,75 @@ def match_videos(videos_a: List[str], videos_b: List[str], threshold: float = 0.
                 'similarity': best_similarity,
                 'completed': False
             })
-            used_b_videos.add(best_match)
+            index.remove(position)
+    
+    # 按相似度排序
+    matched_pairs.sort(key=lambda x: x['similarity'], reverse=True)
+    
+    return matched_pairs
+
+_matrix_cache: "OrderedDict[tuple, SimilarityMatrix]" = OrderedDict()
+_matrix_cache_lock = threading.Lock()
+
+
+def _pairable_b(videos_b: List[str]) -> List[str]:
+    """可以配對的B視頻（去重，空文件名不能配對）"""
+    return [video_b for video_b in dict.fromkeys(videos_b) if video_b]
+
+
+def get_similarity_matrix(videos_a: List[str], videos_b: List[str], threshold: float = 0.6,
+                          rules=None) -> SimilarityMatrix:
+    """
+    A視頻 × 可配對B視頻的相似度矩陣
+    最近用過的矩陣保存在 LRU 緩存中，預覽後創建任務時不需要重新計算
+    """
+    ruleset = get_ruleset(rules)
+    pairable_b = _pairable_b(videos_b)
+    key = (tuple(videos_a), tuple(pairable_b), threshold, ruleset.key)
+    with _matrix_cache_lock:
+        matrix = _matrix_cache.get(key)
+        if matrix is not None:
+            _matrix_cache.move_to_end(key)
+            return matrix
+
+    matrix = SimilarityMatrix.build([ruleset.normalize(video_a) for video_a in videos_a],
+                                    [ruleset.normalize(video_b) for video_b in pairable_b], threshold)
+    with _matrix_cache_lock:
+        _matrix_cache[key] = matrix
+        while len(_matrix_cache) > MATRIX_CACHE_SIZE:
+            _matrix_cache.popitem(last=False)
+    return matrix
+
+
+def optimal_match_videos(videos_a: List[str], videos_b: List[str], threshold: float = 0.6,
+                         rules=None) -> List[Dict]:
+    """
+    按總相似度最大配對兩個資料夾中的視頻文件
+
+    與 match_videos 使用相同的相似度和 threshold，但結果不依賴A視頻的順序；
+    文件數超過 OPTIMAL_MATCH_MAX_SIZE 時退回 match_videos
+    """
+    if max(len(videos_a), len(videos_b)) > OPTIMAL_MATCH_MAX_SIZE:
+        print(f"⚠️ 視頻數超過 {OPTIMAL_MATCH_MAX_SIZE}，使用貪心匹配")
+        return match_videos(videos_a, videos_b, threshold, rules)
+
+    pairable_b = _pairable_b(videos_b)
+    matrix = get_similarity_matrix(videos_a, videos_b, threshold, rules)
+    matched_pairs = [{
+        'video_a': videos_a[row],
+        'video_b': pairable_b[col],
+        'similarity': similarity,
+        'completed': False
+    } for row, col, similarity in matrix.optimal_pairs()]
     
     # 按相似度排序
     matched_pairs.sort(key=lambda x: x['similarity'], reverse=True)
     
     return matched_pairs
 
-def preview_matches(videos_a: List[str], videos_b: List[str]) -> Dict:
-    """預覽匹配結果，不實際執行匹配"""
-    matches = match_videos(videos_a, videos_b)
+def preview_matches(videos_a: List[str], videos_b: List[str], threshold: float = 0.6, rules=None) -> Dict:
+    """預覽匹配結果，不實際執行匹配（相似度矩陣會被緩存，之後用同樣的文件創建任務時直接使用）"""
+    matches = optimal_match_videos(videos_a, videos_b, threshold, rules)
     
     return {
         'total_a': len(videos_a),
@@ -0,0 +1,355 @@
+"""
+視頻元數據探測
+純 Python 解析容器頭部，不依賴 ffprobe：
+- MP4/MOV（ISO BMFF）：moov 中的 mvhd、tkhd、mdhd、hdlr、stsd、stts
+- MKV/WebM（Matroska EBML）：Segment 中的 Info 和 Tracks
+只讀取頭部元素，不讀取媒體數據
+"""
+
+import os
+import struct
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+# moov 超過此大小時不解析（正常的 moov 只有幾 MB）
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+# Matroska 頭部元素（Info/Tracks）的大小上限
+MAX_EBML_HEADER_ELEMENT_SIZE = 16 * 1024 * 1024
+# EBML 頭（DocType 等幾個短字段）的大小上限，正常的只有幾十字節
+MAX_EBML_HEADER_SIZE = 4 * 1024
+
+# ISO BMFF 文件開頭可能出現的頂層 box
+_ISOBMFF_LEADING_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot'}
+
+
+# ---------- ISO BMFF ----------
+
+def iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    """遍歷內存中的 box，返回 (類型, 內容起點, 內容終點)"""
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, position)
+        header = 8
+        if size == 1:
+            if position + 16 > end:
+                return
+            size = struct.unpack_from(">Q", data, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header or position + size > end:
+            return
+        yield box_type, position + header, position + size
+        position += size
+
+
+def iter_file_boxes(f: BinaryIO, file_size: int) -> Iterator[Tuple[bytes, int, int, int]]:
+    """遍歷文件中的頂層 box，返回 (類型, box 起點, 頭部長度, box 大小)，不讀取 box 內容"""
+    position = 0
+    while position + 8 <= file_size:
+        f.seek(position)
+        header = f.read(16)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                return
+            size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - position
+        if size < header_size:
+            return
+        yield box_type, position, header_size, size
+        position += size
+
+
+def _find_child(data: bytes, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int]]:
+    for child_type, child_start, child_end in iter_boxes(data, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def _parse_mvhd(data: bytes, start: int) -> Tuple[int, int]:
+    """返回 (timescale, duration)"""
+    version = data[start]
+    if version == 1:
+        return struct.unpack_from(">IQ", data, start + 4 + 16)
+    return struct.unpack_from(">II", data, start + 4 + 8)
+
+
+def _parse_tkhd_size(data: bytes, start: int) -> Tuple[int, int]:
+    """返回 tkhd 中的 (寬, 高)，16.16 定點數取整數部分"""
+    version = data[start]
+    offset = start + 4 + (32 if version == 1 else 20) + 8 + 8 + 36
+    width, height = struct.unpack_from(">II", data, offset)
+    return width >> 16, height >> 16
+
+
+def _parse_trak(data: bytes, start: int, end: int) -> Dict:
+    track: Dict = {}
+    tkhd = _find_child(data, start, end, b'tkhd')
+    if tkhd:
+        track["width"], track["height"] = _parse_tkhd_size(data, tkhd[0])
+
+    mdia = _find_child(data, start, end, b'mdia')
+    if not mdia:
+        return track
+    mdhd = _find_child(data, mdia[0], mdia[1], b'mdhd')
+    if mdhd:
+        track["timescale"], track["duration"] = _parse_mvhd(data, mdhd[0])
+    hdlr = _find_child(data, mdia[0], mdia[1], b'hdlr')
+    if hdlr:
+        track["handler"] = data[hdlr[0] + 8:hdlr[0] + 12]
+
+    minf = _find_child(data, mdia[0], mdia[1], b'minf')
+    stbl = _find_child(data, minf[0], minf[1], b'stbl') if minf else None
+    if not stbl:
+        return track
+    stsd = _find_child(data, stbl[0], stbl[1], b'stsd')
+    if stsd and stsd[1] - stsd[0] >= 16:
+        entry = stsd[0] + 8
+        track["codec"] = data[entry + 4:entry + 8].decode("latin-1").strip()
+        # 視頻樣本描述中的寬高，tkhd 中沒有時使用
+        if track.get("handler") == b'vide' and entry + 36 <= stsd[1] and not track.get("width"):
+            track["width"], track["height"] = struct.unpack_from(">HH", data, entry + 32)
+    stts = _find_child(data, stbl[0], stbl[1], b'stts')
+    if stts:
+        count = struct.unpack_from(">I", data, stts[0] + 4)[0]
+        entries = min(count, (stts[1] - stts[0] - 8) // 8)
+        track["samples"] = sum(
+            struct.unpack_from(">I", data, stts[0] + 8 + i * 8)[0] for i in range(entries)
+        )
+    return track
+
+
+def probe_mp4(f: BinaryIO, file_size: int) -> Optional[Dict]:
+    moov = None
+    for box_type, position, header_size, size in iter_file_boxes(f, file_size):
+        if box_type == b'moov':
+            if size > MAX_MOOV_SIZE:
+                return None
+            f.seek(position + header_size)
+            moov = f.read(size - header_size)
+            break
+    if moov is None:
+        return None
+
+    result: Dict = {"container": "mp4"}
+    mvhd = _find_child(moov, 0, len(moov), b'mvhd')
+    if mvhd:
+        timescale, duration = _parse_mvhd(moov, mvhd[0])
+        if timescale:
+            result["duration"] = duration / timescale
+
+    for box_type, start, end in iter_boxes(moov):
+        if box_type != b'trak':
+            continue
+        track = _parse_trak(moov, start, end)
+        handler = track.get("handler")
+        if handler == b'vide' and "video_codec" not in result:
+            result["video_codec"] = track.get("codec")
+            result["width"] = track.get("width")
+            result["height"] = track.get("height")
+            if track.get("samples") and track.get("duration") and track.get("timescale"):
+                result["frame_rate"] = round(track["samples"] * track["timescale"] / track["duration"], 3)
+        elif handler == b'soun' and "audio_codec" not in result:
+            result["audio_codec"] = track.get("codec")
+    return result
+
+
+# ---------- Matroska / WebM ----------
+
+_EBML_HEADER = 0x1A45DFA3
+_EBML_DOCTYPE = 0x4282
+_SEGMENT = 0x18538067
+_CLUSTER = 0x1F43B675
+_INFO = 0x1549A966
+_TIMECODE_SCALE = 0x2AD7B1
+_DURATION = 0x4489
+_TRACKS = 0x1654AE6B
+_TRACK_ENTRY = 0xAE
+_TRACK_TYPE = 0x83
+_CODEC_ID = 0x86
+_DEFAULT_DURATION = 0x23E383
+_VIDEO = 0xE0
+_PIXEL_WIDTH = 0xB0
+_PIXEL_HEIGHT = 0xBA
+
+_UNKNOWN_SIZE = -1
+
+
+def _read_vint(data: bytes, position: int, keep_marker: bool) -> Tuple[int, int]:
+    """讀取 EBML 變長整數，返回 (值, 長度)；大小全 1 表示未知大小，返回 -1"""
+    first = data[position]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8 or position + length > len(data):
+        raise ValueError("無效的 EBML 變長整數")
+    value = first if keep_marker else first & (mask - 1)
+    all_ones = (first & (mask - 1)) == mask - 1
+    for byte in data[position + 1:position + length]:
+        value = (value << 8) | byte
+        all_ones = all_ones and byte == 0xFF
+    if not keep_marker and all_ones:
+        return _UNKNOWN_SIZE, length
+    return value, length
+
+
+def iter_ebml(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, int, int]]:
+    """遍歷內存中的 EBML 元素，返回 (ID, 內容起點, 內容終點)"""
+    end = len(data) if end is None else end
+    position = start
+    while position < end:
+        element_id, id_length = _read_vint(data, position, keep_marker=True)
+        size, size_length = _read_vint(data, position + id_length, keep_marker=False)
+        content = position + id_length + size_length
+        content_end = end if size == _UNKNOWN_SIZE else min(content + size, end)
+        yield element_id, content, content_end
+        position = content_end
+
+
+def _ebml_uint(data: bytes, start: int, end: int) -> int:
+    return int.from_bytes(data[start:end], "big")
+
+
+def _ebml_float(data: bytes, start: int, end: int) -> Optional[float]:
+    if end - start == 4:
+        return struct.unpack(">f", data[start:end])[0]
+    if end - start == 8:
+        return struct.unpack(">d", data[start:end])[0]
+    return None
+
+
+def _read_element_header(f: BinaryIO, position: int) -> Optional[Tuple[int, int, int]]:
+    """從文件中讀取元素頭，返回 (ID, 內容起點, 內容大小)"""
+    f.seek(position)
+    header = f.read(12)
+    if not header:
+        return None
+    try:
+        element_id, id_length = _read_vint(header, 0, keep_marker=True)
+        size, size_length = _read_vint(header, id_length, keep_marker=False)
+    except (ValueError, IndexError):
+        return None
+    return element_id, position + id_length + size_length, size
+
+
+def _parse_tracks(data: bytes, result: Dict):
+    for element_id, start, end in iter_ebml(data):
+        if element_id != _TRACK_ENTRY:
+            continue
+        track_type = None
+        codec = None
+        default_duration = None
+        width = height = None
+        for child_id, child_start, child_end in iter_ebml(data, start, end):
+            if child_id == _TRACK_TYPE:
+                track_type = _ebml_uint(data, child_start, child_end)
+            elif child_id == _CODEC_ID:
+                codec = data[child_start:child_end].decode("ascii", "replace").rstrip("\x00")
+            elif child_id == _DEFAULT_DURATION:
+                default_duration = _ebml_uint(data, child_start, child_end)
+            elif child_id == _VIDEO:
+                for video_id, video_start, video_end in iter_ebml(data, child_start, child_end):
+                    if video_id == _PIXEL_WIDTH:
+                        width = _ebml_uint(data, video_start, video_end)
+                    elif video_id == _PIXEL_HEIGHT:
+                        height = _ebml_uint(data, video_start, video_end)
+        if track_type == 1 and "video_codec" not in result:
+            result["video_codec"] = codec
+            result["width"] = width
+            result["height"] = height
+            if default_duration:
+                result["frame_rate"] = round(1e9 / default_duration, 3)
+        elif track_type == 2 and "audio_codec" not in result:
+            result["audio_codec"] = codec
+
+
+def probe_matroska(f: BinaryIO, file_size: int) -> Optional[Dict]:
+    header = _read_element_header(f, 0)
+    if not header or header[0] != _EBML_HEADER or header[2] == _UNKNOWN_SIZE \
+            or header[2] > MAX_EBML_HEADER_SIZE:
+        return None
+    _, content, size = header
+    f.seek(content)
+    ebml_header = f.read(size)
+    result: Dict = {"container": "matroska"}
+    for element_id, start, end in iter_ebml(ebml_header):
+        if element_id == _EBML_DOCTYPE:
+            result["container"] = ebml_header[start:end].decode("ascii", "replace").rstrip("\x00")
+
+    segment = _read_element_header(f, content + size)
+    if not segment or segment[0] != _SEGMENT:
+        return result
+    position = segment[1]
+    segment_end = file_size if segment[2] == _UNKNOWN_SIZE else min(file_size, segment[1] + segment[2])
+
+    timecode_scale = 1000000
+    duration = None
+    found_info = found_tracks = False
+    # Info 和 Tracks 在第一個 Cluster 之前，只掃描頂層元素頭
+    while position < segment_end and not (found_info and found_tracks):
+        element = _read_element_header(f, position)
+        if not element or element[2] == _UNKNOWN_SIZE:
+            break
+        element_id, element_content, element_size = element
+        if element_id == _CLUSTER:
+            break
+        if element_id in (_INFO, _TRACKS) and element_size <= MAX_EBML_HEADER_ELEMENT_SIZE:
+            f.seek(element_content)
+            data = f.read(element_size)
+            if element_id == _INFO:
+                found_info = True
+                for child_id, start, end in iter_ebml(data):
+                    if child_id == _TIMECODE_SCALE:
+                        timecode_scale = _ebml_uint(data, start, end)
+                    elif child_id == _DURATION:
+                        duration = _ebml_float(data, start, end)
+            else:
+                found_tracks = True
+                _parse_tracks(data, result)
+        position = element_content + element_size
+
+    if duration is not None:
+        result["duration"] = duration * timecode_scale / 1e9
+    return result
+
+
+# ---------- 入口 ----------
+
+def probe_video(file_path: str) -> Optional[Dict]:
+    """
+    探測視頻的時長、分辨率、編碼和碼率
+
+    Returns:
+        元數據字典（container, duration, width, height, video_codec, audio_codec,
+        frame_rate, bitrate，缺少的字段不出現）；不支持的容器或解析失敗時返回 None
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        head = f.read(12)
+        try:
+            if head[:4] == b'\x1a\x45\xdf\xa3':
+                result = probe_matroska(f, file_size)
+            elif head[4:8] in _ISOBMFF_LEADING_BOXES:
+                result = probe_mp4(f, file_size)
+            else:
+                result = None
+        except (struct.error, ValueError, IndexError) as e:
+            print(f"⚠️ 解析視頻頭部失敗 {file_path}: {e}")
+            return None
+
+    if result is None:
+        return None
+    result = {key: value for key, value in result.items() if value is not None}
+    if result.get("duration"):
+        result["duration"] = round(result["duration"], 3)
+        result["bitrate"] = int(file_size * 8 / result["duration"])
+    return result
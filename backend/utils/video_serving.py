@@ -0,0 +1,389 @@
+"""
+視頻文件服務
+為盲測播放器的 seek 優化的文件響應：
+- 單範圍和多範圍（multipart/byteranges）請求
+- 強 ETag 和 Last-Modified 來自短時間緩存的 stat 結果，條件請求直接返回 304，不打開文件
+- 版本化 URL（?v=<ETag>）返回 immutable 緩存頭
+- ASGI 服務器支持 zerocopysend/pathsend 擴展時由服務器用 sendfile 零拷貝發送，
+  否則在線程池中按大塊 pread 發送
+- 設置 VIDEO_ACCEL_REDIRECT 時只檢查並解析路徑，返回 X-Accel-Redirect 由 nginx 發送文件內容
+"""
+
+import os
+import time
+import stat
+import threading
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+from uuid import uuid4
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+
+# stat 緩存的有效期（秒）；文件被替換後最多在這段時間內返回舊的 ETag
+STAT_CACHE_TTL = float(os.environ.get("VIDEO_STAT_CACHE_TTL", "2"))
+STAT_CACHE_MAX_ENTRIES = 4096
+# 不支持零拷貝時每次 pread 發送的塊大小
+SERVE_CHUNK_SIZE = 256 * 1024
+# 一個請求最多返回的範圍數，超過時忽略 Range 返回整個文件
+MAX_RANGES = 16
+
+# nginx 中 internal location 的前綴（如 /_protected_uploads），為空時由 Python 發送文件
+VIDEO_ACCEL_REDIRECT = os.environ.get("VIDEO_ACCEL_REDIRECT", "").rstrip("/")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class FileInfo(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    etag: str
+    last_modified: str
+    content_type: str
+
+
+class StatCache:
+    """按路徑緩存 stat 結果及由此生成的響應頭"""
+
+    def __init__(self, ttl: float = STAT_CACHE_TTL, max_entries: int = STAT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, Tuple[float, FileInfo]] = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, path: str, now: float) -> Optional[FileInfo]:
+        with self._lock:
+            cached = self._entries.get(path)
+        if cached and cached[0] > now:
+            return cached[1]
+        return None
+
+    async def get_async(self, path: str) -> Optional[FileInfo]:
+        """get() 的異步版本：緩存命中時直接返回，未命中時在線程池中 stat，不阻塞事件循環"""
+        info = self._cached(path, time.monotonic())
+        if info is not None:
+            return info
+        return await anyio.to_thread.run_sync(self.get, path)
+
+    def get(self, path: str) -> Optional[FileInfo]:
+        """返回普通文件的信息，文件不存在或不是普通文件時返回 None"""
+        now = time.monotonic()
+        info = self._cached(path, now)
+        if info is not None:
+            return info
+
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            with self._lock:
+                self._entries.pop(path, None)
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+
+        # inode + 大小 + 納秒 mtime：內容變化（包括原子替換）必然改變 ETag，可作為強校驗器
+        info = FileInfo(
+            path=path,
+            size=st.st_size,
+            mtime=st.st_mtime,
+            etag=f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"',
+            last_modified=formatdate(st.st_mtime, usegmt=True),
+            content_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        )
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[path] = (now + self.ttl, info)
+        return info
+
+    def invalidate(self, path: Optional[str] = None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    解析 Range 請求頭
+
+    Returns:
+        排序並合併後的 [(起點, 終點含)]；格式無效或範圍過多時返回 None（按整個文件響應）
+
+    Raises:
+        RangeNotSatisfiable: 所有範圍都在文件之外
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        if not dash or not (first.isdigit() or last.isdigit()):
+            return None
+        if not first:
+            # 後綴範圍：最後 N 個字節
+            length = int(last)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = min(int(last), size - 1) if last else size - 1
+        ranges.append((start, end))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    # 重疊或相鄰的範圍合併為一個
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        return None
+    return merged
+
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    """If-Match（強比較）/ If-None-Match（弱比較）"""
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if weak and candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return False
+
+
+class RangeFileResponse(Response):
+    """按範圍發送文件內容的響應，不把文件讀入內存"""
+
+    def __init__(self, info: FileInfo, status_code: int, headers: Dict[str, str],
+                 ranges: Optional[List[Tuple[int, int]]] = None, send_body: bool = True):
+        self.info = info
+        self.status_code = status_code
+        self.ranges = ranges
+        self.send_body = send_body
+        self.background = None
+
+        self.boundary = None
+        self.part_headers: List[bytes] = []
+        if ranges is None:
+            content_length = info.size
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            headers["content-range"] = f"bytes {start}-{end}/{info.size}"
+            content_length = end - start + 1
+        else:
+            self.boundary = uuid4().hex
+            headers["content-type"] = f"multipart/byteranges; boundary={self.boundary}"
+            for start, end in ranges:
+                self.part_headers.append((
+                    f"--{self.boundary}\r\n"
+                    f"Content-Type: {info.content_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{info.size}\r\n\r\n"
+                ).encode("latin-1"))
+            content_length = sum(len(h) + (end - start + 1) + 2
+                                 for h, (start, end) in zip(self.part_headers, ranges))
+            content_length += len(self.closing_boundary)
+        headers.setdefault("content-type", info.content_type)
+        headers["content-length"] = str(content_length)
+        self.init_headers(headers)
+
+    @property
+    def closing_boundary(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async def listen_for_disconnect(task_group):
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    task_group.cancel_scope.cancel()
+                    break
+
+        async with anyio.create_task_group() as task_group:
+            async def send_and_stop():
+                await self._send_body(scope, send)
+                task_group.cancel_scope.cancel()
+            task_group.start_soon(listen_for_disconnect, task_group)
+            await send_and_stop()
+
+    async def _send_body(self, scope, send):
+        extensions = scope.get("extensions") or {}
+        if self.ranges is None and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.info.path)})
+            return
+
+        ranges = self.ranges or ([(0, self.info.size - 1)] if self.info.size else [])
+        zerocopy = "http.response.zerocopysend" in extensions
+        f = await anyio.to_thread.run_sync(open, self.info.path, "rb")
+        try:
+            for index, (start, end) in enumerate(ranges):
+                if self.boundary:
+                    await send({"type": "http.response.body", "body": self.part_headers[index], "more_body": True})
+                if zerocopy:
+                    # 由服務器對 socket 調用 sendfile
+                    await send({"type": "http.response.zerocopysend", "file": f,
+                                "offset": start, "count": end - start + 1, "more_body": True})
+                else:
+                    await self._send_range(f.fileno(), start, end, send)
+                if self.boundary:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        finally:
+            await anyio.to_thread.run_sync(f.close)
+        tail = self.closing_boundary if self.boundary else b""
+        await send({"type": "http.response.body", "body": tail, "more_body": False})
+
+    @staticmethod
+    async def _send_range(fd: int, start: int, end: int, send):
+        position = start
+        while position <= end:
+            length = min(SERVE_CHUNK_SIZE, end - position + 1)
+            chunk = await anyio.to_thread.run_sync(os.pread, fd, length, position)
+            if not chunk:
+                raise IOError("文件在發送過程中被截斷")
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            position += len(chunk)
+
+
+async def serve_file(request: Request, path: str, stat_cache: StatCache) -> Response:
+    """
+    按請求頭生成文件響應（200/206/304/412/416）
+
+    Args:
+        path: 已經過路徑安全檢查的文件路徑
+    """
+    info = await stat_cache.get_async(path)
+    if info is None:
+        return Response(status_code=404)
+
+    version = request.query_params.get("v")
+    immutable = version is not None and f'"{version}"' == info.etag
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": info.etag,
+        "last-modified": info.last_modified,
+        "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+    }
+    request_headers = request.headers
+
+    if_match = request_headers.get("if-match")
+    if if_match is not None and not _etag_matches(if_match, info.etag, weak=False):
+        return Response(status_code=412, headers=headers)
+    if if_match is None:
+        if_unmodified_since = request_headers.get("if-unmodified-since")
+        if if_unmodified_since and not _not_modified_since(if_unmodified_since, info.mtime):
+            return Response(status_code=412, headers=headers)
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, info.etag, weak=True):
+            return Response(status_code=304, headers=headers)
+    else:
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since and _not_modified_since(if_modified_since, info.mtime):
+            return Response(status_code=304, headers=headers)
+
+    send_body = request.method != "HEAD"
+    range_header = request_headers.get("range")
+    if range_header:
+        # If-Range 不匹配（文件已變化）時忽略 Range，返回完整的新文件
+        if_range = request_headers.get("if-range")
+        if if_range is not None:
+            if if_range.startswith('"') or if_range.startswith("W/"):
+                range_valid = if_range == info.etag
+            else:
+                range_valid = if_range == info.last_modified
+            if not range_valid:
+                range_header = None
+    if range_header:
+        try:
+            ranges = parse_range_header(range_header, info.size)
+        except RangeNotSatisfiable:
+            headers["content-range"] = f"bytes */{info.size}"
+            return Response(status_code=416, headers=headers)
+        if ranges is not None:
+            return RangeFileResponse(info, 206, headers, ranges, send_body=send_body)
+
+    return RangeFileResponse(info, 200, headers, send_body=send_body)
+
+
+async def accel_redirect(request: Request, root: str, path: str, stat_cache: StatCache,
+                   location: str = VIDEO_ACCEL_REDIRECT) -> Response:
+    """
+    把文件交給 nginx 發送：響應只帶 X-Accel-Redirect 和緩存頭，
+    範圍請求、條件請求和 sendfile 都由 nginx 的 internal location 處理
+
+    Args:
+        root: location 在 nginx 中 alias 到的目錄
+        path: 已經過路徑安全檢查的文件路徑（root 之下）
+    """
+    relative = os.path.relpath(path, root).replace(os.sep, "/")
+    immutable = False
+    version = request.query_params.get("v")
+    if version is not None:
+        # 只有版本化 URL 需要 stat 來比較 ETag
+        info = await stat_cache.get_async(path)
+        immutable = info is not None and f'"{version}"' == info.etag
+    # nginx 內部重定向時保留上游的 Cache-Control；Content-Type 由 internal location 的 types 決定
+    return Response(status_code=200, headers={
+        "x-accel-redirect": f"{location}/{quote(relative)}",
+        "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+    })
+
+
+def resolve_served_path(root: str, relative_path: str) -> Optional[str]:
+    """
+    把 URL 中的相對路徑解析為 root 下的文件路徑
+
+    Returns:
+        文件路徑；路徑越界或指向隱藏文件時返回 None
+    """
+    parts = [part for part in relative_path.replace("\\", "/").split("/") if part not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    # 上傳臨時文件、元數據索引等隱藏文件不對外提供
+    if any(part.startswith(".") for part in parts):
+        return None
+    return os.path.join(root, *parts)